@@ -0,0 +1,100 @@
+import atexit
+import datetime
+import logging
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import boto3
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+NAMESPACE = 'ESD'
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+# PutMetricData accepts up to 1000 metrics per request
+MAX_METRIC_DATA_PER_REQUEST = 1000
+
+
+class MetricsPublisher:
+    """
+    Aggregates datapoints in process and publishes them from a background thread,
+    so invocations never wait for a PutMetricData round trip.
+
+    Datapoints with the same name, unit and dimensions are folded into one
+    StatisticValues entry, which keeps Sum, SampleCount, Min and Max intact.
+
+    install_comfy.sh copies this module next to the ComfyUI serve.py, it must not
+    import anything from the WebUI.
+    """
+
+    def __init__(self, client=None, namespace: str = NAMESPACE, flush_interval: float = METRICS_FLUSH_INTERVAL,
+                 start: bool = True):
+        self.client = client
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.buffer: Dict[Tuple, dict] = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        if start:
+            self.start()
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def put(self, metric_name: str, dimensions: List[dict], value: float = 1, unit: str = 'Count'):
+        key = (metric_name, unit, tuple((d['Name'], d['Value']) for d in dimensions))
+        with self.lock:
+            stats = self.buffer.get(key)
+            if stats is None:
+                self.buffer[key] = {'SampleCount': 1, 'Sum': value, 'Minimum': value, 'Maximum': value}
+                return
+            stats['SampleCount'] += 1
+            stats['Sum'] += value
+            stats['Minimum'] = min(stats['Minimum'], value)
+            stats['Maximum'] = max(stats['Maximum'], value)
+
+    def flush(self):
+        with self.lock:
+            buffer, self.buffer = self.buffer, {}
+
+        if not buffer:
+            return
+
+        timestamp = datetime.datetime.utcnow()
+        data = [
+            {
+                'MetricName': metric_name,
+                'Dimensions': [{'Name': name, 'Value': value} for name, value in dimensions],
+                'Timestamp': timestamp,
+                'StatisticValues': stats,
+                'Unit': unit
+            } for (metric_name, unit, dimensions), stats in buffer.items()
+        ]
+
+        if self.client is None:
+            self.client = boto3.client('cloudwatch')
+
+        for i in range(0, len(data), MAX_METRIC_DATA_PER_REQUEST):
+            try:
+                response = self.client.put_metric_data(
+                    Namespace=self.namespace,
+                    MetricData=data[i:i + MAX_METRIC_DATA_PER_REQUEST]
+                )
+                logger.info(f"record_metric response: {response}")
+            except Exception as e:
+                logger.error(f"failed to publish {len(data[i:i + MAX_METRIC_DATA_PER_REQUEST])} metrics: {e}")
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
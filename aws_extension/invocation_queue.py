@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+logger = logging.getLogger("sd_proxy")
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# invocations running at the same time, the WebUI runs one generation at a time
+INVOCATION_CONCURRENCY = int(os.environ.get('INVOCATION_CONCURRENCY') or 1)
+# invocations allowed to wait, beyond that the lowest priority one is rejected
+INVOCATION_QUEUE_MAX = int(os.environ.get('INVOCATION_QUEUE_MAX') or 10)
+# seconds an invocation may wait before it is rejected, SageMaker async invocations time out after an hour
+INVOCATION_MAX_WAIT = float(os.environ.get('INVOCATION_MAX_WAIT') or 3600)
+# seconds of waiting that raise an invocation by one priority class, so long jobs are not starved
+PRIORITY_AGING_SECONDS = float(os.environ.get('PRIORITY_AGING_SECONDS') or 300)
+
+# lower runs first: quick calls are not stuck behind generations, model jobs go last
+TASK_PRIORITIES = {
+    'interrogate_clip': 0,
+    'interrogate_deepbooru': 0,
+    'rembg': 0,
+    'extra-single-image': 1,
+    'extra-batch-images': 1,
+    'txt2img': 2,
+    'img2img': 2,
+    'db-create-model': 3,
+    'merge-checkpoint': 3,
+}
+DEFAULT_PRIORITY = 2
+
+
+class QueueRejected(Exception):
+    status_code = 429
+
+    def __init__(self, task: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.task = task
+        self.retry_after = retry_after
+
+
+class QueueFull(QueueRejected):
+    status_code = 429
+
+
+class QueueTimeout(QueueRejected):
+    status_code = 503
+
+
+class _Ticket:
+
+    def __init__(self, task: str, priority: int, seq: int, enqueued_at: float):
+        self.task = task
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = enqueued_at
+        self.shed = False
+
+
+class InvocationQueue:
+    """
+    Admission control for /invocations.
+
+    Up to `concurrency` invocations run, up to `max_queued` wait and are started by task
+    priority, oldest first within a class. A waiting invocation gains one class every
+    `aging` seconds. When the queue is full, the newcomer is rejected unless a waiting
+    invocation has a lower priority, which is rejected instead. Invocations that wait
+    longer than `max_wait` are rejected too, so overload answers fast instead of timing out.
+    """
+
+    def __init__(self, concurrency: int = INVOCATION_CONCURRENCY, max_queued: int = INVOCATION_QUEUE_MAX,
+                 max_wait: float = INVOCATION_MAX_WAIT, aging: float = PRIORITY_AGING_SECONDS,
+                 priorities: Dict[str, int] = None, clock: Callable[[], float] = time.monotonic):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.aging = aging
+        self.priorities = priorities or TASK_PRIORITIES
+        self.clock = clock
+
+        self.condition = threading.Condition()
+        self.waiting: List[_Ticket] = []
+        self.running = 0
+        self.seq = 0
+        self.wait_stats: Dict[str, Dict[str, float]] = {}
+        self.rejected: Dict[str, int] = {}
+
+    @contextmanager
+    def slot(self, task: str):
+        """Waits for a turn to run an invocation of `task`, yields the seconds waited."""
+        waited = self._acquire(task)
+        try:
+            yield waited
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'running': self.running,
+                'waiting': len(self.waiting),
+                'wait_seconds': {task: dict(stats) for task, stats in self.wait_stats.items()},
+                'rejected': dict(self.rejected),
+            }
+
+    def _acquire(self, task: str) -> float:
+        with self.condition:
+            now = self.clock()
+            self.seq += 1
+            ticket = _Ticket(task, self.priorities.get(task, DEFAULT_PRIORITY), self.seq, now)
+
+            if self.running < self.concurrency and not self.waiting:
+                self.running += 1
+                self._record_wait(task, 0)
+                return 0
+
+            if len(self.waiting) >= self.max_queued:
+                victim = max(self.waiting, key=lambda t: (self._effective_priority(t, now), t.seq))
+                if self._effective_priority(victim, now) <= self._effective_priority(ticket, now):
+                    self._reject(task)
+                    raise QueueFull(task, f'{len(self.waiting)} invocations are waiting, try again later',
+                                    self._retry_after())
+                victim.shed = True
+                self.waiting.remove(victim)
+                self.condition.notify_all()
+                logger.info(f'queue full, shed waiting {victim.task} for {task}')
+
+            self.waiting.append(ticket)
+            deadline = now + self.max_wait
+            while True:
+                if ticket.shed:
+                    self._reject(task)
+                    raise QueueFull(task, 'shed for higher priority invocations, try again later',
+                                    self._retry_after())
+
+                now = self.clock()
+                if self.running < self.concurrency and self._next(now) is ticket:
+                    self.waiting.remove(ticket)
+                    self.running += 1
+                    waited = now - ticket.enqueued_at
+                    self._record_wait(task, waited)
+                    # another slot may be free for the next in line
+                    self.condition.notify_all()
+                    return waited
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.waiting.remove(ticket)
+                    self._reject(task)
+                    self.condition.notify_all()
+                    raise QueueTimeout(task, f'waited {self.max_wait} seconds for a free slot',
+                                       self._retry_after())
+
+                self.condition.wait(min(remaining, self.aging) if self.aging else remaining)
+
+    def _next(self, now: float) -> _Ticket:
+        return min(self.waiting, key=lambda t: (self._effective_priority(t, now), t.seq))
+
+    def _effective_priority(self, ticket: _Ticket, now: float) -> float:
+        if not self.aging:
+            return ticket.priority
+        return ticket.priority - int((now - ticket.enqueued_at) / self.aging)
+
+    def _record_wait(self, task: str, waited: float):
+        stats = self.wait_stats.setdefault(task, {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += waited
+        stats['max'] = max(stats['max'], waited)
+
+    def _reject(self, task: str):
+        self.rejected[task] = self.rejected.get(task, 0) + 1
+
+    def _retry_after(self) -> int:
+        # average wait so far is the best guess of when a slot frees up
+        count = sum(stats['count'] for stats in self.wait_stats.values())
+        total = sum(stats['total'] for stats in self.wait_stats.values())
+        return max(1, int(total / count)) if count else 1
@@ -2,10 +2,11 @@ import os
 import io
 import base64
 from PIL import Image
-from utils import ModelsRef
 import subprocess
 import logging
 
+from aws_extension.model_cache import ModelCache
+
 try:
     import modules.shared as shared
     from modules import sd_hijack, sd_models, sd_vae
@@ -17,7 +18,6 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 CN_MODEL_EXTS = [".pt", ".pth", ".ckpt", ".safetensors"]
 models_type_list = ['Stable-diffusion', 'hypernetworks', 'Lora', 'ControlNet', 'embeddings', 'VAE']
-models_used_count = {key: ModelsRef() for key in models_type_list}
 models_path = {key: None for key in models_type_list}
 models_path['Stable-diffusion'] = 'models/Stable-diffusion'
 models_path['ControlNet'] = 'models/ControlNet'
@@ -29,70 +29,34 @@ disk_path = '/tmp'
 #disk_path = '/'
 TAR_TYPE_FILE = 'application/x-tar'
 
+# looked up at call time so that download_and_update can be replaced in tests
+model_cache = ModelCache(models_path,
+                         downloader=lambda model_type, model_s3_pos: download_and_update(model_type, model_s3_pos),
+                         disk_path=disk_path,
+                         exts=CN_MODEL_EXTS)
+
 
 def checkspace_and_update_models(selected_models):
     print(selected_models)
-    models_num = len(models_type_list)
     space_free_size = selected_models['space_free_size']
-    # os.system("df -h")
-    for type_id in range(models_num):
-        model_type = models_type_list[type_id]
+    # models of the current request are never evicted to make room for each other
+    protected = {(model_type, model['model_name'])
+                 for model_type in models_type_list for model in selected_models.get(model_type, [])}
+    for model_type in models_type_list:
         if model_type not in selected_models:
             continue
 
-        selected_models_name = selected_models[model_type]
-        local_models = []
-        for path, subdirs, files in os.walk(models_path[model_type]):
-            for name in files:
-                full_path_name = os.path.join(path, name)
-                name_local = os.path.relpath(full_path_name, models_path[model_type])
-                local_models.append(name_local)
-        for model in selected_models_name:
-            models_used_count[model_type].add_models_ref(model['model_name'])
-            if model['model_name'] in local_models:
-                continue
+        for model in selected_models[model_type]:
             if model_type == 'VAE' and model['model_name'] in ['Automatic', 'None']:
                 print(f'skip vae download for {model["model_name"]}')
                 continue
-            else:
-                st = os.statvfs(disk_path)
-                free = (st.f_bavail * st.f_frsize)
-                print('!!!!!!!!!!!!current free space is', free)
-                if free < space_free_size:
-                    #### delete least used model to get more space ########
-                    space_check_success = False
-                    for i in range(models_num):
-                        type_id_check = (type_id + i)%models_num
-                        type_check = models_type_list[type_id_check]
-                        if type_check not in selected_models:
-                            continue
-                        selected_models_name_check = selected_models[type_check]
-                        print(f'check current model folder: {os.listdir(models_path[type_check])}')
-                        local_models_check = [f for f in os.listdir(models_path[type_check]) if os.path.splitext(f)[1] in CN_MODEL_EXTS]
-                        if len(local_models_check) == 0:
-                            continue
-                        sorted_local_modles = models_used_count[type_check].get_sorted_models(local_models_check)
-                        for local_model in sorted_local_modles:
-                            if local_model in selected_models_name_check:
-                                continue
-                            else:
-                                os.remove(os.path.join(models_path[type_check], local_model))
-                                print('remove models', os.path.join(models_path[type_check], local_model))
-                                models_used_count[type_check].remove_model_ref(local_model)
-                                st = os.statvfs(disk_path)
-                                free = (st.f_bavail * st.f_frsize)
-                                print('!!!!!!!!!!!!current free space is', free)
-                                if free > space_free_size:
-                                    space_check_success = True
-                                    break
-                        if space_check_success:
-                            break
-                    if not space_check_success:
-                        print('can not get enough space to download models!!!!!!')
-                        return
-
-                ####down load models######
-                download_and_update(model_type, f'{model["s3"]}/{model["model_name"]}')
+
+            if not model_cache.ensure(model_type, model['model_name'], f'{model["s3"]}/{model["model_name"]}',
+                                      space_free_size, protected):
+                print('can not get enough space to download models!!!!!!')
+                return
+
+    logger.info(f'model cache stats: {model_cache.stats()}')
 
     shared.opts.sd_model_checkpoint = selected_models['Stable-diffusion'][0]["model_name"]
     sd_models.reload_model_weights()
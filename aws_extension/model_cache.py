@@ -0,0 +1,244 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("sd_proxy")
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+MODEL_EXTS = [".pt", ".pth", ".ckpt", ".safetensors"]
+
+# bytes the cached models may take in total, 0 means only the free space check applies
+MODEL_CACHE_BUDGET = int(os.environ.get('MODEL_CACHE_BUDGET') or 0)
+# comma separated type/name pairs that are never evicted, e.g. Stable-diffusion/v1-5-pruned-emaonly.safetensors
+MODEL_CACHE_PINNED = os.environ.get('MODEL_CACHE_PINNED') or ''
+
+
+@dataclass
+class CachedModel:
+    model_type: str
+    name: str
+    size: int
+    last_used: float
+    pinned: bool = False
+
+
+def disk_free_space(path: str) -> int:
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+class ModelCache:
+    """
+    Index of the model files on local disk.
+
+    The index is built with one walk of each model directory and then kept up to date
+    by the cache's own downloads and evictions, a directory is walked again only when
+    the modification time of its top folder shows that something else changed it.
+
+    When space is needed, unpinned models that the current request does not use are
+    evicted least recently used first, preferring models no larger than what is still
+    missing, so that fitting a small LoRA does not throw out a big base model.
+    """
+
+    def __init__(self, models_path: Dict[str, str],
+                 downloader: Callable[[str, str], None],
+                 disk_path: str = '/tmp',
+                 budget: int = MODEL_CACHE_BUDGET,
+                 free_space: Callable[[str], int] = disk_free_space,
+                 pinned: str = MODEL_CACHE_PINNED,
+                 exts: List[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.models_path = models_path
+        self.downloader = downloader
+        self.disk_path = disk_path
+        self.budget = budget
+        self.free_space = free_space
+        # only files with these extensions are evicted, anything else in the model folders is left alone
+        self.exts = exts or MODEL_EXTS
+        self.clock = clock
+
+        self.lock = threading.RLock()
+        self.index: Dict[Tuple[str, str], CachedModel] = {}
+        self.dir_mtimes: Dict[str, Optional[int]] = {}
+        self.pinned: Set[Tuple[str, str]] = set()
+        for pair in pinned.split(','):
+            if '/' in pair:
+                model_type, name = pair.strip().split('/', 1)
+                self.pin(model_type, name)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def pin(self, model_type: str, name: str):
+        with self.lock:
+            self.pinned.add((model_type, name))
+            if (model_type, name) in self.index:
+                self.index[(model_type, name)].pinned = True
+
+    def contains(self, model_type: str, name: str) -> bool:
+        self._sync(model_type)
+        with self.lock:
+            return (model_type, name) in self.index
+
+    def ensure(self, model_type: str, name: str, s3_pos: str, space_free_size: float = 0,
+               protected: Optional[Set[Tuple[str, str]]] = None) -> bool:
+        """
+        Makes sure the model is on local disk, downloading it after freeing space if needed.
+        Returns False when enough space could not be freed.
+        """
+        key = (model_type, name)
+        if self.contains(model_type, name):
+            with self.lock:
+                self.hits += 1
+                self.index[key].last_used = self.clock()
+            return True
+
+        with self.lock:
+            self.misses += 1
+
+        if not self.make_space(space_free_size, protected=(protected or set()) | {key}):
+            return False
+
+        self._download(model_type, name, s3_pos)
+        return True
+
+    def make_space(self, space_free_size: float = 0, incoming_size: int = 0,
+                   protected: Optional[Set[Tuple[str, str]]] = None) -> bool:
+        with self.lock:
+            for model_type in self.models_path:
+                self._sync(model_type)
+
+            need = space_free_size - self.free_space(self.disk_path)
+            if self.budget:
+                need = max(need, self.used_bytes() + incoming_size - self.budget)
+            if need <= 0:
+                return True
+
+            protected = protected or set()
+            candidates = sorted(
+                [model for key, model in self.index.items()
+                 if key not in protected and not model.pinned
+                 and os.path.splitext(model.name)[1] in self.exts],
+                key=lambda model: model.last_used)
+
+            for model in self._choose_victims(candidates, need):
+                self._evict(model)
+
+            need = space_free_size - self.free_space(self.disk_path)
+            if self.budget:
+                need = max(need, self.used_bytes() + incoming_size - self.budget)
+            if need > 0:
+                logger.error(f'can not free {need} bytes for models, cache stats: {self.stats()}')
+                return False
+
+            return True
+
+    def used_bytes(self) -> int:
+        with self.lock:
+            return sum(model.size for model in self.index.values())
+
+    def stats(self) -> dict:
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0,
+                'evictions': self.evictions,
+                'evicted_bytes': self.evicted_bytes,
+                'models': len(self.index),
+                'used_bytes': sum(model.size for model in self.index.values()),
+            }
+
+    @staticmethod
+    def _choose_victims(candidates: List[CachedModel], need: int) -> List[CachedModel]:
+        victims = []
+        freed = 0
+
+        # least recently used first, skipping models bigger than what is still missing
+        for model in candidates:
+            if freed >= need:
+                return victims
+            if model.size <= need - freed:
+                victims.append(model)
+                freed += model.size
+
+        # then the smallest model that covers the rest, the oldest one on ties
+        remaining = [model for model in candidates if model not in victims]
+        covering = [model for model in remaining if model.size >= need - freed]
+        if freed < need and covering:
+            victims.append(min(covering, key=lambda model: (model.size, model.last_used)))
+            return victims
+
+        # nothing covers it on its own, evict in recency order until it fits
+        for model in remaining:
+            if freed >= need:
+                break
+            victims.append(model)
+            freed += model.size
+
+        return victims
+
+    def _evict(self, model: CachedModel):
+        path = os.path.join(self.models_path[model.model_type], model.name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        logger.info(f'evict model {path} of {model.size} bytes')
+        self.index.pop((model.model_type, model.name), None)
+        self.evictions += 1
+        self.evicted_bytes += model.size
+        self._remember_mtime(model.model_type)
+
+    def _download(self, model_type: str, name: str, s3_pos: str):
+        self.downloader(model_type, s3_pos)
+        with self.lock:
+            # downloads may unpack a tar with several files, pick up whatever arrived
+            self._scan(model_type)
+            if (model_type, name) in self.index:
+                self.index[(model_type, name)].last_used = self.clock()
+
+    def _sync(self, model_type: str):
+        with self.lock:
+            if self._mtime(model_type) != self.dir_mtimes.get(model_type):
+                self._scan(model_type)
+
+    def _mtime(self, model_type: str) -> Optional[int]:
+        # one stat per lookup: models are added and removed at the top of the type folder, the
+        # cache's own downloads and evictions update the index and the remembered mtime themselves
+        try:
+            return os.stat(self.models_path[model_type]).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _remember_mtime(self, model_type: str):
+        self.dir_mtimes[model_type] = self._mtime(model_type)
+
+    def _scan(self, model_type: str):
+        root = self.models_path[model_type]
+        now = self.clock()
+        found = set()
+        if os.path.isdir(root):
+            for path, subdirs, files in os.walk(root):
+                for file_name in files:
+                    full_path = os.path.join(path, file_name)
+                    name = os.path.relpath(full_path, root)
+                    found.add(name)
+                    key = (model_type, name)
+                    size = os.path.getsize(full_path)
+                    if key in self.index:
+                        self.index[key].size = size
+                    else:
+                        # models found on disk count as used now, they were just put there
+                        self.index[key] = CachedModel(model_type, name, size, now, key in self.pinned)
+
+        for key in [key for key in self.index if key[0] == model_type and key[1] not in found]:
+            del self.index[key]
+
+        self._remember_mtime(model_type)
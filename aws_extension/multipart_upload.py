@@ -0,0 +1,231 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# parts sent at the same time, each one holds a connection but only a small read buffer
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY') or 4)
+UPLOAD_PART_RETRIES = 3
+# seconds between progress reports
+UPLOAD_PROGRESS_INTERVAL = 5
+# parts are uploaded concurrently and retried one by one, smaller parts spread better over the workers
+UPLOAD_MIN_PART_SIZE = 100 * 1024 * 1024
+# parts_number accepted by the create checkpoint API per file
+UPLOAD_MAX_PARTS = 100
+
+
+@dataclass
+class UploadResult:
+    parts: List[Dict] = field(default_factory=list)
+    total_bytes: int = 0
+    # bytes sent by this run, parts recorded by an interrupted run are not sent again
+    uploaded_bytes: int = 0
+    resumed_parts: int = 0
+    seconds: float = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second over all parts sent by this run."""
+        return self.uploaded_bytes / self.seconds if self.seconds else 0
+
+    def summary(self) -> str:
+        return (f'{self.uploaded_bytes / 1024 / 1024:.1f} MB in {self.seconds:.1f}s, '
+                f'{self.throughput / 1024 / 1024:.1f} MB/s, {self.resumed_parts} parts resumed')
+
+
+class _PartReader:
+    """A file-like view of one part, requests streams it with a Content-Length instead of reading it into memory."""
+
+    def __init__(self, path: str, offset: int, size: int, on_read: Callable[[int], None]):
+        self.file = open(path, 'rb')
+        self.file.seek(offset)
+        self.remaining = size
+        self.size = size
+        self.on_read = on_read
+
+    def __len__(self):
+        return self.size
+
+    def read(self, amt: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        if amt is None or amt < 0 or amt > self.remaining:
+            amt = self.remaining
+        data = self.file.read(amt)
+        self.remaining -= len(data)
+        self.on_read(len(data))
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartUploader:
+    """
+    Uploads a file to presigned multipart URLs, several parts at a time.
+
+    Each part is streamed from the file by one of `max_workers` threads over a kept
+    connection and retried on its own when it fails. The ETags of finished parts are
+    recorded in `state_path`, so an upload interrupted halfway goes on with the missing
+    parts when it is started again with URLs of the same upload id. The returned parts
+    are what the checkpoint update API needs to complete the upload.
+    """
+
+    def __init__(self, max_workers: int = UPLOAD_CONCURRENCY, retries: int = UPLOAD_PART_RETRIES,
+                 backoff: float = 1.0, on_progress: Callable[[int, int, float], None] = None,
+                 progress_interval: float = UPLOAD_PROGRESS_INTERVAL,
+                 session_factory: Callable[[], requests.Session] = requests.Session):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.session_factory = session_factory
+        self.local = threading.local()
+
+    def upload(self, local_path: str, signed_urls: List[str], part_size: int,
+               state_path: Optional[str] = None) -> UploadResult:
+        total_bytes = os.path.getsize(local_path)
+        if total_bytes > len(signed_urls) * part_size:
+            raise ValueError(f'{local_path} has {total_bytes} bytes, more than {len(signed_urls)} parts of {part_size}')
+
+        upload_id = _upload_id(signed_urls[0])
+        etags = self._load_state(state_path, upload_id, part_size)
+        part_numbers = [i + 1 for i in range(len(signed_urls)) if i == 0 or i * part_size < total_bytes]
+
+        result = UploadResult(total_bytes=total_bytes,
+                              resumed_parts=len([n for n in part_numbers if n in etags]))
+        lock = threading.Lock()
+        progress = {'sent': sum(self._part_size(n, part_size, total_bytes) for n in part_numbers if n in etags),
+                    'reported_at': 0.0}
+        started_at = time.monotonic()
+
+        def on_read(size):
+            with lock:
+                progress['sent'] += size
+                result.uploaded_bytes += size
+                now = time.monotonic()
+                if now - progress['reported_at'] < self.progress_interval:
+                    return
+                progress['reported_at'] = now
+                sent = progress['sent']
+                throughput = result.uploaded_bytes / max(now - started_at, 1e-6)
+            self._report(local_path, sent, total_bytes, throughput)
+
+        def upload_part(part_number):
+            offset = (part_number - 1) * part_size
+            size = self._part_size(part_number, part_size, total_bytes)
+            etag = self._put_part(signed_urls[part_number - 1], local_path, offset, size, part_number, on_read)
+            with lock:
+                etags[part_number] = etag
+                self._save_state(state_path, upload_id, part_size, etags)
+
+        missing = [n for n in part_numbers if n not in etags]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(upload_part, n) for n in missing]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            except Exception:
+                # parts out of retries fail the upload, the recorded ones are kept for the next attempt
+                for future in futures:
+                    future.cancel()
+                raise
+
+        result.seconds = time.monotonic() - started_at
+        result.parts = [{'ETag': etags[n], 'PartNumber': n} for n in part_numbers]
+        self._report(local_path, total_bytes, total_bytes, result.throughput)
+        if state_path and os.path.exists(state_path):
+            os.remove(state_path)
+        logger.info(f'uploaded {local_path}: {result.summary()}')
+        return result
+
+    def _put_part(self, signed_url: str, local_path: str, offset: int, size: int, part_number: int,
+                  on_read: Callable[[int], None]) -> str:
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.session_factory()
+
+        for attempt in range(self.retries + 1):
+            sent = [0]
+
+            def count(n):
+                sent[0] += n
+                on_read(n)
+
+            reader = _PartReader(local_path, offset, size, count)
+            try:
+                response = session.put(signed_url, data=reader)
+                response.raise_for_status()
+                return response.headers['ETag']
+            except Exception as e:
+                # the bytes of a failed attempt are sent again
+                on_read(-sent[0])
+                logger.warning(f'upload of part {part_number} failed, attempt {attempt + 1}: {e}')
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+            finally:
+                reader.close()
+
+    def _report(self, local_path: str, sent: int, total_bytes: int, throughput: float):
+        logger.info(f'upload {local_path}: {sent}/{total_bytes} bytes, {throughput / 1024 / 1024:.1f} MB/s')
+        if self.on_progress:
+            self.on_progress(sent, total_bytes, throughput)
+
+    @staticmethod
+    def _part_size(part_number: int, part_size: int, total_bytes: int) -> int:
+        return max(0, min(part_size, total_bytes - (part_number - 1) * part_size))
+
+    @staticmethod
+    def _load_state(state_path: Optional[str], upload_id: str, part_size: int) -> Dict[int, str]:
+        if not state_path or not os.path.exists(state_path):
+            return {}
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f'ignore upload state {state_path}: {e}')
+            return {}
+        if state.get('upload_id') != upload_id or state.get('part_size') != part_size:
+            return {}
+        return {int(n): etag for n, etag in state['etags'].items()}
+
+    @staticmethod
+    def _save_state(state_path: Optional[str], upload_id: str, part_size: int, etags: Dict[int, str]):
+        if not state_path:
+            return
+        tmp_path = f'{state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'upload_id': upload_id, 'part_size': part_size, 'etags': etags}, f)
+        os.replace(tmp_path, state_path)
+
+
+def part_size_for(total_bytes: int) -> int:
+    """The part size of a file, parts grow beyond the minimum so that large models fit in UPLOAD_MAX_PARTS."""
+    return max(UPLOAD_MIN_PART_SIZE, math.ceil(total_bytes / UPLOAD_MAX_PARTS))
+
+
+def upload_state_path(local_path: str) -> str:
+    """Where the finished parts of an upload of local_path are recorded, outside the folders the WebUI reads."""
+    state_dir = os.path.join(tempfile.gettempdir(), 'sd-webui-uploads')
+    os.makedirs(state_dir, exist_ok=True)
+    digest = hashlib.sha1(os.path.abspath(local_path).encode()).hexdigest()
+    return os.path.join(state_dir, f'{digest}.parts.json')
+
+
+def _upload_id(signed_url: str) -> str:
+    return parse_qs(urlparse(signed_url).query).get('uploadId', [''])[0]
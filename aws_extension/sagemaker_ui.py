@@ -10,6 +10,7 @@ import gradio as gr
 
 from aws_extension.cloud_api_manager.api_logger import ApiLogger
 from aws_extension.constant import MODEL_TYPE
+from aws_extension.multipart_upload import part_size_for
 
 import utils
 from aws_extension.auth_service.simple_cloud_auth import cloud_auth_manager
@@ -35,6 +36,9 @@ logger.setLevel(utils.LOGGING_LEVEL)
 None_Option_For_On_Cloud_Model = "don't use on cloud inference"
 None_Option_For_Infer_Job = "No Selected"
 
+# seconds the API may hold a job status request until the job completes, it holds at most 10
+INFERENCE_WAIT_SECONDS = 10
+
 inference_job_dropdown = None
 embedding_dropdown = None
 hypernet_dropdown = None
@@ -273,8 +277,11 @@ def query_inference_job_list(task_type: str = '', status: str = '',
         return gr.Dropdown.update(choices=[])
 
 
-def get_inference_job(inference_job_id):
+def get_inference_job(inference_job_id, wait: int = 0):
     url = f'inferences/{inference_job_id}'
+    if wait:
+        # the API holds the request until the job succeeds or fails, or the wait times out
+        url += f'?wait={wait}'
     response = server_request(url)
     logger.debug(f"get_inference_job response {response}")
     infer_id = ""
@@ -526,9 +533,11 @@ def sagemaker_upload_model_s3(sd_checkpoints_path, textual_inversion_path, lora_
             logger.info(f"!!!skip to upload duplicate model {model_name}")
             continue
 
-        part_size = 1000 * 1024 * 1024
         file_size = os.stat(lp)
-        parts_number = math.ceil(file_size.st_size / part_size)
+        # room for the tar headers and the yaml that may be packed with the model
+        tar_size = file_size.st_size + 1024 * 1024
+        part_size = part_size_for(tar_size)
+        parts_number = math.ceil(tar_size / part_size)
         logger.info(f'!!!!!!!!!!{file_size} {parts_number}')
 
         # local_tar_path = f'{model_name}.tar'
@@ -590,10 +599,12 @@ def sagemaker_upload_model_s3(sd_checkpoints_path, textual_inversion_path, lora_
             else:
                 tar(mode='c', archive=local_tar_path, sfiles=[local_model_path_in_repo], verbose=True)
 
+            throughput = {}
             multiparts_tags = upload_multipart_files_to_s3_by_signed_url(
                 local_tar_path,
                 s3_signed_urls_resp,
-                part_size
+                part_size,
+                on_progress=lambda sent, total, bytes_per_second: throughput.update(speed=bytes_per_second)
             )
             logger.debug(f"multiparts_tags {multiparts_tags}")
 
@@ -605,7 +616,7 @@ def sagemaker_upload_model_s3(sd_checkpoints_path, textual_inversion_path, lora_
             response = requests.put(url=f"{url}/{checkpoint_id}", json=payload, headers={'x-api-key': api_key})
             logger.debug(response)
 
-            log = f"finish upload {local_tar_path} to {s3_base}"
+            log = f"finish upload {local_tar_path} to {s3_base}, {throughput.get('speed', 0) / 1024 / 1024:.1f} MB/s"
 
             # os.system(f"rm {local_tar_path}")
             rm(local_tar_path, recursive=True)
@@ -720,8 +731,11 @@ def process_result_by_inference_id(inference_id_or_data, endpoint_type):
 
         if resp['taskType'] in ['txt2img', 'img2img', 'interrogate_clip', 'interrogate_deepbooru']:
             while resp and resp['status'] == "inprogress":
-                time.sleep(1)
-                resp = get_inference_job(inference_id)
+                requested_at = time.time()
+                resp = get_inference_job(inference_id, wait=INFERENCE_WAIT_SECONDS)
+                # older APIs ignore wait and answer at once
+                if resp and resp['status'] == "inprogress" and time.time() - requested_at < 1:
+                    time.sleep(1)
             if resp is None:
                 logger.info(f"get_inference_job resp is null.")
                 return image_list, info_text, plaintext_to_html(infotexts), infotexts
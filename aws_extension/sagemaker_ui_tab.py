@@ -763,6 +763,8 @@ def model_upload_tab():
             per_page = resp.json()['data']['per_page']
             total = resp.json()['data']['total']
             pages = resp.json()['data']['pages']
+            if resp.json()['data'].get('truncated'):
+                total = f"{total}+"
 
             if len(resp.json()['data']['checkpoints']) == 0:
                 return default_list, show_page_info, 'No data'
@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+from aws_extension.cloudwatch_metrics import MetricsPublisher
+
+
+class CaptureCloudWatch:
+
+    def __init__(self):
+        self.requests = []
+
+    def put_metric_data(self, Namespace, MetricData):
+        self.requests.append((Namespace, MetricData))
+        return {}
+
+
+class MetricsPublisherTest(TestCase):
+
+    def test_datapoints_are_aggregated(self):
+        client = CaptureCloudWatch()
+        publisher = MetricsPublisher(client=client, start=False)
+
+        for value in [3, 1, 2]:
+            publisher.put('InferenceLatency', [{'Name': 'Endpoint', 'Value': 'ep'}], value, 'Milliseconds')
+        publisher.put('InferenceTotal', [{'Name': 'Endpoint', 'Value': 'ep'}, {'Name': 'Instance', 'Value': 'i'}])
+
+        self.assertEqual(client.requests, [])
+        publisher.flush()
+
+        self.assertEqual(len(client.requests), 1)
+        namespace, data = client.requests[0]
+        self.assertEqual(namespace, 'ESD')
+        latency = next(d for d in data if d['MetricName'] == 'InferenceLatency')
+        self.assertEqual(latency['StatisticValues'], {'SampleCount': 3, 'Sum': 6, 'Minimum': 1, 'Maximum': 3})
+        self.assertEqual(latency['Unit'], 'Milliseconds')
+        total = next(d for d in data if d['MetricName'] == 'InferenceTotal')
+        self.assertEqual(total['Dimensions'], [{'Name': 'Endpoint', 'Value': 'ep'}, {'Name': 'Instance', 'Value': 'i'}])
+
+        publisher.flush()
+        self.assertEqual(len(client.requests), 1)
+
+    def test_publish_errors_are_swallowed(self):
+        class BrokenCloudWatch:
+            def put_metric_data(self, **kwargs):
+                raise Exception('throttled')
+
+        publisher = MetricsPublisher(client=BrokenCloudWatch(), start=False)
+        publisher.put('InferenceTotal', [{'Name': 'Endpoint', 'Value': 'ep'}])
+        publisher.flush()
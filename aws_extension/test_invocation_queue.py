@@ -0,0 +1,130 @@
+import threading
+import time
+from unittest import TestCase
+
+from aws_extension.invocation_queue import InvocationQueue, QueueFull, QueueTimeout
+
+
+class FakeSdApi:
+    """Stands in for the sdapi endpoints, each call blocks until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.releases = {}
+
+    def call(self, task, name):
+        self.calls.append(name)
+        self.releases.setdefault(name, threading.Event()).wait(5)
+        return {'task': task}
+
+    def release(self, name):
+        self.releases.setdefault(name, threading.Event()).set()
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class InvocationQueueTest(TestCase):
+
+    def setUp(self):
+        self.sdapi = FakeSdApi()
+        self.errors = {}
+        self.threads = []
+
+    def tearDown(self):
+        for name in list(self.sdapi.releases) + ['a', 'b', 'c', 'd', 'e']:
+            self.sdapi.release(name)
+        for thread in self.threads:
+            thread.join(5)
+
+    def invoke(self, queue, task, name):
+        def run():
+            try:
+                with queue.slot(task):
+                    self.sdapi.call(task, name)
+            except Exception as e:
+                self.errors[name] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('condition not met')
+
+    def test_quick_tasks_run_before_waiting_generations(self):
+        queue = InvocationQueue(concurrency=1, max_queued=10, aging=0)
+        self.invoke(queue, 'txt2img', 'a')
+        self.wait_for(lambda: self.sdapi.calls == ['a'])
+        self.invoke(queue, 'txt2img', 'b')
+        self.wait_for(lambda: queue.stats()['waiting'] == 1)
+        self.invoke(queue, 'interrogate_clip', 'c')
+        self.wait_for(lambda: queue.stats()['waiting'] == 2)
+
+        self.sdapi.release('a')
+        self.wait_for(lambda: len(self.sdapi.calls) == 2)
+        self.sdapi.release('c')
+        self.wait_for(lambda: len(self.sdapi.calls) == 3)
+
+        self.assertEqual(self.sdapi.calls, ['a', 'c', 'b'])
+        stats = queue.stats()
+        self.assertEqual(stats['wait_seconds']['txt2img']['count'], 2)
+        self.assertEqual(stats['wait_seconds']['interrogate_clip']['count'], 1)
+
+    def test_full_queue_rejects_or_sheds(self):
+        queue = InvocationQueue(concurrency=1, max_queued=1, aging=0)
+        self.invoke(queue, 'txt2img', 'a')
+        self.wait_for(lambda: self.sdapi.calls == ['a'])
+        self.invoke(queue, 'txt2img', 'b')
+        self.wait_for(lambda: queue.stats()['waiting'] == 1)
+
+        self.invoke(queue, 'img2img', 'c').join(5)
+        self.assertIsInstance(self.errors['c'], QueueFull)
+
+        self.invoke(queue, 'rembg', 'd')
+        self.wait_for(lambda: 'b' in self.errors)
+        self.assertIsInstance(self.errors['b'], QueueFull)
+        self.assertEqual(queue.stats()['rejected'], {'img2img': 1, 'txt2img': 1})
+
+        self.sdapi.release('a')
+        self.wait_for(lambda: self.sdapi.calls == ['a', 'd'])
+
+    def test_max_wait(self):
+        queue = InvocationQueue(concurrency=1, max_wait=0.05, aging=0)
+        self.invoke(queue, 'txt2img', 'a')
+        self.wait_for(lambda: self.sdapi.calls == ['a'])
+
+        started = time.monotonic()
+        self.invoke(queue, 'txt2img', 'b').join(5)
+
+        self.assertIsInstance(self.errors['b'], QueueTimeout)
+        self.assertEqual(self.errors['b'].status_code, 503)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(queue.stats()['waiting'], 0)
+
+    def test_waiting_generation_ages_into_priority(self):
+        clock = FakeClock()
+        queue = InvocationQueue(concurrency=1, aging=100, clock=clock)
+        self.invoke(queue, 'txt2img', 'a')
+        self.wait_for(lambda: self.sdapi.calls == ['a'])
+        self.invoke(queue, 'txt2img', 'b')
+        self.wait_for(lambda: queue.stats()['waiting'] == 1)
+
+        clock.now = 250
+        self.invoke(queue, 'rembg', 'c')
+        self.wait_for(lambda: queue.stats()['waiting'] == 2)
+
+        self.sdapi.release('a')
+        self.wait_for(lambda: len(self.sdapi.calls) == 2)
+        self.assertEqual(self.sdapi.calls, ['a', 'b'])
@@ -0,0 +1,162 @@
+import glob
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from aws_extension.model_cache import ModelCache
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class ModelCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.models_path = {
+            'Stable-diffusion': os.path.join(self.tmp.name, 'Stable-diffusion'),
+            'Lora': os.path.join(self.tmp.name, 'Lora'),
+        }
+        for path in self.models_path.values():
+            os.makedirs(path)
+        self.capacity = 100
+        self.downloads = []
+        self.sizes = {}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_model(self, model_type, name, size):
+        with open(os.path.join(self.models_path[model_type], name), 'wb') as f:
+            f.write(b'0' * size)
+
+    def free_space(self, path):
+        used = sum(os.path.getsize(path) for path in glob.glob(os.path.join(self.tmp.name, '**'), recursive=True)
+                   if os.path.isfile(path))
+        return self.capacity - used
+
+    def download(self, model_type, s3_pos):
+        name = s3_pos.split('/')[-1]
+        self.downloads.append((model_type, name))
+        self.write_model(model_type, name, self.sizes.get(name, 10))
+
+    def cache(self, **kwargs):
+        return ModelCache(self.models_path, downloader=self.download, disk_path=self.tmp.name,
+                          free_space=self.free_space, clock=FakeClock(), pinned='', **kwargs)
+
+    def test_hit_and_miss(self):
+        self.write_model('Lora', 'a.safetensors', 10)
+        cache = self.cache()
+
+        self.assertTrue(cache.ensure('Lora', 'a.safetensors', 's3://bucket/a.safetensors'))
+        self.assertTrue(cache.ensure('Lora', 'b.safetensors', 's3://bucket/b.safetensors'))
+        self.assertTrue(cache.ensure('Lora', 'b.safetensors', 's3://bucket/b.safetensors'))
+
+        self.assertEqual(self.downloads, [('Lora', 'b.safetensors')])
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['used_bytes'], 20)
+
+    def test_small_model_does_not_evict_base_model(self):
+        self.write_model('Stable-diffusion', 'base.safetensors', 60)
+        self.write_model('Lora', 'old.safetensors', 10)
+        self.write_model('Lora', 'older.safetensors', 10)
+        cache = self.cache()
+        # base model is the least recently used one
+        cache.ensure('Stable-diffusion', 'base.safetensors', 's3://bucket/base.safetensors')
+        cache.ensure('Lora', 'older.safetensors', 's3://bucket/older.safetensors')
+        cache.ensure('Lora', 'old.safetensors', 's3://bucket/old.safetensors')
+        cache.index[('Stable-diffusion', 'base.safetensors')].last_used = 0
+
+        # 20 free, needs 30
+        self.assertTrue(cache.ensure('Lora', 'new.safetensors', 's3://bucket/new.safetensors', space_free_size=30))
+
+        self.assertTrue(cache.contains('Stable-diffusion', 'base.safetensors'))
+        self.assertFalse(cache.contains('Lora', 'older.safetensors'))
+        self.assertTrue(cache.contains('Lora', 'old.safetensors'))
+        self.assertTrue(cache.contains('Lora', 'new.safetensors'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_large_need_evicts_least_recently_used(self):
+        self.write_model('Stable-diffusion', 'a.safetensors', 40)
+        self.write_model('Stable-diffusion', 'b.safetensors', 40)
+        cache = self.cache()
+        cache.ensure('Stable-diffusion', 'a.safetensors', 's3://bucket/a.safetensors')
+        cache.ensure('Stable-diffusion', 'b.safetensors', 's3://bucket/b.safetensors')
+
+        self.sizes['c.safetensors'] = 40
+        self.assertTrue(cache.ensure('Stable-diffusion', 'c.safetensors', 's3://bucket/c.safetensors',
+                                     space_free_size=40))
+
+        self.assertFalse(cache.contains('Stable-diffusion', 'a.safetensors'))
+        self.assertTrue(cache.contains('Stable-diffusion', 'b.safetensors'))
+
+    def test_pinned_and_protected_models_are_kept(self):
+        self.write_model('Stable-diffusion', 'pinned.safetensors', 40)
+        self.write_model('Stable-diffusion', 'used.safetensors', 40)
+        cache = self.cache()
+        cache.pin('Stable-diffusion', 'pinned.safetensors')
+
+        protected = {('Stable-diffusion', 'used.safetensors'), ('Lora', 'new.safetensors')}
+        self.assertFalse(cache.ensure('Lora', 'new.safetensors', 's3://bucket/new.safetensors',
+                                      space_free_size=40, protected=protected))
+        self.assertEqual(self.downloads, [])
+
+        self.assertTrue(cache.ensure('Lora', 'new.safetensors', 's3://bucket/new.safetensors',
+                                     space_free_size=40))
+        self.assertFalse(cache.contains('Stable-diffusion', 'used.safetensors'))
+        self.assertTrue(cache.contains('Stable-diffusion', 'pinned.safetensors'))
+
+    def test_budget(self):
+        self.write_model('Lora', 'a.safetensors', 10)
+        self.write_model('Lora', 'b.safetensors', 10)
+        cache = self.cache(budget=25)
+        cache.ensure('Lora', 'a.safetensors', 's3://bucket/a.safetensors')
+        cache.ensure('Lora', 'b.safetensors', 's3://bucket/b.safetensors')
+
+        self.assertTrue(cache.make_space(incoming_size=10))
+        self.assertFalse(cache.contains('Lora', 'a.safetensors'))
+        self.assertEqual(cache.used_bytes(), 10)
+
+    def test_index_follows_external_changes(self):
+        cache = self.cache()
+        self.assertFalse(cache.contains('Lora', 'a.safetensors'))
+
+        self.write_model('Lora', 'a.safetensors', 10)
+        os.makedirs(os.path.join(self.models_path['Lora'], 'sub'))
+        self.write_model('Lora', os.path.join('sub', 'b.safetensors'), 10)
+        self.assertTrue(cache.contains('Lora', 'a.safetensors'))
+        self.assertTrue(cache.contains('Lora', os.path.join('sub', 'b.safetensors')))
+
+        os.remove(os.path.join(self.models_path['Lora'], 'a.safetensors'))
+        self.assertFalse(cache.contains('Lora', 'a.safetensors'))
+
+    def test_lookups_do_not_walk_the_model_folders(self):
+        self.write_model('Lora', 'a.safetensors', 10)
+        self.write_model('Stable-diffusion', 'base.safetensors', 50)
+        cache = self.cache()
+        self.assertTrue(cache.contains('Lora', 'a.safetensors'))
+        cache.make_space()
+
+        with patch('aws_extension.model_cache.os.walk', wraps=os.walk) as walk:
+            for _ in range(10):
+                self.assertTrue(cache.ensure('Lora', 'a.safetensors', 's3://bucket/a.safetensors'))
+                cache.make_space(space_free_size=30)
+            self.assertEqual(walk.call_count, 0)
+
+            # a download walks the folder it went to once, an eviction none
+            self.sizes['b.safetensors'] = 30
+            self.assertTrue(cache.ensure('Lora', 'b.safetensors', 's3://bucket/b.safetensors', space_free_size=70))
+            self.assertEqual(walk.call_count, 1)
+            self.assertFalse(cache.contains('Stable-diffusion', 'base.safetensors'))
+            self.assertEqual(walk.call_count, 1)
+
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import parse_qs, urlparse
+
+from aws_extension.multipart_upload import UPLOAD_MAX_PARTS, UPLOAD_MIN_PART_SIZE, MultipartUploader, \
+    part_size_for, upload_state_path
+
+
+class PresignedPartHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        query = parse_qs(urlparse(self.path).query)
+        part_number = int(query['partNumber'][0])
+        assert 'chunked' not in (self.headers.get('Transfer-Encoding') or '')
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.requests.append(part_number)
+            failing = server.failures.get(part_number, 0) > 0
+            if failing:
+                server.failures[part_number] -= 1
+        time.sleep(server.seconds)
+        with server.lock:
+            server.in_flight -= 1
+            if not failing:
+                server.parts[part_number] = body
+
+        if failing:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', f'"{hashlib.md5(body).hexdigest()}"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class PresignedUrlServer:
+    """Stands in for S3 presigned upload_part URLs, optionally failing the first attempts of some parts."""
+
+    def __init__(self, seconds=0.0, failures=None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PresignedPartHandler)
+        self.server.seconds = seconds
+        self.server.failures = dict(failures or {})
+        self.server.lock = threading.Lock()
+        self.server.parts = {}
+        self.server.requests = []
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def urls(self, count, upload_id='upload-1'):
+        port = self.server.server_port
+        return [f'http://127.0.0.1:{port}/model.tar?partNumber={i + 1}&uploadId={upload_id}' for i in range(count)]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MultipartUploaderTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'model.tar')
+        self.content = os.urandom(10 * 1000 + 123)
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.state_path = f'{self.path}.parts.json'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parts_are_sent_concurrently(self):
+        server = PresignedUrlServer(seconds=0.1)
+        progress = []
+        uploader = MultipartUploader(max_workers=4, on_progress=lambda *args: progress.append(args),
+                                     progress_interval=0)
+        try:
+            result = uploader.upload(self.path, server.urls(12), 1000, state_path=self.state_path)
+        finally:
+            server.stop()
+
+        # the last url is not needed for 10123 bytes
+        self.assertEqual([p['PartNumber'] for p in result.parts], list(range(1, 12)))
+        self.assertEqual(b''.join(server.server.parts[n] for n in range(1, 12)), self.content)
+        self.assertEqual(server.server.max_in_flight, 4)
+        # 11 parts of 100ms on 4 workers
+        self.assertLess(result.seconds, 0.6)
+        self.assertEqual(progress[-1][:2], (len(self.content), len(self.content)))
+        self.assertGreater(result.throughput, 0)
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_failed_part_is_retried_alone(self):
+        server = PresignedUrlServer(failures={3: 2})
+        uploader = MultipartUploader(max_workers=2, backoff=0.01)
+        try:
+            result = uploader.upload(self.path, server.urls(11), 1000)
+        finally:
+            server.stop()
+
+        self.assertEqual(server.server.requests.count(3), 3)
+        self.assertEqual(server.server.requests.count(4), 1)
+        self.assertEqual(result.uploaded_bytes, len(self.content))
+        self.assertEqual(result.parts[2]['ETag'], f'"{hashlib.md5(self.content[2000:3000]).hexdigest()}"')
+
+    def test_interrupted_upload_resumes_from_recorded_etags(self):
+        server = PresignedUrlServer(failures={5: 10})
+        try:
+            with self.assertRaises(Exception):
+                MultipartUploader(max_workers=1, retries=0).upload(self.path, server.urls(11), 1000,
+                                                                   state_path=self.state_path)
+            self.assertTrue(os.path.exists(self.state_path))
+            sent_before = list(server.server.requests)
+            server.server.failures = {}
+
+            result = MultipartUploader(max_workers=1).upload(self.path, server.urls(11), 1000,
+                                                             state_path=self.state_path)
+        finally:
+            server.stop()
+
+        resent = server.server.requests[len(sent_before):]
+        # the parts before the failed one are not sent again, queued parts were cancelled
+        self.assertEqual(resent[0], 5)
+        self.assertFalse({1, 2, 3, 4} & set(resent))
+        self.assertLess(len(sent_before), 11)
+        self.assertEqual(result.resumed_parts, 11 - len(resent))
+        self.assertEqual(len(result.parts), 11)
+        self.assertEqual(b''.join(server.server.parts[n] for n in range(1, 12)), self.content)
+
+    def test_other_upload_does_not_reuse_recorded_etags(self):
+        server = PresignedUrlServer()
+        try:
+            MultipartUploader().upload(self.path, server.urls(11), 1000, state_path=self.state_path)
+            with open(self.state_path, 'w') as f:
+                f.write('{"upload_id": "upload-1", "part_size": 1000, "etags": {"1": "old"}}')
+
+            result = MultipartUploader().upload(self.path, server.urls(11, 'upload-2'), 1000,
+                                                state_path=self.state_path)
+        finally:
+            server.stop()
+
+        self.assertEqual(result.resumed_parts, 0)
+        self.assertNotEqual(result.parts[0]['ETag'], 'old')
+
+    def test_file_larger_than_the_parts_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MultipartUploader().upload(self.path, ['http://127.0.0.1/?partNumber=1'], 1000)
+
+    def test_large_models_fit_in_the_parts_accepted_by_the_api(self):
+        self.assertEqual(part_size_for(2 * 1024 ** 3), UPLOAD_MIN_PART_SIZE)
+        for total_bytes in [10 * 1024 ** 3 + 1, 30 * 1024 ** 3]:
+            part_size = part_size_for(total_bytes)
+            self.assertLessEqual(-(-total_bytes // part_size), UPLOAD_MAX_PARTS)
+
+    def test_state_is_kept_out_of_the_model_folder(self):
+        state_path = upload_state_path(self.path)
+
+        self.assertNotEqual(os.path.dirname(state_path), os.path.dirname(self.path))
+        self.assertEqual(state_path, upload_state_path(self.path))
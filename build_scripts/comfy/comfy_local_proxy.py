@@ -182,7 +182,7 @@ def handle_sync_messages(server_use, msg_array):
                 already_synced = True
             elif event == 'executed':
                 global need_resend_msg_result
-                need_resend_msg_result.append(msg)
+                need_resend_msg_result.append([item_msg])
             server_use.send_sync(event, data, sid)
 
     return already_synced
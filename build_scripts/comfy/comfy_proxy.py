@@ -17,6 +17,7 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import subprocess
 from dotenv import load_dotenv
+from model_sync import ManifestSync, SyncDebouncer
 
 import fcntl
 import hashlib
@@ -204,7 +205,7 @@ if is_on_ec2:
                     already_synced = True
                 elif event == 'executed':
                     global need_resend_msg_result
-                    need_resend_msg_result.append(msg)
+                    need_resend_msg_result.append([item_msg])
                 server_use.send_sync(event, data, sid)
 
         return already_synced
@@ -524,42 +525,57 @@ if is_on_ec2:
         #         os.remove(tar_filepath)
 
 
+    manifest_sync = ManifestSync(boto3.client('s3'), bucket_name, hash_file=calculate_file_hash)
+
+
+    def get_sync_dirs():
+        # prepare type -> local folder, folder name under the prepare version, excluded files
+        return {
+            'nodes': (DIR2, 'custom_nodes', ['*comfy_local_proxy.py']),
+            'inputs': (DIR3, 'input', []),
+            'models': (DIR1, 'models', []),
+        }
+
+
+    def get_sync_type(filepath):
+        directory = os.path.dirname(filepath)
+        for prepare_type, (local_dir, _, _) in get_sync_dirs().items():
+            if (str(directory).endswith(f"{local_dir}" if local_dir.startswith("/") else f"/{local_dir}")
+                    or str(filepath) == local_dir or str(filepath) == f'./{local_dir}' or f"{local_dir}/" in filepath):
+                return prepare_type
+        return None
+
+
+    def sync_to_s3(comfy_endpoint, prepare_version, prepare_type):
+        local_dir, folder, excludes = get_sync_dirs()[prepare_type]
+        logger.info(f"sync {prepare_type} files start {local_dir}")
+        return manifest_sync.sync(local_dir, f"comfy/{comfy_endpoint}/{prepare_version}/{folder}/", excludes=excludes)
+
+
+    def send_prepare(comfy_endpoint, prepare_version, prepare_type, need_reboot):
+        url = api_url + "prepare"
+        logger.info(f"URL:{url}")
+        data = {"endpoint_name": comfy_endpoint, "need_reboot": need_reboot, "prepare_id": prepare_version,
+                "prepare_type": prepare_type}
+        logger.info(f"prepare params Data: {json.dumps(data, indent=4)}")
+        result = subprocess.run(["curl", "--location", "--request", "POST", url, "--header",
+                                 f"x-api-key: {api_token}", "--data-raw", json.dumps(data)],
+                                capture_output=True, text=True)
+        logger.info(result.stdout)
+        return result.stdout
+
+
     def sync_default_files(comfy_endpoint, prepare_type):
         try:
             timestamp = str(int(time.time() * 1000))
             prepare_version = PREPARE_ID if PREPARE_MODE == 'additional' else timestamp
-            need_prepare = True
             need_reboot = False
-            # logger.info(f" sync custom nodes files")
-            # s5cmd_syn_node_command = f's5cmd --log=error sync --delete=true --exclude="*comfy_local_proxy.py" {DIR2}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{timestamp}/custom_nodes/"'
-            # logger.info(f"sync custom_nodes files start {s5cmd_syn_node_command}")
-            # os.system(s5cmd_syn_node_command)
-            # compress_and_upload(comfy_endpoint, f"{DIR2}", prepare_version)
             if prepare_type in ['default', 'inputs']:
-                logger.info(f" sync input files")
-                # s5cmd_syn_input_command = f's5cmd --log=error sync --delete=true {DIR3}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/input/"'
-                s5cmd_syn_input_command = f'aws s3 sync --delete {DIR3}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/input/"'
-                logger.info(f"sync input files start {s5cmd_syn_input_command}")
-                os.system(s5cmd_syn_input_command)
+                sync_to_s3(comfy_endpoint, prepare_version, 'inputs')
             if prepare_type in ['default', 'models']:
-                logger.info(f" sync models files")
-                # s5cmd_syn_model_command = f's5cmd --log=error sync --delete=true {DIR1}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/models/"'
-                s5cmd_syn_model_command = f'aws s3 sync --delete {DIR1}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/models/"'
-                logger.info(f"sync models files start {s5cmd_syn_model_command}")
-                os.system(s5cmd_syn_model_command)
-            logger.info(f"Files changed in:: {need_prepare} {prepare_type} {DIR2} {DIR1} {DIR3}")
-
-            url = api_url + "prepare"
-            logger.info(f"URL:{url}")
-            data = {"endpoint_name": comfy_endpoint, "need_reboot": need_reboot, "prepare_id": prepare_version,
-                    "prepare_type": prepare_type}
-            logger.info(f"prepare params Data: {json.dumps(data, indent=4)}")
-            result = subprocess.run(["curl", "--location", "--request", "POST", url, "--header",
-                                     f"x-api-key: {api_token}", "--data-raw", json.dumps(data)],
-                                    capture_output=True, text=True)
-            logger.info(result.stdout)
-
-            return result.stdout
+                sync_to_s3(comfy_endpoint, prepare_version, 'models')
+            logger.info(f"Files changed in:: {prepare_type} {DIR2} {DIR1} {DIR3}")
+            return send_prepare(comfy_endpoint, prepare_version, prepare_type, need_reboot)
         except Exception as e:
             logger.info(f"sync_files error {e}")
             return None
@@ -575,98 +591,45 @@ if is_on_ec2:
                 return None
             timestamp = str(int(time.time() * 1000))
             logger.info(f"Files changed in: {filepath} time is:{timestamp}")
-            need_prepare = False
-            prepare_type = 'inputs'
-            need_reboot = False
             for ignore_item in no_need_sync_files:
                 if filepath.endswith(ignore_item):
                     logger.info(f"no need to sync files by ignore files {filepath} ends by {ignore_item}")
                     return None
-            prepare_version = PREPARE_ID if PREPARE_MODE == 'additional' else timestamp
-            if (str(directory).endswith(f"{DIR2}" if DIR2.startswith("/") else f"/{DIR2}")
-                    or str(filepath) == DIR2 or str(filepath) == f'./{DIR2}' or f"{DIR2}/" in filepath):
-                logger.info(f" sync custom nodes files: {filepath}")
-                s5cmd_syn_node_command = f's5cmd --log=error sync --delete=true --exclude="*comfy_local_proxy.py" {DIR2}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/custom_nodes/"'
-                # s5cmd_syn_node_command = f'aws s3 sync {DIR2}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{timestamp}/custom_nodes/"'
-                # s5cmd_syn_node_command = f's5cmd sync {DIR2}/* "s3://{bucket_name}/comfy/{comfy_endpoint}/{timestamp}/custom_nodes/"'
-
-                # custom_node文件夹有变化 稍后再同步
-                if is_auto and not is_folder_unlocked(directory):
-                    logger.info("sync custom_nodes files is changing ,waiting.... ")
+            prepare_type = get_sync_type(filepath)
+            if not prepare_type:
+                return None
+
+            # 判断文件写完后再同步
+            if is_auto:
+                if prepare_type == 'nodes':
+                    can_sync = is_folder_unlocked(directory)
+                elif bool(is_folder):
+                    can_sync = is_folder_unlocked(filepath)
+                else:
+                    can_sync = is_file_unlocked(filepath)
+                if not can_sync:
+                    logger.info(f"sync {prepare_type} files is changing ,waiting.... ")
                     return None
-                logger.info("sync custom_nodes files start")
-                logger.info(s5cmd_syn_node_command)
-                os.system(s5cmd_syn_node_command)
-                need_prepare = True
-                need_reboot = True
-                prepare_type = 'nodes'
-            elif (str(directory).endswith(f"{DIR3}" if DIR3.startswith("/") else f"/{DIR3}")
-                  or str(filepath) == DIR3 or str(filepath) == f'./{DIR3}' or f"{DIR3}/" in filepath):
-                logger.info(f" sync input files: {filepath}")
-                s5cmd_syn_input_command = f'aws s3 sync --delete {DIR3}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/input/"'
-                # s5cmd_syn_input_command = f'/usr/local/bin/s5cmd sync {DIR3}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/input/"'
-
-                # 判断文件写完后再同步
-                if is_auto:
-                    if bool(is_folder):
-                        can_sync = is_folder_unlocked(filepath)
-                    else:
-                        can_sync = is_file_unlocked(filepath)
-                    if not can_sync:
-                        logger.info("sync input files is changing ,waiting.... ")
-                        return None
-                logger.info("sync input files start")
-                logger.info(s5cmd_syn_input_command)
-                os.system(s5cmd_syn_input_command)
-                # result = subprocess.run(s5cmd_syn_input_command, shell=True, check=True, stdout=subprocess.PIPE)
-                # logger.info(result.stdout.decode())
-                need_prepare = True
-                prepare_type = 'inputs'
-            elif (str(directory).endswith(f"{DIR1}" if DIR1.startswith("/") else f"/{DIR1}")
-                  or str(filepath) == DIR1 or str(filepath) == f'./{DIR1}' or f"{DIR1}/" in filepath):
-                logger.info(f" sync models files: {filepath}")
-                s5cmd_syn_model_command = f'aws s3 sync --delete {DIR1}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/models/"'
-                # s5cmd_syn_model_command = f'/usr/local/bin/s5cmd sync {DIR1}/ "s3://{bucket_name}/comfy/{comfy_endpoint}/{prepare_version}/models/"'
-
-                # 判断文件写完后再同步
-                if is_auto:
-                    if bool(is_folder):
-                        can_sync = is_folder_unlocked(filepath)
-                    else:
-                        can_sync = is_file_unlocked(filepath)
-                    # logger.info(f'is folder {directory} {is_folder} can_sync {can_sync}')
-                    if not can_sync:
-                        logger.info("sync input models is changing ,waiting.... ")
-                        return None
-
-                logger.info("sync models files start")
-                logger.info(s5cmd_syn_model_command)
-                os.system(s5cmd_syn_model_command)
-                # result = subprocess.run(s5cmd_syn_model_command, shell=True, check=True, stdout=subprocess.PIPE)
-                # logger.info(result.stdout.decode())
-                need_prepare = True
-                prepare_type = 'models'
+
+            prepare_version = PREPARE_ID if PREPARE_MODE == 'additional' else timestamp
+            sync_result = sync_to_s3(comfy_endpoint, prepare_version, prepare_type)
             timestamp_sync = str(int(time.time() * 1000))
-            logger.info(f"Files changed in:: {need_prepare} {str(directory)} {DIR2} {DIR1} {DIR3}, time is:{timestamp_sync}")
-            if need_prepare:
-                url = api_url + "prepare"
-                logger.info(f"URL:{url}")
-                data = {"endpoint_name": comfy_endpoint, "need_reboot": need_reboot, "prepare_id": prepare_version,
-                        "prepare_type": prepare_type}
-                logger.info(f"prepare params Data: {json.dumps(data, indent=4)}")
-                result = subprocess.run(["curl", "--location", "--request", "POST", url, "--header",
-                                         f"x-api-key: {api_token}", "--data-raw", json.dumps(data)],
-                                        capture_output=True, text=True)
-                logger.info(result.stdout)
-                timestamp_prepare = str(int(time.time() * 1000))
-                logger.info(f"finish prepare in : {timestamp_prepare}")
-                return result.stdout
-            return None
+            logger.info(f"Files changed in:: {sync_result.changed} {str(directory)} {DIR2} {DIR1} {DIR3}, time is:{timestamp_sync}")
+            if not sync_result.changed:
+                return None
+            result = send_prepare(comfy_endpoint, prepare_version, prepare_type, prepare_type == 'nodes')
+            timestamp_prepare = str(int(time.time() * 1000))
+            logger.info(f"finish prepare in : {timestamp_prepare}")
+            return result
         except Exception as e:
             logger.info(f"sync_files error {e}")
             return None
 
 
+    # bursts of changes in a folder end up in one sync of the folder once it settles
+    sync_debouncer = SyncDebouncer(lambda prepare_type: sync_files(get_sync_dirs()[prepare_type][0], True, False))
+
+
     def is_folder_unlocked(directory):
         # logger.info("check if folder ")
         event_handler = MyHandlerWithCheck()
@@ -736,15 +699,24 @@ if is_on_ec2:
     class MyHandlerWithSync(FileSystemEventHandler):
         def on_modified(self, event):
             logger.info(f"{datetime.datetime.now()} files modified ，start to sync {event}")
-            sync_files(event.src_path, event.is_directory, True)
+            sync_later(event.src_path)
 
         def on_created(self, event):
             logger.info(f"{datetime.datetime.now()} files added ，start to sync {event}")
-            sync_files(event.src_path, event.is_directory, True)
+            sync_later(event.src_path)
 
         def on_deleted(self, event):
             logger.info(f"{datetime.datetime.now()} files deleted ，start to sync {event}")
-            sync_files(event.src_path, event.is_directory, True)
+            sync_later(event.src_path)
+
+
+    def sync_later(filepath):
+        for ignore_item in no_need_sync_files:
+            if filepath.endswith(ignore_item):
+                return
+        prepare_type = get_sync_type(filepath)
+        if prepare_type:
+            sync_debouncer.touch(prepare_type)
 
 
     stop_event = threading.Event()
@@ -1612,6 +1584,7 @@ if is_on_ec2:
                             body=json.dumps({"result": True, "message": "Comfy will be restored in 2 seconds,it may take a few minutes"}))
 
 if is_on_sagemaker:
+    from message_batcher import MessageBatcher
 
     global need_sync
     global prompt_id
@@ -1647,6 +1620,7 @@ if is_on_sagemaker:
 
     ROOT_PATH = '/home/ubuntu/ComfyUI'
     sqs_client = boto3.client('sqs', region_name=REGION)
+    message_batcher = MessageBatcher(sqs_client, QUEUE_URL)
 
     GC_WAIT_TIME = 1800
 
@@ -1672,16 +1646,6 @@ if is_on_sagemaker:
         return web.Response(status=200, content_type='application/json', body=json.dumps(body))
 
 
-    def sen_sqs_msg(message_body, prompt_id_key):
-        response = sqs_client.send_message(
-            QueueUrl=QUEUE_URL,
-            MessageBody=json.dumps(message_body),
-            MessageGroupId=prompt_id_key
-        )
-        message_id = response['MessageId']
-        return message_id
-
-
     def sen_finish_sqs_msg(prompt_id_key):
         global need_sync
         # logger.info(f"sen_finish_sqs_msg start... {need_sync},{prompt_id_key}")
@@ -1689,8 +1653,9 @@ if is_on_sagemaker:
             message_body = {'prompt_id': prompt_id_key, 'event': 'finish',
                             'data': {"node": None, "prompt_id": prompt_id_key},
                             'sid': None}
-            message_id = sen_sqs_msg(message_body, prompt_id_key)
-            logger.info(f"finish message sent {message_id}")
+            # goes out after the buffered messages of the prompt
+            message_batcher.put(prompt_id_key, message_body)
+            logger.info(f"finish message sent {prompt_id_key}")
 
 
     async def prepare_comfy_env(sync_item: dict):
@@ -2185,8 +2150,8 @@ if is_on_sagemaker:
                 data = args[2]
                 sid = args[3] if len(args) == 4 else None
                 message_body = {'prompt_id': prompt_id, 'event': event, 'data': data, 'sid': sid}
-                message_id = sen_sqs_msg(message_body, prompt_id)
-                logger.info(f'send_sync_proxy message_id :{message_id} message_body: {message_body}')
+                message_batcher.put(prompt_id, message_body)
+                logger.info(f'send_sync_proxy message_body: {message_body}')
             logger.debug(f"send_sync_proxy end...")
 
         return wrapper
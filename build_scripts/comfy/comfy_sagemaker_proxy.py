@@ -3,6 +3,7 @@ import datetime
 import json
 import logging
 import os
+import shutil
 import sys
 import tarfile
 import time
@@ -18,11 +19,11 @@ import folder_paths
 from aiohttp import web
 from boto3.dynamodb.conditions import Key
 import comfy
+from message_batcher import MessageBatcher
+from prompt_scheduler import PromptScheduler, QueueFull, staged_response
 
 global need_sync
 global prompt_id
-global executing
-executing = False
 
 global reboot
 reboot = False
@@ -52,9 +53,15 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.INFO)
 
 ROOT_PATH = '/home/ubuntu/ComfyUI'
 sqs_client = boto3.client('sqs', region_name=REGION)
+message_batcher = MessageBatcher(sqs_client, QUEUE_URL)
 
 GC_WAIT_TIME = 1800
 
+# outputs of executed prompts wait here for the finish stage, so the next prompt starts with empty folders
+STAGING_PATH = f'{ROOT_PATH}/staging'
+
+prompt_scheduler = PromptScheduler()
+
 
 def print_env():
     for key, value in os.environ.items():
@@ -77,27 +84,24 @@ def error(body: dict):
     return web.Response(status=200, content_type='application/json', body=json.dumps(body))
 
 
-def sen_sqs_msg(message_body, prompt_id_key):
-    response = sqs_client.send_message(
-        QueueUrl=QUEUE_URL,
-        MessageBody=json.dumps(message_body),
-        MessageGroupId=prompt_id_key
-    )
-    message_id = response['MessageId']
-    return message_id
-
-
-def sen_finish_sqs_msg(prompt_id_key):
+def sen_finish_sqs_msg(prompt_id_key, prompt_need_sync=None):
     global need_sync
+    if prompt_need_sync is None:
+        prompt_need_sync = need_sync
     # logger.info(f"sen_finish_sqs_msg start... {need_sync},{prompt_id_key}")
-    if need_sync and QUEUE_URL and REGION:
+    if prompt_need_sync and QUEUE_URL and REGION:
         message_body = {'prompt_id': prompt_id_key, 'event': 'finish', 'data': {"node": None, "prompt_id": prompt_id_key},
                         'sid': None}
-        message_id = sen_sqs_msg(message_body, prompt_id_key)
-        logger.info(f"finish message sent {message_id}")
+        # goes out after the buffered messages of the prompt
+        message_batcher.put(prompt_id_key, message_body)
+        logger.info(f"finish message sent {prompt_id_key}")
 
 
 async def prepare_comfy_env(sync_item: dict):
+    return prepare_comfy_env_sync(sync_item)
+
+
+def prepare_comfy_env_sync(sync_item: dict):
     try:
         request_id = sync_item['request_id']
         logger.info(f"prepare_environment start sync_item:{sync_item}")
@@ -230,131 +234,176 @@ def sync_local_outputs_to_base64(local_path):
         return {}
 
 
+def stage_local_outputs(local_path, staging_path):
+    os.makedirs(staging_path, exist_ok=True)
+    if not os.path.isdir(local_path):
+        return
+    for name in os.listdir(local_path):
+        shutil.move(os.path.join(local_path, name), os.path.join(staging_path, name))
+
+
+class PromptFailed(Exception):
+    def __init__(self, resp: dict):
+        super().__init__(resp['message'])
+        self.resp = resp
+
+
 @server.PromptServer.instance.routes.post("/execute_proxy")
 async def execute_proxy(request):
     json_data = await request.json()
+    logger.info(f"invocations start json_data:{json_data}")
+    if json_data.get('stream_stages'):
+        # serve.py takes the executed stage as the signal to send the next prompt while this one uploads
+        return await staged_response(request, lambda on_executed: run_prompt(json_data, on_executed))
+    return ok(await run_prompt(json_data))
+
+
+async def run_prompt(json_data, on_executed=None) -> dict:
+    prompt_id_key = json_data["prompt_id"]
+    try:
+        if on_executed:
+            return await prompt_scheduler.run_staged(prompt_id_key, lambda: execute_prompt(json_data),
+                                                     finish_prompt, on_executed)
+        return await prompt_scheduler.run(prompt_id_key, lambda: execute_prompt(json_data), finish_prompt)
+    except QueueFull as e:
+        sen_finish_sqs_msg(prompt_id_key, json_data["need_sync"])
+        return {"prompt_id": prompt_id_key, "instance_id": GEN_INSTANCE_ID, "status": "fail",
+                "message": f"the instance is busy: {e}"}
+    except PromptFailed as e:
+        return e.resp
+    except Exception as ecp:
+        logger.info(f"exception occurred {ecp}")
+        return {"prompt_id": prompt_id_key, "instance_id": GEN_INSTANCE_ID, "status": "fail",
+                "message": f"exception occurred {ecp}"}
+
+
+@server.PromptServer.instance.routes.get("/execute_proxy/stats")
+async def execute_proxy_stats(request):
+    return ok(prompt_scheduler.stats())
+
+
+def execute_prompt(json_data):
+    # execute stage, runs on the scheduler thread one prompt at a time
     if 'out_path' in json_data and json_data['out_path'] is not None:
         out_path = json_data['out_path']
     else:
         out_path = None
-    logger.info(f"invocations start json_data:{json_data}")
     global need_sync
     need_sync = json_data["need_sync"]
     global prompt_id
     prompt_id = json_data["prompt_id"]
-    try:
-        global executing
-        if executing is True:
-            resp = {"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
-                    "message": "the environment is not ready valid[0] is false, need to resync"}
+    logger.info(
+        f'bucket_name: {BUCKET}, region: {REGION}')
+    if ('need_prepare' in json_data and json_data['need_prepare']
+            and 'prepare_props' in json_data and json_data['prepare_props']):
+        sync_already = prepare_comfy_env_sync(json_data['prepare_props'])
+        if not sync_already:
             sen_finish_sqs_msg(prompt_id)
-            return error(resp)
-        executing = True
-        logger.info(
-            f'bucket_name: {BUCKET}, region: {REGION}')
-        if ('need_prepare' in json_data and json_data['need_prepare']
-                and 'prepare_props' in json_data and json_data['prepare_props']):
-            sync_already = await prepare_comfy_env(json_data['prepare_props'])
-            if not sync_already:
-                resp = {"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
-                        "message": "the environment is not ready with sync"}
-                executing = False
-                sen_finish_sqs_msg(prompt_id)
-                return error(resp)
-        server_instance = server.PromptServer.instance
-        if "number" in json_data:
-            number = float(json_data['number'])
-            server_instance.number = number
-        else:
-            number = server_instance.number
-            if "front" in json_data:
-                if json_data['front']:
-                    number = -number
-            server_instance.number += 1
-        valid = execution.validate_prompt(json_data['prompt'])
-        logger.info(f"Validating prompt result is {valid}")
-        if not valid[0]:
-            resp = {"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
-                    "message": "the environment is not ready valid[0] is false, need to resync"}
-            executing = False
-            response = {"prompt_id": prompt_id, "number": number, "node_errors": valid[3]}
-            sen_finish_sqs_msg(prompt_id)
-            return error(resp)
-        # if len(valid) == 4 and len(valid[3]) > 0:
-        #     logger.info(f"Validating prompt error there is something error because of :valid: {valid}")
-        #     resp = {"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
-        #             "message": f"the valid is error, need to resync or check the workflow :{valid}"}
-        #     executing = False
-        #     return error(resp)
-        extra_data = {}
-        client_id = ''
-        if "extra_data" in json_data:
-            extra_data = json_data["extra_data"]
-            if 'client_id' in extra_data and extra_data['client_id']:
-                client_id = extra_data['client_id']
-        if "client_id" in json_data and json_data["client_id"]:
-            extra_data["client_id"] = json_data["client_id"]
-            client_id = json_data["client_id"]
-
-        server_instance.client_id = client_id
-
-        prompt_id = json_data['prompt_id']
-        server_instance.last_prompt_id = prompt_id
-        e = execution.PromptExecutor(server_instance)
+            raise PromptFailed({"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
+                                "message": "the environment is not ready with sync"})
+    server_instance = server.PromptServer.instance
+    if "number" in json_data:
+        number = float(json_data['number'])
+        server_instance.number = number
+    else:
+        number = server_instance.number
+        if "front" in json_data:
+            if json_data['front']:
+                number = -number
+        server_instance.number += 1
+    valid = execution.validate_prompt(json_data['prompt'])
+    logger.info(f"Validating prompt result is {valid}")
+    if not valid[0]:
+        sen_finish_sqs_msg(prompt_id)
+        raise PromptFailed({"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
+                            "message": "the environment is not ready valid[0] is false, need to resync"})
+    extra_data = {}
+    client_id = ''
+    if "extra_data" in json_data:
+        extra_data = json_data["extra_data"]
+        if 'client_id' in extra_data and extra_data['client_id']:
+            client_id = extra_data['client_id']
+    if "client_id" in json_data and json_data["client_id"]:
+        extra_data["client_id"] = json_data["client_id"]
+        client_id = json_data["client_id"]
+
+    server_instance.client_id = client_id
+
+    server_instance.last_prompt_id = prompt_id
+    e = execution.PromptExecutor(server_instance)
+    try:
         outputs_to_execute = valid[2]
         e.execute(json_data['prompt'], prompt_id, extra_data, outputs_to_execute)
+    finally:
+        gc_check(e)
 
-        s3_out_path = f'output/{prompt_id}/{out_path}' if out_path is not None else f'output/{prompt_id}'
-        s3_temp_path = f'temp/{prompt_id}/{out_path}' if out_path is not None else f'temp/{prompt_id}'
-        local_out_path = f'{ROOT_PATH}/output/{out_path}' if out_path is not None else f'{ROOT_PATH}/output'
-        local_temp_path = f'{ROOT_PATH}/temp/{out_path}' if out_path is not None else f'{ROOT_PATH}/temp'
+    s3_out_path = f'output/{prompt_id}/{out_path}' if out_path is not None else f'output/{prompt_id}'
+    s3_temp_path = f'temp/{prompt_id}/{out_path}' if out_path is not None else f'temp/{prompt_id}'
+    local_out_path = f'{ROOT_PATH}/output/{out_path}' if out_path is not None else f'{ROOT_PATH}/output'
+    local_temp_path = f'{ROOT_PATH}/temp/{out_path}' if out_path is not None else f'{ROOT_PATH}/temp'
+    staging_path = f'{STAGING_PATH}/{prompt_id}'
 
-        logger.info(f"s3_out_path is {s3_out_path} and s3_temp_path is {s3_temp_path} and local_out_path is {local_out_path} and local_temp_path is {local_temp_path}")
+    logger.info(f"s3_out_path is {s3_out_path} and s3_temp_path is {s3_temp_path} and local_out_path is {local_out_path} and local_temp_path is {local_temp_path}")
 
-        sync_local_outputs_to_s3(s3_out_path, local_out_path)
-        sync_local_outputs_to_s3(s3_temp_path, local_temp_path)
+    stage_local_outputs(local_out_path, f'{staging_path}/output')
+    stage_local_outputs(local_temp_path, f'{staging_path}/temp')
 
-        response_body = {
-            "prompt_id": prompt_id,
-            "instance_id": GEN_INSTANCE_ID,
-            "status": "success",
-            "output_path": f's3://{BUCKET}/comfy/{s3_out_path}',
-            "temp_path": f's3://{BUCKET}/comfy/{s3_temp_path}',
-        }
-        sen_finish_sqs_msg(prompt_id)
-        logger.info(f"execute inference response is {response_body}")
-        executing = False
-        return ok(response_body)
-    except Exception as ecp:
-        logger.info(f"exception occurred {ecp}")
-        resp = {"prompt_id": prompt_id, "instance_id": GEN_INSTANCE_ID, "status": "fail",
-                "message": f"exception occurred {ecp}"}
-        executing = False
-        return error(resp)
-    finally:
-        logger.info(f"gc check: {time.time()}")
-        try:
-            global last_call_time, gc_triggered
-            gc_triggered = False
-            if last_call_time is None:
-                logger.info(f"gc check last time is NONE")
+    return {
+        "prompt_id": prompt_id,
+        "need_sync": need_sync,
+        "s3_out_path": s3_out_path,
+        "s3_temp_path": s3_temp_path,
+        "staging_path": staging_path,
+    }
+
+
+def finish_prompt(executed: dict):
+    # finish stage, uploads outputs and notifies while the next prompt executes
+    prompt_id_key = executed['prompt_id']
+    s3_out_path = executed['s3_out_path']
+    s3_temp_path = executed['s3_temp_path']
+    staging_path = executed['staging_path']
+
+    sync_local_outputs_to_s3(s3_out_path, f'{staging_path}/output')
+    sync_local_outputs_to_s3(s3_temp_path, f'{staging_path}/temp')
+    shutil.rmtree(staging_path, ignore_errors=True)
+
+    response_body = {
+        "prompt_id": prompt_id_key,
+        "instance_id": GEN_INSTANCE_ID,
+        "status": "success",
+        "output_path": f's3://{BUCKET}/comfy/{s3_out_path}',
+        "temp_path": f's3://{BUCKET}/comfy/{s3_temp_path}',
+    }
+    sen_finish_sqs_msg(prompt_id_key, executed['need_sync'])
+    logger.info(f"execute inference response is {response_body}")
+    return response_body
+
+
+def gc_check(e):
+    logger.info(f"gc check: {time.time()}")
+    try:
+        global last_call_time, gc_triggered
+        gc_triggered = False
+        if last_call_time is None:
+            logger.info(f"gc check last time is NONE")
+            last_call_time = time.time()
+        else:
+            if time.time() - last_call_time > GC_WAIT_TIME:
+                if not gc_triggered:
+                    logger.info(f"gc start: {time.time()} - {last_call_time}")
+                    e.reset()
+                    comfy.model_management.cleanup_models()
+                    gc.collect()
+                    comfy.model_management.soft_empty_cache()
+                    gc_triggered = True
+                    logger.info(f"gc end: {time.time()} - {last_call_time}")
                 last_call_time = time.time()
             else:
-                if time.time() - last_call_time > GC_WAIT_TIME:
-                    if not gc_triggered:
-                        logger.info(f"gc start: {time.time()} - {last_call_time}")
-                        e.reset()
-                        comfy.model_management.cleanup_models()
-                        gc.collect()
-                        comfy.model_management.soft_empty_cache()
-                        gc_triggered = True
-                        logger.info(f"gc end: {time.time()} - {last_call_time}")
-                    last_call_time = time.time()
-                else:
-                    last_call_time = time.time()
-            logger.info(f"gc check end: {time.time()}")
-        except Exception as e:
-            logger.info(f"gc error: {e}")
+                last_call_time = time.time()
+        logger.info(f"gc check end: {time.time()}")
+    except Exception as e:
+        logger.info(f"gc error: {e}")
 
 
 def get_last_ddb_sync_record():
@@ -457,8 +506,7 @@ def sync_instance_monitor_status(need_save: bool):
 @server.PromptServer.instance.routes.post("/reboot")
 async def restart(self):
     logger.debug(f"start to reboot!!!!!!!! {self}")
-    global executing
-    if executing is True:
+    if prompt_scheduler.busy():
         logger.info(f"other inference doing cannot reboot!!!!!!!!")
         return ok({"message": "other inference doing cannot reboot"})
     need_reboot = os.environ.get('NEED_REBOOT')
@@ -583,8 +631,8 @@ def send_sync_proxy(func):
             data = args[2]
             sid = args[3] if len(args) == 4 else None
             message_body = {'prompt_id': prompt_id, 'event': event, 'data': data, 'sid': sid}
-            message_id = sen_sqs_msg(message_body, prompt_id)
-            logger.info(f'send_sync_proxy message_id :{message_id} message_body: {message_body}')
+            message_batcher.put(prompt_id, message_body)
+            logger.info(f'send_sync_proxy message_body: {message_body}')
         logger.debug(f"send_sync_proxy end...")
 
     return wrapper
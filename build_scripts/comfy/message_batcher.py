@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.INFO)
+
+# seconds progress events of a prompt are collected before they are sent
+SYNC_MSG_WINDOW = float(os.environ.get('SYNC_MSG_WINDOW') or 0.5)
+# SQS accepts at most 10 entries and 256KB per send_message_batch call
+SQS_BATCH_SIZE = 10
+SQS_BATCH_BYTES = 256 * 1024
+SQS_SEND_RETRIES = 3
+
+# events the client waits for, the buffered messages of the prompt are sent right away
+FLUSH_EVENTS = ['executed', 'execution_error', 'execution_interrupted', 'execution_success', 'finish']
+
+
+class MessageBatcher:
+    """
+    Sends the websocket messages of prompts to the FIFO sync queue in batches.
+
+    Messages are buffered per prompt for `window` seconds. A progress event replaces
+    the previous one when both come from the same node without another event in
+    between, since clients only show the latest value. Buffered messages go out with
+    send_message_batch in the order they were put, all of a prompt in its message group,
+    so the order of a prompt's messages is kept from the proxy to the message table.
+    """
+
+    def __init__(self, sqs_client, queue_url: str, window: float = SYNC_MSG_WINDOW,
+                 clock: Callable[[], float] = time.monotonic):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.window = window
+        self.clock = clock
+
+        self.lock = threading.Condition()
+        # only one flush sends at a time, otherwise two flushes of a prompt could overtake each other
+        self.send_lock = threading.Lock()
+        self.buffers: Dict[str, List[dict]] = {}
+        self.first_put: Dict[str, float] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+        # explicit deduplication ids, identical progress bodies must not be dropped by the queue
+        self.instance_id = uuid.uuid4().hex
+        self.seq = 0
+
+        self.put_count = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.batches = 0
+        self.failed = 0
+
+    def put(self, prompt_id: str, message: dict):
+        with self.lock:
+            self.put_count += 1
+            buffer = self.buffers.setdefault(prompt_id, [])
+            if buffer and _same_progress(buffer[-1], message):
+                buffer[-1] = message
+                self.coalesced += 1
+            else:
+                buffer.append(message)
+            self.first_put.setdefault(prompt_id, self.clock())
+            self._start()
+            self.lock.notify()
+
+        if message.get('event') in FLUSH_EVENTS:
+            self.flush(prompt_id)
+
+    def flush(self, prompt_id: str = None):
+        """Sends the buffered messages of `prompt_id`, or of all prompts."""
+        with self.send_lock:
+            with self.lock:
+                prompt_ids = [prompt_id] if prompt_id else list(self.buffers)
+                messages = []
+                for key in prompt_ids:
+                    self.first_put.pop(key, None)
+                    messages.extend((key, message) for message in self.buffers.pop(key, []))
+            if messages:
+                self._send(messages)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'buffered': sum(len(buffer) for buffer in self.buffers.values()),
+                'put': self.put_count,
+                'coalesced': self.coalesced,
+                'sent': self.sent,
+                'batches': self.batches,
+                'failed': self.failed,
+            }
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        if self.thread:
+            self.thread.join()
+        self.flush()
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='message-batcher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.closed:
+                    now = self.clock()
+                    due = [key for key, first in self.first_put.items() if first + self.window <= now]
+                    if due:
+                        break
+                    timeout = min(self.first_put.values()) + self.window - now if self.first_put else None
+                    self.lock.wait(timeout)
+                if self.closed:
+                    return
+            for key in due:
+                self.flush(key)
+
+    def _send(self, messages: List[tuple]):
+        for batch in _batches(messages):
+            entries = []
+            for prompt_id, message in batch:
+                self.seq += 1
+                entries.append({
+                    'Id': str(len(entries)),
+                    'MessageBody': json.dumps(message),
+                    'MessageGroupId': prompt_id,
+                    'MessageDeduplicationId': f'{self.instance_id}-{self.seq}',
+                })
+            self._send_entries(entries)
+
+    def _send_entries(self, entries: List[dict]):
+        for attempt in range(SQS_SEND_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(0.1 * 2 ** attempt)
+            try:
+                resp = self.sqs_client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                logger.error(f"send message batch failed: {e}")
+                continue
+
+            self.batches += 1
+            failed_ids = [failed['Id'] for failed in resp.get('Failed') or []]
+            self.sent += len(entries) - len(failed_ids)
+            if not failed_ids:
+                return
+            # the deduplication ids stay the same, entries that made it are not sent twice
+            logger.warning(f"send message batch failed for {failed_ids}: {resp['Failed']}")
+            entries = [entry for entry in entries if entry['Id'] in failed_ids]
+
+        self.failed += len(entries)
+        logger.error(f"dropped {len(entries)} sync messages after {SQS_SEND_RETRIES} retries")
+
+
+def _same_progress(buffered: dict, message: dict) -> bool:
+    if buffered.get('event') != 'progress' or message.get('event') != 'progress':
+        return False
+    return (buffered.get('data') or {}).get('node') == (message.get('data') or {}).get('node')
+
+
+def _batches(messages: List[tuple]):
+    batch = []
+    size = 0
+    for prompt_id, message in messages:
+        message_size = len(json.dumps(message).encode())
+        if batch and (len(batch) == SQS_BATCH_SIZE or size + message_size > SQS_BATCH_BYTES):
+            yield batch
+            batch = []
+            size = 0
+        batch.append((prompt_id, message))
+        size += message_size
+    if batch:
+        yield batch
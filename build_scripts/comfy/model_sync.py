@@ -0,0 +1,268 @@
+import concurrent.futures
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.INFO)
+
+# files uploaded or deleted at the same time
+SYNC_CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY') or 8)
+# a folder is synced once no file in it changed for this many seconds
+SYNC_DEBOUNCE_SECONDS = float(os.environ.get('SYNC_DEBOUNCE_SECONDS') or 3)
+# a folder that keeps changing is synced at least this often
+SYNC_MAX_DELAY_SECONDS = float(os.environ.get('SYNC_MAX_DELAY_SECONDS') or 60)
+
+MANIFEST_SUFFIX = '.manifest.json'
+# S3 deletes at most 1000 keys per delete_objects call
+DELETE_BATCH_SIZE = 1000
+
+
+@dataclass
+class SyncResult:
+    uploaded: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    seconds: float = 0
+
+    @property
+    def changed(self) -> bool:
+        return len(self.uploaded) > 0 or len(self.deleted) > 0
+
+
+class ManifestSync:
+    """
+    Mirrors local folders to S3 prefixes by comparing content manifests.
+
+    The manifest of a prefix lists path, size, mtime and hash of every file uploaded
+    to it and is kept next to the prefix, at `<prefix>.manifest.json`, so the prefix
+    itself only holds the synced files. A sync hashes the local files, diffs them
+    against the manifest, uploads only new and changed files and deletes the files
+    gone locally, all in parallel. Hashes are reused while size and mtime of a file
+    stay the same, so unchanged model files are not read again.
+
+    A prefix without a manifest, e.g. written by `aws s3 sync`, is listed once and
+    files of the same size are taken as unchanged.
+    """
+
+    def __init__(self, s3_client, bucket: str, hash_file: Callable[[str], str],
+                 max_workers: int = SYNC_CONCURRENCY):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.hash_file = hash_file
+        self.max_workers = max_workers
+        # local path -> (size, mtime_ns, hash)
+        self.hashes: Dict[str, Tuple[int, int, str]] = {}
+        self.lock = threading.Lock()
+
+    def sync(self, local_dir: str, prefix: str, excludes: List[str] = None, delete: bool = True) -> SyncResult:
+        # an empty listing of a missing folder would delete the whole prefix
+        if not os.path.isdir(local_dir):
+            raise FileNotFoundError(f"{local_dir} is not a folder")
+        started_at = time.monotonic()
+        prefix = prefix.rstrip('/') + '/'
+        remote = self.load_manifest(prefix)
+        local = self.scan(local_dir, excludes or [], remote)
+        uploads, deletes = self.diff(local, remote)
+
+        result = SyncResult(unchanged=len(local) - len(uploads))
+        manifest = {path: entry for path, entry in remote.items() if path in local or not delete}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.s3_client.upload_file, os.path.join(local_dir, path), self.bucket,
+                                       prefix + path): path for path in uploads}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    future.result()
+                    manifest[path] = local[path]
+                    result.uploaded.append(path)
+                except Exception as e:
+                    logger.error(f"upload {path} to s3://{self.bucket}/{prefix} failed: {e}")
+                    result.failed.append(path)
+
+        if delete and deletes:
+            deleted, failed = self._delete(prefix, deletes)
+            result.deleted.extend(deleted)
+            result.failed.extend(failed)
+            for path in failed:
+                manifest[path] = remote[path]
+
+        for path in local:
+            if path not in uploads and path in manifest:
+                # a matching size only tells the file is unchanged, keep the hash for the next diff
+                manifest[path] = local[path]
+
+        if result.changed or manifest != remote:
+            self._save_manifest(prefix, manifest)
+        result.seconds = time.monotonic() - started_at
+        logger.info(f"synced {local_dir} to s3://{self.bucket}/{prefix}: {len(result.uploaded)} uploaded, "
+                    f"{len(result.deleted)} deleted, {result.unchanged} unchanged, {len(result.failed)} failed "
+                    f"in {result.seconds:.2f}s")
+        return result
+
+    def scan(self, local_dir: str, excludes: List[str], remote: Dict[str, dict] = None) -> Dict[str, dict]:
+        """Lists the files under `local_dir` with size, mtime and hash, keyed by their relative path."""
+        remote = remote or {}
+        files = []
+        for root, _, names in os.walk(local_dir):
+            for name in names:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, local_dir).replace(os.sep, '/')
+                if any(fnmatch.fnmatch(path, pattern) for pattern in excludes):
+                    continue
+                files.append((path, full_path))
+
+        def entry(item):
+            path, full_path = item
+            stat = os.stat(full_path)
+            return path, {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                          'hash': self._hash(full_path, stat, remote.get(path))}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(executor.map(entry, files))
+
+    @staticmethod
+    def diff(local: Dict[str, dict], remote: Dict[str, dict]) -> Tuple[List[str], List[str]]:
+        """Returns the paths to upload and the paths to delete to make `remote` equal `local`."""
+        uploads = []
+        for path, entry in local.items():
+            remote_entry = remote.get(path)
+            if remote_entry is None or remote_entry['size'] != entry['size']:
+                uploads.append(path)
+            elif remote_entry.get('hash') and remote_entry['hash'] != entry['hash']:
+                uploads.append(path)
+        deletes = [path for path in remote if path not in local]
+        return sorted(uploads), sorted(deletes)
+
+    def load_manifest(self, prefix: str) -> Dict[str, dict]:
+        try:
+            resp = self.s3_client.get_object(Bucket=self.bucket, Key=self._manifest_key(prefix))
+            return json.loads(resp['Body'].read())['files']
+        except self.s3_client.exceptions.NoSuchKey:
+            return self._list_prefix(prefix)
+
+    def _hash(self, full_path: str, stat, remote_entry: Optional[dict]) -> str:
+        with self.lock:
+            cached = self.hashes.get(full_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        if (remote_entry and remote_entry.get('hash') and remote_entry['size'] == stat.st_size
+                and remote_entry.get('mtime') == stat.st_mtime_ns):
+            file_hash = remote_entry['hash']
+        else:
+            file_hash = self.hash_file(full_path)
+        with self.lock:
+            self.hashes[full_path] = (stat.st_size, stat.st_mtime_ns, file_hash)
+        return file_hash
+
+    def _list_prefix(self, prefix: str) -> Dict[str, dict]:
+        files = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                files[obj['Key'][len(prefix):]] = {'size': obj['Size']}
+        return files
+
+    def _save_manifest(self, prefix: str, manifest: Dict[str, dict]):
+        body = json.dumps({'version': 1, 'files': manifest})
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._manifest_key(prefix), Body=body.encode())
+
+    def _delete(self, prefix: str, paths: List[str]) -> Tuple[List[str], List[str]]:
+        deleted = []
+        failed = []
+        for i in range(0, len(paths), DELETE_BATCH_SIZE):
+            chunk = paths[i:i + DELETE_BATCH_SIZE]
+            resp = self.s3_client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': prefix + path} for path in chunk], 'Quiet': True})
+            errors = {error['Key'][len(prefix):] for error in resp.get('Errors', [])}
+            for path in chunk:
+                (failed if path in errors else deleted).append(path)
+            if errors:
+                logger.error(f"delete from s3://{self.bucket}/{prefix} failed: {resp['Errors']}")
+        return deleted, failed
+
+    @staticmethod
+    def _manifest_key(prefix: str) -> str:
+        return prefix.rstrip('/') + MANIFEST_SUFFIX
+
+
+class SyncDebouncer:
+    """
+    Collapses bursts of filesystem events into one sync per key.
+
+    `action(key)` runs once no event for the key came in for `delay` seconds, or
+    `max_delay` seconds after the first event of a burst that does not settle.
+    Actions run one at a time on a background thread, events that arrive while
+    an action runs schedule the next one.
+    """
+
+    def __init__(self, action: Callable[[str], None], delay: float = SYNC_DEBOUNCE_SECONDS,
+                 max_delay: float = SYNC_MAX_DELAY_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.action = action
+        self.delay = delay
+        self.max_delay = max_delay
+        self.clock = clock
+
+        self.condition = threading.Condition()
+        # key -> (first event, last event)
+        self.pending: Dict[str, Tuple[float, float]] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+        self.events = 0
+        self.runs = 0
+
+    def touch(self, key: str):
+        with self.condition:
+            now = self.clock()
+            first, _ = self.pending.get(key, (now, now))
+            self.pending[key] = (first, now)
+            self.events += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='sync-debouncer', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {'pending': len(self.pending), 'events': self.events, 'runs': self.runs}
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread:
+            self.thread.join()
+
+    def _due(self, now: float) -> Tuple[Optional[str], Optional[float]]:
+        key, wait = None, None
+        for candidate, (first, last) in self.pending.items():
+            remaining = min(last + self.delay, first + self.max_delay) - now
+            if remaining <= 0:
+                return candidate, 0
+            if wait is None or remaining < wait:
+                wait = remaining
+        return key, wait
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.closed:
+                        return
+                    key, wait = self._due(self.clock())
+                    if key is not None:
+                        del self.pending[key]
+                        break
+                    self.condition.wait(wait)
+            try:
+                self.action(key)
+            except Exception as e:
+                logger.error(f"sync of {key} failed: {e}")
+            with self.condition:
+                self.runs += 1
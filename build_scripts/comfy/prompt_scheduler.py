@@ -0,0 +1,191 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.INFO)
+
+# prompts accepted by the proxy but not yet finished, more are rejected
+PROMPT_QUEUE_MAX = int(os.environ.get('PROMPT_QUEUE_MAX') or 8)
+
+STAGES = ['wait', 'execute', 'finish']
+
+# a staged /execute_proxy response is one json line per stage: the first once the prompt
+# executed, so the dispatcher can send the next prompt while the outputs upload, the last
+# with the response body once the prompt finished
+STAGED_CONTENT_TYPE = 'application/x-ndjson'
+STAGE_EXECUTED = 'executed'
+STAGE_FINISHED = 'finished'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PromptScheduler:
+    """
+    Runs prompts in two stages on two threads: the execute stage (environment
+    preparation, validation and the GPU work) one prompt at a time, and the finish
+    stage (output upload and notification) of the previous prompt next to it,
+    so the GPU does not idle while outputs are uploaded.
+
+    The execute stage must hand its outputs over to the finish stage, e.g. by moving
+    them out of the folders the next prompt writes to.
+    """
+
+    def __init__(self, max_pending: int = PROMPT_QUEUE_MAX, clock: Callable[[], float] = time.monotonic):
+        self.max_pending = max_pending
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.execute_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='prompt-execute')
+        self.finish_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='prompt-finish')
+
+        self.queued = 0
+        self.executing = 0
+        self.finishing = 0
+        self.completed = 0
+        self.failed = 0
+        self.totals = {stage: 0.0 for stage in STAGES}
+        self.last = {stage: 0.0 for stage in STAGES}
+
+    def submit(self, prompt_id: str, execute: Callable[[], Any], finish: Callable[[Any], Any],
+               on_executed: Optional[Callable[[], Any]] = None) -> concurrent.futures.Future:
+        """
+        Queues a prompt, the returned future resolves with the result of finish(execute()).
+        If execute raises, finish is skipped and the future carries the exception.
+        on_executed is called on the execute thread once execute returned, before finish starts.
+        """
+        with self.lock:
+            if self.queued + self.executing + self.finishing >= self.max_pending:
+                raise QueueFull(f'{self.max_pending} prompts are already pending')
+            self.queued += 1
+
+        result = concurrent.futures.Future()
+        submitted_at = self.clock()
+
+        def run_finish(executed):
+            started_at = self.clock()
+            try:
+                finished = finish(executed)
+            except Exception as e:
+                self._done(prompt_id, 'finish', started_at, failed=True)
+                result.set_exception(e)
+                return
+            self._done(prompt_id, 'finish', started_at, failed=False)
+            result.set_result(finished)
+
+        def run_execute():
+            started_at = self.clock()
+            with self.lock:
+                self.queued -= 1
+                self.executing += 1
+                self._timing('wait', started_at - submitted_at)
+            try:
+                executed = execute()
+            except Exception as e:
+                with self.lock:
+                    self.executing -= 1
+                    self.failed += 1
+                    self._timing('execute', self.clock() - started_at)
+                result.set_exception(e)
+                return
+
+            with self.lock:
+                self.executing -= 1
+                self._timing('execute', self.clock() - started_at)
+                # counted as finishing from here, so that pending never dips between the stages
+                self.finishing += 1
+            if on_executed:
+                on_executed()
+            self.finish_pool.submit(run_finish, executed)
+
+        self.execute_pool.submit(run_execute)
+        return result
+
+    async def run(self, prompt_id: str, execute: Callable[[], Any], finish: Callable[[Any], Any]):
+        return await asyncio.wrap_future(self.submit(prompt_id, execute, finish))
+
+    async def run_staged(self, prompt_id: str, execute: Callable[[], Any], finish: Callable[[Any], Any],
+                         on_executed: Callable[[], Awaitable[Any]]):
+        """Like run, and awaits on_executed on the event loop once the prompt executed."""
+        loop = asyncio.get_running_loop()
+        executed = asyncio.Event()
+        result = asyncio.wrap_future(self.submit(prompt_id, execute, finish,
+                                                 on_executed=lambda: loop.call_soon_threadsafe(executed.set)))
+        waiter = asyncio.ensure_future(executed.wait())
+        try:
+            await asyncio.wait([waiter, result], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+
+        if executed.is_set():
+            await on_executed()
+        return await result
+
+    def busy(self) -> bool:
+        with self.lock:
+            return self.queued + self.executing + self.finishing > 0
+
+    def queue_depth(self) -> int:
+        with self.lock:
+            return self.queued
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            finished = self.completed + self.failed
+            return {
+                'queue_depth': self.queued,
+                'executing': self.executing,
+                'finishing': self.finishing,
+                'completed': self.completed,
+                'failed': self.failed,
+                'last_seconds': dict(self.last),
+                'average_seconds': {stage: self.totals[stage] / finished if finished else 0 for stage in STAGES},
+            }
+
+    def shutdown(self):
+        self.execute_pool.shutdown(wait=True)
+        self.finish_pool.shutdown(wait=True)
+
+    def _done(self, prompt_id: str, stage: str, started_at: float, failed: bool):
+        seconds = self.clock() - started_at
+        with self.lock:
+            self.finishing -= 1
+            self._timing(stage, seconds)
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            logger.info(f'prompt {prompt_id} timings: {self.last}, queue depth: {self.queued}')
+
+    def _timing(self, stage: str, seconds: float):
+        self.last[stage] = seconds
+        self.totals[stage] += seconds
+
+
+def stage_line(stage: str, body: Any = None) -> bytes:
+    return (json.dumps({'stage': stage, 'body': body}) + '\n').encode()
+
+
+async def staged_response(request, run: Callable[[Callable[[], Awaitable[Any]]], Awaitable[dict]]):
+    """
+    Answers an aiohttp request in stages. run gets the callback that writes the executed
+    stage and returns the response body, which goes out as the finished stage.
+    """
+    from aiohttp import web
+
+    response = web.StreamResponse(status=200, headers={'Content-Type': STAGED_CONTENT_TYPE})
+    await response.prepare(request)
+
+    async def executed():
+        await response.write(stage_line(STAGE_EXECUTED))
+
+    body = await run(executed)
+    await response.write(stage_line(STAGE_FINISHED, body))
+    await response.write_eof()
+    return response
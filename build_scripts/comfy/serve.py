@@ -11,11 +11,13 @@ from multiprocessing import Process
 from threading import Lock
 
 import boto3
-import httpx
 import requests
 import uvicorn
 from fastapi import APIRouter, FastAPI, Request, HTTPException
 
+from cloudwatch_metrics import MetricsPublisher
+from worker_dispatcher import WorkerDispatcher, WorkerLease
+
 TIMEOUT_KEEP_ALIVE = 30
 SAGEMAKER_PORT = 8080
 LOCALHOST = '0.0.0.0'
@@ -24,8 +26,11 @@ is_on_ec2 = os.getenv('ON_EC2') == 'true'
 program_name = os.getenv('PROGRAM_NAME', 'none')
 SLEEP_TIME = 5
 TIME_OUT_TIME = 86400
-MAX_KEEPALIVE_CONNECTIONS = 100
-MAX_CONNECTIONS = 1500
+# seconds a request waits for a free worker before it is answered with 503, a single request used to fail at once
+SINGLE_DISPATCH_TIMEOUT = float(os.getenv('SINGLE_DISPATCH_TIMEOUT', 10))
+# the requests of a multi GPU invocation queue behind each other for the workers
+MULTI_DISPATCH_TIMEOUT = float(os.getenv('MULTI_DISPATCH_TIMEOUT', 900))
+RETRY_AFTER_SECONDS = 10
 
 app = FastAPI()
 
@@ -37,6 +42,7 @@ sagemaker_safe_port_range = os.getenv('SAGEMAKER_SAFE_PORT_RANGE', "8088-9088")
 start_port = int(sagemaker_safe_port_range.split('-')[0])
 available_apps = []
 is_multi_gpu = False
+dispatcher = WorkerDispatcher(available_apps, is_ready=lambda comfy_app: comfy_app.is_port_ready(), host=PHY_LOCALHOST)
 cloudwatch = boto3.client('cloudwatch')
 
 endpoint_name = os.getenv('ENDPOINT_NAME')
@@ -179,7 +185,8 @@ def update_execute_job_table(prompt_id, key, value):
         raise e
 
 
-async def send_request(request_obj, comfy_app: ComfyApp, need_async: bool):
+async def send_request(request_obj, lease: WorkerLease, need_async: bool):
+    comfy_app = lease.worker
     try:
         record_metric(comfy_app, request_obj)
         logger.info(f"Starting on {comfy_app.port} {need_async} {request_obj}")
@@ -189,25 +196,18 @@ async def send_request(request_obj, comfy_app: ComfyApp, need_async: bool):
 
         request_obj['port'] = comfy_app.port
         request_obj['out_path'] = comfy_app.device_id
+        request_obj['stream_stages'] = True
 
         start_time = datetime.datetime.now().isoformat()
         update_execute_job_table(prompt_id=request_obj['prompt_id'], key="start_time", value=start_time)
 
+        def executed():
+            # the worker takes the next prompt while the outputs of this one upload
+            comfy_app.busy = False
+            comfy_app.set_prompt()
+
         logger.info(f"Invocations start req: {request_obj}, url: {PHY_LOCALHOST}:{comfy_app.port}/execute_proxy")
-        # if need_async:
-        #     async with httpx.AsyncClient(timeout=TIME_OUT_TIME,
-        #                                  limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
-        #                                                      max_connections=MAX_CONNECTIONS)) as client:
-        #         response = await client.post(f"http://{PHY_LOCALHOST}:{comfy_app.port}/execute_proxy", json=request_obj)
-        # else:
-        #     response = requests.post(f"http://{PHY_LOCALHOST}:{comfy_app.port}/execute_proxy", json=request_obj)
-        async with httpx.AsyncClient(timeout=TIME_OUT_TIME,
-                                     limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
-                                                         max_connections=MAX_CONNECTIONS)) as client:
-            response = await client.post(f"http://{PHY_LOCALHOST}:{comfy_app.port}/execute_proxy", json=request_obj)
-
-        comfy_app.busy = False
-        comfy_app.set_prompt()
+        response = await dispatcher.post_staged(lease, "/execute_proxy", request_obj, executed)
 
         if response.status_code != 200:
             raise HTTPException(status_code=response.status_code,
@@ -217,8 +217,28 @@ async def send_request(request_obj, comfy_app: ComfyApp, need_async: bool):
         logger.error(f"send_request error {e}")
         raise HTTPException(status_code=500, detail=f"COMFY service not available for internal multi reqs {e}")
     finally:
-        comfy_app.busy = False
-        comfy_app.set_prompt()
+        # once released the worker may already run the next prompt
+        if not lease.released:
+            comfy_app.busy = False
+            comfy_app.set_prompt()
+
+
+async def dispatch_request(request_obj, need_async: bool):
+    timeout = MULTI_DISPATCH_TIMEOUT if need_async else SINGLE_DISPATCH_TIMEOUT
+    try:
+        lease = await dispatcher.lease(timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail=f"no COMFY worker became free within {timeout}s",
+                            headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+    try:
+        return await send_request(request_obj, lease, need_async)
+    except Exception:
+        # a worker that went away is checked until it is back before getting requests again
+        await dispatcher.release_checked(lease)
+        raise
+    finally:
+        lease.release()
 
 
 async def invocations(request: Request):
@@ -230,20 +250,8 @@ async def invocations(request: Request):
             req = await request.json()
             logger.info(f"Starting multi invocation {req}")
 
-            tasks = []
-            for request_obj in req:
-                comfy_app = check_available_app(True)
-                max_retries = TIME_OUT_TIME
-                while comfy_app is None:
-                    if max_retries > 0:
-                        max_retries = max_retries - 60
-                        time.sleep(60)
-                        comfy_app = check_available_app(True)
-                    else:
-                        raise HTTPException(status_code=500, detail=f"COMFY service not available for multi reqs")
-                # if comfy_app is None:
-                #     raise HTTPException(status_code=500, detail=f"COMFY service not available for multi reqs")
-                tasks.append(send_request(request_obj, comfy_app, True))
+            # requests wait for a free worker in order, each one is dispatched as soon as a worker completes
+            tasks = [dispatch_request(request_obj, True) for request_obj in req]
             logger.info("all tasks completed send, waiting result")
             results = await asyncio.gather(*tasks)
             logger.info(f'Finished invocations {results}')
@@ -253,13 +261,15 @@ async def invocations(request: Request):
             result = []
             logger.info(f"Starting single invocation request is: {req}")
             for request_obj in req:
-                comfy_app = check_available_app(True)
-                if comfy_app is None:
-                    raise HTTPException(status_code=500, detail=f"COMFY service not available for single reqs")
-                response = await send_request(request_obj, comfy_app, False)
+                response = await dispatch_request(request_obj, False)
                 result.append(response)
             logger.info(f"Finished invocations result: {result}")
             return result
+    except HTTPException as e:
+        if e.status_code == 503:
+            raise
+        logger.error(f"invocations error of {e}")
+        return []
     except Exception as e:
         logger.error(f"invocations error of {e}")
         return []
@@ -294,89 +304,26 @@ def wrap_response(start_time, response, comfy_app: ComfyApp, request_obj):
     return data
 
 
+metrics_publisher = MetricsPublisher(cloudwatch, start=False)
+
+
 def record_metric(comfy_app: ComfyApp, request_obj):
-    data = [
-        {
-            'MetricName': 'InferenceTotal',
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': endpoint_name
-                },
-                {
-                    'Name': 'Instance',
-                    'Value': endpoint_instance_id
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': 'InferenceTotal',
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': endpoint_name
-                },
-                {
-                    'Name': 'Instance',
-                    'Value': endpoint_instance_id
-                },
-                {
-                    'Name': 'InstanceGPU',
-                    'Value': f"GPU{comfy_app.device_id}"
-                }
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': 'InferenceEndpointReceived',
-            'Dimensions': [
-                {
-                    'Name': 'Service',
-                    'Value': 'Comfy'
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': 'InferenceEndpointReceived',
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': endpoint_name
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-    ]
+    metrics_publisher.start()
+
+    metrics_publisher.put('InferenceTotal', [
+        {'Name': 'Endpoint', 'Value': endpoint_name},
+        {'Name': 'Instance', 'Value': endpoint_instance_id},
+    ])
+    metrics_publisher.put('InferenceTotal', [
+        {'Name': 'Endpoint', 'Value': endpoint_name},
+        {'Name': 'Instance', 'Value': endpoint_instance_id},
+        {'Name': 'InstanceGPU', 'Value': f"GPU{comfy_app.device_id}"},
+    ])
+    metrics_publisher.put('InferenceEndpointReceived', [{'Name': 'Service', 'Value': 'Comfy'}])
+    metrics_publisher.put('InferenceEndpointReceived', [{'Name': 'Endpoint', 'Value': endpoint_name}])
 
     if 'workflow' in request_obj and request_obj['workflow']:
-        data.append({
-            'MetricName': 'InferenceEndpointReceived',
-            'Dimensions': [
-                {
-                    'Name': 'Workflow',
-                    'Value': request_obj['workflow']
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        })
-
-    response = cloudwatch.put_metric_data(
-        Namespace='ESD',
-        MetricData=data
-    )
-    logger.info(f"record_metric response: {response}")
+        metrics_publisher.put('InferenceEndpointReceived', [{'Name': 'Workflow', 'Value': request_obj['workflow']}])
 
 
 def get_gpu_count():
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+from unittest import TestCase
+
+from message_batcher import MessageBatcher, SQS_BATCH_SIZE
+
+
+class FakeQueue:
+    """Stands in for the FIFO sync queue, keeps the sent messages per message group."""
+
+    def __init__(self, fail_ids=None):
+        self.groups = {}
+        self.calls = []
+        self.dedup_ids = set()
+        self.fail_ids = fail_ids or set()
+        self.lock = threading.Lock()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        assert len(Entries) <= SQS_BATCH_SIZE
+        with self.lock:
+            self.calls.append(len(Entries))
+            failed = []
+            for entry in Entries:
+                if entry['Id'] in self.fail_ids:
+                    self.fail_ids.discard(entry['Id'])
+                    failed.append({'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError'})
+                    continue
+                if entry['MessageDeduplicationId'] in self.dedup_ids:
+                    continue
+                self.dedup_ids.add(entry['MessageDeduplicationId'])
+                self.groups.setdefault(entry['MessageGroupId'], []).append(json.loads(entry['MessageBody']))
+            return {'Successful': [], 'Failed': failed}
+
+    def events(self, prompt_id):
+        with self.lock:
+            return [message['event'] for message in self.groups.get(prompt_id, [])]
+
+
+def progress(prompt_id, node, value):
+    return {'prompt_id': prompt_id, 'event': 'progress', 'sid': None,
+            'data': {'value': value, 'max': 20, 'prompt_id': prompt_id, 'node': node}}
+
+
+def event(prompt_id, name):
+    return {'prompt_id': prompt_id, 'event': name, 'sid': None, 'data': {'node': None, 'prompt_id': prompt_id}}
+
+
+class MessageBatcherTest(TestCase):
+
+    def test_progress_is_coalesced_and_order_kept(self):
+        queue = FakeQueue()
+        batcher = MessageBatcher(queue, 'queue-url', window=10)
+
+        batcher.put('p1', event('p1', 'execution_start'))
+        for value in range(20):
+            batcher.put('p1', progress('p1', '3', value))
+        batcher.put('p1', event('p1', 'executing'))
+        for value in range(20):
+            batcher.put('p1', progress('p1', '8', value))
+        self.assertEqual(queue.calls, [])
+
+        batcher.put('p1', event('p1', 'finish'))
+
+        self.assertEqual(queue.events('p1'), ['execution_start', 'progress', 'executing', 'progress', 'finish'])
+        self.assertEqual([m['data'].get('value') for m in queue.groups['p1'] if m['event'] == 'progress'], [19, 19])
+        self.assertEqual(queue.calls, [5])
+        stats = batcher.stats()
+        self.assertEqual(stats['coalesced'], 38)
+        self.assertEqual(stats['buffered'], 0)
+
+    def test_window_flushes_in_background(self):
+        queue = FakeQueue()
+        batcher = MessageBatcher(queue, 'queue-url', window=0.05)
+
+        for i in range(25):
+            batcher.put('p1', event('p1', f'status{i}'))
+        batcher.put('p2', progress('p2', '3', 1))
+
+        for _ in range(100):
+            if len(queue.events('p1')) == 25 and queue.events('p2'):
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(queue.events('p1'), [f'status{i}' for i in range(25)])
+        self.assertEqual(queue.events('p2'), ['progress'])
+        self.assertLessEqual(len(queue.calls), 4)
+        batcher.close()
+
+    def test_failed_entries_are_retried_without_duplicates(self):
+        queue = FakeQueue(fail_ids={'1'})
+        batcher = MessageBatcher(queue, 'queue-url', window=10)
+
+        batcher.put('p1', event('p1', 'execution_start'))
+        batcher.put('p1', event('p1', 'executing'))
+        batcher.put('p1', event('p1', 'executed'))
+
+        # the retried entry is sent again on its own, entries that made it are not duplicated
+        self.assertEqual(queue.calls, [3, 1])
+
+        self.assertEqual(sorted(queue.events('p1')), ['executed', 'executing', 'execution_start'])
+        self.assertEqual(batcher.stats()['sent'], 3)
+        self.assertEqual(batcher.stats()['failed'], 0)
@@ -0,0 +1,176 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from model_sync import ManifestSync, SyncDebouncer
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FakeS3:
+    """Stands in for the S3 client, objects are kept in memory."""
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, 'rb') as f:
+            body = f.read()
+        with self.lock:
+            self.objects[key] = body
+            self.uploads.append(key)
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.objects.pop(obj['Key'], None)
+        return {}
+
+    def get_paginator(self, name):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {'Contents': [{'Key': key, 'Size': len(body)} for key, body in s3.objects.items()
+                                    if key.startswith(Prefix)]}
+
+        return Paginator()
+
+
+class CountingHasher:
+
+    def __init__(self):
+        self.files = []
+
+    def __call__(self, file_path):
+        self.files.append(os.path.basename(file_path))
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class ManifestSyncTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.models = self.tmp.name
+        self.s3 = FakeS3()
+        self.hasher = CountingHasher()
+        self.sync = ManifestSync(self.s3, 'bucket', hash_file=self.hasher)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_only_changed_files_are_transferred(self):
+        for i in range(5):
+            write(f'{self.models}/loras/lora{i}.safetensors', f'lora {i}')
+        write(f'{self.models}/checkpoints/base.safetensors', 'base')
+
+        first = self.sync.sync(self.models, 'comfy/ep/default/models')
+        self.assertEqual(len(first.uploaded), 6)
+
+        self.s3.uploads = []
+        self.hasher.files = []
+        write(f'{self.models}/loras/lora2.safetensors', 'lora 2 retrained')
+        os.remove(f'{self.models}/loras/lora4.safetensors')
+        second = self.sync.sync(self.models, 'comfy/ep/default/models/')
+
+        self.assertEqual(second.uploaded, ['loras/lora2.safetensors'])
+        self.assertEqual(second.deleted, ['loras/lora4.safetensors'])
+        self.assertEqual(second.unchanged, 4)
+        self.assertEqual(self.s3.uploads, ['comfy/ep/default/models/loras/lora2.safetensors'])
+        # unchanged files are not read again
+        self.assertEqual(self.hasher.files, ['lora2.safetensors'])
+        self.assertNotIn('comfy/ep/default/models/loras/lora4.safetensors', self.s3.objects)
+        self.assertIn('comfy/ep/default/models.manifest.json', self.s3.objects)
+
+        third = self.sync.sync(self.models, 'comfy/ep/default/models')
+        self.assertFalse(third.changed)
+
+    def test_same_size_change_is_found_by_hash(self):
+        write(f'{self.models}/a.txt', 'aaaa')
+        self.sync.sync(self.models, 'models')
+
+        write(f'{self.models}/a.txt', 'bbbb')
+        # a new process only has the manifest
+        result = ManifestSync(self.s3, 'bucket', hash_file=self.hasher).sync(self.models, 'models')
+
+        self.assertEqual(result.uploaded, ['a.txt'])
+        self.assertEqual(self.s3.objects['models/a.txt'], b'bbbb')
+
+    def test_prefix_without_manifest_and_excludes(self):
+        write(f'{self.models}/node/__init__.py', 'same')
+        write(f'{self.models}/node/new.py', 'new')
+        write(f'{self.models}/comfy_local_proxy.py', 'local only')
+        self.s3.objects['nodes/node/__init__.py'] = b'same'
+        self.s3.objects['nodes/old.py'] = b'old'
+
+        result = self.sync.sync(self.models, 'nodes', excludes=['*comfy_local_proxy.py'])
+
+        self.assertEqual(result.uploaded, ['node/new.py'])
+        self.assertEqual(result.deleted, ['old.py'])
+        self.assertNotIn('nodes/comfy_local_proxy.py', self.s3.objects)
+
+    def test_missing_folder_is_not_synced(self):
+        self.s3.objects['models/a.txt'] = b'a'
+        with self.assertRaises(FileNotFoundError):
+            self.sync.sync(f'{self.models}/missing', 'models')
+        self.assertIn('models/a.txt', self.s3.objects)
+
+
+class SyncDebouncerTest(TestCase):
+
+    def test_burst_of_events_runs_one_sync(self):
+        runs = []
+        debouncer = SyncDebouncer(runs.append, delay=0.05, max_delay=10)
+
+        for _ in range(50):
+            debouncer.touch('models')
+            debouncer.touch('inputs')
+            time.sleep(0.001)
+
+        for _ in range(100):
+            if len(runs) == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.1)
+        debouncer.close()
+
+        self.assertEqual(sorted(runs), ['inputs', 'models'])
+        self.assertEqual(debouncer.stats()['events'], 100)
+
+    def test_unsettled_folder_is_synced_after_max_delay(self):
+        runs = []
+        debouncer = SyncDebouncer(runs.append, delay=0.05, max_delay=0.1)
+
+        started = time.monotonic()
+        while not runs and time.monotonic() - started < 2:
+            debouncer.touch('models')
+            time.sleep(0.01)
+        debouncer.close()
+
+        self.assertEqual(runs[:1], ['models'])
+        self.assertLess(time.monotonic() - started, 0.5)
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from prompt_scheduler import PromptScheduler, QueueFull
+
+
+class StubExecutor:
+    """Sleeps instead of using a GPU and records which stages overlapped."""
+
+    def __init__(self, execute_seconds=0.05, finish_seconds=0.05):
+        self.execute_seconds = execute_seconds
+        self.finish_seconds = finish_seconds
+        self.lock = threading.Lock()
+        self.executing = 0
+        self.max_executing = 0
+        self.overlapped = False
+        self.finishing = 0
+
+    def execute(self, prompt_id):
+        with self.lock:
+            self.executing += 1
+            self.max_executing = max(self.max_executing, self.executing)
+            if self.finishing:
+                self.overlapped = True
+        time.sleep(self.execute_seconds)
+        with self.lock:
+            self.executing -= 1
+        return prompt_id
+
+    def finish(self, prompt_id):
+        with self.lock:
+            self.finishing += 1
+        time.sleep(self.finish_seconds)
+        with self.lock:
+            self.finishing -= 1
+        return {'prompt_id': prompt_id, 'status': 'success'}
+
+
+class PromptSchedulerTest(TestCase):
+
+    def test_finish_overlaps_next_execute(self):
+        scheduler = PromptScheduler(max_pending=8)
+        stub = StubExecutor()
+
+        started = time.monotonic()
+        futures = [scheduler.submit(f'p{i}', lambda i=i: stub.execute(f'p{i}'), stub.finish) for i in range(4)]
+        results = [future.result(timeout=5) for future in futures]
+        elapsed = time.monotonic() - started
+
+        self.assertEqual([r['prompt_id'] for r in results], ['p0', 'p1', 'p2', 'p3'])
+        self.assertEqual(stub.max_executing, 1)
+        self.assertTrue(stub.overlapped)
+        # serial would take 8 x 0.05, pipelined about 5 x 0.05
+        self.assertLess(elapsed, 0.35)
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['completed'], 4)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreater(stats['average_seconds']['execute'], 0)
+        self.assertGreater(stats['average_seconds']['finish'], 0)
+        self.assertFalse(scheduler.busy())
+        scheduler.shutdown()
+
+    def test_execute_failure_skips_finish(self):
+        scheduler = PromptScheduler()
+        finished = []
+
+        def fail():
+            raise ValueError('invalid prompt')
+
+        future = scheduler.submit('p0', fail, finished.append)
+        with self.assertRaises(ValueError):
+            future.result(timeout=5)
+
+        self.assertEqual(finished, [])
+        self.assertEqual(scheduler.stats()['failed'], 1)
+        self.assertFalse(scheduler.busy())
+        scheduler.shutdown()
+
+    def test_queue_full(self):
+        scheduler = PromptScheduler(max_pending=2)
+        release = threading.Event()
+
+        scheduler.submit('p0', release.wait, lambda executed: executed)
+        scheduler.submit('p1', release.wait, lambda executed: executed)
+        while scheduler.stats()['executing'] == 0:
+            time.sleep(0.001)
+        self.assertEqual(scheduler.queue_depth(), 1)
+        with self.assertRaises(QueueFull):
+            scheduler.submit('p2', release.wait, lambda executed: executed)
+
+        release.set()
+        scheduler.shutdown()
+        self.assertEqual(scheduler.stats()['completed'], 2)
+
+    def test_run(self):
+        scheduler = PromptScheduler()
+        stub = StubExecutor(0.01, 0.01)
+
+        result = asyncio.run(scheduler.run('p0', lambda: stub.execute('p0'), stub.finish))
+
+        self.assertEqual(result, {'prompt_id': 'p0', 'status': 'success'})
+        scheduler.shutdown()
+
+    def test_run_staged_reports_executed_before_the_result(self):
+        scheduler = PromptScheduler()
+        stub = StubExecutor(0.01, 0.05)
+        events = []
+
+        async def on_executed():
+            events.append('executed')
+
+        async def run():
+            result = await scheduler.run_staged('p0', lambda: stub.execute('p0'), stub.finish, on_executed)
+            events.append(result['status'])
+
+            def fail():
+                raise ValueError('invalid prompt')
+
+            with self.assertRaises(ValueError):
+                await scheduler.run_staged('p1', fail, stub.finish, on_executed)
+
+        asyncio.run(run())
+
+        self.assertEqual(events, ['executed', 'success'])
+        scheduler.shutdown()
@@ -0,0 +1,237 @@
+import asyncio
+import importlib.util
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, skipUnless
+
+from prompt_scheduler import PromptScheduler, staged_response
+from worker_dispatcher import WorkerDispatcher
+
+
+class FakeWorkerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.server.seconds)
+        self.server.connections.add(self.client_address)
+        payload = json.dumps({'prompt_id': body['prompt_id'], 'port': self.server.server_port}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeWorker:
+    """Stands in for a ComfyUI process: an HTTP server answering /execute_proxy after `seconds`."""
+
+    def __init__(self, seconds=0.0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeWorkerHandler)
+        self.server.seconds = seconds
+        self.server.connections = set()
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Worker:
+
+    def __init__(self, port):
+        self.port = port
+
+
+class WorkerDispatcherTest(TestCase):
+
+    def test_waiters_are_served_in_order(self):
+        async def scenario():
+            dispatcher = WorkerDispatcher([Worker(1), Worker(2)], is_ready=lambda worker: True)
+            order = []
+
+            async def job(i):
+                worker = await dispatcher.acquire()
+                order.append(i)
+                await asyncio.sleep(0.01)
+                dispatcher.release(worker)
+
+            await asyncio.gather(*[job(i) for i in range(6)])
+            return order, dispatcher.stats()
+
+        order, stats = asyncio.run(scenario())
+
+        self.assertEqual(order, list(range(6)))
+        self.assertEqual(stats['dispatched'], 6)
+        self.assertEqual(stats['idle'], 2)
+
+    def test_released_worker_is_handed_out_without_polling(self):
+        async def scenario():
+            dispatcher = WorkerDispatcher([Worker(1)], is_ready=lambda worker: True, ready_check_interval=10)
+            worker = await dispatcher.acquire()
+            waiter = asyncio.ensure_future(dispatcher.acquire())
+            await asyncio.sleep(0.05)
+            released_at = time.monotonic()
+            dispatcher.release(worker)
+            await waiter
+            return time.monotonic() - released_at
+
+        self.assertLess(asyncio.run(scenario()), 0.01)
+
+    def test_worker_waits_until_ready(self):
+        ready = threading.Event()
+
+        async def scenario():
+            dispatcher = WorkerDispatcher([Worker(1)], is_ready=lambda worker: ready.is_set(),
+                                          ready_check_interval=0.01)
+            waiter = asyncio.ensure_future(dispatcher.acquire())
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiter.done())
+            self.assertEqual(dispatcher.stats()['recovering'], 1)
+
+            ready.set()
+            worker = await asyncio.wait_for(waiter, 1)
+            dispatcher.release(worker, healthy=False)
+            self.assertEqual(dispatcher.stats()['recovering'], 1)
+            return await asyncio.wait_for(dispatcher.acquire(), 1)
+
+        self.assertEqual(asyncio.run(scenario()).port, 1)
+
+    def test_unreachable_worker_is_skipped_and_waits_are_bounded(self):
+        down = set()
+
+        async def scenario():
+            dispatcher = WorkerDispatcher([Worker(1), Worker(2)], is_ready=lambda worker: worker.port not in down,
+                                          ready_check_interval=0.01)
+            await asyncio.sleep(0.05)
+            # worker 1 restarted after it became ready, the request gets worker 2
+            down.add(1)
+            worker = await dispatcher.acquire(timeout=1)
+            self.assertEqual(worker.port, 2)
+            self.assertEqual(dispatcher.stats()['recovering'], 1)
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await dispatcher.acquire(timeout=0.05)
+
+            down.clear()
+            return await asyncio.wait_for(dispatcher.acquire(timeout=1), 1)
+
+        self.assertEqual(asyncio.run(scenario()).port, 1)
+
+    @skipUnless(importlib.util.find_spec('httpx'), 'httpx is installed in the ComfyUI image')
+    def test_requests_reuse_connections_and_spread_over_workers(self):
+        workers = [FakeWorker(0.05), FakeWorker(0.05)]
+
+        async def scenario():
+            dispatcher = WorkerDispatcher(workers, is_ready=lambda worker: True)
+
+            async def send(i):
+                worker = await dispatcher.acquire()
+                try:
+                    response = await dispatcher.post(worker, '/execute_proxy', {'prompt_id': f'p{i}'})
+                    return response.json()
+                finally:
+                    dispatcher.release(worker)
+
+            # clients are created on the first request of each worker
+            await asyncio.gather(send('warmup'), send('warmup'))
+
+            started = time.monotonic()
+            results = await asyncio.gather(*[send(i) for i in range(8)])
+            elapsed = time.monotonic() - started
+            await dispatcher.close()
+            return results, elapsed
+
+        try:
+            results, elapsed = asyncio.run(scenario())
+        finally:
+            for worker in workers:
+                worker.stop()
+
+        self.assertEqual([r['prompt_id'] for r in results], [f'p{i}' for i in range(8)])
+        ports = [r['port'] for r in results]
+        self.assertGreaterEqual(ports.count(workers[0].port), 3)
+        self.assertGreaterEqual(ports.count(workers[1].port), 3)
+        # 8 requests of 50ms on 2 workers
+        self.assertLess(elapsed, 0.4)
+        for worker in workers:
+            self.assertEqual(len(worker.server.connections), 1)
+
+    @skipUnless(importlib.util.find_spec('httpx') and importlib.util.find_spec('aiohttp'),
+                'httpx and aiohttp are installed in the ComfyUI image')
+    def test_worker_takes_the_next_prompt_while_the_previous_uploads(self):
+        from aiohttp import web
+
+        scheduler = PromptScheduler()
+        spans = {}
+
+        def execute(prompt_id):
+            started = time.monotonic()
+            time.sleep(0.1)
+            spans[f'execute {prompt_id}'] = (started, time.monotonic())
+            return prompt_id
+
+        def finish(prompt_id):
+            started = time.monotonic()
+            time.sleep(0.2)
+            spans[f'finish {prompt_id}'] = (started, time.monotonic())
+            return {'prompt_id': prompt_id, 'status': 'success'}
+
+        # /execute_proxy of comfy_sagemaker_proxy.py
+        async def execute_proxy(request):
+            json_data = await request.json()
+            prompt_id = json_data['prompt_id']
+            if json_data.get('stream_stages'):
+                return await staged_response(request, lambda on_executed: scheduler.run_staged(
+                    prompt_id, lambda: execute(prompt_id), finish, on_executed))
+            return web.json_response(await scheduler.run(prompt_id, lambda: execute(prompt_id), finish))
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_post('/execute_proxy', execute_proxy)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            dispatcher = WorkerDispatcher([Worker(runner.addresses[0][1])], is_ready=lambda worker: True)
+            released = []
+
+            # dispatch_request and send_request of serve.py
+            async def send(prompt_id):
+                lease = await dispatcher.lease()
+                try:
+                    response = await dispatcher.post_staged(lease, '/execute_proxy',
+                                                            {'prompt_id': prompt_id, 'stream_stages': True},
+                                                            lambda: released.append(prompt_id))
+                    return response.json()
+                finally:
+                    lease.release()
+
+            try:
+                results = await asyncio.gather(send('p0'), send('p1'))
+                plain = await dispatcher.post(Worker(runner.addresses[0][1]), '/execute_proxy', {'prompt_id': 'p2'})
+                return results, released, plain.json()
+            finally:
+                await dispatcher.close()
+                await runner.cleanup()
+
+        try:
+            results, released, plain = asyncio.run(scenario())
+        finally:
+            scheduler.shutdown()
+
+        self.assertEqual(results, [{'prompt_id': 'p0', 'status': 'success'}, {'prompt_id': 'p1', 'status': 'success'}])
+        self.assertEqual(released, ['p0', 'p1'])
+        # p1 executes while p0 uploads
+        self.assertLess(spans['execute p1'][0], spans['finish p0'][1])
+        # serial would take 2 x 0.3, pipelined about 0.1 + 0.1 + 0.2
+        self.assertLess(spans['finish p1'][1] - spans['execute p0'][0], 0.55)
+        self.assertEqual(plain, {'prompt_id': 'p2', 'status': 'success'})
@@ -0,0 +1,200 @@
+import asyncio
+import json as jsonlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from prompt_scheduler import STAGE_EXECUTED, STAGE_FINISHED, STAGED_CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TIME_OUT_TIME = 86400
+# how often a worker that is starting or restarting is checked until it accepts connections
+READY_CHECK_INTERVAL = float(os.getenv('READY_CHECK_INTERVAL', 1))
+# connections kept open per worker, a worker runs one prompt while it uploads the outputs of earlier ones
+WORKER_KEEPALIVE_CONNECTIONS = 4
+
+
+def default_client_factory(base_url: str):
+    import httpx
+    return httpx.AsyncClient(base_url=base_url, timeout=TIME_OUT_TIME,
+                             limits=httpx.Limits(max_keepalive_connections=WORKER_KEEPALIVE_CONNECTIONS,
+                                                 max_connections=WORKER_KEEPALIVE_CONNECTIONS))
+
+
+@dataclass
+class StagedResponse:
+    status_code: int
+    text: str
+
+    def json(self):
+        return jsonlib.loads(self.text)
+
+
+class WorkerLease:
+    """A worker handed out by the dispatcher, released once whatever comes first releases it."""
+
+    def __init__(self, dispatcher, worker):
+        self.dispatcher = dispatcher
+        self.worker = worker
+        self.released = False
+
+    def release(self, healthy: bool = True):
+        if self.released:
+            return
+        self.released = True
+        self.dispatcher.release(self.worker, healthy)
+
+
+class WorkerDispatcher:
+    """
+    Hands out idle ComfyUI workers from a ready queue.
+
+    A worker goes back into the queue as soon as its request completes and the
+    longest waiting request gets it first, so requests do not sleep to find a
+    free worker. Its port is checked once before it gets a request, so a worker
+    that restarted since is recovered instead of failing the request, and again
+    while it starts or after a request could not reach it.
+
+    Each worker has one HTTP client whose keep-alive connections are reused by
+    all requests sent to it.
+
+    With post_staged a worker goes back into the queue once it executed the
+    prompt, and takes the next one while the outputs of the previous upload.
+    """
+
+    def __init__(self, workers: List[Any], is_ready: Callable[[Any], bool],
+                 host: str = '127.0.0.1',
+                 client_factory: Callable[[str], Any] = default_client_factory,
+                 ready_check_interval: float = READY_CHECK_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.workers = workers
+        self.is_ready = is_ready
+        self.host = host
+        self.client_factory = client_factory
+        self.ready_check_interval = ready_check_interval
+        self.clock = clock
+
+        self.ready: Optional[asyncio.Queue] = None
+        self.clients: Dict[int, Any] = {}
+        self.recovering = set()
+
+        self.waiting = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+
+    def start(self):
+        # the queue belongs to the running loop, uvicorn runs the api in its own process
+        if self.ready is not None:
+            return
+        self.ready = asyncio.Queue()
+        for worker in self.workers:
+            self._recover(worker)
+
+    async def acquire(self, timeout: float = TIME_OUT_TIME):
+        self.start()
+        started_at = self.clock()
+        self.waiting += 1
+        try:
+            while True:
+                worker = await asyncio.wait_for(self.ready.get(), max(started_at + timeout - self.clock(), 0))
+                if await asyncio.to_thread(self.is_ready, worker):
+                    break
+                logger.info(f"worker on port {worker.port} is not reachable, waiting until it is back")
+                self._recover(worker)
+        finally:
+            self.waiting -= 1
+
+        waited = self.clock() - started_at
+        self.dispatched += 1
+        self.total_wait += waited
+        self.last_wait = waited
+        logger.info(f"dispatch to worker on port {worker.port} after {waited:.3f}s, {self.waiting} waiting")
+        return worker
+
+    async def lease(self, timeout: float = TIME_OUT_TIME) -> WorkerLease:
+        return WorkerLease(self, await self.acquire(timeout))
+
+    def release(self, worker, healthy: bool = True):
+        if healthy:
+            self.ready.put_nowait(worker)
+        else:
+            self._recover(worker)
+
+    async def release_checked(self, lease: WorkerLease):
+        """Releases the worker of a failed request, checked off the event loop whether it is still reachable."""
+        if not lease.released:
+            lease.release(await asyncio.to_thread(self.is_ready, lease.worker))
+
+    async def post(self, worker, path: str, json: Any):
+        return await self._client(worker).post(path, json=json)
+
+    async def post_staged(self, lease: WorkerLease, path: str, json: Any,
+                          on_executed: Optional[Callable[[], Any]] = None):
+        """
+        Posts to a worker that answers in stages, see prompt_scheduler.staged_response.
+        The lease is released at the executed stage and the finished stage is returned
+        like a plain response. Workers answering in one piece are returned as is.
+        """
+        async with self._client(lease.worker).stream('POST', path, json=json) as response:
+            if response.status_code != 200 or \
+                    not response.headers.get('content-type', '').startswith(STAGED_CONTENT_TYPE):
+                await response.aread()
+                return StagedResponse(response.status_code, response.text)
+
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                stage = jsonlib.loads(line)
+                if stage['stage'] == STAGE_EXECUTED:
+                    if on_executed:
+                        on_executed()
+                    lease.release()
+                elif stage['stage'] == STAGE_FINISHED:
+                    return StagedResponse(200, jsonlib.dumps(stage['body']))
+
+        raise ConnectionError(f"worker on port {lease.worker.port} closed {path} before it finished")
+
+    def stats(self) -> dict:
+        return {
+            'idle': self.ready.qsize() if self.ready else 0,
+            'waiting': self.waiting,
+            'recovering': len(self.recovering),
+            'dispatched': self.dispatched,
+            'last_wait_seconds': self.last_wait,
+            'average_wait_seconds': self.total_wait / self.dispatched if self.dispatched else 0,
+        }
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients = {}
+
+    def _client(self, worker):
+        client = self.clients.get(worker.port)
+        if client is None:
+            client = self.clients[worker.port] = self.client_factory(f"http://{self.host}:{worker.port}")
+        return client
+
+    def _recover(self, worker):
+        if worker.port in self.recovering:
+            return
+        self.recovering.add(worker.port)
+        asyncio.get_running_loop().create_task(self._wait_ready(worker))
+
+    async def _wait_ready(self, worker):
+        # a restarted worker drops the kept connections, start over with a new client
+        client = self.clients.pop(worker.port, None)
+        if client is not None:
+            await client.aclose()
+
+        while not await asyncio.to_thread(self.is_ready, worker):
+            await asyncio.sleep(self.ready_check_interval)
+
+        logger.info(f"worker on port {worker.port} is ready")
+        self.recovering.discard(worker.port)
+        self.ready.put_nowait(worker)
@@ -9,7 +9,7 @@ import subprocess
 import sys
 import threading
 import time
-from typing import List
+from typing import Dict, List, Optional
 
 import aiohttp
 import boto3
@@ -31,6 +31,23 @@ sagemaker_safe_port_range = os.getenv('SAGEMAKER_SAFE_PORT_RANGE')
 start_port = int(sagemaker_safe_port_range.split('-')[0])
 should_exit = 0
 
+# seconds a forwarded invocation may take, by task type, override with e.g. INVOCATION_TIMEOUTS='{"txt2img": 900}'
+INVOCATION_TIMEOUTS = {
+    'interrogate_clip': 120,
+    'interrogate_deepbooru': 120,
+    'rembg': 120,
+    'extra-single-image': 120,
+    'extra-batch-images': 300,
+    'txt2img': 300,
+    'img2img': 300,
+    'db-create-model': 3600,
+    'merge-checkpoint': 3600,
+}
+INVOCATION_TIMEOUTS.update(json.loads(os.getenv('INVOCATION_TIMEOUTS') or '{}'))
+DEFAULT_INVOCATION_TIMEOUT = int(os.getenv('DEFAULT_INVOCATION_TIMEOUT', 300))
+# how often an app that is starting or went away is checked until its port accepts connections
+READY_CHECK_INTERVAL = 1
+
 
 class App:
     def __init__(self, device_id):
@@ -44,6 +61,9 @@ class App:
         self.stderr_thread = None
         self.cmd = None
         self.cwd = None
+        # one session per app, its keep-alive connections are reused by all forwarded requests
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.reachable = True
 
     def start(self):
         self.cwd = '/home/ubuntu/stable-diffusion-webui'
@@ -125,7 +145,18 @@ class App:
             result = sock.connect_ex(('127.0.0.1', self.port))
             return result == 0
 
-    async def invocations(self, payload, infer_id=None):
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(base_url=f"http://{self.host}:{self.port}",
+                                                 connector=aiohttp.TCPConnector(limit=2))
+        return self.session
+
+    async def close_session(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def invocations(self, payload, infer_id=None, timeout: float = DEFAULT_INVOCATION_TIMEOUT):
 
         try:
             self.busy = True
@@ -134,19 +165,17 @@ class App:
             payload['port'] = self.port
             payload['out_path'] = self.device_id
 
-            url = f"http://127.0.0.1:{self.port}/invocations"
-            timeout = aiohttp.ClientTimeout(total=300)
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=timeout) as response:
-                    if response.status != 200:
-                        result = json.dumps({
-                            "status_code": response.status,
-                            "detail": f"service returned an error: {await response.text()}"
-                        })
-                        self.busy = False
-                        return result
-                    response_data = await response.json()
+            async with self.get_session().post("/invocations", json=payload, timeout=client_timeout) as response:
+                if response.status != 200:
+                    result = json.dumps({
+                        "status_code": response.status,
+                        "detail": f"service returned an error: {await response.text()}"
+                    })
+                    self.busy = False
+                    return result
+                response_data = await response.json()
 
             self.busy = False
             self.name = f"{service_type}-gpu{self.device_id}"
@@ -154,6 +183,8 @@ class App:
             return response_data
         except Exception as e:
             self.busy = False
+            if isinstance(e, aiohttp.ClientConnectionError):
+                self.reachable = False
             logger.error(f"invocations error:{e}")
             return json.dumps({
                 "status_code": 500,
@@ -161,7 +192,57 @@ class App:
             })
 
 
+class AppPool:
+    """
+    Idle apps wait in a queue and a finished invocation hands its app to the longest
+    waiting request right away. Ports are only checked while an app starts or after
+    it could not be reached.
+    """
+
+    def __init__(self, pool_apps: List[App], ready_check_interval: float = READY_CHECK_INTERVAL):
+        self.apps = pool_apps
+        self.ready_check_interval = ready_check_interval
+        self.ready: Optional[asyncio.Queue] = None
+        self.known: Dict[int, App] = {}
+
+    def start(self):
+        # the queue is created in the server loop, apps are started after the server
+        if self.ready is None:
+            self.ready = asyncio.Queue()
+        for pool_app in self.apps:
+            if pool_app.port not in self.known:
+                self.known[pool_app.port] = pool_app
+                asyncio.get_running_loop().create_task(self._wait_ready(pool_app))
+
+    async def acquire(self) -> App:
+        self.start()
+        return await self.ready.get()
+
+    def release(self, pool_app: App):
+        if pool_app.reachable:
+            self.ready.put_nowait(pool_app)
+        else:
+            asyncio.get_running_loop().create_task(self._wait_ready(pool_app))
+
+    def idle(self) -> int:
+        return self.ready.qsize() if self.ready else 0
+
+    async def _wait_ready(self, pool_app: App):
+        # a restarted app drops the kept connections
+        await pool_app.close_session()
+        while not await asyncio.to_thread(pool_app.is_port_ready):
+            await asyncio.sleep(self.ready_check_interval)
+        logger.info(f"app on device {pool_app.device_id} port {pool_app.port} is ready")
+        pool_app.reachable = True
+        self.ready.put_nowait(pool_app)
+
+
+def get_invocation_timeout(payload: dict) -> float:
+    return INVOCATION_TIMEOUTS.get(payload.get('task'), DEFAULT_INVOCATION_TIMEOUT)
+
+
 apps: List[App] = []
+app_pool = AppPool(apps)
 
 
 def get_gpu_count():
@@ -278,15 +359,13 @@ async def invocations(request: Request):
     else:
         infer_id = payload['prompt_id']
 
-    logger.info(f"controller_invocation {infer_id} received")
+    logger.info(f"controller_invocation {infer_id} received, {app_pool.idle()} apps idle")
 
-    while True:
-        app = get_available_app()
-        if app:
-            return await app.invocations(payload=payload, infer_id=infer_id)
-        else:
-            await asyncio.sleep(1)
-            logger.info(f'controller_invocation {infer_id} waiting for an available app...')
+    sd_app = await app_pool.acquire()
+    try:
+        return await sd_app.invocations(payload=payload, infer_id=infer_id, timeout=get_invocation_timeout(payload))
+    finally:
+        app_pool.release(sd_app)
 
 
 def stop():
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import time
+import unittest
+from unittest import TestCase
+
+try:
+    import aiohttp
+    from aiohttp import web
+    import fastapi
+    import uvicorn
+except ImportError:
+    raise unittest.SkipTest('aiohttp, fastapi and uvicorn are installed in the inference image')
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('SAGEMAKER_SAFE_PORT_RANGE', '8088-9088')
+
+import controller
+
+
+class StubBackend:
+    """Stands in for a WebUI process: /invocations answers after `seconds`."""
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.peers = set()
+        self.runner = None
+        self.port = None
+
+    async def start(self):
+        async def invocations(request):
+            self.peers.add(request.transport.get_extra_info('peername'))
+            payload = await request.json()
+            await asyncio.sleep(self.seconds)
+            return web.json_response({'id': payload['id'], 'port': self.port})
+
+        web_app = web.Application()
+        web_app.router.add_post('/invocations', invocations)
+        self.runner = web.AppRunner(web_app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def start_pool(backends):
+    pool_apps = []
+    for device_id, backend in enumerate(backends):
+        await backend.start()
+        pool_app = controller.App(device_id)
+        pool_app.port = backend.port
+        pool_apps.append(pool_app)
+    return pool_apps, controller.AppPool(pool_apps, ready_check_interval=0.01)
+
+
+async def invoke(pool, payload):
+    pool_app = await pool.acquire()
+    try:
+        return await pool_app.invocations(payload=payload, infer_id=payload['id'],
+                                          timeout=controller.get_invocation_timeout(payload))
+    finally:
+        pool.release(pool_app)
+
+
+class ControllerTest(TestCase):
+
+    def test_requests_are_handed_to_free_apps_over_kept_connections(self):
+        backends = [StubBackend(0.1), StubBackend(0.1)]
+
+        async def scenario():
+            pool_apps, pool = await start_pool(backends)
+            # sessions are opened by the first request of each app
+            await asyncio.gather(invoke(pool, {'id': 'warmup', 'task': 'txt2img'}),
+                                 invoke(pool, {'id': 'warmup', 'task': 'txt2img'}))
+
+            started = time.monotonic()
+            results = await asyncio.gather(*[invoke(pool, {'id': f'job{i}', 'task': 'txt2img'}) for i in range(6)])
+            elapsed = time.monotonic() - started
+
+            for pool_app in pool_apps:
+                await pool_app.close_session()
+            for backend in backends:
+                await backend.stop()
+            return results, elapsed
+
+        results, elapsed = asyncio.run(scenario())
+
+        self.assertEqual([r['id'] for r in results], [f'job{i}' for i in range(6)])
+        # 6 requests of 100ms on 2 apps, polling every second would add up to 3 seconds
+        self.assertLess(elapsed, 0.6)
+        for backend in backends:
+            self.assertEqual(len(backend.peers), 1)
+
+    def test_timeout_depends_on_task(self):
+        backend = StubBackend(0.3)
+        controller.INVOCATION_TIMEOUTS['interrogate_clip'] = 0.05
+
+        async def scenario():
+            pool_apps, pool = await start_pool([backend])
+            quick = await invoke(pool, {'id': 'quick', 'task': 'interrogate_clip'})
+            slow = await invoke(pool, {'id': 'slow', 'task': 'txt2img'})
+            await pool_apps[0].close_session()
+            await backend.stop()
+            return quick, slow
+
+        try:
+            quick, slow = asyncio.run(scenario())
+        finally:
+            controller.INVOCATION_TIMEOUTS['interrogate_clip'] = 120
+
+        self.assertEqual(json.loads(quick)['status_code'], 500)
+        self.assertEqual(slow['id'], 'slow')
+        self.assertEqual(controller.get_invocation_timeout({'prompt_id': 'comfy'}),
+                         controller.DEFAULT_INVOCATION_TIMEOUT)
+
+    def test_unreachable_app_is_not_handed_out_until_ready(self):
+        backend = StubBackend()
+
+        async def scenario():
+            pool_apps, pool = await start_pool([backend])
+            await invoke(pool, {'id': 'first', 'task': 'txt2img'})
+            await backend.stop()
+
+            failed = await invoke(pool, {'id': 'lost', 'task': 'txt2img'})
+            self.assertFalse(pool_apps[0].reachable)
+            waiter = asyncio.ensure_future(pool.acquire())
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiter.done())
+
+            await backend.start()
+            pool_apps[0].port = backend.port
+            recovered = await asyncio.wait_for(waiter, 1)
+            await backend.stop()
+            return failed, recovered
+
+        failed, recovered = asyncio.run(scenario())
+
+        self.assertEqual(json.loads(failed)['status_code'], 500)
+        self.assertTrue(recovered.reachable)
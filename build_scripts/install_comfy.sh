@@ -24,6 +24,11 @@ if [ -n "$ESD_COMMIT_ID" ]; then
 fi
 
 cp stable-diffusion-aws-extension/build_scripts/comfy/serve.py ComfyUI/
+cp stable-diffusion-aws-extension/build_scripts/comfy/prompt_scheduler.py ComfyUI/
+cp stable-diffusion-aws-extension/build_scripts/comfy/worker_dispatcher.py ComfyUI/
+cp stable-diffusion-aws-extension/build_scripts/comfy/message_batcher.py ComfyUI/
+cp stable-diffusion-aws-extension/build_scripts/comfy/model_sync.py ComfyUI/
+cp stable-diffusion-aws-extension/aws_extension/cloudwatch_metrics.py ComfyUI/
 cp stable-diffusion-aws-extension/build_scripts/comfy/comfy_proxy.py ComfyUI/custom_nodes/
 #  TODO 6.14 delete
 cp stable-diffusion-aws-extension/build_scripts/comfy/comfy_sagemaker_proxy.py ComfyUI/custom_nodes/
@@ -1,10 +1,7 @@
 import os
 import re
 import json
-import threading
 import sys
-import time
-import pickle
 import logging
 import base64
 logger = logging.getLogger(__name__)
@@ -14,62 +11,20 @@ logging.basicConfig(level=logging.INFO) # Set logging level and STDOUT handler
 import boto3
 
 sys.path.insert(0, os.path.join(os.getcwd(), "extensions/stable-diffusion-aws-extension/"))
-from utils import download_file_from_s3, download_folder_from_s3_by_tar, download_folder_from_s3, upload_file_to_s3, upload_folder_to_s3_by_tar
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from training_status import ArtifactUploader, ControlReader, TrainingStatusSync
+from utils import download_folder_from_s3_by_tar, download_folder_from_s3, upload_file_to_s3, upload_folder_to_s3_by_tar
 from utils import get_bucket_name_from_s3_path, get_path_from_s3_path
 
 os.environ['IGNORE_CMD_ARGS_ERRORS'] = ""
 
 from utils import tar, mv
 
-def sync_status_from_s3_json(bucket_name, webui_status_file_path, sagemaker_status_file_path):
-    while True:
-        time.sleep(1)
-        print(f'sagemaker status: {status.__dict__}')
-        try:
-            download_file_from_s3(bucket_name, webui_status_file_path, 'webui_status.json')
-            with open('webui_status.json') as webui_status_file:
-                webui_status = json.load(webui_status_file)
-            status.do_save_model = webui_status['do_save_model']
-            status.do_save_samples = webui_status['do_save_samples']
-            status.interrupted = webui_status['interrupted']
-            status.interrupted_after_save = webui_status['interrupted_after_save']
-            status.interrupted_after_epoch =  webui_status['interrupted_after_epoch']
-        except Exception as e:
-            print('The webui status file is not exists')
-            print(e)
-        with open('sagemaker_status.json', 'w') as sagemaker_status_file:
-            json.dump(status.__dict__, sagemaker_status_file)
-        upload_file_to_s3('sagemaker_status.json', bucket_name, sagemaker_status_file_path)
-
-def sync_status_from_s3_in_sagemaker(bucket_name, webui_status_file_path, sagemaker_status_file_path):
-    while True:
-        time.sleep(1)
-        print(status.__dict__)
-        try:
-            download_file_from_s3(bucket_name, webui_status_file_path, 'webui_status.pickle')
-            with open('webui_status.pickle', 'rb') as webui_status_file:
-                webui_status = pickle.load(webui_status_file)
-            status.do_save_model = webui_status['do_save_model']
-            status.do_save_samples = webui_status['do_save_samples']
-            status.interrupted = webui_status['interrupted']
-            status.interrupted_after_save = webui_status['interrupted_after_save']
-            status.interrupted_after_epoch =  webui_status['interrupted_after_epoch']
-        except Exception as e:
-            print('The webui status file is not exists')
-            print(f'error: {e}')
-        with open('sagemaker_status.pickle', 'wb') as sagemaker_status_file:
-            pickle.dump(status, sagemaker_status_file)
-        upload_file_to_s3('sagemaker_status.pickle', bucket_name, sagemaker_status_file_path)
-
-
-def check_and_upload(local_path, bucket, s3_path):
-    while True:
-        time.sleep(1)
-        if os.path.exists(local_path):
-            print(f'upload {s3_path} to {local_path}')
-            upload_folder_to_s3_by_tar(local_path, bucket, s3_path)
-        else:
-            print(f'{local_path} is not exist')
+def save_webui_status(webui_status):
+    # the trainer reads the control flags (do_save_model, interrupted...) from the local file
+    with open('webui_status.json.tmp', 'w') as webui_status_file:
+        json.dump(webui_status, webui_status_file)
+    os.replace('webui_status.json.tmp', 'webui_status.json')
 
 def upload_model_to_s3(model_name, s3_output_path):
     output_bucket_name = get_bucket_name_from_s3_path(s3_output_path)
@@ -135,13 +90,24 @@ def download_data(data_list, s3_data_path_list, s3_input_path):
 
 
 def sync_status(job_id, bucket_name, model_dir):
-    local_samples_dir = f'models/dreambooth/{model_dir}/samples'
-    upload_thread = threading.Thread(target=check_and_upload, args=(local_samples_dir, bucket_name, f'aigc-webui-test-samples/{job_id}'))
-    upload_thread.start()
-    sync_status_thread = threading.Thread(target=sync_status_from_s3_in_sagemaker,
-                                        args=(bucket_name, f'aigc-webui-test-status/{job_id}/webui_status.pickle',
-                                              f'aigc-webui-test-status/{job_id}/sagemaker_status.pickle'))
-    sync_status_thread.start()
+    """
+    Publishes the trainer status and new samples when they change, the returned sync is stopped after training.
+    Not started by main: this entrypoint runs no trainer that writes sagemaker_status.json, and the
+    training params carry neither the job id nor the model dir. The WebUI reads progress from the status
+    file in S3, progress events and their consumer wait until a trainer is wired in here.
+    """
+    s3_client = boto3.client('s3')
+    status_sync = TrainingStatusSync(
+        job_id, s3_client, bucket_name,
+        status_path='sagemaker_status.json',
+        status_key=f'aigc-webui-test-status/{job_id}/sagemaker_status.json',
+        artifacts=[ArtifactUploader(s3_client, bucket_name, f'models/dreambooth/{model_dir}/samples',
+                                    f'aigc-webui-test-samples/{job_id}')],
+        control=ControlReader(s3_client, bucket_name, f'aigc-webui-test-status/{job_id}/webui_status.json'),
+        on_control=save_webui_status,
+    )
+    status_sync.start()
+    return status_sync
 
 def main(s3_input_path, s3_output_path, params):
     os.system("df -h")
@@ -156,7 +122,6 @@ def main(s3_input_path, s3_output_path, params):
     # s3_data_path_list = params["s3_data_path_list"]
     # s3_class_data_path_list = params["s3_class_data_path_list"]
     os.system("df -h")
-    # sync_status(job_id, bucket_name, model_dir)
     os.system("df -h")
     os.system("ls -R models")
     upload_model_to_s3_v2(model_name, s3_output_path, model_type)
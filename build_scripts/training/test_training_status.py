@@ -0,0 +1,166 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from training_status import ArtifactUploader, ControlReader, TrainingStatusSync
+
+
+class ClientError(Exception):
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3:
+    """Stands in for the S3 client, counts the requests the status sync makes."""
+
+    def __init__(self):
+        self.objects = {}
+        self.etags = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        with self.lock:
+            self.calls.append(('put_object', Key))
+            self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+            self.etags[Key] = f'"{len(self.calls)}"'
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, 'rb') as f:
+            body = f.read()
+        with self.lock:
+            self.calls.append(('upload_file', key))
+            self.objects[key] = body
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        with self.lock:
+            self.calls.append(('get_object', Key))
+            if Key not in self.objects:
+                raise ClientError('NoSuchKey')
+            if IfNoneMatch and IfNoneMatch == self.etags[Key]:
+                raise ClientError('304')
+            return {'Body': io.BytesIO(self.objects[Key]), 'ETag': self.etags[Key]}
+
+
+class FakeEvents:
+
+    def __init__(self):
+        self.details = []
+
+    def put_events(self, Entries):
+        for entry in Entries:
+            self.details.append(json.loads(entry['Detail']))
+
+
+class FakeTrainer:
+    """Writes status files and samples the way a trainer does, into a temp folder."""
+
+    def __init__(self, root):
+        self.status_path = os.path.join(root, 'sagemaker_status.json')
+        self.samples = os.path.join(root, 'samples')
+        os.makedirs(self.samples)
+
+    def write_status(self, **status):
+        tmp_path = f'{self.status_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self.status_path)
+
+    def write_sample(self, name, content):
+        with open(os.path.join(self.samples, name), 'wb') as f:
+            f.write(content)
+
+
+class TrainingStatusSyncTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.trainer = FakeTrainer(self.tmp.name)
+        self.s3 = FakeS3()
+        self.events = FakeEvents()
+        self.controls = []
+        self.sync = TrainingStatusSync(
+            'job-1', self.s3, 'bucket',
+            status_path=self.trainer.status_path,
+            status_key='status/job-1/sagemaker_status.json',
+            artifacts=[ArtifactUploader(self.s3, 'bucket', self.trainer.samples, 'samples/job-1', settle_seconds=0)],
+            control=ControlReader(self.s3, 'bucket', 'status/job-1/webui_status.json'),
+            on_control=self.controls.append,
+            events_client=self.events,
+            control_interval=0,
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_status_is_published_only_when_it_changes(self):
+        self.assertFalse(self.sync.check())
+
+        self.trainer.write_status(step=1, epoch=0)
+        self.assertTrue(self.sync.check())
+        # checks without changes make no requests but the conditional control read
+        for _ in range(10):
+            self.assertFalse(self.sync.check())
+        # rewritten with the same content
+        self.trainer.write_status(step=1, epoch=0)
+        self.assertFalse(self.sync.check())
+        self.trainer.write_status(step=2, epoch=0)
+        self.assertTrue(self.sync.check())
+
+        puts = [call for call in self.s3.calls if call[0] == 'put_object']
+        self.assertEqual(len(puts), 2)
+        self.assertEqual(json.loads(self.s3.objects['status/job-1/sagemaker_status.json']), {'step': 2, 'epoch': 0})
+        self.assertEqual([(d['seq'], d['status']['step']) for d in self.events.details], [(1, 1), (2, 2)])
+        self.assertEqual(self.events.details[0]['training_id'], 'job-1')
+
+    def test_samples_are_uploaded_once_by_content(self):
+        self.trainer.write_sample('0001.png', b'first')
+        self.trainer.write_sample('0002.png', b'second')
+        self.sync.check()
+        self.trainer.write_sample('0001.png', b'first')
+        self.sync.check()
+        self.trainer.write_sample('0002.png', b'second, retrained')
+        self.sync.check()
+
+        uploads = [call[1] for call in self.s3.calls if call[0] == 'upload_file']
+        self.assertEqual(uploads, ['samples/job-1/0001.png', 'samples/job-1/0002.png', 'samples/job-1/0002.png'])
+        self.assertEqual(self.events.details[-1]['uploaded'], ['samples/job-1/0002.png'])
+        self.assertNotIn('status', self.events.details[-1])
+
+    def test_unsettled_sample_waits_for_a_later_or_final_check(self):
+        uploader = ArtifactUploader(self.s3, 'bucket', self.trainer.samples, 'samples/job-1', settle_seconds=60)
+        self.trainer.write_sample('model.safetensors', b'half written')
+
+        self.assertEqual(uploader.upload_changed(), [])
+        self.assertEqual(uploader.upload_changed(settled_only=False), ['samples/job-1/model.safetensors'])
+
+    def test_control_is_read_only_when_its_etag_changes(self):
+        self.s3.put_object(Bucket='bucket', Key='status/job-1/webui_status.json', Body='{"interrupted": false}')
+        for _ in range(3):
+            self.sync.check()
+        self.s3.put_object(Bucket='bucket', Key='status/job-1/webui_status.json', Body='{"interrupted": true}')
+        self.sync.check()
+
+        self.assertEqual(self.controls, [{'interrupted': False}, {'interrupted': True}])
+
+    def test_running_sync_publishes_the_last_status_on_stop(self):
+        self.sync.interval = 0.01
+        self.sync.start()
+        for step in range(5):
+            self.trainer.write_status(step=step)
+            time.sleep(0.03)
+        self.trainer.write_status(step=99, finished=True)
+        self.trainer.write_sample('final.png', b'final')
+        self.sync.stop()
+
+        self.assertEqual(json.loads(self.s3.objects['status/job-1/sagemaker_status.json']),
+                         {'step': 99, 'finished': True})
+        self.assertIn('samples/job-1/final.png', self.s3.objects)
+        seqs = [d['seq'] for d in self.events.details]
+        self.assertEqual(seqs, sorted(seqs))
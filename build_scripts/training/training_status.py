@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# seconds between checks of the local status file and artifact folders, a check without changes is a few stat calls
+STATUS_CHECK_SECONDS = int(os.environ.get('STATUS_CHECK_SECONDS') or 5)
+# seconds between checks of the control file the WebUI writes to S3
+CONTROL_CHECK_SECONDS = int(os.environ.get('CONTROL_CHECK_SECONDS') or 30)
+# files younger than this are still being written by the trainer and uploaded by a later check
+ARTIFACT_SETTLE_SECONDS = 2
+
+PROGRESS_EVENT_SOURCE = 'esd.training'
+PROGRESS_EVENT_DETAIL_TYPE = 'Training Job Progress'
+
+
+def file_digest(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _error_code(e: Exception) -> str:
+    return str(getattr(e, 'response', {}).get('Error', {}).get('Code', ''))
+
+
+class ArtifactUploader:
+    """
+    Uploads the new and changed files of a folder, one object per file.
+
+    A file is hashed only when its size or mtime changed, and uploaded only when its
+    content differs from what this uploader sent before, so samples and checkpoints
+    written once are sent once however often the folder is checked.
+    """
+
+    def __init__(self, s3_client, bucket: str, local_dir: str, prefix: str,
+                 hash_file: Callable[[str], str] = file_digest, settle_seconds: float = ARTIFACT_SETTLE_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.local_dir = local_dir
+        self.prefix = prefix.rstrip('/')
+        self.hash_file = hash_file
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        # relative path -> (size, mtime_ns) of the last check and the digest of the uploaded content
+        self.stats: Dict[str, tuple] = {}
+        self.digests: Dict[str, str] = {}
+
+    def upload_changed(self, settled_only: bool = True) -> List[str]:
+        if not os.path.isdir(self.local_dir):
+            return []
+
+        uploaded = []
+        now = self.clock()
+        for root, _, files in os.walk(self.local_dir):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, self.local_dir).replace(os.sep, '/')
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                file_stat = (stat.st_size, stat.st_mtime_ns)
+                if self.stats.get(rel_path) == file_stat:
+                    continue
+                if settled_only and now - stat.st_mtime < self.settle_seconds:
+                    continue
+
+                digest = self.hash_file(file_path)
+                if self.digests.get(rel_path) != digest:
+                    key = f'{self.prefix}/{rel_path}'
+                    self.s3_client.upload_file(file_path, self.bucket, key)
+                    self.digests[rel_path] = digest
+                    uploaded.append(key)
+                self.stats[rel_path] = file_stat
+        return uploaded
+
+
+class ControlReader:
+    """Reads the control file written by the WebUI, it is only downloaded again when its ETag changed."""
+
+    def __init__(self, s3_client, bucket: str, key: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.etag = None
+
+    def read(self) -> Optional[dict]:
+        params = {'Bucket': self.bucket, 'Key': self.key}
+        if self.etag:
+            params['IfNoneMatch'] = self.etag
+        try:
+            resp = self.s3_client.get_object(**params)
+        except Exception as e:
+            if _error_code(e) in ('304', 'NotModified', 'NoSuchKey', '404'):
+                return None
+            raise
+        self.etag = resp.get('ETag')
+        return json.loads(resp['Body'].read())
+
+
+class TrainingStatusSync:
+    """
+    Publishes the progress of a training job when it changes.
+
+    The trainer writes its status as JSON to `status_path`. Each check compares the file
+    to the last published status and, only when it differs, uploads it to `status_key`
+    and sends a progress event that training_event.py records on the training job.
+    Changed artifacts are uploaded on the same checks, and control changes made by the
+    WebUI are handed to `on_control`.
+    """
+
+    def __init__(self, training_id: str, s3_client, bucket: str, status_path: str, status_key: str,
+                 artifacts: List[ArtifactUploader] = None, control: Optional[ControlReader] = None,
+                 on_control: Callable[[dict], None] = None, events_client=None,
+                 interval: float = STATUS_CHECK_SECONDS, control_interval: float = CONTROL_CHECK_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.training_id = training_id
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.status_path = status_path
+        self.status_key = status_key
+        self.artifacts = artifacts or []
+        self.control = control
+        self.on_control = on_control
+        self.events_client = events_client
+        self.interval = interval
+        self.control_interval = control_interval
+        self.clock = clock
+        self.seq = 0
+        self.status_stat = None
+        self.published = None
+        self.control_checked_at = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def check(self, final: bool = False) -> bool:
+        """Runs one check, returns whether anything was published. The final check also uploads unsettled files."""
+        status = self._changed_status()
+        uploaded = []
+        for artifact in self.artifacts:
+            uploaded.extend(artifact.upload_changed(settled_only=not final))
+
+        if status is not None:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.status_key, Body=json.dumps(status))
+        if status is not None or uploaded:
+            self.seq += 1
+            self._send_event(status, uploaded)
+
+        now = self.clock()
+        if self.control and (self.control_checked_at is None or now - self.control_checked_at >= self.control_interval):
+            self.control_checked_at = now
+            control = self.control.read()
+            if control is not None and self.on_control:
+                self.on_control(control)
+
+        return status is not None or len(uploaded) > 0
+
+    def _changed_status(self) -> Optional[dict]:
+        try:
+            stat = os.stat(self.status_path)
+        except FileNotFoundError:
+            return None
+        file_stat = (stat.st_size, stat.st_mtime_ns)
+        if file_stat == self.status_stat:
+            return None
+
+        try:
+            with open(self.status_path) as f:
+                status = json.load(f)
+        except ValueError:
+            # caught while the trainer writes it, read on the next check
+            return None
+        self.status_stat = file_stat
+        if status == self.published:
+            return None
+        self.published = status
+        return status
+
+    def _send_event(self, status: Optional[dict], uploaded: List[str]):
+        if not self.events_client:
+            return
+        detail = {'training_id': self.training_id, 'seq': self.seq, 'uploaded': uploaded}
+        if status is not None:
+            detail['status'] = status
+        try:
+            self.events_client.put_events(Entries=[{
+                'Source': PROGRESS_EVENT_SOURCE,
+                'DetailType': PROGRESS_EVENT_DETAIL_TYPE,
+                'Detail': json.dumps(detail),
+            }])
+        except Exception as e:
+            # the status file in S3 is still there, a lost event only delays the job record
+            logger.warning(f'progress event {self.seq} of {self.training_id} not sent: {e}')
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f'training status check failed: {e}')
+
+    def stop(self):
+        """Stops the checks and publishes what changed since the last one."""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.check(final=True)
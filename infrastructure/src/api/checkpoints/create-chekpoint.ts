@@ -14,6 +14,7 @@ export interface CreateCheckPointApiProps {
   router: aws_apigateway.Resource;
   httpMethod: string;
   checkpointTable: aws_dynamodb.Table;
+  checkpointNameIndexTable: aws_dynamodb.Table;
   multiUserTable: aws_dynamodb.Table;
   commonLayer: aws_lambda.LayerVersion;
   s3Bucket: aws_s3.Bucket;
@@ -25,6 +26,7 @@ export class CreateCheckPointApi {
   private readonly httpMethod: string;
   private readonly scope: Construct;
   private readonly checkpointTable: aws_dynamodb.Table;
+  private readonly checkpointNameIndexTable: aws_dynamodb.Table;
   private readonly multiUserTable: aws_dynamodb.Table;
   private readonly layer: aws_lambda.LayerVersion;
   private readonly s3Bucket: aws_s3.Bucket;
@@ -36,6 +38,7 @@ export class CreateCheckPointApi {
     this.scope = scope;
     this.httpMethod = props.httpMethod;
     this.checkpointTable = props.checkpointTable;
+    this.checkpointNameIndexTable = props.checkpointNameIndexTable;
     this.multiUserTable = props.multiUserTable;
     this.baseId = id;
     this.router = props.router;
@@ -236,6 +239,7 @@ export class CreateCheckPointApi {
       tracing: aws_lambda.Tracing.ACTIVE,
       environment: {
         CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
         UPLOAD_BY_URL_LAMBDA_NAME: this.uploadByUrlLambda.functionName,
       },
       layers: [this.layer],
@@ -257,6 +261,7 @@ export class CreateCheckPointApi {
       ephemeralStorageSize: Size.mebibytes(10240),
       environment: {
         CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
       },
       layers: [this.layer],
     });
@@ -279,7 +284,11 @@ export class CreateCheckPointApi {
         'dynamodb:UpdateItem',
         'dynamodb:DeleteItem',
       ],
-      resources: [this.checkpointTable.tableArn, this.multiUserTable.tableArn],
+      resources: [
+        this.checkpointTable.tableArn,
+        this.checkpointNameIndexTable.tableArn,
+        this.multiUserTable.tableArn,
+      ],
     }));
 
     newRole.addToPolicy(new aws_iam.PolicyStatement({
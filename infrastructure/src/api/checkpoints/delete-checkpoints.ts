@@ -20,6 +20,7 @@ export interface DeleteCheckpointsApiProps {
   router: Resource;
   httpMethod: string;
   checkPointsTable: Table;
+  checkpointNameIndexTable: Table;
   userTable: Table;
   commonLayer: LayerVersion;
   s3Bucket: Bucket;
@@ -30,6 +31,7 @@ export class DeleteCheckpointsApi {
   private readonly httpMethod: string;
   private readonly scope: Construct;
   private readonly checkPointsTable: Table;
+  private readonly checkpointNameIndexTable: Table;
   private readonly userTable: Table;
   private readonly layer: LayerVersion;
   private readonly baseId: string;
@@ -41,6 +43,7 @@ export class DeleteCheckpointsApi {
     this.router = props.router;
     this.httpMethod = props.httpMethod;
     this.checkPointsTable = props.checkPointsTable;
+    this.checkpointNameIndexTable = props.checkpointNameIndexTable;
     this.userTable = props.userTable;
     this.layer = props.commonLayer;
     this.s3Bucket = props.s3Bucket;
@@ -113,6 +116,7 @@ export class DeleteCheckpointsApi {
         tracing: aws_lambda.Tracing.ACTIVE,
         environment: {
           CHECKPOINTS_TABLE: this.checkPointsTable.tableName,
+          CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
         },
         layers: [this.layer],
       });
@@ -140,6 +144,7 @@ export class DeleteCheckpointsApi {
       ],
       resources: [
         this.checkPointsTable.tableArn,
+        this.checkpointNameIndexTable.tableArn,
         this.userTable.tableArn,
       ],
     }));
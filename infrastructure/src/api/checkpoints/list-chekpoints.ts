@@ -5,7 +5,14 @@ import { Effect } from 'aws-cdk-lib/aws-iam';
 import { Architecture, Runtime } from 'aws-cdk-lib/aws-lambda';
 import { Construct } from 'constructs';
 import { ApiModels } from '../../shared/models';
-import { SCHEMA_CHECKPOINT_ID, SCHEMA_CHECKPOINT_STATUS, SCHEMA_CHECKPOINT_TYPE, SCHEMA_DEBUG, SCHEMA_MESSAGE } from '../../shared/schema';
+import {
+  SCHEMA_CHECKPOINT_ID,
+  SCHEMA_CHECKPOINT_STATUS,
+  SCHEMA_CHECKPOINT_TYPE,
+  SCHEMA_DEBUG,
+  SCHEMA_LAST_KEY,
+  SCHEMA_MESSAGE,
+} from '../../shared/schema';
 
 
 export interface ListCheckPointsApiProps {
@@ -50,6 +57,8 @@ export class ListCheckPointsApi {
       requestParameters: {
         'method.request.querystring.page': false,
         'method.request.querystring.per_page': false,
+        'method.request.querystring.limit': false,
+        'method.request.querystring.exclusive_start_key': false,
         'method.request.querystring.username': false,
       },
       methodResponses: [
@@ -91,6 +100,10 @@ export class ListCheckPointsApi {
               total: {
                 type: JsonSchemaType.INTEGER,
               },
+              truncated: {
+                type: JsonSchemaType.BOOLEAN,
+              },
+              last_evaluated_key: SCHEMA_LAST_KEY,
               checkpoints: {
                 type: JsonSchemaType.ARRAY,
                 items: {
@@ -152,10 +165,22 @@ export class ListCheckPointsApi {
             },
             required: [
               'checkpoints',
-              'page',
-              'pages',
               'per_page',
-              'total',
+            ],
+            // page/pages/total by default, last_evaluated_key when limit or exclusive_start_key is sent
+            anyOf: [
+              {
+                required: [
+                  'page',
+                  'pages',
+                  'total',
+                ],
+              },
+              {
+                required: [
+                  'last_evaluated_key',
+                ],
+              },
             ],
           },
         },
@@ -202,7 +227,11 @@ export class ListCheckPointsApi {
         'dynamodb:Scan',
         'dynamodb:Query',
       ],
-      resources: [this.checkpointTable.tableArn, this.multiUserTable.tableArn],
+      resources: [
+        this.checkpointTable.tableArn,
+        `${this.checkpointTable.tableArn}/*`,
+        this.multiUserTable.tableArn,
+      ],
     }));
 
     newRole.addToPolicy(new aws_iam.PolicyStatement({
@@ -14,6 +14,7 @@ export interface UpdateCheckPointApiProps {
   router: aws_apigateway.Resource;
   httpMethod: string;
   checkpointTable: aws_dynamodb.Table;
+  checkpointNameIndexTable: aws_dynamodb.Table;
   userTable: aws_dynamodb.Table;
   commonLayer: aws_lambda.LayerVersion;
   s3Bucket: aws_s3.Bucket;
@@ -24,6 +25,7 @@ export class UpdateCheckPointApi {
   private readonly httpMethod: string;
   private readonly scope: Construct;
   private readonly checkpointTable: aws_dynamodb.Table;
+  private readonly checkpointNameIndexTable: aws_dynamodb.Table;
   private readonly userTable: aws_dynamodb.Table;
   private readonly layer: aws_lambda.LayerVersion;
   private readonly s3Bucket: aws_s3.Bucket;
@@ -37,6 +39,7 @@ export class UpdateCheckPointApi {
     this.router = props.router;
     this.httpMethod = props.httpMethod;
     this.checkpointTable = props.checkpointTable;
+    this.checkpointNameIndexTable = props.checkpointNameIndexTable;
     this.userTable = props.userTable;
     this.s3Bucket = props.s3Bucket;
     this.role = this.iamRole();
@@ -219,6 +222,19 @@ export class UpdateCheckPointApi {
       ],
     }));
 
+    newRole.addToPolicy(new aws_iam.PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        'dynamodb:GetItem',
+        'dynamodb:PutItem',
+        'dynamodb:BatchWriteItem',
+        'dynamodb:DeleteItem',
+      ],
+      resources: [
+        this.checkpointNameIndexTable.tableArn,
+      ],
+    }));
+
     newRole.addToPolicy(new aws_iam.PolicyStatement({
       effect: Effect.ALLOW,
       actions: [
@@ -310,6 +326,7 @@ export class UpdateCheckPointApi {
       ephemeralStorageSize: Size.mebibytes(10240),
       environment: {
         CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
       },
       layers: [this.layer],
     });
@@ -328,6 +345,7 @@ export class UpdateCheckPointApi {
       tracing: aws_lambda.Tracing.ACTIVE,
       environment: {
         CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
         RENAME_LAMBDA_NAME: renameLambdaFunction.functionName,
       },
       layers: [this.layer],
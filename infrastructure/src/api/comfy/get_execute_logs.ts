@@ -96,7 +96,18 @@ export class GetExecuteLogsApi {
                                         }
                                     }
                                 },
-                            }
+                            },
+                            status: {
+                                type: JsonSchemaType.STRING,
+                                description: 'Status of the logs query, results are partial until it is Complete',
+                            },
+                            next_token: {
+                                type: [
+                                    JsonSchemaType.STRING,
+                                    JsonSchemaType.NULL,
+                                ],
+                                description: 'Pass as next_token to get the rest of a query still running',
+                            },
                         }
                     },
                 },
@@ -125,6 +136,7 @@ export class GetExecuteLogsApi {
             tracing: aws_lambda.Tracing.ACTIVE,
             environment: {
                 EXECUTE_TABLE: this.executeTable.tableName,
+                S3_BUCKET_NAME: this.s3Bucket.bucketName,
             },
             layers: [this.layer],
         });
@@ -85,6 +85,7 @@ export class PrepareApi {
         this.syncTable.tableArn,
         this.instanceMonitorTable.tableArn,
         this.endpointTable.tableArn,
+        `${this.endpointTable.tableArn}/*`,
       ],
     }));
 
@@ -41,7 +41,10 @@ export class SyncMsgApi {
 
     const lambdaFunction = this.apiLambda();
 
-    const syncMsgEventSource = new SqsEventSource(this.queue);
+    const syncMsgEventSource = new SqsEventSource(this.queue, {
+      // the handler reports messages it could not save, only those are delivered again
+      reportBatchItemFailures: true,
+    });
     lambdaFunction.addEventSource(syncMsgEventSource);
 
     const lambdaIntegration = new LambdaIntegration(
@@ -223,7 +223,8 @@ export class CropDatasetApi {
       handler: 'handler',
       timeout: Duration.seconds(900),
       role: this.role,
-      memorySize: 2048,
+      // a batch of images is cropped on all vCPUs, which grow with the memory size
+      memorySize: 4096,
       tracing: aws_lambda.Tracing.ACTIVE,
       environment: {
         DATASET_ITEM_TABLE: this.datasetItemsTable.tableName,
@@ -55,6 +55,7 @@ export class ListEndpointsApi {
       requestParameters: {
         'method.request.querystring.limit': false,
         'method.request.querystring.exclusive_start_key': false,
+        'method.request.querystring.status': false,
       },
       methodResponses: [
         ApiModels.methodResponse(this.responseModel()),
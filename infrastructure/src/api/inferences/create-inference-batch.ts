@@ -0,0 +1,327 @@
+import { PythonFunction } from '@aws-cdk/aws-lambda-python-alpha';
+import { Aws, aws_apigateway, aws_dynamodb, aws_iam, aws_lambda, aws_s3, Duration } from 'aws-cdk-lib';
+import { JsonSchemaType, JsonSchemaVersion, LambdaIntegration, Model } from 'aws-cdk-lib/aws-apigateway';
+import { Effect } from 'aws-cdk-lib/aws-iam';
+import { Architecture, Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Construct } from 'constructs';
+import { ApiModels } from '../../shared/models';
+import {
+  SCHEMA_DEBUG,
+  SCHEMA_INFER_TYPE,
+  SCHEMA_INFERENCE,
+  SCHEMA_MESSAGE,
+  SCHEMA_WORKFLOW,
+} from '../../shared/schema';
+import { ApiValidators } from '../../shared/validator';
+
+export interface CreateInferenceBatchApiProps {
+  router: aws_apigateway.Resource;
+  httpMethod: string;
+  endpointDeploymentTable: aws_dynamodb.Table;
+  inferenceJobTable: aws_dynamodb.Table;
+  inferenceResultCacheTable: aws_dynamodb.Table;
+  s3Bucket: aws_s3.Bucket;
+  commonLayer: aws_lambda.LayerVersion;
+  checkpointTable: aws_dynamodb.Table;
+  checkpointNameIndexTable: aws_dynamodb.Table;
+  multiUserTable: aws_dynamodb.Table;
+}
+
+export class CreateInferenceBatchApi {
+
+  private readonly id: string;
+  private readonly scope: Construct;
+  private readonly endpointDeploymentTable: aws_dynamodb.Table;
+  private readonly inferenceJobTable: aws_dynamodb.Table;
+  private readonly inferenceResultCacheTable: aws_dynamodb.Table;
+  private readonly layer: aws_lambda.LayerVersion;
+  private readonly s3Bucket: aws_s3.Bucket;
+  private readonly httpMethod: string;
+  private readonly router: aws_apigateway.Resource;
+  private readonly checkpointTable: aws_dynamodb.Table;
+  private readonly checkpointNameIndexTable: aws_dynamodb.Table;
+  private readonly multiUserTable: aws_dynamodb.Table;
+  private readonly role: aws_iam.Role;
+
+  constructor(scope: Construct, id: string, props: CreateInferenceBatchApiProps) {
+    this.id = id;
+    this.scope = scope;
+    this.checkpointTable = props.checkpointTable;
+    this.checkpointNameIndexTable = props.checkpointNameIndexTable;
+    this.multiUserTable = props.multiUserTable;
+    this.endpointDeploymentTable = props.endpointDeploymentTable;
+    this.inferenceJobTable = props.inferenceJobTable;
+    this.inferenceResultCacheTable = props.inferenceResultCacheTable;
+    this.layer = props.commonLayer;
+    this.s3Bucket = props.s3Bucket;
+    this.httpMethod = props.httpMethod;
+    this.router = props.router;
+
+    this.role = this.lambdaRole();
+
+    const dispatchLambda = this.dispatchLambda();
+
+    const lambdaFunction = this.apiLambda(dispatchLambda);
+
+    const lambdaIntegration = new LambdaIntegration(
+      lambdaFunction,
+      {
+        proxy: true,
+      },
+    );
+
+    this.router.addMethod(this.httpMethod, lambdaIntegration, {
+      apiKeyRequired: true,
+      requestValidator: ApiValidators.bodyValidator,
+      requestModels: {
+        'application/json': this.createRequestBodyModel(),
+      },
+      operationName: 'CreateInferenceBatch',
+      methodResponses: [
+        ApiModels.methodResponse(this.responseModel(), '202'),
+        ApiModels.methodResponses400(),
+        ApiModels.methodResponses401(),
+        ApiModels.methodResponses403(),
+      ],
+    });
+  }
+
+  private responseModel() {
+    return new Model(this.scope, `${this.id}-resp-model`, {
+      restApi: this.router.api,
+      modelName: 'CreateInferenceBatchResponse',
+      description: 'Response Model CreateInferenceBatch',
+      schema: {
+        schema: JsonSchemaVersion.DRAFT7,
+        title: 'CreateInferenceBatchResponse',
+        type: JsonSchemaType.OBJECT,
+        properties: {
+          statusCode: {
+            type: JsonSchemaType.INTEGER,
+            enum: [202],
+          },
+          debug: SCHEMA_DEBUG,
+          message: SCHEMA_MESSAGE,
+          data: {
+            type: JsonSchemaType.OBJECT,
+            properties: {
+              batch_id: {
+                type: JsonSchemaType.STRING,
+                format: 'uuid',
+              },
+              status: {
+                type: JsonSchemaType.STRING,
+              },
+              total: {
+                type: JsonSchemaType.INTEGER,
+              },
+              models: {
+                type: JsonSchemaType.ARRAY,
+                items: {
+                  type: JsonSchemaType.OBJECT,
+                  additionalProperties: true,
+                },
+              },
+              inferences: {
+                type: JsonSchemaType.ARRAY,
+                items: {
+                  type: JsonSchemaType.OBJECT,
+                  properties: {
+                    id: SCHEMA_INFERENCE.InferenceJobId,
+                    endpoint_name: {
+                      type: JsonSchemaType.STRING,
+                    },
+                  },
+                  required: [
+                    'id',
+                    'endpoint_name',
+                  ],
+                },
+              },
+            },
+            required: [
+              'batch_id',
+              'status',
+              'total',
+              'inferences',
+            ],
+          },
+        },
+        required: [
+          'statusCode',
+          'debug',
+          'data',
+          'message',
+        ],
+      },
+      contentType: 'application/json',
+    });
+  }
+
+  private createRequestBodyModel(): Model {
+    return new Model(this.scope, `${this.id}-model`, {
+      restApi: this.router.api,
+      modelName: `${this.id}Request`,
+      description: `Request Model ${this.id}`,
+      schema: {
+        schema: JsonSchemaVersion.DRAFT7,
+        title: this.id,
+        type: JsonSchemaType.OBJECT,
+        properties: {
+          task_type: {
+            type: JsonSchemaType.STRING,
+            enum: ['txt2img', 'img2img'],
+          },
+          inference_type: SCHEMA_INFER_TYPE,
+          workflow: SCHEMA_WORKFLOW,
+          sagemaker_endpoint_name: {
+            type: JsonSchemaType.STRING,
+          },
+          use_result_cache: {
+            type: JsonSchemaType.BOOLEAN,
+          },
+          models: {
+            type: JsonSchemaType.OBJECT,
+          },
+          payloads: {
+            type: JsonSchemaType.ARRAY,
+            minItems: 1,
+            maxItems: 500,
+            items: {
+              type: [JsonSchemaType.OBJECT, JsonSchemaType.STRING],
+            },
+          },
+        },
+        required: [
+          'task_type',
+          'inference_type',
+          'models',
+          'payloads',
+        ],
+      },
+      contentType: 'application/json',
+    });
+  }
+
+  private lambdaRole(): aws_iam.Role {
+    const newRole = new aws_iam.Role(this.scope, `${this.id}-role`, {
+      assumedBy: new aws_iam.ServicePrincipal('lambda.amazonaws.com'),
+    });
+
+    newRole.addToPolicy(new aws_iam.PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        'dynamodb:BatchGetItem',
+        'dynamodb:GetItem',
+        'dynamodb:Scan',
+        'dynamodb:Query',
+        'dynamodb:BatchWriteItem',
+        'dynamodb:PutItem',
+        'dynamodb:UpdateItem',
+        'dynamodb:DeleteItem',
+      ],
+      resources: [
+        this.inferenceJobTable.tableArn,
+        this.inferenceResultCacheTable.tableArn,
+        this.endpointDeploymentTable.tableArn,
+        `${this.endpointDeploymentTable.tableArn}/*`,
+        this.checkpointTable.tableArn,
+        this.checkpointNameIndexTable.tableArn,
+        this.multiUserTable.tableArn,
+      ],
+    }));
+
+    newRole.addToPolicy(new aws_iam.PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        'lambda:invokeFunction',
+      ],
+      resources: [
+        `arn:${Aws.PARTITION}:lambda:${Aws.REGION}:${Aws.ACCOUNT_ID}:function:*${this.id}*`,
+      ],
+    }));
+
+    newRole.addToPolicy(new aws_iam.PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        'sagemaker:InvokeEndpointAsync',
+        'sagemaker:InvokeEndpoint',
+      ],
+      resources: [`arn:${Aws.PARTITION}:sagemaker:${Aws.REGION}:${Aws.ACCOUNT_ID}:endpoint/*`],
+    }));
+
+    newRole.addToPolicy(new aws_iam.PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        's3:GetObject',
+        's3:PutObject',
+        's3:DeleteObject',
+        's3:ListBucket',
+        's3:ListBuckets',
+        's3:CreateBucket',
+      ],
+      resources: [
+        `${this.s3Bucket.bucketArn}/*`,
+        `arn:${Aws.PARTITION}:s3:::*sagemaker*`,
+      ],
+    }));
+
+    newRole.addToPolicy(new aws_iam.PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        'logs:CreateLogGroup',
+        'logs:CreateLogStream',
+        'logs:PutLogEvents',
+        'cloudwatch:PutMetricData',
+        'kms:Decrypt',
+      ],
+      resources: ['*'],
+    }));
+
+    return newRole;
+  }
+
+  private apiLambda(dispatchLambda: PythonFunction) {
+    return new PythonFunction(this.scope, `${this.id}-lambda`, {
+      entry: '../middleware_api/inferences',
+      architecture: Architecture.X86_64,
+      runtime: Runtime.PYTHON_3_10,
+      index: 'create_inference_batch.py',
+      handler: 'handler',
+      memorySize: 3000,
+      tracing: aws_lambda.Tracing.ACTIVE,
+      timeout: Duration.seconds(900),
+      role: this.role,
+      environment: {
+        INFERENCE_JOB_TABLE: this.inferenceJobTable.tableName,
+        INFERENCE_RESULT_CACHE_TABLE: this.inferenceResultCacheTable.tableName,
+        CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
+        DISPATCH_LAMBDA_NAME: dispatchLambda.functionName,
+      },
+      layers: [this.layer],
+    });
+  }
+
+  private dispatchLambda() {
+    return new PythonFunction(this.scope, `${this.id}-dispatch-lambda`, {
+      entry: '../middleware_api/inferences',
+      architecture: Architecture.X86_64,
+      runtime: Runtime.PYTHON_3_10,
+      index: 'dispatch_inference_batch.py',
+      handler: 'handler',
+      memorySize: 3000,
+      tracing: aws_lambda.Tracing.ACTIVE,
+      timeout: Duration.seconds(900),
+      role: this.role,
+      environment: {
+        INFERENCE_JOB_TABLE: this.inferenceJobTable.tableName,
+        INFERENCE_RESULT_CACHE_TABLE: this.inferenceResultCacheTable.tableName,
+        CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
+      },
+      layers: [this.layer],
+    });
+  }
+
+}
@@ -21,9 +21,11 @@ export interface CreateInferenceJobApiProps {
   httpMethod: string;
   endpointDeploymentTable: aws_dynamodb.Table;
   inferenceJobTable: aws_dynamodb.Table;
+  inferenceResultCacheTable: aws_dynamodb.Table;
   s3Bucket: aws_s3.Bucket;
   commonLayer: aws_lambda.LayerVersion;
   checkpointTable: aws_dynamodb.Table;
+  checkpointNameIndexTable: aws_dynamodb.Table;
   multiUserTable: aws_dynamodb.Table;
 }
 
@@ -33,20 +35,24 @@ export class CreateInferenceJobApi {
   private readonly scope: Construct;
   private readonly endpointDeploymentTable: aws_dynamodb.Table;
   private readonly inferenceJobTable: aws_dynamodb.Table;
+  private readonly inferenceResultCacheTable: aws_dynamodb.Table;
   private readonly layer: aws_lambda.LayerVersion;
   private readonly s3Bucket: aws_s3.Bucket;
   private readonly httpMethod: string;
   private readonly router: aws_apigateway.Resource;
   private readonly checkpointTable: aws_dynamodb.Table;
+  private readonly checkpointNameIndexTable: aws_dynamodb.Table;
   private readonly multiUserTable: aws_dynamodb.Table;
 
   constructor(scope: Construct, id: string, props: CreateInferenceJobApiProps) {
     this.id = id;
     this.scope = scope;
     this.checkpointTable = props.checkpointTable;
+    this.checkpointNameIndexTable = props.checkpointNameIndexTable;
     this.multiUserTable = props.multiUserTable;
     this.endpointDeploymentTable = props.endpointDeploymentTable;
     this.inferenceJobTable = props.inferenceJobTable;
+    this.inferenceResultCacheTable = props.inferenceResultCacheTable;
     this.layer = props.commonLayer;
     this.s3Bucket = props.s3Bucket;
     this.httpMethod = props.httpMethod;
@@ -230,6 +236,9 @@ export class CreateInferenceJobApi {
           payload_string: {
             type: JsonSchemaType.STRING,
           },
+          use_result_cache: {
+            type: JsonSchemaType.BOOLEAN,
+          },
           models: {
             type: JsonSchemaType.OBJECT,
             properties: {
@@ -268,8 +277,11 @@ export class CreateInferenceJobApi {
       ],
       resources: [
         this.inferenceJobTable.tableArn,
+        this.inferenceResultCacheTable.tableArn,
         this.endpointDeploymentTable.tableArn,
+        `${this.endpointDeploymentTable.tableArn}/*`,
         this.checkpointTable.tableArn,
+        this.checkpointNameIndexTable.tableArn,
         this.multiUserTable.tableArn,
       ],
     }));
@@ -335,7 +347,9 @@ export class CreateInferenceJobApi {
       role: this.lambdaRole(),
       environment: {
         INFERENCE_JOB_TABLE: this.inferenceJobTable.tableName,
+        INFERENCE_RESULT_CACHE_TABLE: this.inferenceResultCacheTable.tableName,
         CHECKPOINT_TABLE: this.checkpointTable.tableName,
+        CHECKPOINT_NAME_INDEX_TABLE: this.checkpointNameIndexTable.tableName,
       },
       layers: [this.layer],
     });
@@ -19,6 +19,7 @@ export interface DeleteInferenceJobsApiProps {
   router: Resource;
   httpMethod: string;
   inferenceJobTable: Table;
+  inferenceResultCacheTable: Table;
   userTable: Table;
   commonLayer: LayerVersion;
   s3Bucket: Bucket;
@@ -29,6 +30,7 @@ export class DeleteInferenceJobsApi {
   private readonly httpMethod: string;
   private readonly scope: Construct;
   private readonly inferenceJobTable: Table;
+  private readonly inferenceResultCacheTable: Table;
   private readonly userTable: Table;
   private readonly layer: LayerVersion;
   private readonly baseId: string;
@@ -40,6 +42,7 @@ export class DeleteInferenceJobsApi {
     this.router = props.router;
     this.httpMethod = props.httpMethod;
     this.inferenceJobTable = props.inferenceJobTable;
+    this.inferenceResultCacheTable = props.inferenceResultCacheTable;
     this.userTable = props.userTable;
     this.layer = props.commonLayer;
     this.s3Bucket = props.s3Bucket;
@@ -119,6 +122,7 @@ export class DeleteInferenceJobsApi {
         tracing: aws_lambda.Tracing.ACTIVE,
         environment: {
           INFERENCE_JOB_TABLE: this.inferenceJobTable.tableName,
+          INFERENCE_RESULT_CACHE_TABLE: this.inferenceResultCacheTable.tableName,
         },
         layers: [this.layer],
       });
@@ -138,14 +142,18 @@ export class DeleteInferenceJobsApi {
       actions: [
         // get an inference job
         'dynamodb:GetItem',
-        // delete inference job
+        // delete inference jobs and their result cache entries
         'dynamodb:DeleteItem',
+        'dynamodb:BatchWriteItem',
+        // fail the jobs waiting for a deleted one
+        'dynamodb:UpdateItem',
         // query users
         'dynamodb:Query',
         'dynamodb:Scan',
       ],
       resources: [
         this.inferenceJobTable.tableArn,
+        this.inferenceResultCacheTable.tableArn,
         this.userTable.tableArn,
       ],
     }));
@@ -0,0 +1,187 @@
+import { PythonFunction } from '@aws-cdk/aws-lambda-python-alpha';
+import { Aws, aws_lambda, Duration } from 'aws-cdk-lib';
+import { JsonSchemaType, JsonSchemaVersion, LambdaIntegration, Model, Resource } from 'aws-cdk-lib/aws-apigateway';
+import { Table } from 'aws-cdk-lib/aws-dynamodb';
+import { Effect, PolicyStatement, Role, ServicePrincipal } from 'aws-cdk-lib/aws-iam';
+import { Architecture, LayerVersion, Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Construct } from 'constructs';
+import { ApiModels } from '../../shared/models';
+import { SCHEMA_DEBUG, SCHEMA_INFERENCE, SCHEMA_MESSAGE } from '../../shared/schema';
+
+export interface GetInferenceBatchApiProps {
+  router: Resource;
+  httpMethod: string;
+  inferenceJobTable: Table;
+  userTable: Table;
+  commonLayer: LayerVersion;
+}
+
+export class GetInferenceBatchApi {
+  private readonly router: Resource;
+  private readonly httpMethod: string;
+  private readonly scope: Construct;
+  private readonly inferenceJobTable: Table;
+  private readonly userTable: Table;
+  private readonly layer: LayerVersion;
+  private readonly baseId: string;
+
+  constructor(scope: Construct, id: string, props: GetInferenceBatchApiProps) {
+    this.scope = scope;
+    this.baseId = id;
+    this.router = props.router;
+    this.httpMethod = props.httpMethod;
+    this.inferenceJobTable = props.inferenceJobTable;
+    this.layer = props.commonLayer;
+    this.userTable = props.userTable;
+
+    const lambdaFunction = this.apiLambda();
+
+    const lambdaIntegration = new LambdaIntegration(
+      lambdaFunction,
+      {
+        proxy: true,
+      },
+    );
+
+    this.router.addMethod(
+      this.httpMethod,
+      lambdaIntegration,
+      {
+        apiKeyRequired: true,
+        operationName: 'GetInferenceBatch',
+        methodResponses: [
+          ApiModels.methodResponse(this.responseModel()),
+          ApiModels.methodResponses401(),
+          ApiModels.methodResponses403(),
+          ApiModels.methodResponses404(),
+        ],
+      });
+  }
+
+  private responseModel() {
+    return new Model(this.scope, `${this.baseId}-resp-model`, {
+      restApi: this.router.api,
+      modelName: 'GetInferenceBatchResponse',
+      description: 'Response Model GetInferenceBatch',
+      schema: {
+        schema: JsonSchemaVersion.DRAFT7,
+        title: 'GetInferenceBatch',
+        type: JsonSchemaType.OBJECT,
+        properties: {
+          statusCode: {
+            type: JsonSchemaType.NUMBER,
+          },
+          debug: SCHEMA_DEBUG,
+          message: SCHEMA_MESSAGE,
+          data: {
+            type: JsonSchemaType.OBJECT,
+            properties: {
+              batch_id: {
+                type: JsonSchemaType.STRING,
+                format: 'uuid',
+              },
+              status: {
+                type: JsonSchemaType.STRING,
+                enum: ['inprogress', 'succeed', 'failed', 'partially_failed'],
+              },
+              total: {
+                type: JsonSchemaType.INTEGER,
+              },
+              counts: {
+                type: JsonSchemaType.OBJECT,
+                additionalProperties: true,
+              },
+              inferences: {
+                type: JsonSchemaType.ARRAY,
+                items: {
+                  type: JsonSchemaType.OBJECT,
+                  additionalProperties: true,
+                  properties: {
+                    InferenceJobId: SCHEMA_INFERENCE.InferenceJobId,
+                    status: SCHEMA_INFERENCE.status,
+                  },
+                  required: [
+                    'InferenceJobId',
+                    'status',
+                  ],
+                },
+              },
+            },
+            required: [
+              'batch_id',
+              'status',
+              'total',
+              'counts',
+              'inferences',
+            ],
+          },
+        },
+        required: [
+          'statusCode',
+          'debug',
+          'data',
+          'message',
+        ],
+      },
+      contentType: 'application/json',
+    });
+  }
+
+  private apiLambda() {
+    return new PythonFunction(
+      this.scope,
+      `${this.baseId}-lambda`,
+      {
+        entry: '../middleware_api/inferences',
+        architecture: Architecture.X86_64,
+        runtime: Runtime.PYTHON_3_10,
+        index: 'get_inference_batch.py',
+        handler: 'handler',
+        timeout: Duration.seconds(900),
+        role: this.iamRole(),
+        memorySize: 2048,
+        tracing: aws_lambda.Tracing.ACTIVE,
+        environment: {
+          INFERENCE_JOB_TABLE: this.inferenceJobTable.tableName,
+        },
+        layers: [this.layer],
+      });
+  }
+
+  private iamRole(): Role {
+
+    const newRole = new Role(
+      this.scope,
+      `${this.baseId}-role`,
+      {
+        assumedBy: new ServicePrincipal('lambda.amazonaws.com'),
+      },
+    );
+
+    newRole.addToPolicy(new PolicyStatement({
+      actions: [
+        // query the jobs of a batch through the batch_id index, and users
+        'dynamodb:GetItem',
+        'dynamodb:Query',
+        'dynamodb:Scan',
+      ],
+      resources: [
+        this.inferenceJobTable.tableArn,
+        `${this.inferenceJobTable.tableArn}/*`,
+        this.userTable.tableArn,
+      ],
+    }));
+
+    newRole.addToPolicy(new PolicyStatement({
+      effect: Effect.ALLOW,
+      actions: [
+        'logs:CreateLogGroup',
+        'logs:CreateLogStream',
+        'logs:PutLogEvents',
+      ],
+      resources: [`arn:${Aws.PARTITION}:logs:${Aws.REGION}:${Aws.ACCOUNT_ID}:log-group:*:*`],
+    }));
+
+    return newRole;
+  }
+}
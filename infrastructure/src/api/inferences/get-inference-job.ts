@@ -53,8 +53,12 @@ export class GetInferenceJobApi {
       {
         apiKeyRequired: true,
         operationName: 'GetInferenceJob',
+        requestParameters: {
+          'method.request.querystring.wait': false,
+        },
         methodResponses: [
           ApiModels.methodResponse(this.responseModel()),
+          ApiModels.methodResponses400(),
           ApiModels.methodResponses401(),
           ApiModels.methodResponses403(),
           ApiModels.methodResponses404(),
@@ -142,6 +146,8 @@ export class GetInferenceJobApi {
       actions: [
         // get an inference job
         'dynamodb:GetItem',
+        // settle a job waiting for an identical one
+        'dynamodb:UpdateItem',
         // query users
         'dynamodb:Query',
         'dynamodb:Scan',
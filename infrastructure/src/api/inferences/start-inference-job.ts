@@ -14,6 +14,7 @@ export interface StartInferenceJobApiProps {
   httpMethod: string;
   endpointDeploymentTable: aws_dynamodb.Table;
   inferenceJobTable: aws_dynamodb.Table;
+  inferenceResultCacheTable: aws_dynamodb.Table;
   checkpointTable: aws_dynamodb.Table;
   userTable: aws_dynamodb.Table;
   s3Bucket: aws_s3.Bucket;
@@ -30,6 +31,7 @@ export class StartInferenceJobApi {
   private readonly router: aws_apigateway.Resource;
   private readonly endpointDeploymentTable: aws_dynamodb.Table;
   private readonly inferenceJobTable: aws_dynamodb.Table;
+  private readonly inferenceResultCacheTable: aws_dynamodb.Table;
   private readonly checkpointTable: aws_dynamodb.Table;
   private readonly userTable: aws_dynamodb.Table;
 
@@ -39,6 +41,7 @@ export class StartInferenceJobApi {
     this.endpointDeploymentTable = props.endpointDeploymentTable;
     this.router = props.router;
     this.inferenceJobTable = props.inferenceJobTable;
+    this.inferenceResultCacheTable = props.inferenceResultCacheTable;
     this.checkpointTable = props.checkpointTable;
     this.userTable = props.userTable;
     this.layer = props.commonLayer;
@@ -131,6 +134,7 @@ export class StartInferenceJobApi {
       ],
       resources: [
         this.inferenceJobTable.tableArn,
+        this.inferenceResultCacheTable.tableArn,
         this.endpointDeploymentTable.tableArn,
         this.checkpointTable.tableArn,
         this.userTable.tableArn,
@@ -191,6 +195,7 @@ export class StartInferenceJobApi {
       role: this.getLambdaRole(),
       environment: {
         INFERENCE_JOB_TABLE: this.inferenceJobTable.tableName,
+        INFERENCE_RESULT_CACHE_TABLE: this.inferenceResultCacheTable.tableName,
         CHECKPOINT_TABLE: this.checkpointTable.tableName,
       },
       layers: [this.layer],
@@ -10,6 +10,7 @@ import { UpdateCheckPointApi } from '../api/checkpoints/update-chekpoint';
 
 export interface CheckpointStackProps extends StackProps {
   checkpointTable: Table;
+  checkpointNameIndexTable: Table;
   multiUserTable: Table;
   routers: { [key: string]: Resource };
   s3Bucket: aws_s3.Bucket;
@@ -33,6 +34,7 @@ export class CheckpointStack {
     // POST /checkpoint
     new CreateCheckPointApi(scope, 'CreateCheckPoint', {
       checkpointTable: props.checkpointTable,
+      checkpointNameIndexTable: props.checkpointNameIndexTable,
       commonLayer: props.commonLayer,
       httpMethod: 'POST',
       router: props.routers.checkpoints,
@@ -43,6 +45,7 @@ export class CheckpointStack {
     // PUT /checkpoints/{id}
     new UpdateCheckPointApi(scope, 'UpdateCheckPoint', {
       checkpointTable: props.checkpointTable,
+      checkpointNameIndexTable: props.checkpointNameIndexTable,
       userTable: props.multiUserTable,
       commonLayer: props.commonLayer,
       httpMethod: 'PUT',
@@ -55,6 +58,7 @@ export class CheckpointStack {
       router: props.routers.checkpoints,
       commonLayer: props.commonLayer,
       checkPointsTable: props.checkpointTable,
+      checkpointNameIndexTable: props.checkpointNameIndexTable,
       userTable: props.multiUserTable,
       httpMethod: 'DELETE',
       s3Bucket: props.s3Bucket,
@@ -199,7 +199,9 @@ export class Middleware extends Stack {
       snsTopic: snsTopics.snsTopic,
       sd_inference_job_table: ddbTables.sDInferenceJobTable,
       sd_endpoint_deployment_job_table: ddbTables.sDEndpointDeploymentJobTable,
+      inferenceResultCacheTable: ddbTables.inferenceResultCacheTable,
       checkpointTable: ddbTables.checkpointTable,
+      checkpointNameIndexTable: ddbTables.checkpointNameIndexTable,
       multiUserTable: ddbTables.multiUserTable,
       commonLayer: commonLayers.commonLayer,
       synthesizer: props.synthesizer,
@@ -212,6 +214,7 @@ export class Middleware extends Stack {
       // env: devEnv,
       synthesizer: props.synthesizer,
       checkpointTable: ddbTables.checkpointTable,
+      checkpointNameIndexTable: ddbTables.checkpointNameIndexTable,
       multiUserTable: ddbTables.multiUserTable,
       routers: restApi.routers,
       s3Bucket: s3Bucket,
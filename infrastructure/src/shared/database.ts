@@ -6,9 +6,11 @@ export class Database {
 
   public trainingTable: Table;
   public checkpointTable: Table;
+  public checkpointNameIndexTable: Table;
   public datasetInfoTable: Table;
   public datasetItemTable: Table;
   public sDInferenceJobTable: Table;
+  public inferenceResultCacheTable: Table;
   public sDEndpointDeploymentJobTable: Table;
   public multiUserTable: Table;
   public workflowsTable: Table;
@@ -20,12 +22,16 @@ export class Database {
 
     this.checkpointTable = this.table(scope, baseId, 'CheckpointTable');
 
+    this.checkpointNameIndexTable = this.table(scope, baseId, 'CheckpointNameIndexTable');
+
     this.datasetInfoTable = this.table(scope, baseId, 'DatasetInfoTable');
 
     this.datasetItemTable = this.table(scope, baseId, 'DatasetItemTable');
 
     this.sDInferenceJobTable = this.table(scope, baseId, 'SDInferenceJobTable');
 
+    this.inferenceResultCacheTable = this.table(scope, baseId, 'InferenceResultCacheTable');
+
     this.sDEndpointDeploymentJobTable = this.table(scope, baseId, 'SDEndpointDeploymentJobTable');
 
     this.multiUserTable = this.table(scope, baseId, 'MultiUserTable');
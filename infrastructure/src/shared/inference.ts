@@ -10,8 +10,10 @@ import * as s3 from 'aws-cdk-lib/aws-s3';
 import { Size } from 'aws-cdk-lib/core';
 import { Construct } from 'constructs';
 import { ResourceProvider } from './resource-provider';
+import { CreateInferenceBatchApi } from '../api/inferences/create-inference-batch';
 import { CreateInferenceJobApi } from '../api/inferences/create-inference-job';
 import { DeleteInferenceJobsApi } from '../api/inferences/delete-inference-jobs';
+import { GetInferenceBatchApi } from '../api/inferences/get-inference-batch';
 import { GetInferenceJobApi } from '../api/inferences/get-inference-job';
 import { ListInferencesApi } from '../api/inferences/list-inferences';
 import { StartInferenceJobApi } from '../api/inferences/start-inference-job';
@@ -33,7 +35,9 @@ export interface InferenceProps extends StackProps {
   snsTopic: aws_sns.Topic;
   sd_inference_job_table: aws_dynamodb.Table;
   sd_endpoint_deployment_job_table: aws_dynamodb.Table;
+  inferenceResultCacheTable: aws_dynamodb.Table;
   checkpointTable: aws_dynamodb.Table;
+  checkpointNameIndexTable: aws_dynamodb.Table;
   commonLayer: PythonLayerVersion;
   resourceProvider: ResourceProvider;
 }
@@ -50,16 +54,44 @@ export class Inference {
     new CreateInferenceJobApi(
       scope, 'CreateInferenceJob', {
         checkpointTable: props.checkpointTable,
+        checkpointNameIndexTable: props.checkpointNameIndexTable,
         commonLayer: props.commonLayer,
         endpointDeploymentTable: props.sd_endpoint_deployment_job_table,
         httpMethod: 'POST',
         inferenceJobTable: props.sd_inference_job_table,
+        inferenceResultCacheTable: props.inferenceResultCacheTable,
         router: props.routers.inferences,
         s3Bucket: props.s3_bucket,
         multiUserTable: props.multiUserTable,
       },
     );
 
+    const batchRouter = props.routers.inferences.addResource('batches');
+
+    new CreateInferenceBatchApi(
+      scope, 'CreateInferenceBatch', {
+        checkpointTable: props.checkpointTable,
+        checkpointNameIndexTable: props.checkpointNameIndexTable,
+        commonLayer: props.commonLayer,
+        endpointDeploymentTable: props.sd_endpoint_deployment_job_table,
+        httpMethod: 'POST',
+        inferenceJobTable: props.sd_inference_job_table,
+        inferenceResultCacheTable: props.inferenceResultCacheTable,
+        router: batchRouter,
+        s3Bucket: props.s3_bucket,
+        multiUserTable: props.multiUserTable,
+      },
+    );
+
+    new GetInferenceBatchApi(scope, 'GetInferenceBatch', {
+      router: batchRouter.addResource('{id}'),
+      commonLayer: props.commonLayer,
+      inferenceJobTable: props.sd_inference_job_table,
+      userTable: props.multiUserTable,
+      httpMethod: 'GET',
+    },
+    );
+
     new StartInferenceJobApi(
       scope, 'StartInferenceJob', {
         userTable: props.multiUserTable,
@@ -68,6 +100,7 @@ export class Inference {
         endpointDeploymentTable: props.sd_endpoint_deployment_job_table,
         httpMethod: 'PUT',
         inferenceJobTable: props.sd_inference_job_table,
+        inferenceResultCacheTable: props.inferenceResultCacheTable,
         router: inferV2Router,
         s3Bucket: props.s3_bucket,
       },
@@ -99,6 +132,7 @@ export class Inference {
       resources: [
         props.sd_endpoint_deployment_job_table.tableArn,
         props.sd_inference_job_table.tableArn,
+        props.inferenceResultCacheTable.tableArn,
       ],
     });
 
@@ -144,6 +178,7 @@ export class Inference {
         commonLayer: props.commonLayer,
         userTable: props.multiUserTable,
         inferenceJobTable: props.sd_inference_job_table,
+        inferenceResultCacheTable: props.inferenceResultCacheTable,
         httpMethod: 'DELETE',
         s3Bucket: props.s3_bucket,
       },
@@ -160,6 +195,7 @@ export class Inference {
       timeout: Duration.seconds(900),
       environment: {
         INFERENCE_JOB_TABLE: props.sd_inference_job_table.tableName,
+        INFERENCE_RESULT_CACHE_TABLE: props.inferenceResultCacheTable.tableName,
         ACCOUNT_ID: Aws.ACCOUNT_ID,
         REGION_NAME: Aws.REGION,
         SNS_INFERENCE_SUCCESS: props.inferenceResultTopic.topicName,
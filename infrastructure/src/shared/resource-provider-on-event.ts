@@ -79,7 +79,13 @@ async function createAndCheckResources() {
   await putItemUsersTable();
 
   await createGlobalSecondaryIndex('SDInferenceJobTable', 'taskType', 'createTime');
+  // the status of a batch reads these fields of its jobs, the payloads stay out of the index
+  await createGlobalSecondaryIndex('SDInferenceJobTable', 'batch_id', 'createTime', 'S', [
+    'status', 'startTime', 'completeTime', 'image_names', 'result_inference_id', 'sagemakerRaw',
+  ]);
   await createGlobalSecondaryIndex('SDEndpointDeploymentJobTable', 'endpoint_name', 'startTime');
+  await createGlobalSecondaryIndex('SDEndpointDeploymentJobTable', 'endpoint_status', 'startTime');
+  await createGlobalSecondaryIndex('CheckpointTable', 'checkpoint_type', 'timestamp', 'N');
 }
 
 async function waitTableReady(tableName: string) {
@@ -96,7 +102,10 @@ async function waitTableReady(tableName: string) {
       throw new Error(`Table ${tableName} does not exist.`);
     }
 
-    if (data.Table.TableStatus === 'ACTIVE') {
+    // only one index of a table can be created at a time, wait for the one in backfill
+    const indexesReady = (data.Table.GlobalSecondaryIndexes || []).every(index => index.IndexStatus === 'ACTIVE');
+
+    if (data.Table.TableStatus === 'ACTIVE' && indexesReady) {
       break;
     }
 
@@ -178,6 +187,22 @@ async function createTables() {
         type: AttributeType.STRING,
       },
     },
+    InferenceResultCacheTable: {
+      partitionKey: {
+        name: 'cache_key',
+        type: AttributeType.STRING,
+      },
+    },
+    CheckpointNameIndexTable: {
+      partitionKey: {
+        name: 'checkpoint_name',
+        type: AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'checkpoint_type',
+        type: AttributeType.STRING,
+      },
+    },
     DatasetInfoTable: {
       partitionKey: {
         name: 'dataset_name',
@@ -362,7 +387,8 @@ async function putItem(tableName: string, item: any) {
   }
 }
 
-async function createGlobalSecondaryIndex(tableName: string, pk: string, sk: string, skt: ScalarAttributeType = 'S') {
+async function createGlobalSecondaryIndex(tableName: string, pk: string, sk: string, skt: ScalarAttributeType = 'S',
+  nonKeyAttributes?: string[]) {
 
   await waitTableReady(tableName);
 
@@ -392,7 +418,10 @@ async function createGlobalSecondaryIndex(tableName: string, pk: string, sk: str
               KeyType: 'RANGE',
             },
           ],
-          Projection: {
+          Projection: nonKeyAttributes ? {
+            ProjectionType: 'INCLUDE',
+            NonKeyAttributes: nonKeyAttributes,
+          } : {
             ProjectionType: 'ALL',
           },
         },
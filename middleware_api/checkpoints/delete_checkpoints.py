@@ -7,6 +7,7 @@ import boto3
 from aws_lambda_powertools import Tracer
 
 from common.response import no_content
+from libs.checkpoint_index import delete_checkpoint_names
 from libs.utils import response_error
 
 tracer = Tracer()
@@ -57,6 +58,7 @@ def handler(event, ctx):
                 bucket.Object(object_key).delete()
 
             checkpoints_table.delete_item(Key={'id': checkpoint_id})
+            delete_checkpoint_names(checkpoint_names, checkpoint['Item']['checkpoint_type'], checkpoint_id)
 
         return no_content(message='checkpoints deleted')
     except Exception as e:
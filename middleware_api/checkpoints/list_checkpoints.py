@@ -2,18 +2,25 @@ import json
 import logging
 import os
 
+import boto3
 from aws_lambda_powertools import Tracer
 
 from common.const import PERMISSION_CHECKPOINT_ALL, PERMISSION_CHECKPOINT_LIST
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import ok
 from common.util import get_multi_query_params, get_query_param
+from libs.checkpoint_listing import list_checkpoints
 from libs.data_types import CheckPoint, PARTITION_KEYS, Role
-from libs.utils import get_user_roles, check_user_permissions, get_permissions_by_username, permissions_check, \
-    response_error
+from libs.utils import get_user_roles, get_permissions_by_username, permissions_check, response_error
 
 tracer = Tracer()
 checkpoint_table = os.environ.get('CHECKPOINT_TABLE')
+table = boto3.resource('dynamodb').Table(checkpoint_table)
+LEGACY_QUERY_PAGE_SIZE = 100
+# the legacy page parameter counts at most this many checkpoints, later pages are reached with the cursor
+LEGACY_MAX_CHECKPOINTS = int(os.environ.get('LEGACY_MAX_CHECKPOINTS') or 1000)
+# pages read for one legacy request, restrictive filters can return short pages
+LEGACY_MAX_QUERIES = 20
 
 user_table = os.environ.get('MULTI_USER_TABLE')
 
@@ -23,83 +30,57 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 ddb_service = DynamoDbUtilsService(logger=logger)
 
 
-# GET /checkpoints?username=USER_NAME&types=value&status=value
+# GET /checkpoints?username=USER_NAME&types=value&status=value&page=1&per_page=10
+# pages with page/pages/total over the first LEGACY_MAX_CHECKPOINTS query results, sending limit or
+# exclusive_start_key like the other list APIs pages with last_evaluated_key instead
 @tracer.capture_lambda_handler
 def handler(event, context):
     try:
         logger.info(json.dumps(event))
-        _filter = {}
         requestor_name = permissions_check(event, [PERMISSION_CHECKPOINT_ALL, PERMISSION_CHECKPOINT_LIST])
         user_roles = ['*']
 
         page = int(get_query_param(event, 'page', 1))
         per_page = int(get_query_param(event, 'per_page', 10))
+        limit = get_query_param(event, 'limit', None)
+        exclusive_start_key = get_query_param(event, 'exclusive_start_key', None)
         username = get_query_param(event, 'username', None)
 
         roles = get_multi_query_params(event, 'roles', default=[])
-
         status = get_multi_query_params(event, 'status')
-        if status:
-            _filter['checkpoint_status'] = status
-
         types = get_multi_query_params(event, 'types')
-        if types:
-            _filter['checkpoint_type'] = types
 
         if username:
             user_roles = get_user_roles(ddb_service=ddb_service, user_table_name=user_table, username=username)
 
         requestor_permissions = get_permissions_by_username(ddb_service, user_table, requestor_name)
-        requestor_created_roles_rows = ddb_service.scan(table=user_table, filters={
+        requestor_created_roles_rows = ddb_service.query_items(table=user_table, key_values={
             'kind': PARTITION_KEYS.role,
+        }, filters={
             'creator': requestor_name
         })
         for requestor_created_roles_row in requestor_created_roles_rows:
             role = Role(**ddb_service.deserialize(requestor_created_roles_row))
             user_roles.append(role.sort_key)
 
-        raw_ckpts = ddb_service.scan(table=checkpoint_table, filters=_filter)
-        if raw_ckpts is None or len(raw_ckpts) == 0:
-            data = {
-                'page': page,
-                'per_page': per_page,
-                'pages': 0,
-                'total': 0,
-                'checkpoints': []
-            }
-            return ok(data=data)
-
-        ckpts = []
-        for r in raw_ckpts:
-            ckpt = CheckPoint(**(ddb_service.deserialize(r)))
-
-            if len(roles) > 0 and set(roles).isdisjoint(set(ckpt.allowed_roles_or_users)):
-                continue
-
-            if check_user_permissions(ckpt.allowed_roles_or_users, user_roles, username) or (
-                    'user' in requestor_permissions and 'all' in requestor_permissions['user']
-            ):
-                ckpts.append({
-                    'id': ckpt.id,
-                    's3Location': ckpt.s3_location,
-                    'type': ckpt.checkpoint_type,
-                    'status': ckpt.checkpoint_status.value,
-                    'name': ckpt.checkpoint_names,
-                    'created': ckpt.timestamp,
-                    'params': ckpt.params,
-                    'allowed_roles_or_users': ckpt.allowed_roles_or_users,
-                    'source_path': ckpt.source_path,
-                    'target_path': ckpt.target_path,
-                })
-
-        ckpts = sort_checkpoints(ckpts)
+        visible_to = None
+        if 'user' not in requestor_permissions or 'all' not in requestor_permissions['user']:
+            visible_to = user_roles + ([username] if username else [])
+
+        def query_page(limit, last_key=None):
+            return list_checkpoints(table, limit=limit, last_evaluated_key=last_key, types=types, status=status,
+                                    visible_to=visible_to, roles=roles)
+
+        if limit is None and exclusive_start_key is None:
+            return ok(data=legacy_page(query_page, page, per_page), decimal=True)
+
+        limit = int(limit) if limit is not None else per_page
+        result = query_page(limit, exclusive_start_key)
 
         data = {
-            'page': page,
-            'per_page': per_page,
-            'pages': int(len(ckpts) / per_page) + 1,
-            'total': len(ckpts),
-            'checkpoints': page_data(ckpts, page, per_page),
+            'per_page': limit,
+            'checkpoints': [to_response(ckpt) for ckpt in result.items],
+            'last_evaluated_key': result.last_evaluated_key,
         }
 
         return ok(data=data, decimal=True)
@@ -107,15 +88,49 @@ def handler(event, context):
         return response_error(e)
 
 
-# todo will use query
-def page_data(data, page, per_page):
+def to_response(raw):
+    ckpt = CheckPoint(**raw)
+    return {
+        'id': ckpt.id,
+        's3Location': ckpt.s3_location,
+        'type': ckpt.checkpoint_type,
+        'status': ckpt.checkpoint_status.value,
+        'name': ckpt.checkpoint_names,
+        'created': ckpt.timestamp,
+        'params': ckpt.params,
+        'allowed_roles_or_users': ckpt.allowed_roles_or_users,
+        'source_path': ckpt.source_path,
+        'target_path': ckpt.target_path,
+    }
+
+
+def legacy_page(query_page, page, per_page):
+    # offset pages need the total, checkpoints are counted up to LEGACY_MAX_CHECKPOINTS
+    # and only the ones of the requested page are kept
     start = (page - 1) * per_page
     end = page * per_page
-    return data[start:end]
-
-
-def sort_checkpoints(data):
-    if len(data) == 0:
-        return data
 
-    return sorted(data, key=lambda x: x['created'], reverse=True)
+    ckpts = []
+    total = 0
+    last_key = None
+    for _ in range(LEGACY_MAX_QUERIES):
+        if total >= LEGACY_MAX_CHECKPOINTS:
+            break
+        result = query_page(min(LEGACY_QUERY_PAGE_SIZE, LEGACY_MAX_CHECKPOINTS - total), last_key)
+        for item in result.items:
+            if start <= total < end:
+                ckpts.append(item)
+            total += 1
+        last_key = result.last_evaluated_key
+        if not last_key:
+            break
+
+    return {
+        'page': page,
+        'per_page': per_page,
+        'pages': int(total / per_page) + 1 if total else 0,
+        'total': total,
+        # more checkpoints match than were counted
+        'truncated': bool(last_key),
+        'checkpoints': [to_response(ckpt) for ckpt in ckpts],
+    }
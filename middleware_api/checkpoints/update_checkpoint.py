@@ -1,7 +1,7 @@
 import json
 import logging
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Any, Dict
 
 import boto3
@@ -10,6 +10,7 @@ from aws_lambda_powertools import Tracer
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import ok, not_found, bad_request, accepted
 from create_checkpoint import check_ckpt_name_unique
+from libs.checkpoint_index import put_checkpoint_names
 from libs.common_tools import complete_multipart_upload
 from libs.data_types import CheckPoint, CheckPointStatus
 from libs.utils import response_error
@@ -77,6 +78,8 @@ def update_status(event: UpdateCheckPointEvent, checkpoint: CheckPoint):
         field_name='checkpoint_status',
         value=new_status
     )
+    # the name index points at active checkpoints only
+    put_checkpoint_names(replace(checkpoint, checkpoint_status=new_status))
     data = {
         'checkpoint': {
             'id': checkpoint.id,
@@ -109,6 +112,7 @@ def update_name(event: UpdateCheckPointEvent, checkpoint: CheckPoint):
         InvocationType='Event',
         Payload=json.dumps({
             'id': checkpoint.id,
+            'checkpoint_type': checkpoint.checkpoint_type,
             's3_path': s3_path,
             'old_name': old_name,
             'new_name': new_name,
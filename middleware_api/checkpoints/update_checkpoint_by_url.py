@@ -1,19 +1,24 @@
-import concurrent.futures
 import datetime
 import json
 import logging
+import math
 import os
+import threading
+import time
 import urllib.parse
 from dataclasses import dataclass
 from typing import Any, Optional
 
+import boto3
 import requests
 from aws_lambda_powertools import Tracer
 
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import bad_request, forbidden
 from common.const import COMFY_TYPE
-from libs.common_tools import get_base_checkpoint_s3_key, multipart_upload_from_url
+from libs.checkpoint_index import put_checkpoint_names
+from libs.common_tools import get_base_checkpoint_s3_key, multipart_upload_from_url, create_multipart_upload, \
+    IMPORT_PART_SIZE, MULTIPART_MAX_PARTS
 from libs.data_types import CheckPoint, CheckPointStatus
 from libs.utils import get_user_roles, get_permissions_by_username
 
@@ -24,52 +29,126 @@ checkpoint_type = ["Stable-diffusion", "embeddings", "Lora", "hypernetworks", "C
 user_table = os.environ.get('MULTI_USER_TABLE')
 CN_MODEL_EXTS = [".pt", ".pth", ".ckpt", ".safetensors", ".yaml"]
 
+# the import stops reading the url this long before the lambda times out and goes on in a new invocation
+IMPORT_RESUME_MARGIN_SECONDS = 120
+IMPORT_MAX_RESUMES = 20
+# seconds between progress updates of the checkpoint record
+IMPORT_PROGRESS_INTERVAL = 10
+
 logger = logging.getLogger(__name__)
 logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 ddb_service = DynamoDbUtilsService(logger=logger)
-MAX_WORKERS = 10
+s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 
 
 @tracer.capture_method
-def download_and_upload_models(url: str, base_key: str, file_names: list, multipart_upload: dict,
-                               cannot_download: list):
-    logger.info(f"download_and_upload_models: {url}, {base_key}, {file_names}")
+def get_download_url(url: str):
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
         # Add more headers if needed
     }
     response = requests.get(url, headers=headers, allow_redirects=False, stream=True)
-    logger.info( response.status_code)
+    logger.info(response.status_code)
     if response and response.status_code == 307:
         logger.info(f"response:{response}, statuscode:{response} headers:{response.headers}")
         if response.headers and 'Location' in response.headers:
             logger.info(f"response ok:{response.headers.get('Location')}")
             url = response.headers.get('Location')
+    response.close()
+    return url
+
+
+def get_download_file_name(url: str) -> Optional[str]:
     parsed_url = urllib.parse.urlparse(url)
     filename = os.path.basename(parsed_url.path)
     if os.path.splitext(filename)[1] not in CN_MODEL_EXTS:
         logger.info(f"download_and_upload_models file error url:{url}, parsed_url:{parsed_url} filename:{filename}")
-        cannot_download.append(url)
+        return None
+    return filename
+
+
+class ImportProgress:
+    """Writes the progress of an url import to the params of the checkpoint record, at most every few seconds."""
+
+    def __init__(self, checkpoint: CheckPoint, interval: float = IMPORT_PROGRESS_INTERVAL):
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.updated_at = 0
+
+    def report(self, uploaded_bytes: int, total_bytes: Optional[int]):
+        with self.lock:
+            state = self.checkpoint.params['import']
+            state['uploaded_bytes'] = uploaded_bytes
+            state['total_bytes'] = total_bytes
+            if time.monotonic() - self.updated_at < self.interval:
+                return
+            self.updated_at = time.monotonic()
+            self.save()
+
+    def save(self, status: CheckPointStatus = None):
+        fields = {'params': self.checkpoint.params}
+        if status:
+            self.checkpoint.checkpoint_status = status
+            fields['checkpoint_status'] = status.value
+        ddb_service.update_item_fields(checkpoint_table, {'id': self.checkpoint.id}, fields)
+
+
+@tracer.capture_method
+def import_checkpoint(checkpoint: CheckPoint, context):
+    state = checkpoint.params['import']
+    filename = checkpoint.checkpoint_names[0]
+    upload = checkpoint.params['multipart_upload'][filename]
+    progress = ImportProgress(checkpoint)
+
+    try:
+        result = multipart_upload_from_url(
+            state['url'], upload['bucket'], upload['key'],
+            upload_id=upload['uploadId'],
+            part_size=int(upload['part_size']),
+            on_progress=progress.report,
+            should_stop=lambda: context.get_remaining_time_in_millis() < IMPORT_RESUME_MARGIN_SECONDS * 1000,
+            s3=s3_client,
+        )
+    except Exception as e:
+        logger.error(f"import of {state['url']} failed: {e}")
+        s3_client.abort_multipart_upload(Bucket=upload['bucket'], Key=upload['key'], UploadId=upload['uploadId'])
+        state['status'] = 'Failed'
+        state['error'] = str(e)
+        progress.save()
         return
-    logger.info(f"file name is :{filename}")
-    file_names.append(filename)
-    s3_key = f'{base_key}/{filename}'
-    logger.info(f"upload s3 key is :{filename}")
-    multipart_upload[filename] = multipart_upload_from_url(url, bucket_name, s3_key)
 
+    state['uploaded_bytes'] = result.uploaded_bytes
+    state['total_bytes'] = result.total_bytes
+    if result.completed:
+        state['status'] = 'Completed'
+        progress.save(CheckPointStatus.Active)
+        put_checkpoint_names(checkpoint)
+        logger.info(f"import of {filename} completed")
+        return
 
-def concurrent_upload(file_url: str, base_key, file_names, multipart_upload):
-    cannot_download = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(download_and_upload_models, file_url, base_key, file_names, multipart_upload,
-                                   cannot_download)]
+    if int(state['resumes']) >= IMPORT_MAX_RESUMES:
+        state['status'] = 'Failed'
+        state['error'] = f'not completed after {IMPORT_MAX_RESUMES} resumes'
+        progress.save()
+        return
 
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
-    if cannot_download:
-        return cannot_download
-    return None
+    # the parts uploaded so far are listed by the next invocation, the download goes on from there
+    state['resumes'] = int(state['resumes']) + 1
+    progress.save()
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps({
+            'checkpoint_type': checkpoint.checkpoint_type,
+            'params': {},
+            'url': state['url'],
+            'checkpoint_id': checkpoint.id,
+        })
+    )
+    logger.info(f"import of {filename} resumes at {result.uploaded_bytes} bytes")
 
 
 @dataclass
@@ -79,6 +158,8 @@ class CreateCheckPointByUrlEvent:
     url: str
     source_path: Optional[str] = None
     target_path: Optional[str] = None
+    # set when an import goes on in a new invocation
+    checkpoint_id: Optional[str] = None
 
 
 @tracer.capture_lambda_handler
@@ -88,6 +169,14 @@ def handler(raw_event, context):
     request_id = context.aws_request_id
     event = CreateCheckPointByUrlEvent(**raw_event)
 
+    if event.checkpoint_id:
+        raw_checkpoint = ddb_service.get_item(table=checkpoint_table, key_values={'id': event.checkpoint_id})
+        if not raw_checkpoint:
+            logger.error(f"checkpoint {event.checkpoint_id} to resume not found")
+            return
+        import_checkpoint(CheckPoint(**raw_checkpoint), context)
+        return
+
     if event.checkpoint_type == COMFY_TYPE:
         if not event.source_path or not event.target_path:
             return bad_request(message='Please check your source_path or target_path of the checkpoints')
@@ -95,13 +184,11 @@ def handler(raw_event, context):
         base_key = event.source_path
     else:
         base_key = get_base_checkpoint_s3_key(event.checkpoint_type, 'custom', request_id)
-    file_names = []
     logger.info(f"start to upload model:{event.url}")
     checkpoint_params = {}
     if event.params is not None and len(event.params) > 0:
         checkpoint_params = event.params
     checkpoint_params['created'] = str(datetime.datetime.now())
-    checkpoint_params['multipart_upload'] = {}
 
     user_roles = ['*']
     creator_permissions = {}
@@ -113,17 +200,34 @@ def handler(raw_event, context):
             ('all' not in creator_permissions['checkpoint'] and 'create' not in creator_permissions['checkpoint']):
         return forbidden(message=f"user has no permissions to create a model")
 
-    cannot_download = concurrent_upload(event.url, base_key, file_names, checkpoint_params['multipart_upload'])
-    if cannot_download:
-        return bad_request(message=f"contains invalid urls:{cannot_download}")
+    url = get_download_url(event.url)
+    filename = get_download_file_name(url)
+    if not filename:
+        return bad_request(message=f"contains invalid urls:{[event.url]}")
 
-    logger.info("finished upload, prepare to insert item to ddb")
+    s3_key = f'{base_key}/{filename}'
+    checkpoint_params['multipart_upload'] = {
+        filename: {
+            'uploadId': create_multipart_upload(s3_client, bucket_name, s3_key),
+            'key': s3_key,
+            'bucket': bucket_name,
+            'part_size': get_import_part_size(url),
+        }
+    }
+    checkpoint_params['import'] = {
+        'url': url,
+        'status': 'Importing',
+        'uploaded_bytes': 0,
+        'resumes': 0,
+    }
+
+    # the record is there from the start, so the import progress can be followed on it
     checkpoint = CheckPoint(
         id=request_id,
         checkpoint_type=event.checkpoint_type,
         s3_location=f's3://{bucket_name}/{base_key}',
-        checkpoint_names=file_names,
-        checkpoint_status=CheckPointStatus.Active,
+        checkpoint_names=[filename],
+        checkpoint_status=CheckPointStatus.Initial,
         params=checkpoint_params,
         timestamp=datetime.datetime.now().timestamp(),
         allowed_roles_or_users=user_roles,
@@ -131,16 +235,17 @@ def handler(raw_event, context):
         target_path=event.target_path,
     )
     ddb_service.put_items(table=checkpoint_table, entries=checkpoint.__dict__)
-    logger.info("finished insert item to ddb")
-    data = {
-        'checkpoint': {
-            'id': request_id,
-            'type': event.checkpoint_type,
-            's3_location': checkpoint.s3_location,
-            'status': checkpoint.checkpoint_status.value,
-            'params': checkpoint.params,
-            'source_path': checkpoint.source_path,
-            'target_path': checkpoint.target_path,
-        }
-    }
-    logger.info(data)
+    logger.info(f"checkpoint {request_id} created, importing {url}")
+
+    import_checkpoint(checkpoint, context)
+
+
+def get_import_part_size(url: str) -> int:
+    # the part size is fixed when the upload starts, resumed imports continue with the same parts
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=10)
+        total_size = int(response.headers.get('Content-Length') or 0)
+    except Exception as e:
+        logger.info(f"size of {url} unknown: {e}")
+        total_size = 0
+    return max(IMPORT_PART_SIZE, math.ceil(total_size / MULTIPART_MAX_PARTS))
@@ -6,6 +6,7 @@ from aws_lambda_powertools import Tracer
 
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import ok
+from libs.checkpoint_index import rename_checkpoint_name
 from libs.utils import response_error
 
 tracer = Tracer()
@@ -42,6 +43,8 @@ def handler(raw_event, context):
             ]
         )
 
+        rename_checkpoint_name(ckpt_id, raw_event['checkpoint_type'], old_name, new_name)
+
         return ok(message='update name success')
     except Exception as e:
         return response_error(e)
@@ -16,6 +16,7 @@ from sagemaker.serializers import JSONSerializer
 
 from common.ddb_service.client import DynamoDbUtilsService
 from common.excepts import BadRequestException
+from common.metrics import flush_metrics
 from common.response import ok, created
 from common.util import s3_scan_files, generate_presigned_url_for_keys, \
     record_latency_metrics, record_count_metrics, get_workflow_name
@@ -266,6 +267,7 @@ def response_schema(inference_job: ComfyExecuteTable):
 
 
 @tracer.capture_lambda_handler
+@flush_metrics
 def handler(raw_event, ctx):
     try:
         logger.info(f"execute start... Received event: {raw_event}")
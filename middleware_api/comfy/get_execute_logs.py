@@ -1,24 +1,25 @@
 import logging
 import os
-import time
-from datetime import datetime, timedelta
 
 import boto3
 from aws_lambda_powertools import Tracer
 
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import ok, not_found
+from common.util import get_query_param
 from libs.comfy_data_types import ComfyExecuteTable
+from libs.enums import ComfyExecuteType
+from libs.execute_logs import ExecuteLogs
 from libs.utils import response_error
 
 tracer = Tracer()
 logger = logging.getLogger(__name__)
 logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
-ddb = boto3.resource('dynamodb')
-client = boto3.client('logs')
 ddb_service = DynamoDbUtilsService(logger=logger)
 
 execute_table = os.environ.get('EXECUTE_TABLE')
+bucket_name = os.environ.get('S3_BUCKET_NAME')
+execute_logs = ExecuteLogs(boto3.client('logs'), boto3.client('s3'), bucket_name)
 
 
 @tracer.capture_lambda_handler
@@ -36,46 +37,18 @@ def handler(event, ctx):
         job = ComfyExecuteTable(**item)
         logger.info(job)
 
-        query = f"""
-        fields @timestamp, @message, @logStream
-        | filter @message like /{prompt_id}/
-        | sort @timestamp asc
-        | limit 1000
-        """
-
-        dt = datetime.strptime(job.start_time, '%Y-%m-%dT%H:%M:%S.%f')
-        response = client.start_query(
-            logGroupName=f'/aws/sagemaker/Endpoints/{job.endpoint_name}',
-            startTime=int(dt.timestamp()),
-            endTime=int((dt + timedelta(hours=1)).timestamp()),
-            queryString=query,
-            limit=1000
+        result = execute_logs.get(
+            prompt_id=prompt_id,
+            endpoint_name=job.endpoint_name,
+            start_time=job.start_time,
+            finished=job.status in (ComfyExecuteType.SUCCESS.value, ComfyExecuteType.FAILED.value),
+            next_token=get_query_param(event, 'next_token'),
         )
 
-        query_id = response['queryId']
-
-        # Wait for the query to complete
-        while True:
-            query_status = client.get_query_results(
-                queryId=query_id
-            )
-            status = query_status['status']
-            if status == 'Complete':
-                break
-            elif status == 'Failed' or status == 'Cancelled':
-                print("Query failed or was cancelled")
-                break
-            time.sleep(1)
-
-        results = []
-        for result in query_status['results']:
-            item = {field['field']: field['value'] for field in result}
-            results.append({
-                'timestamp': item["@timestamp"],
-                'message': item["@message"],
-                'logStream': item["@logStream"],
-            })
-
-        return ok(data={'results': results}, decimal=True)
+        return ok(data={
+            'results': result.results,
+            'status': result.status,
+            'next_token': result.next_token,
+        }, decimal=True)
     except Exception as e:
         return response_error(e)
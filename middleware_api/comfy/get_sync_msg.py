@@ -55,12 +55,19 @@ def save_message_to_dynamodb(prompt_id, message):
 def read_messages_from_dynamodb(prompt_id):
     try:
         # process_sqs_messages_and_write_to_ddb(prompt_id)
-        response = ddb.query(
-            TableName=msg_table_name,
-            KeyConditionExpression='prompt_id = :pid',
-            ExpressionAttributeValues={':pid': {'S': prompt_id}},
-        )
-        messages = [json.loads(item['message_body']['S']) for item in response.get('Items', [])]
+        messages = []
+        query_params = {
+            'TableName': msg_table_name,
+            'KeyConditionExpression': 'prompt_id = :pid',
+            'ExpressionAttributeValues': {':pid': {'S': prompt_id}},
+        }
+        # an item holds several messages of a prompt, items are returned in request_time order
+        while True:
+            response = ddb.query(**query_params)
+            messages.extend(json.loads(item['message_body']['S']) for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
         logger.info("read_messages_from_dynamodb response: {}".format(messages))
         return messages
     except Exception as e:
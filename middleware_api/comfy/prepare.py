@@ -10,6 +10,7 @@ from aws_lambda_powertools import Tracer
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import ok
 from libs.comfy_data_types import ComfySyncTable
+from libs.endpoint_directory import EndpointDirectory
 from libs.utils import response_error
 
 tracer = Tracer()
@@ -24,6 +25,7 @@ endpoint_table = os.environ.get('ENDPOINT_TABLE')
 config_table = os.environ.get('CONFIG_TABLE')
 
 ddb_service = DynamoDbUtilsService(logger=logger)
+endpoint_directory = EndpointDirectory(endpoint_table, ddb_service)
 
 
 @dataclass
@@ -39,20 +41,15 @@ class PrepareEnvEvent:
 
 
 def get_endpoint_info(endpoint_name: str):
-    endpoint_raw = ddb_service.scan(endpoint_table, filters={'endpoint_name': endpoint_name})[0] if ddb_service.scan(endpoint_table, filters={'endpoint_name': endpoint_name}) else None
-    logger.debug(f'endpoint_raw is : {endpoint_raw}')
-    if not endpoint_raw:
-        raise Exception(f'sagemaker endpoint with name {endpoint_name} is not found')
-
-    endpoint_info = ddb_service.deserialize(endpoint_raw)
-    logger.debug(f'endpoint_info is : {endpoint_info}')
+    endpoint = endpoint_directory.get_by_name(endpoint_name)
+    logger.debug(f'endpoint is : {endpoint}')
 
-    if endpoint_info is None or len(endpoint_info) == 0:
+    if endpoint is None:
         raise Exception(f'sagemaker endpoint with name {endpoint_name} is not found')
 
-    if endpoint_info['endpoint_status'] != 'InService':
-        raise Exception(f'sagemaker endpoint is not ready with status: {endpoint_info["endpoint_status"]}')
-    return endpoint_info
+    if endpoint.endpoint_status != 'InService':
+        raise Exception(f'sagemaker endpoint is not ready with status: {endpoint.endpoint_status}')
+    return endpoint.__dict__
 
 
 def prepare_sagemaker_env(request_id: str, event: PrepareEnvEvent):
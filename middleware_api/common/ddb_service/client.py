@@ -1,8 +1,12 @@
+import concurrent.futures
 import datetime
 import enum
 import logging
+import random
+import time
+from dataclasses import dataclass, field
 from decimal import Decimal
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional
 
 import boto3
 from aws_lambda_powertools import Tracer
@@ -12,11 +16,39 @@ from common.ddb_service.types_ import GetItemOutput, ScanOutput
 
 tracer = Tracer()
 
+# DynamoDB accepts at most 25 write requests per batch_write_item call
+BATCH_WRITE_SIZE = 25
+BATCH_WRITE_MAX_RETRIES = 8
+BATCH_WRITE_BASE_DELAY = 0.05
+BATCH_WRITE_MAX_DELAY = 5
+BATCH_WRITE_CONCURRENCY = 4
+
+_RETRYABLE_ERRORS = ['ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded',
+                     'InternalServerError']
+
+
+@dataclass
+class BatchWriteFailure:
+    table: str
+    operation: str  # put or delete
+    item: Dict[str, Any]  # the item for put, the key for delete
+    reason: str = ''
+
+
+@dataclass
+class BatchWriteResult:
+    written: int = 0
+    failures: List[BatchWriteFailure] = field(default_factory=list)
+
+    @property
+    def succeed(self) -> bool:
+        return len(self.failures) == 0
+
 
 class DynamoDbUtilsService:
 
-    def __init__(self, logging_level=logging.INFO, logger=None):
-        self.client = boto3.client('dynamodb')
+    def __init__(self, logging_level=logging.INFO, logger=None, client=None):
+        self.client = client or boto3.client('dynamodb')
         if logger:
             self.logger = logger
         else:
@@ -44,21 +76,93 @@ class DynamoDbUtilsService:
             raise Exception(f'table {table} put item failed -> {entries}: {e}')
 
     @tracer.capture_method
-    def batch_put_items(self, table_items: Dict[str, List[Dict[str, Any]]]) -> Any:
+    def batch_put_items(self, table_items: Dict[str, List[Dict[str, Any]]]) -> Optional[BatchWriteResult]:
         if not table_items or len(table_items) == 0:
             return None
 
-        for table_name, items in table_items.items():
-            raws = [{'PutRequest': {'Item': self._serialize(item)}} for item in items]
-            batch = []
-            for raw in raws:
-                batch.append(raw)
-                if len(batch) == 25:
-                    self.client.batch_write_item(RequestItems={table_name: batch})
-                    batch = []
+        return self.batch_write_items(put_items=table_items)
+
+    @tracer.capture_method
+    def batch_delete_items(self, table_keys: Dict[str, List[Dict[str, Any]]]) -> Optional[BatchWriteResult]:
+        if not table_keys or len(table_keys) == 0:
+            return None
+
+        return self.batch_write_items(delete_keys=table_keys)
 
-            if len(batch) > 0:
-                self.client.batch_write_item(RequestItems={table_name: batch})
+    @tracer.capture_method
+    def batch_write_items(self, put_items: Dict[str, List[Dict[str, Any]]] = None,
+                          delete_keys: Dict[str, List[Dict[str, Any]]] = None,
+                          max_workers: int = BATCH_WRITE_CONCURRENCY) -> BatchWriteResult:
+        """
+        Writes puts and deletes, possibly for several tables, in chunks of 25 requests.
+
+        Chunks are sent concurrently, unprocessed items and throttled chunks are retried with
+        exponential backoff, and whatever still fails is reported per item instead of being dropped.
+        A key must not appear twice in one call, DynamoDB rejects such batches.
+
+        :param put_items: table name -> items to put
+        :param delete_keys: table name -> keys to delete
+        :param max_workers: how many chunks are in flight at the same time
+        :return: the number of written requests and the failed items
+        """
+        requests = []
+        for table_name, items in (put_items or {}).items():
+            for item in items:
+                requests.append((table_name, {'PutRequest': {'Item': self._serialize(item)}}))
+        for table_name, keys in (delete_keys or {}).items():
+            for key in keys:
+                requests.append((table_name, {'DeleteRequest': {'Key': self._serialize(key)}}))
+
+        result = BatchWriteResult()
+        if len(requests) == 0:
+            return result
+
+        chunks = [requests[i:i + BATCH_WRITE_SIZE] for i in range(0, len(requests), BATCH_WRITE_SIZE)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            for failures in executor.map(self._batch_write_chunk, chunks):
+                result.failures.extend(failures)
+
+        result.written = len(requests) - len(result.failures)
+        if result.failures:
+            self.logger.error(f'batch write failed for {len(result.failures)} of {len(requests)} items')
+
+        return result
+
+    def _batch_write_chunk(self, chunk: List[tuple]) -> List[BatchWriteFailure]:
+        request_items = {}
+        for table_name, request in chunk:
+            request_items.setdefault(table_name, []).append(request)
+
+        reason = ''
+        for attempt in range(BATCH_WRITE_MAX_RETRIES + 1):
+            if attempt > 0:
+                # full jitter, so that concurrent chunks do not retry in lockstep
+                delay = min(BATCH_WRITE_MAX_DELAY, BATCH_WRITE_BASE_DELAY * (2 ** attempt))
+                time.sleep(random.uniform(0, delay))
+
+            try:
+                resp = self.client.batch_write_item(RequestItems=request_items)
+            except ClientError as e:
+                reason = e.response['Error']['Code']
+                if reason not in _RETRYABLE_ERRORS:
+                    break
+                continue
+
+            request_items = resp.get('UnprocessedItems') or {}
+            if len(request_items) == 0:
+                return []
+            reason = 'UnprocessedItems'
+
+        failures = []
+        for table_name, requests in request_items.items():
+            for request in requests:
+                if 'PutRequest' in request:
+                    failures.append(BatchWriteFailure(table=table_name, operation='put', reason=reason,
+                                                      item=self.deserialize(request['PutRequest']['Item'])))
+                else:
+                    failures.append(BatchWriteFailure(table=table_name, operation='delete', reason=reason,
+                                                      item=self.deserialize(request['DeleteRequest']['Key'])))
+        return failures
 
     def update_item(self, table: str, key: Dict[str, Any], field_name: str, value: Any):
         search_keys = self._serialize(key)
@@ -78,6 +182,54 @@ class DynamoDbUtilsService:
             raise Exception(
                 f'dynamodb update failed with table {table}, key: {key}, field: {field_name}, value: {value}, error: {e}')
 
+    def update_item_fields(self, table: str, key: Dict[str, Any], fields: Dict[str, Any],
+                           condition_expression: str = None, condition_values: Dict[str, Any] = None):
+        """
+        Sets several attributes of one item in a single update_item call, so readers never see
+        a half updated item. Fields with None values are skipped.
+
+        :param table: table name
+        :param key: the primary key of the item
+        :param fields: attribute name -> new value
+        :param condition_expression: defaults to the item must exist, placeholders are :names
+        :param condition_values: values of the placeholders in condition_expression
+        """
+        names = {}
+        values = {}
+        set_expressions = []
+        for i, (field_name, value) in enumerate(fields.items()):
+            if value is None:
+                continue
+            names[f'#f{i}'] = field_name
+            values[f':v{i}'] = self._convert(value)
+            set_expressions.append(f'#f{i} = :v{i}')
+
+        if len(set_expressions) == 0:
+            return
+
+        if not condition_expression:
+            key_names = []
+            for i, key_name in enumerate(key.keys()):
+                names[f'#k{i}'] = key_name
+                key_names.append(f'attribute_exists(#k{i})')
+            condition_expression = ' AND '.join(key_names)
+
+        for placeholder, value in (condition_values or {}).items():
+            values[placeholder] = self._convert(value)
+
+        try:
+            self.client.update_item(
+                TableName=table,
+                Key=self._serialize(key),
+                UpdateExpression='SET ' + ', '.join(set_expressions),
+                ConditionExpression=condition_expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as e:
+            self.logger.error('keys: %s -> %s', key, fields)
+            raise Exception(f'dynamodb update failed with table {table}, key: {key}, fields: {fields}, error: {e}')
+
     def get_item(self, table: str, key_values: Dict[str, Any]) -> Dict[str, Any]:
         try:
             search_keys = self._serialize(key_values)
@@ -0,0 +1,113 @@
+import os
+import threading
+from unittest import TestCase
+
+from botocore.exceptions import ClientError
+
+from common.ddb_service import client as ddb_client
+from common.ddb_service.client import DynamoDbUtilsService
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+class FakeDynamoDb:
+    """
+    Keeps items in memory and leaves some requests unprocessed or throttles whole calls,
+    the way DynamoDB behaves when a table runs out of write capacity.
+    """
+
+    def __init__(self, unprocessed_rounds=0, throttled_calls=0, always_unprocessed=None):
+        self.tables = {}
+        self.calls = 0
+        self.unprocessed_rounds = unprocessed_rounds
+        self.throttled_calls = throttled_calls
+        self.always_unprocessed = always_unprocessed or set()
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        with self.lock:
+            self.calls += 1
+            if self.throttled_calls > 0:
+                self.throttled_calls -= 1
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'BatchWriteItem')
+
+            unprocessed = {}
+            for table_name, requests in RequestItems.items():
+                assert len(requests) <= 25
+                table = self.tables.setdefault(table_name, {})
+                for i, request in enumerate(requests):
+                    if 'PutRequest' in request:
+                        item = request['PutRequest']['Item']
+                        key = item['id']['S']
+                    else:
+                        item = None
+                        key = request['DeleteRequest']['Key']['id']['S']
+
+                    # leave every other request of the batch unprocessed for a few rounds
+                    if key in self.always_unprocessed or (self.unprocessed_rounds > 0 and i % 2 == 0):
+                        unprocessed.setdefault(table_name, []).append(request)
+                        continue
+
+                    if item:
+                        table[key] = item
+                    else:
+                        table.pop(key, None)
+
+            if self.unprocessed_rounds > 0:
+                self.unprocessed_rounds -= 1
+
+            return {'UnprocessedItems': unprocessed}
+
+
+class BatchWriteTest(TestCase):
+
+    def setUp(self):
+        self.base_delay = ddb_client.BATCH_WRITE_BASE_DELAY
+        ddb_client.BATCH_WRITE_BASE_DELAY = 0
+
+    def tearDown(self):
+        ddb_client.BATCH_WRITE_BASE_DELAY = self.base_delay
+
+    def test_retries_unprocessed_items(self):
+        fake = FakeDynamoDb(unprocessed_rounds=3)
+        service = DynamoDbUtilsService(client=fake)
+
+        result = service.batch_put_items({'table': [{'id': str(i), 'value': i} for i in range(110)]})
+
+        self.assertTrue(result.succeed)
+        self.assertEqual(result.written, 110)
+        self.assertEqual(len(fake.tables['table']), 110)
+
+    def test_retries_throttled_calls(self):
+        fake = FakeDynamoDb(throttled_calls=3)
+        service = DynamoDbUtilsService(client=fake)
+
+        result = service.batch_put_items({'table': [{'id': str(i)} for i in range(30)]})
+
+        self.assertTrue(result.succeed)
+        self.assertEqual(len(fake.tables['table']), 30)
+
+    def test_mixed_put_and_delete(self):
+        fake = FakeDynamoDb()
+        service = DynamoDbUtilsService(client=fake)
+        service.batch_put_items({'a': [{'id': str(i)} for i in range(10)]})
+
+        result = service.batch_write_items(put_items={'b': [{'id': 'x'}]},
+                                           delete_keys={'a': [{'id': str(i)} for i in range(5)]})
+
+        self.assertTrue(result.succeed)
+        self.assertEqual(sorted(fake.tables['a'].keys()), ['5', '6', '7', '8', '9'])
+        self.assertEqual(list(fake.tables['b'].keys()), ['x'])
+
+    def test_reports_failed_items(self):
+        fake = FakeDynamoDb(always_unprocessed={'3', 'gone'})
+        service = DynamoDbUtilsService(client=fake)
+
+        result = service.batch_write_items(put_items={'table': [{'id': str(i)} for i in range(50)]},
+                                           delete_keys={'other': [{'id': 'gone'}]})
+
+        self.assertFalse(result.succeed)
+        self.assertEqual(result.written, 49)
+        failed = sorted((f.operation, f.item['id']) for f in result.failures)
+        self.assertEqual(failed, [('delete', 'gone'), ('put', '3')])
+        self.assertEqual(result.failures[0].reason, 'UnprocessedItems')
@@ -0,0 +1,109 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+NAMESPACE = 'ESD'
+
+# CloudWatch accepts at most 100 values per metric in one embedded metric document
+MAX_VALUES_PER_METRIC = 100
+# seconds datapoints wait in the buffer when no flush_metrics handler writes them at the end of the invocation
+MAX_BUFFER_SECONDS = 60
+
+
+def stdout_sink(line: str):
+    # EMF documents must be plain lines on stdout, so they bypass the python logger
+    # and its level, Lambda extracts the metrics from the log stream asynchronously
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+class MetricsEmitter:
+    """
+    Buffers datapoints in memory and writes them as CloudWatch Embedded Metric Format
+    log lines, instead of calling PutMetricData once per event.
+
+    Datapoints with the same metric name, unit and dimension values are merged
+    into a single document with a list of values. Handlers decorated with
+    flush_metrics write what they recorded once they return.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE, sink: Callable[[str], None] = stdout_sink,
+                 max_buffer_seconds: float = MAX_BUFFER_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.namespace = namespace
+        self.sink = sink
+        self.max_buffer_seconds = max_buffer_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.buffer: Dict[Tuple, List[float]] = {}
+        self.buffered_at = 0.0
+
+    def put(self, metric_name: str, value: float, unit: str, dimension_sets: List[Dict[str, str]]):
+        with self.lock:
+            if not self.buffer:
+                self.buffered_at = self.clock()
+            for dimensions in dimension_sets:
+                key = (metric_name, unit, tuple(dimensions.items()))
+                self.buffer.setdefault(key, []).append(value)
+
+    def flush(self):
+        with self.lock:
+            buffer, self.buffer = self.buffer, {}
+
+        for (metric_name, unit, dimensions), values in buffer.items():
+            for i in range(0, len(values), MAX_VALUES_PER_METRIC):
+                try:
+                    self.sink(self._document(metric_name, unit, dict(dimensions), values[i:i + MAX_VALUES_PER_METRIC]))
+                except Exception as e:
+                    # metrics must never fail the request that produced them
+                    logger.error(f"failed to emit metric {metric_name}: {e}")
+
+    def record(self, metric_name: str, value: float, unit: str, dimension_sets: List[Dict[str, str]]):
+        self.put(metric_name, value, unit, dimension_sets)
+        # outside of a flush_metrics handler the buffer is written once it got old
+        with self.lock:
+            expired = self.clock() - self.buffered_at >= self.max_buffer_seconds
+        if expired:
+            self.flush()
+
+    def _document(self, metric_name: str, unit: str, dimensions: Dict[str, str], values: List[float]) -> str:
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [
+                    {
+                        'Namespace': self.namespace,
+                        'Dimensions': [list(dimensions.keys())],
+                        'Metrics': [{'Name': metric_name, 'Unit': unit}],
+                    }
+                ],
+            },
+            metric_name: values[0] if len(values) == 1 else values,
+        }
+        document.update(dimensions)
+
+        return json.dumps(document)
+
+
+emitter = MetricsEmitter()
+
+
+def flush_metrics(handler):
+    """Decorates a Lambda handler, the metrics it recorded are written once it returns."""
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            emitter.flush()
+
+    return wrapper
+
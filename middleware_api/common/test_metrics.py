@@ -0,0 +1,106 @@
+import json
+import os
+from unittest import TestCase
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('ESD_VERSION', 'v1.0.0-test')
+os.environ.setdefault('S3_BUCKET_NAME', 'bucket')
+os.environ.setdefault('ENDPOINT_TABLE_NAME', 'SDEndpointDeploymentJobTable')
+
+from common import metrics
+from common.metrics import MetricsEmitter, MAX_VALUES_PER_METRIC, flush_metrics
+
+
+class MetricsEmitterTest(TestCase):
+
+    def setUp(self):
+        self.lines = []
+        self.emitter = MetricsEmitter(sink=self.lines.append)
+
+    def documents(self):
+        return [json.loads(line) for line in self.lines]
+
+    def test_record_writes_one_document_per_dimension_set(self):
+        self.emitter.record('InferenceSucceed', 1, 'Count', [{'Service': 'sd'}, {'Endpoint': 'ep'}])
+        self.emitter.flush()
+
+        documents = self.documents()
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0]['Service'], 'sd')
+        self.assertEqual(documents[1]['Endpoint'], 'ep')
+        for document in documents:
+            directive = document['_aws']['CloudWatchMetrics'][0]
+            self.assertEqual(directive['Namespace'], 'ESD')
+            self.assertEqual(directive['Metrics'], [{'Name': 'InferenceSucceed', 'Unit': 'Count'}])
+            self.assertEqual(document['InferenceSucceed'], 1)
+
+    def test_buffered_values_are_merged(self):
+        for value in range(MAX_VALUES_PER_METRIC + 5):
+            self.emitter.put('InferenceLatency', value, 'Milliseconds', [{'Endpoint': 'ep'}])
+        self.emitter.put('InferenceLatency', 1, 'Milliseconds', [{'Endpoint': 'other'}])
+
+        self.assertEqual(self.lines, [])
+        self.emitter.flush()
+
+        documents = self.documents()
+        self.assertEqual(len(documents), 3)
+        self.assertEqual(len(documents[0]['InferenceLatency']), MAX_VALUES_PER_METRIC)
+        self.assertEqual(documents[1]['InferenceLatency'], [100, 101, 102, 103, 104])
+        self.assertEqual(documents[2]['Endpoint'], 'other')
+
+        self.emitter.flush()
+        self.assertEqual(len(self.lines), 3)
+
+    def test_sink_errors_are_swallowed(self):
+        def broken_sink(line):
+            raise IOError('closed')
+
+        emitter = MetricsEmitter(sink=broken_sink)
+        emitter.record('InferenceSucceed', 1, 'Count', [{'Service': 'sd'}])
+        emitter.flush()
+
+    def test_records_are_buffered_until_the_handler_returns(self):
+        sink = metrics.emitter.sink
+        metrics.emitter.sink = self.lines.append
+
+        @flush_metrics
+        def handler(event, context):
+            for _ in range(3):
+                metrics.emitter.record('InferenceTotal', 1, 'Count', [{'Endpoint': 'ep'}])
+            self.assertEqual(self.lines, [])
+            raise ValueError('failed')
+
+        try:
+            with self.assertRaises(ValueError):
+                handler({}, None)
+        finally:
+            metrics.emitter.sink = sink
+
+        self.assertEqual([document['InferenceTotal'] for document in self.documents()], [[1, 1, 1]])
+
+    def test_old_buffer_is_written_by_a_later_record(self):
+        now = [0]
+        emitter = MetricsEmitter(sink=self.lines.append, max_buffer_seconds=60, clock=lambda: now[0])
+
+        emitter.record('InferenceTotal', 1, 'Count', [{'Endpoint': 'ep'}])
+        now[0] = 30
+        emitter.record('InferenceTotal', 1, 'Count', [{'Endpoint': 'ep'}])
+        self.assertEqual(self.lines, [])
+
+        now[0] = 61
+        emitter.record('InferenceTotal', 1, 'Count', [{'Endpoint': 'ep'}])
+        self.assertEqual(self.documents()[0]['InferenceTotal'], [1, 1, 1])
+
+    def test_record_count_metrics_dimensions(self):
+        from common import util
+
+        sink = metrics.emitter.sink
+        metrics.emitter.sink = self.lines.append
+        try:
+            util.record_count_metrics(ep_name='ep', metric_name='InferenceTotal', service='comfy', workflow='wf')
+            metrics.emitter.flush()
+        finally:
+            metrics.emitter.sink = sink
+
+        dimensions = [document['_aws']['CloudWatchMetrics'][0]['Dimensions'] for document in self.documents()]
+        self.assertEqual(dimensions, [[['Service']], [['Endpoint']], [['Workflow']]])
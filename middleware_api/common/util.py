@@ -14,6 +14,7 @@ from PIL import Image, PngImagePlugin
 from aws_lambda_powertools import Tracer
 
 from common.ddb_service.client import DynamoDbUtilsService
+from common.metrics import emitter as metrics_emitter
 from libs.comfy_data_types import InferenceResult
 from libs.data_types import Endpoint
 from libs.enums import ServiceType
@@ -38,82 +39,32 @@ esd_version = os.environ.get("ESD_VERSION")
 logs = boto3.client('logs')
 
 
+def _metric_dimension_sets(service: str, ep_name: str = None, workflow: str = None):
+    dimension_sets = [{'Service': service}]
+
+    if ep_name:
+        dimension_sets.append({'Endpoint': ep_name})
+
+    if workflow:
+        dimension_sets.append({'Workflow': workflow})
+
+    return dimension_sets
+
+
 def record_count_metrics(ep_name: str,
                          metric_name='InferenceSucceed',
                          service=ServiceType.SD.value,
-                         workflow: str = None
+                         workflow: str = None,
+                         count: int = 1
                          ):
-    data = [
-        {
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Service',
-                    'Value': service
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': ep_name
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-    ]
-
-    if workflow:
-        data.append({
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Workflow',
-                    'Value': workflow
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        })
-
-    response = cloudwatch.put_metric_data(
-        Namespace='ESD',
-        MetricData=data
-    )
-
-    logger.info(f"record_metric response: {response}")
+    metrics_emitter.record(metric_name, count, 'Count', _metric_dimension_sets(service, ep_name, workflow))
 
 
 def record_seconds_metrics(start_time: str, metric_name='Inference', service=ServiceType.SD.value):
     start_time = datetime.datetime.fromisoformat(start_time)
     latency = (datetime.datetime.now() - start_time).seconds
 
-    response = cloudwatch.put_metric_data(
-        Namespace='ESD',
-        MetricData=[
-            {
-                'MetricName': metric_name,
-                'Dimensions': [
-                    {
-                        'Name': 'Service',
-                        'Value': service
-                    },
-                ],
-                'Timestamp': datetime.datetime.utcnow(),
-                'Value': latency,
-                'Unit': 'Seconds'
-            },
-        ]
-    )
-    logger.info(f"record_metric response: {response}")
+    metrics_emitter.record(metric_name, latency, 'Seconds', _metric_dimension_sets(service))
 
 
 def record_latency_metrics(start_time,
@@ -136,52 +87,7 @@ def record_latency_metrics(start_time,
 
     logger.info(f"{service} {metric_name}: {latency} Milliseconds")
 
-    data = [
-        {
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Service',
-                    'Value': service
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': latency,
-            'Unit': 'Milliseconds'
-        },
-        {
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': ep_name
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': latency,
-            'Unit': 'Milliseconds'
-        },
-    ]
-
-    if workflow:
-        data.append({
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Workflow',
-                    'Value': workflow
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': latency,
-            'Unit': 'Milliseconds'
-        })
-
-    response = cloudwatch.put_metric_data(
-        Namespace='ESD',
-        MetricData=data
-    )
-    logger.info(f"record_metric response: {response}")
+    metrics_emitter.record(metric_name, latency, 'Milliseconds', _metric_dimension_sets(service, ep_name, workflow))
 
 
 def record_queue_latency_metrics(create_time: str, start_time, ep_name: str, service=ServiceType.SD.value):
@@ -202,38 +108,7 @@ def record_queue_latency_metrics(create_time: str, start_time, ep_name: str, ser
 
     logger.info(f"{service} {metric_name}: {latency} Milliseconds")
 
-    data = [
-        {
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Service',
-                    'Value': service
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': latency,
-            'Unit': 'Milliseconds'
-        },
-        {
-            'MetricName': metric_name,
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': ep_name
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': latency,
-            'Unit': 'Milliseconds'
-        },
-    ]
-
-    response = cloudwatch.put_metric_data(
-        Namespace='ESD',
-        MetricData=data
-    )
-    logger.info(f"record_metric response: {response}")
+    metrics_emitter.record(metric_name, latency, 'Milliseconds', _metric_dimension_sets(service, ep_name))
 
 
 def get_multi_query_params(event, param_name: str, default=None):
@@ -99,10 +99,13 @@ def handler(raw_event, context):
 
         logger.info(f"dataset_info: {new_dataset_info.__dict__}")
 
-        ddb_service.batch_put_items({
+        result = ddb_service.batch_put_items({
             dataset_info_table: [new_dataset_info.__dict__],
             dataset_item_table: dataset,
         })
+        if not result.succeed:
+            failed_names = [f.item.get('name', f.item.get('dataset_name')) for f in result.failures]
+            raise Exception(f'failed to save dataset {new_dataset_info.dataset_name} items: {failed_names}')
 
         data = {
             'datasetName': new_dataset_info.dataset_name,
@@ -11,8 +11,9 @@ from common.const import PERMISSION_TRAIN_ALL
 from common.ddb_service.client import DynamoDbUtilsService
 from common.excepts import NotFoundException, BadRequestException
 from common.response import accepted
-from datasets.crop_dataset_handler import DatasetCropItemEvent
+from datasets.crop_dataset_handler import DatasetCropBatchEvent
 from libs.data_types import DatasetItem, DatasetInfo
+from libs.dataset_crop import CROP_BATCH_SIZE
 from libs.enums import DatasetStatus
 from libs.utils import permissions_check, response_error
 
@@ -64,17 +65,23 @@ def handler(event, context):
             'dataset_name': dataset_name
         })
 
+        items = []
         for row in rows:
             item = DatasetItem(**ddb_service.deserialize(row))
-            old_s3_location = item.get_s3_key(dataset_info.prefix)
-            payload = DatasetCropItemEvent(
+            items.append({
+                'name': item.name,
+                'type': item.type,
+                'old_s3_location': item.get_s3_key(dataset_info.prefix),
+                'user_roles': item.allowed_roles_or_users,
+            })
+
+        # each invocation crops a batch of items and writes their records together
+        for i in range(0, len(items), CROP_BATCH_SIZE):
+            payload = DatasetCropBatchEvent(
                 dataset_name=dataset_name_new,
                 prefix=dataset_info.prefix,
-                type=item.type,
                 max_resolution=event_parse.max_resolution,
-                name=item.name,
-                user_roles=item.allowed_roles_or_users,
-                old_s3_location=old_s3_location
+                items=items[i:i + CROP_BATCH_SIZE]
             )
             resp = lambda_client.invoke(
                 FunctionName=crop_lambda_name,
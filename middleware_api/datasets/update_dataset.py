@@ -59,9 +59,12 @@ def handler(raw_event, context):
             item.data_status = DataStatus[event.status]
             updates_items.append(item.__dict__)
 
-        ddb_service.batch_put_items(table_items={
+        result = ddb_service.batch_put_items(table_items={
             dataset_item_table: updates_items
         })
+        if result and not result.succeed:
+            failed_names = [f.item['name'] for f in result.failures]
+            raise Exception(f'failed to update dataset {dataset_info.dataset_name} items: {failed_names}')
 
         return ok(data={
             'datasetName': dataset_info.dataset_name,
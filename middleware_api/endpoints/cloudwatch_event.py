@@ -8,7 +8,9 @@ from aws_lambda_powertools import Tracer
 
 from common.ddb_service.client import DynamoDbUtilsService
 from delete_endpoints import get_endpoint_in_sagemaker
+from libs.dashboards import DashboardRecords, endpoint_metrics, list_esd_metrics, workflow_names
 from libs.data_types import Endpoint
+from libs.endpoint_directory import EndpointDirectory
 from libs.utils import get_endpoint_by_name
 
 aws_region = os.environ.get('AWS_REGION')
@@ -24,6 +26,9 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 cloudwatch = boto3.client('cloudwatch')
 sagemaker = boto3.client('sagemaker')
 ddb_service = DynamoDbUtilsService(logger=logger)
+endpoint_directory = EndpointDirectory(sagemaker_endpoint_table, ddb_service)
+# what each dashboard has, kept across invocations of the warm lambda
+dashboards = DashboardRecords(cloudwatch)
 period = 300
 
 
@@ -31,47 +36,40 @@ period = 300
 def handler(event, context):
     logger.info(json.dumps(event))
 
-    gen_workflow_ds()
+    metrics = list_esd_metrics(cloudwatch)
+    metrics_by_endpoint = endpoint_metrics(metrics)
+
+    gen_workflow_ds(metrics)
 
     if 'detail' in event and 'EndpointStatus' in event['detail']:
         endpoint_name = event['detail']['EndpointName']
         endpoint_status = event['detail']['EndpointStatus']
         if endpoint_status == 'InService':
             ep = get_endpoint_by_name(endpoint_name)
-            create_ds(ep)
-            clean_ds()
+            create_ds(ep, metrics_by_endpoint.get(endpoint_name, []), check_sagemaker=False)
             return {}
 
-    eps = ddb_service.scan(sagemaker_endpoint_table)
-    logger.info(f"Endpoints: {eps}")
-
-    for ep in eps:
-        ep_name = ep['endpoint_name']['S']
-        ep = get_endpoint_by_name(ep_name)
+    eps = {}
+    for ep in endpoint_directory.list_active():
+        eps.setdefault(ep.endpoint_name, ep)
+    logger.info(f"Endpoints: {list(eps.keys())}")
 
+    updated = []
+    for ep_name, ep in eps.items():
         if ep.endpoint_status == 'Creating':
             continue
 
-        endpoint = get_endpoint_in_sagemaker(ep_name)
-        if endpoint is None:
-            continue
+        if create_ds(ep, metrics_by_endpoint.get(ep_name, [])):
+            updated.append(ep_name)
 
-        create_ds(ep)
+    logger.info(f"Dashboards updated: {updated}, {len(eps) - len(updated)} unchanged or skipped")
 
-    clean_ds()
+    clean_ds(set(eps.keys()))
     return {}
 
 
-def gen_workflow_ds():
-    dimensions = [{'Name': 'Workflow'}]
-    metrics = cloudwatch.list_metrics(Namespace='ESD', MetricName='InferenceTotal', Dimensions=dimensions)['Metrics']
-
-    workflow_name = []
-    for m in metrics:
-        workflow = m['Dimensions'][0]['Value']
-        workflow_name.append(workflow)
-
-    workflow_name.sort()
+def gen_workflow_ds(metrics):
+    workflow_name = workflow_names(metrics)
 
     logger.info(f"Workflow Names: {workflow_name}")
 
@@ -145,26 +143,23 @@ def gen_workflow_ds():
         })
         y = y + 1
 
-    if len(widgets) > 0:
-        cloudwatch.put_dashboard(DashboardName='ESD-Workflow', DashboardBody=json.dumps({"widgets": widgets}))
-
-
-def clean_ds():
-    ds = cloudwatch.list_dashboards()
-    if 'DashboardEntries' in ds:
-        prefix = ('comfy-async-', 'comfy-real-time-', 'sd-async-', 'sd-real-time-')
-        filtered_dashboards = [dashboard['DashboardName'] for dashboard in ds['DashboardEntries'] if
-                               dashboard['DashboardName'].startswith(prefix)]
-        for ep_name in filtered_dashboards:
-            try:
-                get_endpoint_by_name(ep_name)
-            except Exception as e:
-                print(f"Error: {e}")
-                print(f"Deleting {ep_name}")
+    body = {"widgets": widgets}
+    if len(widgets) > 0 and not dashboards.is_current('ESD-Workflow', body):
+        dashboards.put('ESD-Workflow', body)
+
+
+def clean_ds(endpoint_names):
+    prefix = ('comfy-async-', 'comfy-real-time-', 'sd-async-', 'sd-real-time-')
+    for page in cloudwatch.get_paginator('list_dashboards').paginate():
+        for dashboard in page.get('DashboardEntries', []):
+            ep_name = dashboard['DashboardName']
+            if ep_name.startswith(prefix) and ep_name not in endpoint_names:
+                logger.info(f"Deleting {ep_name}")
                 cloudwatch.delete_dashboards(DashboardNames=[ep_name])
+                dashboards.forget(ep_name)
 
 
-def ds_body(ep: Endpoint, custom_metrics):
+def ds_body(ep: Endpoint, custom_metrics) -> dict:
     ep_name = ep.endpoint_name
     last_build_time = datetime.datetime.now().isoformat()
     dashboard_body = {
@@ -564,7 +559,7 @@ def ds_body(ep: Endpoint, custom_metrics):
     for gpu_ds in gpus_ds:
         dashboard_body['widgets'].append(gpu_ds)
 
-    return json.dumps(dashboard_body)
+    return dashboard_body
 
 
 def resolve_gpu_nums(ep: Endpoint):
@@ -768,38 +763,17 @@ def resolve_gpu_ds(ep: Endpoint, custom_metrics):
     return list
 
 
-def get_dashboard(dashboard_name):
-    try:
-        response = cloudwatch.get_dashboard(DashboardName=dashboard_name)
-        return response['DashboardBody']
-    except cloudwatch.exceptions.ResourceNotFound:
-        return None
-
-
-def create_ds(ep: Endpoint):
+def create_ds(ep: Endpoint, custom_metrics, check_sagemaker=True) -> bool:
+    """Writes the dashboard of the endpoint when its widgets or metrics changed, returns whether it was written."""
     ep_name = ep.endpoint_name
-    dimensions = [
-        {
-            'Name': 'Endpoint',
-            'Value': ep_name
-        }
-    ]
-
-    metrics1 = cloudwatch.list_metrics(Namespace='ESD', MetricName='GPUMemoryUtilization', Dimensions=dimensions)[
-        'Metrics']
-    metrics2 = cloudwatch.list_metrics(Namespace='ESD', MetricName='GPUUtilization', Dimensions=dimensions)['Metrics']
-    metrics3 = cloudwatch.list_metrics(Namespace='ESD', MetricName='InferenceTotal', Dimensions=dimensions)['Metrics']
-
-    custom_metrics = metrics1 + metrics2 + metrics3
-
-    logger.info(f"Custom Metrics: ")
-    logger.info(json.dumps(custom_metrics))
 
-    existing_dashboard = get_dashboard(ep_name)
+    body = ds_body(ep, custom_metrics)
+    if dashboards.is_current(ep_name, body):
+        return False
 
-    cloudwatch.put_dashboard(DashboardName=ep_name, DashboardBody=ds_body(ep, custom_metrics))
+    if check_sagemaker and get_endpoint_in_sagemaker(ep_name) is None:
+        return False
 
-    if existing_dashboard:
-        logger.info(f"Dashboard '{ep_name}' updated successfully.")
-    else:
-        logger.info(f"Dashboard '{ep_name}' created successfully.")
+    dashboards.put(ep_name, body)
+    logger.info(f"Dashboard '{ep_name}' written.")
+    return True
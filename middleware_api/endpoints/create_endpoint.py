@@ -16,6 +16,7 @@ from common.excepts import BadRequestException
 from common.response import bad_request, accepted
 from common.util import resolve_instance_invocations_num
 from libs.data_types import Endpoint, Workflow
+from libs.endpoint_directory import EndpointDirectory
 from libs.enums import EndpointStatus, EndpointType
 from libs.utils import response_error, permissions_check, get_workflow_by_name
 
@@ -41,6 +42,7 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 sagemaker = boto3.client('sagemaker')
 ddb_service = DynamoDbUtilsService(logger=logger)
+endpoint_directory = EndpointDirectory(sagemaker_endpoint_table, ddb_service)
 
 
 @dataclass
@@ -158,23 +160,12 @@ def handler(raw_event, ctx):
         initial_instance_count = int(event.initial_instance_count) if event.initial_instance_count else 1
         instance_type = event.instance_type
 
-        endpoint_rows = ddb_service.scan(sagemaker_endpoint_table, filters=None)
-        for endpoint_row in endpoint_rows:
-            logger.info("endpoint_row:")
-            logger.info(endpoint_row)
-            endpoint = Endpoint(**(ddb_service.deserialize(endpoint_row)))
-            logger.info("endpoint:")
-            logger.info(endpoint.__dict__)
-
-            if not endpoint.owner_group_or_role:
-                continue
-
-            # Compatible with fields used in older data, endpoint.status must be 'deleted'
-            if endpoint.endpoint_status != EndpointStatus.DELETED.value and endpoint.status != 'deleted':
-                for role in event.assign_to_roles:
-                    if role in endpoint.owner_group_or_role:
-                        return bad_request(
-                            message=f"role [{role}] has a valid endpoint already, not allow to have another one")
+        role_owner = endpoint_directory.find_role_owner(event.assign_to_roles)
+        if role_owner:
+            role, endpoint = role_owner
+            logger.info(f"role {role} is assigned to endpoint: {endpoint.__dict__}")
+            return bad_request(
+                message=f"role [{role}] has a valid endpoint already, not allow to have another one")
 
         _create_sagemaker_model(model_name, model_data_url, endpoint_name, endpoint_id, event)
 
@@ -12,7 +12,7 @@ from common.excepts import NotFoundException
 from common.response import no_content
 from common.util import endpoint_clean
 from libs.data_types import Endpoint
-from libs.enums import EndpointStatus
+from libs.endpoint_directory import EndpointDirectory
 from libs.utils import response_error, get_endpoint_by_name
 
 tracer = Tracer()
@@ -23,6 +23,7 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 sagemaker = boto3.client('sagemaker')
 ddb_service = DynamoDbUtilsService(logger=logger)
+endpoint_directory = EndpointDirectory(sagemaker_endpoint_table, ddb_service)
 esd_version = os.environ.get("ESD_VERSION")
 
 
@@ -55,20 +56,9 @@ def handler(raw_event, ctx):
         return response_error(e)
 
 
-def update_endpoint_field(ep: Endpoint, field_name, field_value):
-    logger.info(f"Updating {field_name} to {field_value} for: {ep.EndpointDeploymentJobId}")
-    ddb_service.update_item(
-        table=sagemaker_endpoint_table,
-        key={'EndpointDeploymentJobId': ep.EndpointDeploymentJobId},
-        field_name=field_name,
-        value=field_value
-    )
-
-
 @tracer.capture_method
 def delete_endpoint(ep: Endpoint):
-    update_endpoint_field(ep, 'endpoint_status', EndpointStatus.DELETED.value)
-    update_endpoint_field(ep, 'current_instance_count', 0)
+    endpoint_directory.archive(ep)
 
     endpoint = get_endpoint_in_sagemaker(ep.endpoint_name)
     if endpoint is None:
@@ -6,6 +6,7 @@ from datetime import datetime
 import boto3
 from aws_lambda_powertools import Tracer
 
+from common.metrics import flush_metrics
 from common.util import record_seconds_metrics, endpoint_clean
 from inferences.inference_libs import update_table_by_pk
 from libs.data_types import Endpoint
@@ -35,6 +36,7 @@ aws_region = os.environ.get('AWS_REGION')
 
 # lambda: handle sagemaker events
 @tracer.capture_lambda_handler
+@flush_metrics
 def handler(event, context):
     logger.info(json.dumps(event))
     endpoint_name = event['detail']['EndpointName']
@@ -2,7 +2,6 @@ import json
 import logging
 import os
 
-import boto3
 from aws_lambda_powertools import Tracer
 
 from common.const import PERMISSION_ENDPOINT_ALL, PERMISSION_ENDPOINT_LIST
@@ -10,6 +9,7 @@ from common.ddb_service.client import DynamoDbUtilsService
 from common.response import ok
 from common.util import get_query_param
 from libs.data_types import Endpoint, PARTITION_KEYS, Role
+from libs.endpoint_directory import ACTIVE_STATUSES, ARCHIVED_STATUS, EndpointDirectory, is_archived
 from libs.enums import EndpointStatus
 from libs.utils import get_user_roles, check_user_permissions, get_permissions_by_username, permissions_check, \
     response_error, decode_last_key, encode_last_key
@@ -17,15 +17,14 @@ from libs.utils import get_user_roles, check_user_permissions, get_permissions_b
 tracer = Tracer()
 sagemaker_endpoint_table = os.environ.get('ENDPOINT_TABLE_NAME')
 user_table = os.environ.get('MULTI_USER_TABLE')
-ddb = boto3.resource('dynamodb')
-table = ddb.Table(sagemaker_endpoint_table)
 logger = logging.getLogger(__name__)
 logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 ddb_service = DynamoDbUtilsService(logger=logger)
+endpoint_directory = EndpointDirectory(sagemaker_endpoint_table, ddb_service)
 
 
-# GET /endpoints?name=SageMaker_Endpoint_Name&username=&filter=key:value,key:value
+# GET /endpoints?name=SageMaker_Endpoint_Name&username=&status=InService,Updating&filter=key:value,key:value
 @tracer.capture_lambda_handler
 def handler(event, ctx):
     _filter = {}
@@ -38,24 +37,18 @@ def handler(event, ctx):
         limit = int(get_query_param(event, 'limit', 10))
         last_evaluated_key = None
 
-        scan_kwargs = {
-            'Limit': limit,
-        }
-
-        if exclusive_start_key:
-            scan_kwargs['ExclusiveStartKey'] = decode_last_key(exclusive_start_key)
-
         endpoint_deployment_job_id = get_query_param(event, 'endpointDeploymentJobId', None)
         username = get_query_param(event, 'username', None)
 
         if endpoint_deployment_job_id:
-            scan_rows = ddb_service.query_items(sagemaker_endpoint_table,
-                                                key_values={'EndpointDeploymentJobId': endpoint_deployment_job_id},
-                                                )
+            rows = ddb_service.query_items(sagemaker_endpoint_table,
+                                           key_values={'EndpointDeploymentJobId': endpoint_deployment_job_id},
+                                           )
+            endpoints = [Endpoint(**ddb_service.deserialize(row)) for row in rows]
         else:
-            response = table.scan(**scan_kwargs)
-            scan_rows = response.get('Items', [])
-            last_evaluated_key = encode_last_key(response.get('LastEvaluatedKey'))
+            endpoints, last_key = endpoint_directory.list_by_status(get_statuses(event), limit=limit,
+                                                                    start_key=decode_last_key(exclusive_start_key))
+            last_evaluated_key = encode_last_key(last_key)
 
         results = []
         user_roles = []
@@ -72,13 +65,12 @@ def handler(event, ctx):
             role = Role(**ddb_service.deserialize(requestor_created_roles_row))
             user_roles.append(role.sort_key)
 
-        for row in scan_rows:
+        for endpoint in endpoints:
             # Compatible with fields used in older data, must be 'deleted'
-            if 'status' in row and 'S' in row['status'] and row['status']['S'] == 'deleted':
-                row['endpoint_status']['S'] = EndpointStatus.DELETED.value
+            if is_archived(endpoint):
+                endpoint.endpoint_status = EndpointStatus.DELETED.value
 
-            logger.info(f"row: {row}")
-            endpoint = Endpoint(**row)
+            logger.info(f"endpoint: {endpoint.__dict__}")
             if 'sagemaker_endpoint' in requestor_permissions and \
                     'list' in requestor_permissions['sagemaker_endpoint'] and \
                     endpoint.owner_group_or_role and \
@@ -104,6 +96,16 @@ def handler(event, ctx):
         return response_error(e)
 
 
+def get_statuses(event):
+    """Statuses to list, comma separated or `all`, only the endpoints not deleted by default."""
+    status = get_query_param(event, 'status', None)
+    if not status:
+        return ACTIVE_STATUSES
+    if status == 'all':
+        return ACTIVE_STATUSES + [ARCHIVED_STATUS]
+    return [s.strip() for s in status.split(',') if s.strip()]
+
+
 def sort_endpoints(data):
     if len(data) == 0:
         return data
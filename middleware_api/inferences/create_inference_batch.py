@@ -0,0 +1,187 @@
+import dataclasses
+import json
+import logging
+import os
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import List, Any, Optional
+
+import boto3
+from aws_lambda_powertools import Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from common.const import PERMISSION_INFERENCE_ALL, PERMISSION_INFERENCE_CREATE
+from common.ddb_service.client import DynamoDbUtilsService
+from common.excepts import BadRequestException
+from common.metrics import flush_metrics
+from common.response import accepted
+from common.util import record_count_metrics, get_workflow_name
+from create_inference_job import get_used_models, get_available_endpoints, get_base_inference_param_s3_key, \
+    record_recent_models, endpoint_directory, scheduler
+from libs.data_types import InferenceJob
+from libs.inference_batch import parse_batch_payloads, assign_endpoints, check_job_items, discard_batch_jobs, \
+    is_inline_payload, INFERENCE_BATCH_DISPATCH_SIZE
+from libs.utils import permissions_check, response_error, log_json
+
+tracer = Tracer()
+bucket_name = os.environ.get('S3_BUCKET_NAME')
+inference_table_name = os.environ.get('INFERENCE_JOB_TABLE')
+dispatch_lambda_name = os.environ.get('DISPATCH_LAMBDA_NAME')
+lambda_client = boto3.client('lambda')
+s3_client = boto3.client('s3')
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+ddb_service = DynamoDbUtilsService(logger=logger)
+
+batch_task_types = ['txt2img', 'img2img']
+
+
+@dataclasses.dataclass
+class CreateInferenceBatchEvent:
+    task_type: str
+    models: dict[str, List[str]]
+    # one parameter set per job, the same as payload_string of a single job
+    payloads: List[Any]
+    inference_type: Optional[str] = None
+    sagemaker_endpoint_name: Optional[str] = ""
+    workflow: Optional[str] = None
+    use_result_cache: Optional[bool] = False
+
+
+@dataclasses.dataclass
+class InferenceBatchDispatchEvent:
+    batch_id: str
+    username: str
+    job_ids: List[str]
+
+
+# POST /inferences/batches
+@tracer.capture_lambda_handler
+@flush_metrics
+def handler(raw_event: dict, context: LambdaContext):
+    try:
+        logger.info(json.dumps(raw_event, default=str))
+        batch_id = context.aws_request_id
+        event = CreateInferenceBatchEvent(**json.loads(raw_event['body']))
+
+        username = permissions_check(raw_event, [PERMISSION_INFERENCE_ALL, PERMISSION_INFERENCE_CREATE])
+
+        if event.task_type not in batch_task_types:
+            raise BadRequestException(f'task type {event.task_type} should be in {batch_task_types}')
+
+        payload_strings = parse_batch_payloads(event.payloads)
+
+        # checkpoints and endpoints are resolved once for the whole batch
+        ckpts, used_models = get_used_models(event.models or {})
+        model_names = (event.models or {}).get('Stable-diffusion', [])
+        endpoints = _schedule_batch_endpoints(event, username, model_names, len(payload_strings))
+
+        workflow = event.workflow
+        if workflow:
+            workflow = get_workflow_name(workflow, endpoints[0].instance_type)
+
+        create_time = datetime.now().isoformat()
+        jobs = []
+        # param s3 key -> payloads too large to be stored in the job, the endpoint reads them from input_body_s3
+        s3_payloads = {}
+        for payload_string, ep in zip(payload_strings, endpoints):
+            inference_id = str(uuid.uuid4())
+            param_s3_key = f'{get_base_inference_param_s3_key(event.task_type, inference_id)}/api_param.json'
+            if not is_inline_payload(payload_string):
+                s3_payloads[param_s3_key] = payload_string
+                payload_string = None
+            jobs.append(InferenceJob(
+                InferenceJobId=inference_id,
+                createTime=create_time,
+                status='created',
+                taskType=event.task_type,
+                inference_type=event.inference_type,
+                workflow=workflow,
+                owner_group_or_role=[username],
+                payload_string=payload_string,
+                batch_id=batch_id,
+                params={
+                    'input_body_s3': f's3://{bucket_name}/{param_s3_key}',
+                    'input_body_presign_url': None,
+                    'sagemaker_inference_endpoint_id': ep.EndpointDeploymentJobId,
+                    'sagemaker_inference_instance_type': ep.instance_type,
+                    'sagemaker_inference_endpoint_name': ep.endpoint_name,
+                    'use_result_cache': bool(event.use_result_cache),
+                    'used_models': used_models,
+                },
+            ))
+
+        check_job_items([job.__dict__ for job in jobs])
+
+        for param_s3_key, payload_string in s3_payloads.items():
+            s3_client.put_object(Bucket=bucket_name, Key=param_s3_key, Body=payload_string)
+
+        result = ddb_service.batch_put_items({inference_table_name: [job.__dict__ for job in jobs]})
+        if not result.succeed:
+            message = f'failed to create {len(result.failures)} of {len(jobs)} jobs of batch {batch_id}'
+            failed_ids = {failure.item['InferenceJobId'] for failure in result.failures}
+            discard_batch_jobs(ddb_service, inference_table_name,
+                               [job.InferenceJobId for job in jobs if job.InferenceJobId not in failed_ids], message)
+            raise Exception(message)
+
+        # one datapoint per endpoint, counting the jobs assigned to it
+        jobs_per_endpoint = Counter(ep.endpoint_name for ep in endpoints)
+        for endpoint_name, count in jobs_per_endpoint.items():
+            record_count_metrics(ep_name=endpoint_name,
+                                 metric_name='InferenceTotal',
+                                 workflow=workflow,
+                                 count=count,
+                                 )
+
+        # the jobs start in the background, a few dispatch invocations for the whole batch
+        job_ids = [job.InferenceJobId for job in jobs]
+        for i in range(0, len(job_ids), INFERENCE_BATCH_DISPATCH_SIZE):
+            payload = InferenceBatchDispatchEvent(
+                batch_id=batch_id,
+                username=username,
+                job_ids=job_ids[i:i + INFERENCE_BATCH_DISPATCH_SIZE],
+            )
+            resp = lambda_client.invoke(
+                FunctionName=dispatch_lambda_name,
+                InvocationType='Event',
+                Payload=json.dumps(payload.__dict__)
+            )
+            logger.info(resp)
+
+        return accepted(data={
+            'batch_id': batch_id,
+            'status': 'created',
+            'total': len(jobs),
+            'models': [{'id': ckpt.id, 'name': ckpt.checkpoint_names, 'type': ckpt.checkpoint_type}
+                       for ckpt in ckpts],
+            'inferences': [{'id': job.InferenceJobId,
+                            'endpoint_name': job.params['sagemaker_inference_endpoint_name']}
+                           for job in jobs],
+        })
+    except Exception as e:
+        return response_error(e)
+
+
+@tracer.capture_method
+def _schedule_batch_endpoints(event: CreateInferenceBatchEvent, username: str, model_names: List[str], count: int):
+    if event.sagemaker_endpoint_name:
+        endpoint = endpoint_directory.get_by_name(event.sagemaker_endpoint_name)
+        if endpoint is None:
+            raise Exception(f'sagemaker endpoint with name {event.sagemaker_endpoint_name} is not found')
+
+        if endpoint.endpoint_status != 'InService':
+            raise Exception(f'sagemaker endpoint is not ready with status: {endpoint.endpoint_status}')
+        return [endpoint] * count
+
+    available_endpoints = get_available_endpoints(event.inference_type, username)
+    log_json('available_endpoints', available_endpoints)
+
+    endpoints = assign_endpoints(scheduler, available_endpoints, count, model_names)
+    if model_names:
+        for endpoint in {ep.EndpointDeploymentJobId: ep for ep in endpoints}.values():
+            record_recent_models(endpoint, model_names)
+
+    return endpoints
@@ -2,26 +2,28 @@ import dataclasses
 import json
 import logging
 import os
-import random
 from datetime import datetime
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Tuple
 
 from aws_lambda_powertools import Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 from common.const import PERMISSION_INFERENCE_ALL, PERMISSION_INFERENCE_CREATE
 from common.ddb_service.client import DynamoDbUtilsService
+from common.excepts import BadRequestException
+from common.metrics import flush_metrics
 from common.response import bad_request, created
 from common.util import generate_presign_url, record_count_metrics, get_workflow_name
+from libs.checkpoint_index import get_checkpoint_by_name
 from libs.data_types import CheckPoint, CheckPointStatus
 from libs.data_types import InferenceJob, Endpoint
-from libs.enums import EndpointStatus
+from libs.endpoint_directory import EndpointDirectory, SERVING_STATUSES
+from libs.endpoint_scheduler import EndpointScheduler, merge_recent_models
 from libs.utils import get_user_roles, check_user_permissions, permissions_check, response_error, log_json
 from start_inference_job import inference_start
 
 tracer = Tracer()
 bucket_name = os.environ.get('S3_BUCKET_NAME')
-checkpoint_table = os.environ.get('CHECKPOINT_TABLE')
 sagemaker_endpoint_table = os.environ.get('ENDPOINT_TABLE_NAME')
 inference_table_name = os.environ.get('INFERENCE_JOB_TABLE')
 user_table = os.environ.get('MULTI_USER_TABLE')
@@ -30,6 +32,8 @@ logger = logging.getLogger(__name__)
 logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 ddb_service = DynamoDbUtilsService(logger=logger)
+endpoint_directory = EndpointDirectory(sagemaker_endpoint_table, ddb_service)
+scheduler = EndpointScheduler()
 
 
 @dataclasses.dataclass
@@ -43,10 +47,13 @@ class CreateInferenceEvent:
     user_id: Optional[str] = ""
     payload_string: Optional[str] = None
     workflow: Optional[str] = None
+    # reuse the result of an identical job with a fixed seed instead of running it again
+    use_result_cache: Optional[bool] = False
 
 
 # POST /inferences
 @tracer.capture_lambda_handler
+@flush_metrics
 def handler(raw_event: dict, context: LambdaContext):
     try:
         logger.info(json.dumps(raw_event, default=str))
@@ -74,7 +81,8 @@ def handler(raw_event: dict, context: LambdaContext):
         # check if endpoint table for endpoint status and existence
         ep = _schedule_inference_endpoint(event.sagemaker_endpoint_name,
                                           event.inference_type,
-                                          username)
+                                          username,
+                                          (event.models or {}).get('Stable-diffusion', []))
 
         if event.workflow:
             event.workflow = get_workflow_name(event.workflow, ep.instance_type)
@@ -100,6 +108,7 @@ def handler(raw_event: dict, context: LambdaContext):
                 'sagemaker_inference_endpoint_id': ep.EndpointDeploymentJobId,
                 'sagemaker_inference_instance_type': ep.instance_type,
                 'sagemaker_inference_endpoint_name': ep.endpoint_name,
+                'use_result_cache': bool(event.use_result_cache),
             },
         )
         resp = {
@@ -113,40 +122,9 @@ def handler(raw_event: dict, context: LambdaContext):
 
         if _type in simple_generate_types:
             # check if model(checkpoint) path(s) exists. return error if not
-            ckpts = []
-            ckpts_to_upload = []
-            for ckpt_type, names in event.models.items():
-                for name in names:
-                    ckpt = _get_checkpoint_by_name(name, ckpt_type)
-                    # todo: need check if user has permission for the model
-                    if ckpt is None:
-                        ckpts_to_upload.append({
-                            'name': name,
-                            'ckpt_type': ckpt_type
-                        })
-                    else:
-                        ckpts.append(ckpt)
-
-            if len(ckpts_to_upload) > 0:
-                message = [f'checkpoint with name {c["name"]}, type {c["ckpt_type"]} is not found' for c in
-                           ckpts_to_upload]
-                return bad_request(message=' '.join(message))
+            ckpts, used_models = get_used_models(event.models)
 
             # create an inference job with param location in ddb, status set to Created
-            used_models = {}
-            for ckpt in ckpts:
-                if ckpt.checkpoint_type not in used_models:
-                    used_models[ckpt.checkpoint_type] = []
-
-                used_models[ckpt.checkpoint_type].append(
-                    {
-                        'id': ckpt.id,
-                        'model_name': ckpt.checkpoint_names[0],
-                        's3': ckpt.s3_location,
-                        'type': ckpt.checkpoint_type
-                    }
-                )
-
             inference_job.params['used_models'] = used_models
             resp['inference']['models'] = [{'id': ckpt.id, 'name': ckpt.checkpoint_names, 'type': ckpt.checkpoint_type}
                                            for ckpt in ckpts]
@@ -166,10 +144,8 @@ def handler(raw_event: dict, context: LambdaContext):
         return response_error(e)
 
 
-# fixme: this is a very expensive function
 @tracer.capture_method
 def _get_checkpoint_by_name(ckpt_name, model_type, status='Active') -> CheckPoint:
-    tracer.put_annotation('ckpt_name', ckpt_name)
     if model_type == 'VAE' and ckpt_name in ['None', 'Automatic']:
         return CheckPoint(
             id=model_type,
@@ -180,22 +156,45 @@ def _get_checkpoint_by_name(ckpt_name, model_type, status='Active') -> CheckPoin
             timestamp=0,
         )
 
-    checkpoint_raw = ddb_service.client.scan(
-        TableName=checkpoint_table,
-        FilterExpression='contains(checkpoint_names, :checkpointName) and checkpoint_type=:model_type and checkpoint_status=:checkpoint_status',
-        ExpressionAttributeValues={
-            ':checkpointName': {'S': ckpt_name},
-            ':model_type': {'S': model_type},
-            ':checkpoint_status': {'S': status}
-        }
-    )
+    return get_checkpoint_by_name(ckpt_name, model_type, CheckPointStatus[status])
 
-    from common.ddb_service.types_ import ScanOutput
-    named_ = ScanOutput(**checkpoint_raw)
-    if checkpoint_raw is None or len(named_['Items']) == 0:
-        return None
 
-    return CheckPoint(**ddb_service.deserialize(named_['Items'][0]))
+@tracer.capture_method
+def get_used_models(models: dict[str, List[str]]) -> Tuple[List[CheckPoint], dict]:
+    ckpts = []
+    ckpts_to_upload = []
+    for ckpt_type, names in models.items():
+        for name in names:
+            ckpt = _get_checkpoint_by_name(name, ckpt_type)
+            # todo: need check if user has permission for the model
+            if ckpt is None:
+                ckpts_to_upload.append({
+                    'name': name,
+                    'ckpt_type': ckpt_type
+                })
+            else:
+                ckpts.append(ckpt)
+
+    if len(ckpts_to_upload) > 0:
+        message = [f'checkpoint with name {c["name"]}, type {c["ckpt_type"]} is not found' for c in
+                   ckpts_to_upload]
+        raise BadRequestException(' '.join(message))
+
+    used_models = {}
+    for ckpt in ckpts:
+        if ckpt.checkpoint_type not in used_models:
+            used_models[ckpt.checkpoint_type] = []
+
+        used_models[ckpt.checkpoint_type].append(
+            {
+                'id': ckpt.id,
+                'model_name': ckpt.checkpoint_names[0],
+                's3': ckpt.s3_location,
+                'type': ckpt.checkpoint_type
+            }
+        )
+
+    return ckpts, used_models
 
 
 def get_base_inference_param_s3_key(_type: str, request_id: str) -> str:
@@ -204,41 +203,52 @@ def get_base_inference_param_s3_key(_type: str, request_id: str) -> str:
 
 # currently only two scheduling ways: by endpoint name and by user
 @tracer.capture_method
-def _schedule_inference_endpoint(endpoint_name, inference_type, user_id):
+def _schedule_inference_endpoint(endpoint_name, inference_type, user_id, model_names: List[str] = None):
     tracer.put_annotation('endpoint_name', endpoint_name)
-    # fixme: endpoint is not indexed by name, and this is very expensive query
-    # fixme: we can either add index for endpoint name or make endpoint as the partition key
     if endpoint_name:
-        sagemaker_endpoint_raw = ddb_service.scan(sagemaker_endpoint_table, filters={
-            'endpoint_name': endpoint_name
-        })[0]
-        sagemaker_endpoint_raw = ddb_service.deserialize(sagemaker_endpoint_raw)
-        if sagemaker_endpoint_raw is None or len(sagemaker_endpoint_raw) == 0:
+        endpoint = endpoint_directory.get_by_name(endpoint_name)
+        if endpoint is None:
             raise Exception(f'sagemaker endpoint with name {endpoint_name} is not found')
 
-        if sagemaker_endpoint_raw['endpoint_status'] != 'InService':
-            raise Exception(f'sagemaker endpoint is not ready with status: {sagemaker_endpoint_raw["endpoint_status"]}')
-        return Endpoint(**sagemaker_endpoint_raw)
+        if endpoint.endpoint_status != 'InService':
+            raise Exception(f'sagemaker endpoint is not ready with status: {endpoint.endpoint_status}')
+        return endpoint
     elif user_id:
-        sagemaker_endpoint_raws = ddb_service.scan(sagemaker_endpoint_table, filters=None)
-        user_roles = get_user_roles(ddb_service, user_table, user_id)
-        available_endpoints = []
-        for row in sagemaker_endpoint_raws:
-            endpoint = Endpoint(**ddb_service.deserialize(row))
-            if endpoint.service_type != '' and endpoint.service_type != 'sd':
-                continue
-            if endpoint.status == 'deleted':
-                continue
-            if endpoint.endpoint_status != EndpointStatus.UPDATING.value and endpoint.endpoint_status != EndpointStatus.IN_SERVICE.value:
-                continue
-            if endpoint.endpoint_type != inference_type:
-                continue
-            if check_user_permissions(endpoint.owner_group_or_role, user_roles, user_id):
-                available_endpoints.append(endpoint)
-
-        if len(available_endpoints) == 0:
-            raise Exception(f'no available {inference_type} endpoints for user "{user_id}"')
+        available_endpoints = get_available_endpoints(inference_type, user_id)
 
         log_json('available_endpoints', available_endpoints)
 
-        return random.choice(available_endpoints)
+        endpoint = scheduler.select(available_endpoints, model_names)
+        if model_names:
+            record_recent_models(endpoint, model_names)
+
+        return endpoint
+
+
+def get_available_endpoints(inference_type: str, user_id: str) -> List[Endpoint]:
+    serving_endpoints = endpoint_directory.list_active(SERVING_STATUSES)
+    user_roles = get_user_roles(ddb_service, user_table, user_id)
+    available_endpoints = []
+    for endpoint in serving_endpoints:
+        if endpoint.service_type != '' and endpoint.service_type != 'sd':
+            continue
+        if endpoint.endpoint_type != inference_type:
+            continue
+        if check_user_permissions(endpoint.owner_group_or_role, user_roles, user_id):
+            available_endpoints.append(endpoint)
+
+    if len(available_endpoints) == 0:
+        raise Exception(f'no available {inference_type} endpoints for user "{user_id}"')
+
+    return available_endpoints
+
+
+def record_recent_models(endpoint: Endpoint, model_names: List[str]):
+    recent_models = merge_recent_models(endpoint.recent_models, model_names)
+    if recent_models == endpoint.recent_models:
+        return
+
+    ddb_service.update_item(table=sagemaker_endpoint_table,
+                            key={'EndpointDeploymentJobId': endpoint.EndpointDeploymentJobId},
+                            field_name='recent_models',
+                            value=recent_models)
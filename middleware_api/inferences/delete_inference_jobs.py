@@ -2,11 +2,14 @@ import json
 import logging
 import os
 from dataclasses import dataclass
+from datetime import datetime
 
 import boto3
 from aws_lambda_powertools import Tracer
 
+from common.ddb_service.client import DynamoDbUtilsService
 from common.response import no_content
+from libs.inference_cache import DynamoDbResultCacheStore, InferenceResultCache, update_waiter
 from libs.utils import response_error
 
 tracer = Tracer()
@@ -14,7 +17,11 @@ logger = logging.getLogger(__name__)
 logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 dynamodb = boto3.resource('dynamodb')
-inference_job_table = dynamodb.Table(os.environ.get('INFERENCE_JOB_TABLE'))
+inference_job_table_name = os.environ.get('INFERENCE_JOB_TABLE')
+inference_job_table = dynamodb.Table(inference_job_table_name)
+result_cache_table = dynamodb.Table(os.environ.get('INFERENCE_RESULT_CACHE_TABLE') or 'InferenceResultCacheTable')
+result_cache = InferenceResultCache(DynamoDbResultCacheStore(result_cache_table))
+ddb_service = DynamoDbUtilsService(logger=logger)
 
 s3_bucket_name = os.environ.get('S3_BUCKET_NAME')
 s3_client = boto3.client('s3')
@@ -37,6 +44,7 @@ def handler(event, ctx):
 
         # unique list for preventing duplicate delete
         inference_id_list = list(set(body.inference_id_list))
+        delete_keys = []
 
         for inference_id in inference_id_list:
 
@@ -53,6 +61,8 @@ def handler(event, ctx):
 
             params = inference['Item']['params']
 
+            withdraw_result(inference_id, params)
+
             if 'input_body_s3' in params:
                 s3_client.delete_object(
                     Bucket=s3_bucket_name,
@@ -66,8 +76,31 @@ def handler(event, ctx):
                 )
 
             # todo will rename primary key
-            inference_job_table.delete_item(Key={'InferenceJobId': inference_id})
+            delete_keys.append({'InferenceJobId': inference_id})
+
+        result = ddb_service.batch_delete_items({inference_job_table_name: delete_keys})
+        if result and not result.succeed:
+            failed_ids = [f.item['InferenceJobId'] for f in result.failures]
+            raise Exception(f'failed to delete inferences: {failed_ids}')
 
         return no_content(message='inferences deleted')
     except Exception as e:
         return response_error(e)
+
+
+def withdraw_result(inference_id: str, params: dict):
+    """
+    Result images are shared: jobs that reused them read them from the job that produced them,
+    and keep them when that job is deleted. Deleting it withdraws its result from the cache,
+    so no new job reuses it, and fails the jobs still waiting for it.
+    """
+    key = params.get('result_cache_key')
+    if not key:
+        return
+
+    for waiter in result_cache.release(key, inference_id):
+        update_waiter(inference_job_table, waiter, {
+            'status': 'failed',
+            'sagemakerRaw': f'identical inference {inference_id} was deleted',
+            'completeTime': datetime.now().isoformat(),
+        })
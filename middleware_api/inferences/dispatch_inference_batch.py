@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+
+from aws_lambda_powertools import Tracer
+
+from common.ddb_service.client import DynamoDbUtilsService
+from common.metrics import flush_metrics
+from create_inference_batch import InferenceBatchDispatchEvent
+from inference_libs import update_inference_job_fields
+from libs.data_types import InferenceJob
+from libs.inference_batch import dispatch_batch_jobs
+from start_inference_job import inference_start
+
+tracer = Tracer()
+inference_table_name = os.environ.get('INFERENCE_JOB_TABLE')
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+ddb_service = DynamoDbUtilsService(logger=logger)
+
+
+# invoked by create_inference_batch with a part of the jobs of a batch
+@tracer.capture_lambda_handler
+@flush_metrics
+def handler(event, context):
+    logger.info(json.dumps(event))
+    dispatch = InferenceBatchDispatchEvent(**event)
+
+    def start(inference_id: str):
+        inference_raw = ddb_service.get_item(inference_table_name, {'InferenceJobId': inference_id})
+        if not inference_raw:
+            raise Exception(f'inference {inference_id} of batch {dispatch.batch_id} not found')
+
+        job = InferenceJob(**inference_raw)
+        # a retried dispatch does not start a job twice
+        if job.status != 'created':
+            return
+
+        inference_start(job, dispatch.username)
+
+    failures = dispatch_batch_jobs(dispatch.job_ids, start)
+
+    # the batch finishes even if some of its jobs never reached an endpoint
+    for inference_id, error in failures.items():
+        update_inference_job_fields(inference_id, {
+            'status': 'failed',
+            'sagemakerRaw': error,
+        })
+
+    logger.info(f'batch {dispatch.batch_id}: started {len(dispatch.job_ids) - len(failures)} '
+                f'of {len(dispatch.job_ids)} jobs')
@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+
+from aws_lambda_powertools import Tracer
+
+from common.const import PERMISSION_INFERENCE_ALL
+from common.ddb_service.client import DynamoDbUtilsService
+from common.excepts import NotFoundException
+from common.response import ok
+from libs.inference_batch import query_batch_jobs, summarize_batch
+from libs.utils import permissions_check, response_error
+
+tracer = Tracer()
+inference_table_name = os.environ.get('INFERENCE_JOB_TABLE')
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+ddb_service = DynamoDbUtilsService(logger=logger)
+
+
+# GET /inferences/batches/{id}
+@tracer.capture_lambda_handler
+def handler(event, ctx):
+    try:
+        logger.info(json.dumps(event))
+
+        batch_id = event['pathParameters']['id']
+
+        permissions_check(event, [PERMISSION_INFERENCE_ALL])
+
+        jobs = query_batch_jobs(ddb_service, inference_table_name, batch_id)
+        if not jobs:
+            raise NotFoundException(f'inference batch with id {batch_id} not found')
+
+        data = {
+            'batch_id': batch_id,
+            **summarize_batch(jobs),
+            'inferences': jobs,
+        }
+
+        return ok(data=data, decimal=True)
+    except Exception as e:
+        return response_error(e)
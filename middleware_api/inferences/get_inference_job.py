@@ -5,7 +5,11 @@ import os
 import boto3
 from aws_lambda_powertools import Tracer
 
-from common.response import ok, not_found
+from common.excepts import BadRequestException
+from common.response import ok, not_found, bad_request
+from common.util import get_query_param
+from libs.inference_cache import settle_waiter
+from libs.inference_notifications import JobStatusPoller, parse_wait_seconds
 from libs.utils import response_error, log_json
 
 tracer = Tracer()
@@ -15,6 +19,7 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 dynamodb = boto3.resource('dynamodb')
 inference_job_table = dynamodb.Table(os.environ.get('INFERENCE_JOB_TABLE'))
+job_status_poller = JobStatusPoller(inference_job_table)
 
 s3_bucket_name = os.environ.get('S3_BUCKET_NAME')
 s3 = boto3.client('s3')
@@ -27,6 +32,16 @@ def handler(event, ctx):
 
         inference_id = event['pathParameters']['id']
 
+        # GET /inferences/{id}?wait=seconds polls the job on the server side and returns as soon as
+        # it succeeds or fails, or with the current status after at most MAX_WAIT_SECONDS
+        try:
+            wait = parse_wait_seconds(get_query_param(event, 'wait'))
+        except BadRequestException as e:
+            return bad_request(message=str(e))
+
+        if wait > 0:
+            job_status_poller.wait(inference_id, wait)
+
         return get_infer_data(inference_id)
     except Exception as e:
         return response_error(e)
@@ -39,21 +54,25 @@ def get_infer_data(inference_id: str):
     if 'Item' not in inference:
         return not_found(message=f'inference with id {inference_id} not found')
 
-    item = inference['Item']
+    # a job waiting for an identical one is settled here when that one's notification was lost
+    item = settle_waiter(inference_job_table, inference['Item'])
 
     log_json("inference job", item)
 
+    # a job served from the result cache reads the outputs of the job that produced them
+    result_id = item.get('result_inference_id') or inference_id
+
     img_presigned_urls = []
     if 'image_names' in item:
         for image_name in item['image_names']:
-            presigned_url = generate_presigned_url(s3_bucket_name, f"out/{inference_id}/result/{image_name}")
+            presigned_url = generate_presigned_url(s3_bucket_name, f"out/{result_id}/result/{image_name}")
             img_presigned_urls.append(presigned_url)
     else:
         item['image_names'] = []
 
     output_presigned_urls = generate_presigned_url(
         s3_bucket_name,
-        f"out/{inference_id}/result/{inference_id}_param.json")
+        f"out/{result_id}/result/{result_id}_param.json")
 
     data = {
         "img_presigned_urls": img_presigned_urls,
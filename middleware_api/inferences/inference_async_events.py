@@ -1,14 +1,16 @@
 import json
 import logging
 import os
+from datetime import datetime
 
 import boto3
 from aws_lambda_powertools import Tracer
 
+from common.metrics import flush_metrics
 from common.sns_util import send_message_to_sns
 from common.util import record_latency_metrics, record_count_metrics
-from inference_libs import parse_sagemaker_result, get_bucket_and_key, get_inference_job
-from start_inference_job import update_inference_job_table
+from inference_libs import parse_sagemaker_result, get_bucket_and_key, get_inference_job, \
+    release_outstanding_job, update_inference_job_fields, settle_result_cache
 
 tracer = Tracer()
 s3_resource = boto3.resource('s3')
@@ -20,6 +22,7 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 
 @tracer.capture_lambda_handler
+@flush_metrics
 def handler(event, context):
     logger.info(json.dumps(event))
 
@@ -39,13 +42,20 @@ def handler(event, context):
     task_type = job.get('taskType', 'txt2img')
     workflow = job.get('workflow', None)
     create_time = job.get('createTime')
+    params = job.get('params', {})
 
     endpoint_name = message["requestParameters"]["endpointName"]
 
+    release_outstanding_job(inference_id)
+
     if invocation_status != "Completed":
-        update_inference_job_table(inference_id, 'status', 'failed')
-        update_inference_job_table(inference_id, 'sagemakerRaw', str(message))
+        update_inference_job_fields(inference_id, {
+            'status': 'failed',
+            'sagemakerRaw': str(message),
+            'completeTime': datetime.now().isoformat(),
+        })
         print(f"Not complete invocation!")
+        settle_result_cache(params, inference_id, 'failed')
         send_message_to_sns(message, SNS_TOPIC)
         record_count_metrics(ep_name=endpoint_name,
                              metric_name='InferenceFailed',
@@ -62,7 +72,11 @@ def handler(event, context):
 
     sagemaker_out = json.loads(body)
     if sagemaker_out is None:
-        update_inference_job_table(inference_id, 'status', 'failed')
+        update_inference_job_fields(inference_id, {
+            'status': 'failed',
+            'completeTime': datetime.now().isoformat(),
+        })
+        settle_result_cache(params, inference_id, 'failed')
         message_json = {
             'InferenceJobId': inference_id,
             'status': "failed",
@@ -71,7 +85,12 @@ def handler(event, context):
         send_message_to_sns(message_json, SNS_TOPIC)
         raise ValueError("body contains invalid JSON")
 
-    parse_sagemaker_result(sagemaker_out, create_time, inference_id, task_type, endpoint_name)
+    try:
+        fields = parse_sagemaker_result(sagemaker_out, create_time, inference_id, task_type, endpoint_name)
+    except Exception as e:
+        settle_result_cache(params, inference_id, 'failed')
+        raise e
+    settle_result_cache(params, inference_id, 'succeed', fields.get('image_names'))
 
     record_count_metrics(ep_name=endpoint_name,
                          metric_name='InferenceSucceed',
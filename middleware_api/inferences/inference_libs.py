@@ -1,16 +1,24 @@
 import base64
+import concurrent.futures
 import io
 import json
 import logging
 import os
+import time
 from datetime import datetime
+from typing import List, Tuple
 
 import boto3
 from PIL import Image
 from aws_lambda_powertools import Tracer
+from botocore.exceptions import ClientError
 
+from common.ddb_service.client import DynamoDbUtilsService
 from common.util import upload_file_to_s3, record_queue_latency_metrics
+from libs.endpoint_scheduler import OUTSTANDING_JOBS_TTL_SECONDS
 from libs.enums import ServiceType
+from libs.inference_cache import DynamoDbResultCacheStore, InferenceResultCache, update_waiter
+from libs.inference_notifications import JobStatusPoller
 from libs.utils import log_json
 
 tracer = Tracer()
@@ -22,14 +30,29 @@ s3_client = boto3.client('s3')
 
 ddb_client = boto3.resource('dynamodb')
 inference_table = ddb_client.Table('SDInferenceJobTable')
+endpoint_table = ddb_client.Table(os.environ.get('ENDPOINT_TABLE_NAME'))
+result_cache_table = ddb_client.Table(os.environ.get('INFERENCE_RESULT_CACHE_TABLE') or 'InferenceResultCacheTable')
 
 S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
+# empty keeps images as encoded by the endpoint, e.g. png converts every result to png
+RESULT_IMAGE_CONVERT_FORMAT = (os.environ.get('RESULT_IMAGE_CONVERT_FORMAT') or '').lower()
+RESULT_UPLOAD_WORKERS = 8
+
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+ddb_service = DynamoDbUtilsService(logger=logger)
+job_status_poller = JobStatusPoller(inference_table)
+result_cache = InferenceResultCache(DynamoDbResultCacheStore(result_cache_table))
 
 
 @tracer.capture_method
 def parse_sagemaker_result(sagemaker_out, create_time, inference_id, task_type, endpoint_name):
-    update_inference_job_table(inference_id, 'completeTime', datetime.now().isoformat())
-
+    fields = {}
     try:
         # maybe start_time is not in the response
         record_queue_latency_metrics(create_time=create_time,
@@ -37,16 +60,67 @@ def parse_sagemaker_result(sagemaker_out, create_time, inference_id, task_type,
                                      ep_name=endpoint_name,
                                      service=ServiceType.SD.value)
         if task_type in ["interrogate_clip", "interrogate_deepbooru"]:
-            interrogate_clip_interrogate_deepbooru(sagemaker_out, inference_id)
+            fields['caption'] = sagemaker_out['caption']
         elif task_type in ["txt2img", "img2img"]:
-            txt2_img_img(sagemaker_out, inference_id, endpoint_name)
+            fields['image_names'] = txt2_img_img(sagemaker_out, inference_id, endpoint_name)
         elif task_type in ["extra-single-image", "rembg"]:
-            esi_rembg(sagemaker_out, inference_id, endpoint_name)
+            fields['image_names'] = esi_rembg(sagemaker_out, inference_id, endpoint_name)
 
-        update_inference_job_table(inference_id, 'status', 'succeed')
+        fields['status'] = 'succeed'
     except Exception as e:
-        update_inference_job_table(inference_id, 'status', 'failed')
+        fields['status'] = 'failed'
         raise e
+    finally:
+        fields['completeTime'] = datetime.now().isoformat()
+        update_inference_job_fields(inference_id, fields)
+
+    return fields
+
+
+def load_inference_payload(params: dict, payload_string: str = None):
+    if payload_string:
+        return json.loads(payload_string)
+
+    bucket, key = get_bucket_and_key(params['input_body_s3'])
+    try:
+        return json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except (ClientError, ValueError) as e:
+        logger.info(f"no payload for the result cache: {e}")
+        return None
+
+
+def complete_from_cache(inference_id: str, source: dict):
+    """Completes a job with the result of an identical job, its images stay where that job stored them."""
+    update_inference_job_fields(inference_id, {
+        'status': 'succeed',
+        'image_names': source.get('image_names', []),
+        'result_inference_id': source['inference_id'],
+        'completeTime': datetime.now().isoformat(),
+    })
+
+
+def settle_result_cache(params: dict, inference_id: str, status: str, image_names: List[str] = None):
+    """Records the result of a job that ran for a cache key, and finishes the identical jobs waiting for it."""
+    key = (params or {}).get('result_cache_key')
+    if not key:
+        return
+
+    # waiters deleted or already settled when they were read are left as they are
+    if status == 'succeed':
+        for waiter in result_cache.complete(key, inference_id, image_names or []):
+            update_waiter(inference_table, waiter, {
+                'status': 'succeed',
+                'image_names': image_names or [],
+                'completeTime': datetime.now().isoformat(),
+            })
+        return
+
+    for waiter in result_cache.release(key, inference_id):
+        update_waiter(inference_table, waiter, {
+            'status': 'failed',
+            'sagemakerRaw': f'identical inference {inference_id} failed',
+            'completeTime': datetime.now().isoformat(),
+        })
 
 
 def decode_base64_to_image(encoding):
@@ -55,17 +129,56 @@ def decode_base64_to_image(encoding):
     return Image.open(io.BytesIO(base64.b64decode(encoding)))
 
 
-def update_ddb_image(inference_id: str, image_name: str):
-    inference_table.update_item(
-        Key={
-            'InferenceJobId': inference_id
-        },
-        UpdateExpression='SET image_names = list_append(if_not_exists(image_names, :empty_list), :new_image)',
-        ExpressionAttributeValues={
-            ':new_image': [image_name],
-            ':empty_list': []
-        }
-    )
+def decode_base64_to_bytes(encoding) -> bytes:
+    if encoding.startswith("data:image/"):
+        encoding = encoding.split(";")[1].split(",")[1]
+    return base64.b64decode(encoding)
+
+
+def image_format(data: bytes):
+    for signature, img_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return img_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def encode_result_image(data: bytes):
+    """
+    Returns the bytes to store and their file extension. The endpoint already encodes
+    images, so they are stored as they are unless RESULT_IMAGE_CONVERT_FORMAT asks
+    for a different format.
+    """
+    img_type = image_format(data) or 'png'
+
+    if RESULT_IMAGE_CONVERT_FORMAT and RESULT_IMAGE_CONVERT_FORMAT != img_type:
+        output = io.BytesIO()
+        Image.open(io.BytesIO(data)).save(output, format=RESULT_IMAGE_CONVERT_FORMAT.upper())
+        return output.getvalue(), RESULT_IMAGE_CONVERT_FORMAT
+
+    return data, img_type
+
+
+@tracer.capture_method
+def upload_result_images(inference_id: str, images: List[Tuple[str, bytes]]):
+    """Uploads (image_name, data) pairs of one job in parallel."""
+
+    def upload(image):
+        image_name, data = image
+        s3_client.put_object(
+            Body=data,
+            Bucket=S3_BUCKET_NAME,
+            Key=f"out/{inference_id}/result/{image_name}"
+        )
+
+    if len(images) <= 1:
+        list(map(upload, images))
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(images), RESULT_UPLOAD_WORKERS)) as executor:
+        # list() re-raises the first upload error
+        list(executor.map(upload, images))
 
 
 def get_bucket_and_key(s3uri):
@@ -93,6 +206,97 @@ def update_inference_job_table(inference_id, key, value):
         raise e
 
 
+def update_endpoint_outstanding_jobs(endpoint_id: str, delta: int):
+    if not endpoint_id:
+        return
+
+    logger.info(f"Update endpoint {endpoint_id} outstanding jobs by {delta}")
+    now = int(time.time())
+    key = {"EndpointDeploymentJobId": endpoint_id}
+    try:
+        if delta < 0:
+            # never goes below zero when a completion arrives for a job counted before a reset
+            endpoint_table.update_item(
+                Key=key,
+                UpdateExpression="ADD outstanding_jobs :d SET outstanding_jobs_updated = :now",
+                ConditionExpression="outstanding_jobs >= :abs",
+                ExpressionAttributeValues={':d': delta, ':abs': -delta, ':now': now},
+            )
+            return
+
+        try:
+            endpoint_table.update_item(
+                Key=key,
+                UpdateExpression="ADD outstanding_jobs :d SET outstanding_jobs_updated = :now",
+                ConditionExpression="outstanding_jobs_updated >= :stale_before",
+                ExpressionAttributeValues={':d': delta, ':now': now,
+                                           ':stale_before': now - OUTSTANDING_JOBS_TTL_SECONDS},
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            # a stale counter holds jobs whose completion was lost, it starts over from this job
+            endpoint_table.update_item(
+                Key=key,
+                UpdateExpression="SET outstanding_jobs = :d, outstanding_jobs_updated = :now",
+                ConditionExpression="attribute_exists(EndpointDeploymentJobId)",
+                ExpressionAttributeValues={':d': delta, ':now': now},
+            )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise e
+        logger.info(f"Skip outstanding jobs update for endpoint {endpoint_id}")
+
+
+def count_outstanding_job(inference_id: str, endpoint_id: str):
+    """Counts an async job on its endpoint, the mark on the job lets only one completion release it."""
+    if not endpoint_id:
+        return
+
+    try:
+        inference_table.update_item(
+            Key={"InferenceJobId": inference_id},
+            UpdateExpression="SET outstanding_endpoint_id = :e",
+            ConditionExpression="attribute_exists(InferenceJobId) AND attribute_not_exists(outstanding_endpoint_id)",
+            ExpressionAttributeValues={':e': endpoint_id},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise e
+        logger.info(f"inference {inference_id} is already counted")
+        return
+
+    update_endpoint_outstanding_jobs(endpoint_id, 1)
+
+
+def release_outstanding_job(inference_id: str):
+    """Releases the count of a finished async job, redelivered notifications find no mark and release nothing."""
+    try:
+        resp = inference_table.update_item(
+            Key={"InferenceJobId": inference_id},
+            UpdateExpression="REMOVE outstanding_endpoint_id",
+            ConditionExpression="attribute_exists(outstanding_endpoint_id)",
+            ReturnValues="UPDATED_OLD",
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise e
+        logger.info(f"inference {inference_id} is not counted on an endpoint")
+        return
+
+    update_endpoint_outstanding_jobs(resp['Attributes']['outstanding_endpoint_id'], -1)
+
+
+def update_inference_job_fields(inference_id, fields: dict):
+    logger.info(f"Update job with inference id: {inference_id}, fields: {fields}")
+    try:
+        ddb_service.update_item_fields(table=inference_table.name, key={"InferenceJobId": inference_id},
+                                       fields=fields)
+    except Exception as e:
+        logger.error(f"Update Inference job table error: {e}")
+        raise e
+
+
 def update_table_by_pk(table_name: str, pk: str, id: str, key: str, value):
     logger.info(f"Update {table_name} with {pk}: {id}, key: {key}, value: {value}")
     try:
@@ -116,80 +320,58 @@ def esi_rembg(sagemaker_out, inference_id, endpoint_name):
     if 'image' not in sagemaker_out:
         raise Exception(sagemaker_out)
 
-    image = Image.open(io.BytesIO(base64.b64decode(sagemaker_out["image"])))
-    output = io.BytesIO()
-    image.save(output, format="PNG")
-    # Upload the image to the S3 bucket
-    s3_client.put_object(
-        Body=output.getvalue(),
-        Bucket=S3_BUCKET_NAME,
-        Key=f"out/{inference_id}/result/image.png"
-    )
-
-    update_ddb_image(inference_id, "image.png")
+    data, img_type = encode_result_image(decode_base64_to_bytes(sagemaker_out["image"]))
+    image_names = [f"image.{img_type}"]
+    upload_result_images(inference_id, [(image_names[0], data)])
 
     save_inference_parameters(sagemaker_out, inference_id, endpoint_name)
 
-
-def interrogate_clip_interrogate_deepbooru(sagemaker_out, inference_id):
-    caption = sagemaker_out['caption']
-    # Update the DynamoDB table for the caption
-    inference_table.update_item(
-        Key={
-            'InferenceJobId': inference_id
-        },
-        UpdateExpression='SET caption=:f',
-        ExpressionAttributeValues={
-            ':f': caption,
-        }
-    )
+    return image_names
 
 
 def txt2_img_img(sagemaker_out, inference_id, endpoint_name):
+    output_img_type = None
+    if 'output_img_type' in sagemaker_out and sagemaker_out['output_img_type']:
+        output_img_type = sagemaker_out['output_img_type']
+        logger.info(f"handle_sagemaker_out: output_img_type is not null, {output_img_type}")
+
+    images = []
     for count, b64image in enumerate(sagemaker_out["images"]):
-        output_img_type = None
-        if 'output_img_type' in sagemaker_out and sagemaker_out['output_img_type']:
-            output_img_type = sagemaker_out['output_img_type']
-            logger.info(f"handle_sagemaker_out: output_img_type is not null, {output_img_type}")
         if not output_img_type:
-            image = decode_base64_to_image(b64image)
-            output = io.BytesIO()
-            image.save(output, format="PNG")
-            s3_client.put_object(
-                Body=output.getvalue(),
-                Bucket=S3_BUCKET_NAME,
-                Key=f"out/{inference_id}/result/image_{count}.png"
-            )
+            data, img_type = encode_result_image(decode_base64_to_bytes(b64image))
         else:
-            gif_data = base64.b64decode(b64image.split(",", 1)[0])
-            if len(output_img_type) == 1 and (output_img_type[0] == 'PNG' or output_img_type[0] == 'TXT'):
-                logger.debug(f'output_img_type len is 1 :{output_img_type[0]} {count}')
-                img_type = 'png'
-            elif len(output_img_type) == 2 and ('PNG' in output_img_type and 'TXT' in output_img_type):
-                logger.debug(f'output_img_type len is 2 :{output_img_type[0]} {output_img_type[1]} {count}')
-                img_type = 'png'
-            else:
-                img_type = 'gif'
-                output_img_type = [element for element in output_img_type if
-                                   "TXT" not in element and "PNG" not in element]
-                logger.debug(f'output_img_type new is  :{output_img_type}  {count}')
-                # type set
-                image_count = len(sagemaker_out["images"])
-                type_count = len(output_img_type)
-                if image_count % type_count == 0:
-                    idx = count % type_count
-                    img_type = output_img_type[idx].lower()
-            logger.debug(f'img_type is :{img_type} count is:{count}')
-            s3_client.put_object(
-                Body=gif_data,
-                Bucket=S3_BUCKET_NAME,
-                Key=f"out/{inference_id}/result/image_{count}.{img_type}"
-            )
+            data = base64.b64decode(b64image.split(",", 1)[0])
+            img_type = animated_img_type(output_img_type, count, len(sagemaker_out["images"]))
+        logger.debug(f'img_type is :{img_type} count is:{count}')
+        images.append((f"image_{count}.{img_type}", data))
 
-        update_ddb_image(inference_id, f"image_{count}.png")
+    upload_result_images(inference_id, images)
 
     save_inference_parameters(sagemaker_out, inference_id, endpoint_name)
 
+    return [image_name for image_name, _ in images]
+
+
+def animated_img_type(output_img_type, count, image_count):
+    if len(output_img_type) == 1 and (output_img_type[0] == 'PNG' or output_img_type[0] == 'TXT'):
+        logger.debug(f'output_img_type len is 1 :{output_img_type[0]} {count}')
+        return 'png'
+
+    if len(output_img_type) == 2 and ('PNG' in output_img_type and 'TXT' in output_img_type):
+        logger.debug(f'output_img_type len is 2 :{output_img_type[0]} {output_img_type[1]} {count}')
+        return 'png'
+
+    img_type = 'gif'
+    output_img_type = [element for element in output_img_type if "TXT" not in element and "PNG" not in element]
+    logger.debug(f'output_img_type new is  :{output_img_type}  {count}')
+    # type set
+    type_count = len(output_img_type)
+    if type_count and image_count % type_count == 0:
+        idx = count % type_count
+        img_type = output_img_type[idx].lower()
+
+    return img_type
+
 
 @tracer.capture_method
 def save_inference_parameters(sagemaker_out, inference_id, endpoint_name):
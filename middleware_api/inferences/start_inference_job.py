@@ -12,12 +12,17 @@ from sagemaker.serializers import JSONSerializer
 from common.const import PERMISSION_INFERENCE_ALL
 from common.ddb_service.client import DynamoDbUtilsService
 from common.excepts import BadRequestException
+from common.metrics import flush_metrics
 from common.response import accepted
 from common.util import record_latency_metrics, record_count_metrics
 from get_inference_job import get_infer_data
-from inference_libs import parse_sagemaker_result, update_inference_job_table
+from inference_libs import parse_sagemaker_result, update_inference_job_table, update_endpoint_outstanding_jobs, \
+    update_inference_job_fields, load_inference_payload, complete_from_cache, settle_result_cache, result_cache, \
+    job_status_poller, count_outstanding_job
 from libs.data_types import InferenceJob, InvocationRequest
 from libs.enums import EndpointType
+from libs.inference_cache import ACTION_REUSE, ACTION_RUN, inference_cache_key
+from libs.inference_notifications import MAX_WAIT_SECONDS
 from libs.utils import response_error, permissions_check, log_json
 
 tracer = Tracer()
@@ -32,6 +37,7 @@ predictors = {}
 
 
 @tracer.capture_lambda_handler
+@flush_metrics
 def handler(event: dict, _):
     try:
         logger.info(json.dumps(event))
@@ -83,6 +89,10 @@ def inference_start(job: InferenceJob, username):
     log_json("inference job", job.__dict__)
     log_json("inference invoke payload", payload.__dict__)
 
+    cached = start_from_result_cache(job)
+    if cached:
+        return cached
+
     if job.inference_type == EndpointType.RealTime.value:
         update_inference_job_table(job.InferenceJobId, 'startTime', datetime.now().isoformat())
         return real_time_inference(payload, job, endpoint_name)
@@ -90,23 +100,81 @@ def inference_start(job: InferenceJob, username):
     return async_inference(payload, job, endpoint_name)
 
 
+@tracer.capture_method
+def start_from_result_cache(job: InferenceJob):
+    """
+    With params.use_result_cache, a job identical to a finished one completes with its result,
+    and a job identical to one in flight waits for it. Returns None when the job has to run.
+    """
+    if not job.params.get('use_result_cache'):
+        return None
+
+    key = inference_cache_key(job.taskType, job.workflow,
+                              load_inference_payload(job.params, job.payload_string),
+                              job.params.get('used_models'))
+    if not key:
+        return None
+
+    decision = result_cache.lookup(key, job.InferenceJobId)
+    if decision.action == ACTION_RUN:
+        # the job settles the entry when its result arrives, async jobs are saved with it before the invocation
+        job.params['result_cache_key'] = key
+        return None
+
+    if decision.action == ACTION_REUSE:
+        complete_from_cache(job.InferenceJobId, decision.entry)
+        status = 'succeed'
+    else:
+        update_inference_job_fields(job.InferenceJobId, {
+            'status': 'inprogress',
+            'startTime': datetime.now().isoformat(),
+            'result_inference_id': decision.entry['inference_id'],
+        })
+        status = 'inprogress'
+
+    if job.inference_type == EndpointType.RealTime.value:
+        if status == 'inprogress':
+            job_status_poller.wait(job.InferenceJobId, MAX_WAIT_SECONDS)
+        return get_infer_data(job.InferenceJobId)
+
+    return accepted(data={
+        'InferenceJobId': job.InferenceJobId,
+        'status': status,
+        'result_inference_id': decision.entry['inference_id'],
+    })
+
+
 @tracer.capture_method
 def real_time_inference(payload: InvocationRequest, job: InferenceJob, ep_name: str):
     tracer.put_annotation(key="InferenceJobId", value=job.InferenceJobId)
-    sagemaker_out = predictor_real_time_predict(endpoint_name=ep_name,
-                                                data=payload.__dict__,
-                                                inference_id=job.InferenceJobId,
-                                                )
+    endpoint_id = job.params.get('sagemaker_inference_endpoint_id')
+    update_endpoint_outstanding_jobs(endpoint_id, 1)
+    try:
+        sagemaker_out = predictor_real_time_predict(endpoint_name=ep_name,
+                                                    data=payload.__dict__,
+                                                    inference_id=job.InferenceJobId,
+                                                    )
+    finally:
+        update_endpoint_outstanding_jobs(endpoint_id, -1)
 
     if 'error' in sagemaker_out:
         record_count_metrics(ep_name=ep_name,
                              metric_name='InferenceFailed',
                              workflow=job.workflow,
                              )
-        update_inference_job_table(job.InferenceJobId, 'sagemakerRaw', str(sagemaker_out))
+        update_inference_job_fields(job.InferenceJobId, {
+            'status': 'failed',
+            'sagemakerRaw': str(sagemaker_out),
+        })
+        settle_result_cache(job.params, job.InferenceJobId, 'failed')
         raise Exception(str(sagemaker_out))
 
-    parse_sagemaker_result(sagemaker_out, job.createTime, job.InferenceJobId, job.taskType, ep_name)
+    try:
+        fields = parse_sagemaker_result(sagemaker_out, job.createTime, job.InferenceJobId, job.taskType, ep_name)
+    except Exception as e:
+        settle_result_cache(job.params, job.InferenceJobId, 'failed')
+        raise e
+    settle_result_cache(job.params, job.InferenceJobId, 'succeed', fields.get('image_names'))
 
     record_count_metrics(ep_name=ep_name,
                          metric_name='InferenceSucceed',
@@ -170,9 +238,13 @@ def predictor_async_predict(endpoint_name, data, inference_id):
 def async_inference(payload: InvocationRequest, job: InferenceJob, endpoint_name):
     tracer.put_annotation(key="inference_id", value=job.InferenceJobId)
 
-    prediction = predictor_async_predict(endpoint_name=endpoint_name,
-                                         data=payload.__dict__,
-                                         inference_id=job.InferenceJobId)
+    try:
+        prediction = predictor_async_predict(endpoint_name=endpoint_name,
+                                             data=payload.__dict__,
+                                             inference_id=job.InferenceJobId)
+    except Exception as e:
+        settle_result_cache(job.params, job.InferenceJobId, 'failed')
+        raise e
     logger.info(f"prediction: {prediction}")
     output_path = prediction.output_path
 
@@ -181,6 +253,9 @@ def async_inference(payload: InvocationRequest, job: InferenceJob, endpoint_name
     job.params['output_path'] = output_path
     ddb_service.put_items(inference_table_name, job.__dict__)
 
+    # released by inference_async_events when sagemaker notifies the result
+    count_outstanding_job(job.InferenceJobId, job.params.get('sagemaker_inference_endpoint_id'))
+
     data = {
         'InferenceJobId': job.InferenceJobId,
         'status': job.status,
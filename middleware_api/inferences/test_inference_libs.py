@@ -0,0 +1,169 @@
+import base64
+import io
+import os
+import threading
+import time
+from unittest import TestCase
+
+from PIL import Image
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('ESD_VERSION', 'v1.0.0-test')
+os.environ.setdefault('S3_BUCKET_NAME', 'bucket')
+os.environ.setdefault('ENDPOINT_TABLE_NAME', 'SDEndpointDeploymentJobTable')
+
+from inferences import inference_libs
+from libs.endpoint_scheduler import OUTSTANDING_JOBS_TTL_SECONDS
+
+
+class CaptureS3:
+
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Body, Bucket, Key):
+        with self.lock:
+            self.objects[Key] = Body
+
+
+def encode_image(img_format):
+    output = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(output, format=img_format)
+    return output.getvalue()
+
+
+class ResultImagesTest(TestCase):
+
+    def setUp(self):
+        self.s3 = CaptureS3()
+        self.s3_client = inference_libs.s3_client
+        self.convert_format = inference_libs.RESULT_IMAGE_CONVERT_FORMAT
+        self.save_parameters = inference_libs.save_inference_parameters
+        inference_libs.s3_client = self.s3
+        inference_libs.save_inference_parameters = lambda *args: None
+
+    def tearDown(self):
+        inference_libs.s3_client = self.s3_client
+        inference_libs.RESULT_IMAGE_CONVERT_FORMAT = self.convert_format
+        inference_libs.save_inference_parameters = self.save_parameters
+
+    def test_images_are_stored_as_encoded(self):
+        png = encode_image('PNG')
+        jpeg = encode_image('JPEG')
+        sagemaker_out = {'images': [base64.b64encode(png).decode()] * 8 + [base64.b64encode(jpeg).decode()]}
+
+        names = inference_libs.txt2_img_img(sagemaker_out, 'job', 'endpoint')
+
+        self.assertEqual(names, [f'image_{i}.png' for i in range(8)] + ['image_8.jpeg'])
+        self.assertEqual(self.s3.objects['out/job/result/image_0.png'], png)
+        self.assertEqual(self.s3.objects['out/job/result/image_8.jpeg'], jpeg)
+
+    def test_data_uri(self):
+        png = encode_image('PNG')
+
+        names = inference_libs.esi_rembg({'image': 'data:image/png;base64,' + base64.b64encode(png).decode()},
+                                         'job', 'endpoint')
+
+        self.assertEqual(names, ['image.png'])
+        self.assertEqual(self.s3.objects['out/job/result/image.png'], png)
+
+    def test_conversion_is_opt_in(self):
+        inference_libs.RESULT_IMAGE_CONVERT_FORMAT = 'png'
+        sagemaker_out = {'images': [base64.b64encode(encode_image('JPEG')).decode()]}
+
+        names = inference_libs.txt2_img_img(sagemaker_out, 'job', 'endpoint')
+
+        self.assertEqual(names, ['image_0.png'])
+        self.assertEqual(inference_libs.image_format(self.s3.objects['out/job/result/image_0.png']), 'png')
+
+    def test_animated_outputs(self):
+        gif = encode_image('GIF')
+        sagemaker_out = {
+            'images': [base64.b64encode(gif).decode()] * 2,
+            'output_img_type': ['GIF', 'WEBM'],
+        }
+
+        names = inference_libs.txt2_img_img(sagemaker_out, 'job', 'endpoint')
+
+        self.assertEqual(names, ['image_0.gif', 'image_1.webm'])
+
+
+def conditional_check_failed():
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+
+
+class FakeJobTable:
+    """Keeps the outstanding_endpoint_id mark of jobs."""
+
+    def __init__(self, job_ids):
+        self.marks = {job_id: None for job_id in job_ids}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues=None,
+                    ReturnValues=None):
+        job_id = Key['InferenceJobId']
+        if UpdateExpression.startswith('SET'):
+            if job_id not in self.marks or self.marks[job_id]:
+                raise conditional_check_failed()
+            self.marks[job_id] = ExpressionAttributeValues[':e']
+            return {}
+
+        if not self.marks.get(job_id):
+            raise conditional_check_failed()
+        endpoint_id, self.marks[job_id] = self.marks[job_id], None
+        return {'Attributes': {'outstanding_endpoint_id': endpoint_id}}
+
+
+class FakeEndpointTable:
+    """Applies the updates of outstanding_jobs on one endpoint."""
+
+    def __init__(self):
+        self.item = {'EndpointDeploymentJobId': 'ep'}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        values = ExpressionAttributeValues
+        if ConditionExpression == 'outstanding_jobs >= :abs':
+            passed = self.item.get('outstanding_jobs', 0) >= values[':abs']
+        elif ConditionExpression == 'outstanding_jobs_updated >= :stale_before':
+            passed = self.item.get('outstanding_jobs_updated', 0) >= values[':stale_before'] \
+                     and 'outstanding_jobs_updated' in self.item
+        else:
+            passed = True
+        if not passed:
+            raise conditional_check_failed()
+
+        if UpdateExpression.startswith('ADD'):
+            self.item['outstanding_jobs'] = self.item.get('outstanding_jobs', 0) + values[':d']
+        else:
+            self.item['outstanding_jobs'] = values[':d']
+        self.item['outstanding_jobs_updated'] = values[':now']
+
+
+class OutstandingJobsTest(TestCase):
+
+    def setUp(self):
+        self.tables = inference_libs.inference_table, inference_libs.endpoint_table
+        inference_libs.inference_table = FakeJobTable(['job-1', 'job-2'])
+        inference_libs.endpoint_table = self.endpoint = FakeEndpointTable()
+
+    def tearDown(self):
+        inference_libs.inference_table, inference_libs.endpoint_table = self.tables
+
+    def test_redelivered_completion_releases_once(self):
+        inference_libs.count_outstanding_job('job-1', 'ep')
+        inference_libs.count_outstanding_job('job-1', 'ep')
+        inference_libs.count_outstanding_job('job-2', 'ep')
+        self.assertEqual(self.endpoint.item['outstanding_jobs'], 2)
+
+        inference_libs.release_outstanding_job('job-1')
+        inference_libs.release_outstanding_job('job-1')
+        self.assertEqual(self.endpoint.item['outstanding_jobs'], 1)
+
+    def test_stale_counter_starts_over(self):
+        self.endpoint.item.update({'outstanding_jobs': 5,
+                                   'outstanding_jobs_updated': int(time.time()) - OUTSTANDING_JOBS_TTL_SECONDS - 1})
+
+        inference_libs.count_outstanding_job('job-1', 'ep')
+
+        self.assertEqual(self.endpoint.item['outstanding_jobs'], 1)
@@ -0,0 +1,150 @@
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from aws_lambda_powertools import Tracer
+from botocore.exceptions import ClientError
+
+from common.ddb_service.client import DynamoDbUtilsService
+from common.ddb_service.types_ import ScanOutput
+from libs.data_types import CheckPoint
+from libs.enums import CheckPointStatus
+
+tracer = Tracer()
+checkpoint_table = os.environ.get('CHECKPOINT_TABLE')
+checkpoint_name_index_table = os.environ.get('CHECKPOINT_NAME_INDEX_TABLE')
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+ddb_service = DynamoDbUtilsService(logger=logger)
+
+
+# misses are remembered this long, so names that are not in the table do not scan it on every lookup
+CHECKPOINT_NAME_MISS_TTL = float(os.environ.get('CHECKPOINT_NAME_MISS_TTL') or 60)
+
+# (checkpoint_type, checkpoint_name, status) -> when the remembered miss expires
+_missing_names: Dict[Tuple[str, str, str], float] = {}
+
+
+# CheckpointNameIndexTable keeps one item per checkpoint file name:
+#   checkpoint_name (partition key) + checkpoint_type (sort key) -> checkpoint_id
+# only active checkpoints are indexed, a pending upload never takes the name of an active checkpoint.
+# it must be maintained by every handler that activates, renames or deletes a checkpoint
+@tracer.capture_method
+def put_checkpoint_names(checkpoint: CheckPoint):
+    if not checkpoint.checkpoint_names or checkpoint.checkpoint_status != CheckPointStatus.Active:
+        return
+
+    for name in checkpoint.checkpoint_names:
+        _forget_missing(name, checkpoint.checkpoint_type)
+
+    ddb_service.batch_put_items({
+        checkpoint_name_index_table: [
+            {
+                'checkpoint_name': name,
+                'checkpoint_type': checkpoint.checkpoint_type,
+                'checkpoint_id': checkpoint.id,
+            } for name in checkpoint.checkpoint_names
+        ]
+    })
+
+
+@tracer.capture_method
+def delete_checkpoint_names(names: [str], ckpt_type: str, ckpt_id: str = None):
+    """Deletes the index entries of the names, with a checkpoint id only those that point to that checkpoint."""
+    for name in names:
+        kwargs = {}
+        if ckpt_id:
+            kwargs['ConditionExpression'] = 'checkpoint_id = :checkpoint_id'
+            kwargs['ExpressionAttributeValues'] = {':checkpoint_id': {'S': ckpt_id}}
+        try:
+            ddb_service.client.delete_item(
+                TableName=checkpoint_name_index_table,
+                Key={'checkpoint_name': {'S': name}, 'checkpoint_type': {'S': ckpt_type}},
+                **kwargs
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+
+
+@tracer.capture_method
+def rename_checkpoint_name(ckpt_id: str, ckpt_type: str, old_name: str, new_name: str):
+    delete_checkpoint_names([old_name], ckpt_type, ckpt_id)
+    _forget_missing(new_name, ckpt_type)
+    ddb_service.put_items(checkpoint_name_index_table, entries={
+        'checkpoint_name': new_name,
+        'checkpoint_type': ckpt_type,
+        'checkpoint_id': ckpt_id,
+    })
+
+
+@tracer.capture_method
+def get_checkpoint_by_name(ckpt_name: str, ckpt_type: str,
+                           status: CheckPointStatus = CheckPointStatus.Active) -> Optional[CheckPoint]:
+    tracer.put_annotation('ckpt_name', ckpt_name)
+
+    index_item = ddb_service.get_item(checkpoint_name_index_table, {
+        'checkpoint_name': ckpt_name,
+        'checkpoint_type': ckpt_type,
+    })
+
+    if index_item:
+        raw = ddb_service.get_item(checkpoint_table, {'id': index_item['checkpoint_id']})
+        checkpoint = CheckPoint(**raw) if raw else None
+        if checkpoint and ckpt_name in checkpoint.checkpoint_names:
+            if checkpoint.checkpoint_status == status:
+                return checkpoint
+            # another checkpoint with the name may have the status, the scan below finds it
+        else:
+            # the checkpoint was removed or renamed without the index being updated
+            delete_checkpoint_names([ckpt_name], ckpt_type, index_item['checkpoint_id'])
+
+    miss_key = (ckpt_type, ckpt_name, status.value)
+    if _missing_names.get(miss_key, 0) > time.monotonic():
+        return None
+
+    checkpoint = _scan_checkpoint_by_name(ckpt_name, ckpt_type, status)
+    if checkpoint is None or checkpoint.checkpoint_status != status:
+        _missing_names[miss_key] = time.monotonic() + CHECKPOINT_NAME_MISS_TTL
+        return None
+
+    # checkpoints created before the index existed are backfilled on first lookup
+    put_checkpoint_names(checkpoint)
+
+    return checkpoint
+
+
+def _forget_missing(ckpt_name: str, ckpt_type: str):
+    for key in [key for key in _missing_names if key[:2] == (ckpt_type, ckpt_name)]:
+        _missing_names.pop(key, None)
+
+
+def _scan_checkpoint_by_name(ckpt_name: str, ckpt_type: str, status: CheckPointStatus) -> Optional[CheckPoint]:
+    logger.info(f'checkpoint {ckpt_type}/{ckpt_name} is not indexed, fallback to scan')
+    scan_kwargs = {
+        'TableName': checkpoint_table,
+        'FilterExpression': 'contains(checkpoint_names, :checkpointName) and checkpoint_type=:model_type',
+        'ExpressionAttributeValues': {
+            ':checkpointName': {'S': ckpt_name},
+            ':model_type': {'S': ckpt_type},
+        },
+    }
+
+    checkpoints = []
+    while True:
+        named_ = ScanOutput(**ddb_service.client.scan(**scan_kwargs))
+        for item in named_.get('Items', []):
+            checkpoints.append(CheckPoint(**ddb_service.deserialize(item)))
+        if 'LastEvaluatedKey' not in named_:
+            break
+        scan_kwargs['ExclusiveStartKey'] = named_['LastEvaluatedKey']
+
+    if len(checkpoints) == 0:
+        return None
+
+    # prefer the one with the status if legacy data or pending uploads have duplicated names
+    checkpoints.sort(key=lambda c: c.checkpoint_status != status)
+    return checkpoints[0]
@@ -0,0 +1,173 @@
+import heapq
+import logging
+import os
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from aws_lambda_powertools import Tracer
+from boto3.dynamodb.conditions import Attr, Key
+
+from libs.utils import encode_last_key, decode_last_key
+
+tracer = Tracer()
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# GSI of CheckpointTable: checkpoint_type (partition key) + timestamp (sort key)
+CHECKPOINT_TYPE_INDEX = 'checkpoint_type-timestamp-index'
+
+# queries of one type per page, each evaluates at most `limit` items before the filter,
+# so a restrictive filter returns a short page and a cursor instead of reading the whole type
+CHECKPOINT_QUERY_MAX_ROUNDS = 4
+
+CHECKPOINT_TYPES = ["Stable-diffusion", "embeddings", "Lora", "hypernetworks", "ControlNet", "VAE", "Comfy"]
+
+
+@dataclass
+class CheckpointPage:
+    items: List[Dict[str, Any]]
+    # opaque cursor for the next page, None when all matching checkpoints were returned
+    last_evaluated_key: Optional[str]
+
+
+def _position(item) -> Dict[str, str]:
+    # the index key of an item, timestamp is kept as string so the cursor can be json encoded
+    return {
+        'id': item['id'],
+        'checkpoint_type': item['checkpoint_type'],
+        'timestamp': str(item['timestamp']),
+    }
+
+
+def _start_key(position: Dict[str, str]) -> Dict[str, Any]:
+    return {**position, 'timestamp': Decimal(position['timestamp'])}
+
+
+def _filter_expression(status: List[str] = None, visible_to: List[str] = None, roles: List[str] = None):
+    conditions = []
+
+    if status:
+        conditions.append(Attr('checkpoint_status').is_in(status))
+
+    if visible_to is not None:
+        # same rule as check_user_permissions: no owners, shared with '*' or any of the owners matches
+        visible = Attr('allowed_roles_or_users').not_exists() \
+                  | Attr('allowed_roles_or_users').attribute_type('NULL') \
+                  | Attr('allowed_roles_or_users').size().eq(0)
+        for name in sorted(set(visible_to) | {'*'}):
+            visible = visible | Attr('allowed_roles_or_users').contains(name)
+        conditions.append(visible)
+
+    if roles:
+        allowed = Attr('allowed_roles_or_users').contains(roles[0])
+        for role in roles[1:]:
+            allowed = allowed | Attr('allowed_roles_or_users').contains(role)
+        conditions.append(allowed)
+
+    if not conditions:
+        return None
+
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+
+    return expression
+
+
+@tracer.capture_method
+def list_checkpoints(table, limit: int, last_evaluated_key: str = None, types: List[str] = None,
+                     status: List[str] = None, visible_to: List[str] = None,
+                     roles: List[str] = None) -> CheckpointPage:
+    """
+    Lists checkpoints newest first by querying the type index of each requested type
+    and merging the results, so the cost of a page depends on the page size, not on
+    the size of the table. A page can hold fewer than `limit` checkpoints, even none,
+    when filters skip most of what was read; only an empty cursor ends the listing.
+
+    :param table: boto3 Table resource of CheckpointTable
+    :param limit: max checkpoints returned
+    :param last_evaluated_key: cursor returned by the previous page
+    :param types: checkpoint types, all types if empty
+    :param status: allowed checkpoint status values, any status if empty
+    :param visible_to: only checkpoints without owners or owned by one of these users or roles, None to skip
+    :param roles: only checkpoints owned by at least one of these roles
+    """
+    if last_evaluated_key:
+        # types absent from the cursor were exhausted by previous pages
+        positions = decode_last_key(last_evaluated_key)
+    else:
+        positions = {ckpt_type: None for ckpt_type in (types or CHECKPOINT_TYPES)}
+
+    filter_expression = _filter_expression(status, visible_to, roles)
+
+    buffers = {}
+    ends = {}
+    for ckpt_type, position in positions.items():
+        buffers[ckpt_type], ends[ckpt_type] = _read_type(table, ckpt_type, position, limit, filter_expression)
+
+    # a type cut short by CHECKPOINT_QUERY_MAX_ROUNDS has unread checkpoints older than its end,
+    # the page stops there so that the next one continues in order
+    cutoffs = [_sort_key(ends[ckpt_type]) for ckpt_type, items in buffers.items()
+               if ends[ckpt_type] and len(items) < limit]
+    cutoff = max(cutoffs) if cutoffs else None
+
+    merged = heapq.merge(*[[(ckpt_type, item) for item in items] for ckpt_type, items in buffers.items()],
+                         key=lambda pair: (pair[1]['timestamp'], pair[1]['id']), reverse=True)
+    page = []
+    consumed = {ckpt_type: 0 for ckpt_type in buffers}
+    for ckpt_type, item in merged:
+        if len(page) >= limit or (cutoff and _sort_key(item) < cutoff):
+            break
+        page.append(item)
+        consumed[ckpt_type] += 1
+
+    next_positions = {}
+    for ckpt_type, items in buffers.items():
+        if consumed[ckpt_type] < len(items):
+            next_positions[ckpt_type] = _position(items[consumed[ckpt_type] - 1]) \
+                if consumed[ckpt_type] > 0 else positions[ckpt_type]
+        elif ends[ckpt_type]:
+            next_positions[ckpt_type] = ends[ckpt_type]
+
+    return CheckpointPage(items=page, last_evaluated_key=encode_last_key(next_positions))
+
+
+def _sort_key(item):
+    return Decimal(str(item['timestamp'])), item['id']
+
+
+def _read_type(table, ckpt_type: str, position: Optional[Dict[str, str]], limit: int, filter_expression):
+    """
+    Reads up to `limit` matching checkpoints of one type after `position`, in at most
+    CHECKPOINT_QUERY_MAX_ROUNDS queries. Returns the items and the position after the
+    last item read, None if the type is exhausted.
+    """
+    query_kwargs = {
+        'IndexName': CHECKPOINT_TYPE_INDEX,
+        'KeyConditionExpression': Key('checkpoint_type').eq(ckpt_type),
+        'ScanIndexForward': False,
+        'Limit': limit,
+    }
+    if filter_expression is not None:
+        query_kwargs['FilterExpression'] = filter_expression
+
+    items = []
+    start_key = _start_key(position) if position else None
+    for _ in range(CHECKPOINT_QUERY_MAX_ROUNDS):
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        resp = table.query(**query_kwargs)
+        items.extend(resp.get('Items', []))
+
+        start_key = resp.get('LastEvaluatedKey')
+        if not start_key:
+            return items, None
+
+        if len(items) >= limit:
+            break
+
+    if len(items) > limit:
+        return items[:limit], _position(items[limit - 1])
+
+    return items, _position(start_key)
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.ddb_service.client import DynamoDbUtilsService
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# DynamoDB items are limited to 400KB, messages of a prompt are packed into items up to this size
+MSG_ITEM_MAX_BYTES = 300 * 1024
+
+
+@dataclass
+class SyncMessage:
+    record_id: str
+    prompt_id: str
+    message: Dict[str, Any]
+
+
+def parse_records(records: List[dict]) -> List[SyncMessage]:
+    """Reads the sync messages out of SQS records, records without a prompt are skipped."""
+    messages = []
+    for record in records:
+        if not record or 'body' not in record:
+            logger.error("ignore empty body msg")
+            continue
+        message = json.loads(record['body'])
+        if not message.get('prompt_id'):
+            logger.error(f"ignore msg without prompt_id: {message}")
+            continue
+        messages.append(SyncMessage(record_id=record.get('messageId'), prompt_id=message['prompt_id'],
+                                    message=message))
+    return messages
+
+
+def build_message_items(messages: List[SyncMessage], now_ms: int) -> List[Tuple[dict, List[str]]]:
+    """
+    Packs the messages of each prompt, in order, into as few message table items as possible.
+
+    Items get increasing request_time sort keys starting at `now_ms`, so a query by prompt_id
+    returns them in the order the messages were sent. Each item is returned with the ids of
+    the records it holds.
+    """
+    by_prompt: Dict[str, List[SyncMessage]] = {}
+    for message in messages:
+        by_prompt.setdefault(message.prompt_id, []).append(message)
+
+    items = []
+    request_time = now_ms
+    for prompt_id, prompt_messages in by_prompt.items():
+        chunk = []
+        size = 0
+        for message in prompt_messages:
+            message_size = len(json.dumps(message.message).encode())
+            if chunk and size + message_size > MSG_ITEM_MAX_BYTES:
+                items.append(_message_item(prompt_id, request_time, chunk))
+                request_time += 1
+                chunk = []
+                size = 0
+            chunk.append(message)
+            size += message_size
+        items.append(_message_item(prompt_id, request_time, chunk))
+        request_time += 1
+    return items
+
+
+def save_messages(ddb_service: DynamoDbUtilsService, table: str, messages: List[SyncMessage],
+                  now_ms: Optional[int] = None) -> List[str]:
+    """
+    Writes the messages with batch writes and returns the ids of the records that were not saved.
+
+    When an item of a prompt fails, the records of all later items of that prompt are reported
+    too, so a redelivery does not put them out of order.
+    """
+    if not messages:
+        return []
+
+    items = build_message_items(messages, now_ms if now_ms is not None else int(time.time() * 1000))
+    result = ddb_service.batch_put_items({table: [item for item, _ in items]})
+    if result.succeed:
+        return []
+
+    failed_keys = {(failure.item['prompt_id'], int(failure.item['request_time'])) for failure in result.failures}
+    failed_prompts = set()
+    failed_ids = []
+    for item, record_ids in items:
+        if item['prompt_id'] in failed_prompts or (item['prompt_id'], item['request_time']) in failed_keys:
+            failed_prompts.add(item['prompt_id'])
+            failed_ids.extend(record_ids)
+    return failed_ids
+
+
+def _message_item(prompt_id: str, request_time: int, chunk: List[SyncMessage]) -> Tuple[dict, List[str]]:
+    item = {
+        'prompt_id': prompt_id,
+        'request_time': request_time,
+        'message_body': json.dumps([message.message for message in chunk]),
+    }
+    return item, [message.record_id for message in chunk]
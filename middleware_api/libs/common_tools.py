@@ -3,17 +3,26 @@ import decimal
 import json
 import logging
 import math
+import os
 import threading
+import time
 import urllib.request
+from dataclasses import dataclass
 from datetime import datetime
 from datetime import timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Optional
 
 import boto3
 
 from libs.data_types import MultipartFileReq, CheckPoint
 
-PART_SIZE = 500 * 1024 * 1024
+# part size of url imports, an import holds about IMPORT_CONCURRENCY + 1 parts in memory
+IMPORT_PART_SIZE = int(os.environ.get('IMPORT_PART_SIZE_MB') or 64) * 1024 * 1024
+# parts uploaded at the same time
+IMPORT_CONCURRENCY = int(os.environ.get('IMPORT_CONCURRENCY') or 8)
+IMPORT_PART_RETRIES = 3
+# S3 multipart uploads have at most 10000 parts
+MULTIPART_MAX_PARTS = 10000
 
 
 def batch_get_s3_multipart_signed_urls(bucket_name, base_key, filenames: [MultipartFileReq]) -> Dict[str, Any]:
@@ -27,15 +36,18 @@ def batch_get_s3_multipart_signed_urls(bucket_name, base_key, filenames: [Multip
     return presign_url_map
 
 
-def get_s3_multipart_signed_urls(bucket_name, key, parts_number) -> Any:
-    s3 = boto3.client('s3')
+def create_multipart_upload(s3, bucket_name, key) -> str:
     response = s3.create_multipart_upload(
         Bucket=bucket_name,
         Key=key,
         Expires=datetime.now() + timedelta(seconds=3600 * 24 * 7)
     )
+    return response['UploadId']
+
 
-    upload_id = response['UploadId']
+def get_s3_multipart_signed_urls(bucket_name, key, parts_number) -> Any:
+    s3 = boto3.client('s3')
+    upload_id = create_multipart_upload(s3, bucket_name, key)
 
     presign_urls = []
 
@@ -97,73 +109,178 @@ def split_s3_path(s3_path):
 
 
 def upload_part_file(s3, bucket, key, part_number, upload_id, part_data):
-    try:
-        response = s3.upload_part(
-            Bucket=bucket,
-            Key=key,
-            PartNumber=part_number,
-            UploadId=upload_id,
-            Body=part_data
-        )
-        return {'PartNumber': part_number, 'ETag': response['ETag']}
-    except Exception as e:
-        logging.error(f"Upload of part {part_number} failed: {str(e)}")
-        return {'PartNumber': part_number, 'ETag': None}
+    for attempt in range(IMPORT_PART_RETRIES + 1):
+        try:
+            response = s3.upload_part(
+                Bucket=bucket,
+                Key=key,
+                PartNumber=part_number,
+                UploadId=upload_id,
+                Body=part_data
+            )
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        except Exception as e:
+            logging.error(f"Upload of part {part_number} failed: {str(e)}")
+            if attempt == IMPORT_PART_RETRIES:
+                raise
+            time.sleep(2 ** attempt)
+
 
+def list_uploaded_parts(s3, bucket, key, upload_id) -> Dict[int, Dict[str, Any]]:
+    parts = {}
+    params = {'Bucket': bucket, 'Key': key, 'UploadId': upload_id}
+    while True:
+        response = s3.list_parts(**params)
+        for part in response.get('Parts', []):
+            parts[part['PartNumber']] = {'PartNumber': part['PartNumber'], 'ETag': part['ETag'], 'Size': part['Size']}
+        if not response.get('IsTruncated'):
+            return parts
+        params['PartNumberMarker'] = response['NextPartNumberMarker']
 
+
+@dataclass
+class UrlImportResult:
+    upload_id: str
+    key: str
+    bucket: str
+    part_size: int
+    uploaded_bytes: int
+    total_bytes: Optional[int]
+    completed: bool
+
+
+# Streams the file at url into a multipart upload, parts are uploaded concurrently while the next one is read,
+# at most max_workers parts are in flight, so memory use is bounded by (max_workers + 1) * part_size.
+# With an upload_id the upload is resumed: the parts already uploaded from the start of the file are kept
+# and the download continues after them, with a Range request if the server supports it.
+# When should_stop returns true, the import stops after the parts in flight and returns completed=False,
+# the upload can then be resumed by another call.
 # Args:
 #     url (str): model source file url,eg:eg：https://civitai.com/api/download/models/xxxx or https://huggingface.co/stabilityai/stable-diffusion-xxxx/resolve/main/xxxx.safetensors
 #     bucket_name(str): bucket name
 #     s3_key(str):s3 key
+#     on_progress: called with the uploaded and total bytes after each part, total is None if unknown
 # Returns:
-#     upload_id: s3 uploadId
-#     key:s3 key
-#     bucket: bucket name
-def multipart_upload_from_url(url, bucket_name, s3_key):
-    s3 = boto3.client('s3')
-    logging.info(f"start multipart_upload_from_url:{url}, {s3_key}")
-    lock = threading.Lock()
-    try:
-        with urllib.request.urlopen(url) as response:
-            # 获取文件总大小
-            total_size = int(response.info().get('Content-Length'))
-            part_count = math.ceil(total_size / PART_SIZE)
-            upload_id = s3.create_multipart_upload(Bucket=bucket_name, Key=s3_key,
-                                                   Expires=datetime.now() + timedelta(seconds=3600 * 24 * 7))[
-                'UploadId']
-            logging.info(
-                f"multipart_upload_from_url:   total_size:{total_size}, part_count:{part_count} upload_id:{upload_id}")
-            parts = []
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = []
-                for part_number in range(1, part_count + 1):
-                    with lock:
-                        start = (part_number - 1) * PART_SIZE
-                        end = min(part_number * PART_SIZE, total_size)
-                        part_data = response.read(end - start)
-                        futures.append(
-                            executor.submit(upload_part_file, s3, bucket_name, s3_key, part_number, upload_id,
-                                            part_data))
-
-                for future in concurrent.futures.as_completed(futures):
-                    parts.append(future.result())
-            parts.sort(key=lambda part: part['PartNumber'])
-            # 完成Multipart上传
-            s3.complete_multipart_upload(
-                Bucket=bucket_name,
-                Key=s3_key,
-                UploadId=upload_id,
-                MultipartUpload={'Parts': parts}
-            )
-            logging.info("Multipart upload completed!")
-            return {
-                "uploadId": upload_id,
-                "key": s3_key,
-                "bucket": bucket_name,
-            }
-    except Exception as e:
-        logging.error(f"Multipart upload failed: {str(e)}")
+#     UrlImportResult
+def multipart_upload_from_url(url, bucket_name, s3_key, upload_id: str = None, part_size: int = IMPORT_PART_SIZE,
+                              max_workers: int = IMPORT_CONCURRENCY,
+                              on_progress: Callable[[int, Optional[int]], None] = None,
+                              should_stop: Callable[[], bool] = None, s3=None) -> UrlImportResult:
+    s3 = s3 or boto3.client('s3')
+    logging.info(f"start multipart_upload_from_url:{url}, {s3_key}, upload_id:{upload_id}")
+
+    parts = {}
+    if upload_id:
+        uploaded = list_uploaded_parts(s3, bucket_name, s3_key, upload_id)
+        # only full parts from the start of the file can be kept, the rest is uploaded again
+        part_number = 1
+        while part_number in uploaded and uploaded[part_number]['Size'] == part_size:
+            parts[part_number] = {'PartNumber': part_number, 'ETag': uploaded[part_number]['ETag']}
+            part_number += 1
+    offset = len(parts) * part_size
+
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header('Range', f'bytes={offset}-')
+
+    with urllib.request.urlopen(request) as response:
+        total_size = _content_total_size(response, offset)
+        if not upload_id:
+            if total_size:
+                part_size = max(part_size, math.ceil(total_size / MULTIPART_MAX_PARTS))
+            upload_id = create_multipart_upload(s3, bucket_name, s3_key)
+        if offset and response.status != 206:
+            # the server ignored the range, skip what is already uploaded
+            _skip(response, offset)
+        logging.info(f"multipart_upload_from_url: total_size:{total_size}, part_size:{part_size}, "
+                     f"kept_parts:{len(parts)}, upload_id:{upload_id}")
+
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(max_workers)
+        progress = {'uploaded': offset}
+        errors = []
+
+        def upload(number, data):
+            try:
+                part = upload_part_file(s3, bucket_name, s3_key, number, upload_id, data)
+                with lock:
+                    parts[number] = part
+                    progress['uploaded'] += len(data)
+                    uploaded_bytes = progress['uploaded']
+                if on_progress:
+                    on_progress(uploaded_bytes, total_size)
+            except Exception as e:
+                errors.append(e)
+                raise
+            finally:
+                slots.release()
+
+        completed = False
+        part_number = len(parts) + 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            while not errors:
+                if should_stop and should_stop():
+                    logging.info(f"multipart_upload_from_url stopped before part {part_number}")
+                    break
+                slots.acquire()
+                part_data = _read_part(response, part_size)
+                if not part_data and part_number > 1:
+                    slots.release()
+                    completed = True
+                    break
+                futures.append(executor.submit(upload, part_number, part_data))
+                part_number += 1
+                if len(part_data) < part_size:
+                    completed = True
+                    break
+
+            for future in futures:
+                future.result()
+
+    result = UrlImportResult(upload_id=upload_id, key=s3_key, bucket=bucket_name, part_size=part_size,
+                             uploaded_bytes=progress['uploaded'], total_bytes=total_size, completed=completed)
+    if not completed:
+        return result
+
+    s3.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=s3_key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': [parts[number] for number in sorted(parts)]}
+    )
+    logging.info("Multipart upload completed!")
+    return result
+
+
+def _content_total_size(response, offset: int) -> Optional[int]:
+    content_range = response.headers.get('Content-Range')
+    if response.status == 206 and content_range and not content_range.endswith('/*'):
+        return int(content_range.split('/')[-1])
+    content_length = response.headers.get('Content-Length')
+    if content_length is None:
         return None
+    return int(content_length) + (offset if response.status == 206 else 0)
+
+
+def _read_part(response, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = response.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _skip(response, size: int):
+    while size > 0:
+        chunk = response.read(min(size, 1024 * 1024))
+        if not chunk:
+            break
+        size -= len(chunk)
 
 
 class DecimalEncoder(json.JSONEncoder):
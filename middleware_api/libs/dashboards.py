@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+ESD_NAMESPACE = 'ESD'
+# custom metrics an endpoint dashboard has per instance and gpu widgets for
+ENDPOINT_DASHBOARD_METRICS = ('GPUMemoryUtilization', 'GPUUtilization', 'InferenceTotal')
+# the header widget shows when the dashboard was written, it is not part of what the dashboard shows
+BUILD_TIME_MARKER = 'Last Build Time'
+
+
+def list_esd_metrics(cloudwatch) -> List[dict]:
+    """Lists every metric of the ESD namespace with one paginated call, instead of one call per endpoint and name."""
+    metrics = []
+    for page in cloudwatch.get_paginator('list_metrics').paginate(Namespace=ESD_NAMESPACE):
+        metrics.extend(page.get('Metrics', []))
+    return metrics
+
+
+def _dimension(metric: dict, name: str) -> Optional[str]:
+    for dimension in metric.get('Dimensions', []):
+        if dimension['Name'] == name:
+            return dimension['Value']
+    return None
+
+
+def _metric_order(metric: dict):
+    return (ENDPOINT_DASHBOARD_METRICS.index(metric['MetricName']),
+            [(d['Name'], d['Value']) for d in metric.get('Dimensions', [])])
+
+
+def endpoint_metrics(metrics: List[dict]) -> Dict[str, List[dict]]:
+    """Groups the metrics endpoint dashboards are built from by endpoint name, in a stable order."""
+    by_endpoint: Dict[str, List[dict]] = {}
+    for metric in metrics:
+        if metric['MetricName'] not in ENDPOINT_DASHBOARD_METRICS:
+            continue
+        endpoint_name = _dimension(metric, 'Endpoint')
+        if endpoint_name:
+            by_endpoint.setdefault(endpoint_name, []).append(metric)
+
+    for endpoint_name in by_endpoint:
+        by_endpoint[endpoint_name].sort(key=_metric_order)
+    return by_endpoint
+
+
+def workflow_names(metrics: List[dict]) -> List[str]:
+    names = set()
+    for metric in metrics:
+        if metric['MetricName'] != 'InferenceTotal':
+            continue
+        workflow = _dimension(metric, 'Workflow')
+        if workflow:
+            names.add(workflow)
+    return sorted(names)
+
+
+def dashboard_signature(body: dict) -> str:
+    """Digest of the widgets and metrics of a dashboard, the build time in its header is left out."""
+    widgets = [widget for widget in body.get('widgets', [])
+               if BUILD_TIME_MARKER not in str(widget.get('properties', {}).get('markdown', ''))]
+    return hashlib.sha256(json.dumps(widgets, sort_keys=True).encode()).hexdigest()
+
+
+class DashboardRecords:
+    """
+    Keeps the signature of every dashboard as it was last written, so a dashboard is only
+    put again when its widgets or metrics changed.
+
+    The records live as long as the warm lambda. A dashboard without a record is read once
+    with get_dashboard, after that unchanged dashboards cost no CloudWatch call at all.
+    """
+
+    def __init__(self, cloudwatch):
+        self.cloudwatch = cloudwatch
+        self.signatures: Dict[str, Optional[str]] = {}
+
+    def is_current(self, name: str, body: dict) -> bool:
+        if name not in self.signatures:
+            self.signatures[name] = self._load(name)
+        return self.signatures[name] == dashboard_signature(body)
+
+    def _load(self, name: str) -> Optional[str]:
+        try:
+            response = self.cloudwatch.get_dashboard(DashboardName=name)
+        except self.cloudwatch.exceptions.ResourceNotFound:
+            return None
+        try:
+            return dashboard_signature(json.loads(response['DashboardBody']))
+        except ValueError:
+            return None
+
+    def put(self, name: str, body: dict):
+        self.cloudwatch.put_dashboard(DashboardName=name, DashboardBody=json.dumps(body))
+        self.signatures[name] = dashboard_signature(body)
+
+    def forget(self, name: str):
+        self.signatures.pop(name, None)
@@ -165,6 +165,12 @@ class InferenceJob:
     inference_type: Optional[str] = None
     payload_string: Optional[str] = None
     workflow: Optional[str] = None
+    # set when the images are those of an identical job, see libs/inference_cache.py
+    result_inference_id: Optional[str] = None
+    # set on the jobs submitted together with POST /inferences/batches
+    batch_id: Optional[str] = None
+    # endpoint an async job is counted on until its result arrives, see update_endpoint_outstanding_jobs
+    outstanding_endpoint_id: Optional[str] = None
 
 
 @dataclass
@@ -185,6 +191,9 @@ class Endpoint:
     min_instance_number: str = None
     custom_extensions: str = ""
     service_type: str = ""
+    outstanding_jobs: int = 0  # jobs dispatched to the endpoint and not finished yet
+    outstanding_jobs_updated: Optional[int] = None  # epoch seconds of the last change of outstanding_jobs
+    recent_models: Optional[List[str]] = None  # checkpoints recently scheduled to the endpoint
 
 
 @dataclass
@@ -0,0 +1,225 @@
+import concurrent.futures
+import logging
+import math
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from common.ddb_service.client import DynamoDbUtilsService
+from libs.data_types import DatasetItem
+from libs.enums import DataStatus
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# dataset items handled by one crop invocation
+CROP_BATCH_SIZE = int(os.environ.get('CROP_BATCH_SIZE') or 50)
+# images cropped at the same time, one process each
+CROP_PROCESSES = int(os.environ.get('CROP_PROCESSES') or os.cpu_count() or 1)
+# downloads and uploads at the same time
+CROP_IO_CONCURRENCY = 8
+
+IMG_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")  # copy from train_util.py
+
+
+@dataclass
+class CropTask:
+    name: str
+    type: str
+    old_s3_location: str
+    user_roles: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CropBatchResult:
+    items: List[DatasetItem] = field(default_factory=list)
+    # name of the data -> reason
+    failed: Dict[str, str] = field(default_factory=dict)
+    seconds: float = 0
+
+
+def parse_resolution(max_resolution: str) -> Tuple[int, int]:
+    width, height = max_resolution.lower().split("x")
+    return int(width), int(height)
+
+
+def get_target_key(dataset_name: str, prefix: str, name: str) -> str:
+    if prefix:
+        return f"dataset/{dataset_name}/{prefix}/{name}"
+    return f"dataset/{dataset_name}/{name}"
+
+
+def crop_image(src_path: str, dst_path: str, width: int, height: int, interpolation='lanczos'):
+    """Scales the image down until it covers width x height, then center crops it to exactly that size."""
+    # Select interpolation method
+    if interpolation == 'lanczos':
+        interpolation_type = Image.LANCZOS
+    elif interpolation == 'cubic':
+        interpolation_type = Image.BICUBIC
+    else:
+        interpolation_type = Image.NEAREST
+
+    # save the original image mode, such as RGBA -> RGBA
+    image = Image.open(src_path)
+
+    current_width, current_height = image.size
+
+    # Check if the image needs resizing
+    if current_width > width and current_height > height:
+        scale_factor_width = width / current_width
+        scale_factor_height = height / current_height
+
+        if scale_factor_height > scale_factor_width:
+            new_width = math.ceil(current_width * scale_factor_height)
+            image = image.resize((new_width, height), interpolation_type)
+        elif scale_factor_height < scale_factor_width:
+            new_height = math.ceil(current_height * scale_factor_width)
+            image = image.resize((width, new_height), interpolation_type)
+        else:
+            image = image.resize((width, height), interpolation_type)
+
+    resized_img = np.array(image)
+    new_img = np.zeros((height, width) + resized_img.shape[2:], dtype=np.uint8)
+
+    # Center crop the image, images smaller than the target are padded
+    new_y = 0
+    new_x = 0
+    height_dst = height
+    width_dst = width
+    y = int((resized_img.shape[0] - height) / 2)
+    if y < 0:
+        new_y = -y
+        height_dst = resized_img.shape[0]
+        y = 0
+    x = int((resized_img.shape[1] - width) / 2)
+    if x < 0:
+        new_x = -x
+        width_dst = resized_img.shape[1]
+        x = 0
+    new_img[new_y:new_y + height_dst, new_x:new_x + width_dst] = resized_img[y:y + height_dst, x:x + width_dst]
+
+    Image.fromarray(new_img).save(dst_path, quality=95)
+
+
+def _prepare_file(args) -> Optional[str]:
+    """Runs in a worker process, returns the error instead of raising so one bad image does not fail the batch."""
+    src_path, dst_path, width, height, interpolation = args
+    try:
+        if src_path.lower().endswith(IMG_EXTS):
+            crop_image(src_path, dst_path, width, height, interpolation)
+        else:
+            # captions and other files are copied as they are
+            shutil.copyfile(src_path, dst_path)
+        return None
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+
+
+def _process_executor(processes: int) -> concurrent.futures.Executor:
+    if processes > 1:
+        try:
+            return concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+        except (OSError, NotImplementedError) as e:
+            # Lambda has no /dev/shm for the process pool queues, PIL releases the GIL while resizing
+            logger.info(f"process pool not available, crop with threads: {e}")
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max(processes, 1))
+
+
+def crop_dataset_items(s3_client, bucket_name: str, dataset_name: str, prefix: str, max_resolution: str,
+                       tasks: List[CropTask], work_dir: str = '/tmp', interpolation='lanczos',
+                       processes: int = CROP_PROCESSES, io_workers: int = CROP_IO_CONCURRENCY) -> CropBatchResult:
+    """
+    Crops a batch of dataset files into the dataset `dataset_name`.
+
+    Files are downloaded and uploaded by a thread pool and the images are cropped by
+    `processes` worker processes. A file that can not be downloaded, cropped or uploaded
+    is reported in `failed` and does not stop the others.
+    """
+    started_at = time.monotonic()
+    width, height = parse_resolution(max_resolution)
+    result = CropBatchResult()
+    batch_dir = os.path.join(work_dir, f'crop_{dataset_name}_{os.getpid()}_{int(started_at * 1000)}')
+    os.makedirs(batch_dir, exist_ok=True)
+
+    def local_path(index, task, kind):
+        return os.path.join(batch_dir, f'{index}_{kind}_{os.path.basename(task.name)}')
+
+    def download(index_task):
+        index, task = index_task
+        s3_client.download_file(bucket_name, task.old_s3_location, local_path(index, task, 'src'))
+
+    def upload(index_task):
+        index, task = index_task
+        s3_client.upload_file(local_path(index, task, 'dst'), bucket_name,
+                              get_target_key(dataset_name, prefix, task.name))
+
+    def run_io(action, pending):
+        done = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=io_workers) as executor:
+            futures = {executor.submit(action, index_task): index_task for index_task in pending}
+            for future in concurrent.futures.as_completed(futures):
+                index, task = futures[future]
+                try:
+                    future.result()
+                    done.append((index, task))
+                except Exception as e:
+                    logger.error(f"{action.__name__} of {task.name} failed: {e}")
+                    result.failed[task.name] = f'{action.__name__} failed: {e}'
+        return sorted(done, key=lambda index_task: index_task[0])
+
+    try:
+        downloaded = run_io(download, list(enumerate(tasks)))
+
+        cropped = []
+        with _process_executor(processes) as executor:
+            args = [(local_path(index, task, 'src'), local_path(index, task, 'dst'), width, height, interpolation)
+                    for index, task in downloaded]
+            for (index, task), error in zip(downloaded, executor.map(_prepare_file, args)):
+                if error:
+                    logger.error(f"crop of {task.name} failed: {error}")
+                    result.failed[task.name] = f'crop failed: {error}'
+                else:
+                    cropped.append((index, task))
+
+        uploaded = run_io(upload, cropped)
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+    timestamp = datetime.now().timestamp()
+    for _, task in uploaded:
+        result.items.append(_dataset_item(dataset_name, task, timestamp, DataStatus.Enabled, {}))
+    for task in tasks:
+        if task.name in result.failed:
+            # failed files are kept disabled with the reason, so the new dataset shows what is missing
+            result.items.append(_dataset_item(dataset_name, task, timestamp, DataStatus.Disabled,
+                                              {'error': result.failed[task.name]}))
+
+    result.seconds = time.monotonic() - started_at
+    logger.info(f"cropped {len(uploaded)} of {len(tasks)} files into {dataset_name} in {result.seconds:.1f}s")
+    return result
+
+
+def _dataset_item(dataset_name: str, task: CropTask, timestamp: float, status: DataStatus, params: dict):
+    return DatasetItem(
+        dataset_name=dataset_name,
+        sort_key=f'{timestamp}_{task.name}',
+        name=task.name,
+        type=task.type,
+        data_status=status,
+        params=params,
+        allowed_roles_or_users=task.user_roles
+    )
+
+
+def save_dataset_items(ddb_service: DynamoDbUtilsService, table: str, items: List[DatasetItem]) -> List[str]:
+    """Writes the items of a crop batch in batch writes, returns the names of the items that were not written."""
+    result = ddb_service.batch_put_items({table: [item.__dict__ for item in items]})
+    if not result:
+        return []
+    return [failure.item['name'] for failure in result.failures]
@@ -0,0 +1,162 @@
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from common.ddb_service.client import DynamoDbUtilsService
+from libs.data_types import Endpoint
+from libs.enums import EndpointStatus
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+ENDPOINT_NAME_INDEX = 'endpoint_name-startTime-index'
+ENDPOINT_STATUS_INDEX = 'endpoint_status-startTime-index'
+
+# deleted endpoints stay in the table as history, they are archived under their own status
+# partition of the status index by the delete and event handlers, and no lookup of the
+# working set reads them
+ARCHIVED_STATUS = EndpointStatus.DELETED.value
+# statuses endpoint_event.get_business_status has no business status for, stored as SageMaker sends them
+SAGEMAKER_STATUSES = [
+    'SYSTEM_UPDATING',
+    'OUT_OF_SERVICE',
+    'ROLLING_BACK',
+    'UPDATE_ROLLBACK_FAILED',
+]
+ACTIVE_STATUSES = [
+    EndpointStatus.IN_SERVICE.value,
+    EndpointStatus.UPDATING.value,
+    EndpointStatus.CREATING.value,
+    EndpointStatus.ROLLING_BACK.value,
+    EndpointStatus.DELETING.value,
+    EndpointStatus.FAILED.value,
+    *SAGEMAKER_STATUSES,
+]
+# endpoints inference jobs can be scheduled to
+SERVING_STATUSES = [EndpointStatus.IN_SERVICE.value, EndpointStatus.UPDATING.value]
+
+
+def is_archived(endpoint: Endpoint) -> bool:
+    # Compatible with fields used in older data, endpoint.status must be 'deleted'
+    return endpoint.endpoint_status == ARCHIVED_STATUS or endpoint.status == 'deleted'
+
+
+class EndpointDirectory:
+    """
+    Looks up endpoints of the endpoint deployment table through its indexes instead of scans:
+    by name with the endpoint_name-startTime index, by status with the endpoint_status-startTime
+    index, and by role among the active endpoints.
+
+    A name can be reused after its endpoint was deleted, a lookup by name prefers the newest
+    endpoint that is not archived.
+    """
+
+    def __init__(self, table_name: str, ddb_service: DynamoDbUtilsService):
+        self.table_name = table_name
+        self.ddb_service = ddb_service
+
+    def get_by_name(self, endpoint_name: str) -> Optional[Endpoint]:
+        endpoints = self._query(ENDPOINT_NAME_INDEX, 'endpoint_name', endpoint_name)
+        if not endpoints:
+            return None
+
+        for endpoint in endpoints:
+            if not is_archived(endpoint):
+                return endpoint
+        return endpoints[0]
+
+    def list_by_status(self, statuses: List[str], limit: int = None,
+                       start_key: dict = None) -> Tuple[List[Endpoint], Optional[dict]]:
+        """
+        Lists the endpoints of the given statuses, newest first within a status.
+
+        With a limit the result is a page, the returned key continues the listing from
+        where it stopped, across the statuses.
+        """
+        endpoints = []
+        position = 0
+        last_key = None
+        if start_key and start_key.get('status') in statuses:
+            position = statuses.index(start_key['status'])
+            last_key = start_key.get('key')
+
+        for i in range(position, len(statuses)):
+            status = statuses[i]
+            while True:
+                remaining = limit - len(endpoints) if limit else None
+                page, last_key = self._query_page(ENDPOINT_STATUS_INDEX, 'endpoint_status', status,
+                                                  limit=remaining, start_key=last_key)
+                # legacy rows deleted before endpoint_status existed are left out, not rewritten,
+                # listings run with read only roles
+                endpoints.extend(endpoint for endpoint in page
+                                 if status == ARCHIVED_STATUS or not is_archived(endpoint))
+
+                if limit and len(endpoints) >= limit:
+                    if last_key:
+                        return endpoints, {'status': status, 'key': last_key}
+                    if i + 1 < len(statuses):
+                        return endpoints, {'status': statuses[i + 1], 'key': None}
+                    return endpoints, None
+
+                if not last_key:
+                    break
+
+        return endpoints, None
+
+    def list_active(self, statuses: List[str] = None) -> List[Endpoint]:
+        endpoints, _ = self.list_by_status(statuses or ACTIVE_STATUSES)
+        return endpoints
+
+    def list_by_role(self, role: str) -> List[Endpoint]:
+        return [endpoint for endpoint in self.list_active()
+                if endpoint.owner_group_or_role and role in endpoint.owner_group_or_role]
+
+    def find_role_owner(self, roles: List[str]) -> Optional[Tuple[str, Endpoint]]:
+        """Returns the first of the roles that already has an active endpoint, with that endpoint."""
+        for endpoint in self.list_active():
+            if not endpoint.owner_group_or_role:
+                continue
+            for role in roles:
+                if role in endpoint.owner_group_or_role:
+                    return role, endpoint
+        return None
+
+    def archive(self, endpoint: Endpoint):
+        logger.info(f"archive endpoint {endpoint.endpoint_name}: {endpoint.EndpointDeploymentJobId}")
+        self.ddb_service.update_item_fields(
+            table=self.table_name,
+            key={'EndpointDeploymentJobId': endpoint.EndpointDeploymentJobId},
+            fields={
+                'endpoint_status': ARCHIVED_STATUS,
+                'current_instance_count': 0,
+            },
+        )
+        endpoint.endpoint_status = ARCHIVED_STATUS
+        endpoint.current_instance_count = 0
+
+    def _query(self, index_name: str, key_name: str, key_value: str) -> List[Endpoint]:
+        endpoints = []
+        last_key = None
+        while True:
+            page, last_key = self._query_page(index_name, key_name, key_value, start_key=last_key)
+            endpoints.extend(page)
+            if not last_key:
+                return endpoints
+
+    def _query_page(self, index_name: str, key_name: str, key_value: str, limit: int = None,
+                    start_key: dict = None) -> Tuple[List[Endpoint], Optional[dict]]:
+        query_kwargs = {
+            'TableName': self.table_name,
+            'IndexName': index_name,
+            'KeyConditionExpression': f'{key_name} = :value',
+            'ExpressionAttributeValues': {':value': {'S': key_value}},
+            'ScanIndexForward': False,
+        }
+        if limit:
+            query_kwargs['Limit'] = limit
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+
+        response = self.ddb_service.client.query(**query_kwargs)
+        endpoints = [Endpoint(**self.ddb_service.deserialize(item)) for item in response.get('Items', [])]
+        return endpoints, response.get('LastEvaluatedKey')
@@ -0,0 +1,124 @@
+import logging
+import os
+import random
+import time
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+from libs.data_types import Endpoint
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+STRATEGY_RANDOM = 'random'
+STRATEGY_LEAST_OUTSTANDING = 'least_outstanding'
+STRATEGY_BACKLOG_WEIGHTED = 'backlog_weighted'
+STRATEGY_MODEL_AFFINITY = 'model_affinity'
+
+DEFAULT_STRATEGY = os.environ.get('INFERENCE_SCHEDULER_STRATEGY') or STRATEGY_MODEL_AFFINITY
+
+# how many recently dispatched checkpoints are remembered per endpoint,
+# roughly what an endpoint keeps in its local model cache
+RECENT_MODELS_LIMIT = 20
+
+# an endpoint that holds the model is preferred unless its backlog per instance
+# exceeds the least loaded endpoint by more than this number of jobs
+AFFINITY_BACKLOG_TOLERANCE = 2
+
+# async invocations time out within an hour, a counter unchanged for longer only holds jobs
+# whose completion was lost, it is ignored here and reset by the next job sent to the endpoint
+OUTSTANDING_JOBS_TTL_SECONDS = 3600
+
+
+def outstanding_jobs(endpoint: Endpoint, now: float = None) -> int:
+    if not endpoint.outstanding_jobs:
+        return 0
+
+    updated = endpoint.outstanding_jobs_updated
+    if updated and (now or time.time()) - float(updated) > OUTSTANDING_JOBS_TTL_SECONDS:
+        return 0
+
+    return max(int(endpoint.outstanding_jobs), 0)
+
+
+def instance_count(endpoint: Endpoint) -> int:
+    try:
+        return max(int(Decimal(str(endpoint.current_instance_count))), 1)
+    except Exception:
+        return 1
+
+
+def backlog_per_instance(endpoint: Endpoint) -> float:
+    return outstanding_jobs(endpoint) / instance_count(endpoint)
+
+
+def holds_models(endpoint: Endpoint, model_names: List[str]) -> bool:
+    if not model_names or not endpoint.recent_models:
+        return False
+
+    return all(name in endpoint.recent_models for name in model_names)
+
+
+def merge_recent_models(recent_models: Optional[List[str]], model_names: List[str]) -> List[str]:
+    merged = [name for name in (recent_models or []) if name not in model_names]
+    merged.extend(model_names)
+
+    return merged[-RECENT_MODELS_LIMIT:]
+
+
+def _random(endpoints: List[Endpoint], model_names: List[str], rng: random.Random) -> Endpoint:
+    return rng.choice(endpoints)
+
+
+def _least_outstanding(endpoints: List[Endpoint], model_names: List[str], rng: random.Random) -> Endpoint:
+    least = min(backlog_per_instance(ep) for ep in endpoints)
+
+    return rng.choice([ep for ep in endpoints if backlog_per_instance(ep) == least])
+
+
+def _backlog_weighted(endpoints: List[Endpoint], model_names: List[str], rng: random.Random) -> Endpoint:
+    # weighted instead of strict minimum, so that concurrent requests reading the
+    # same counters do not all pile onto the one endpoint that looks idle
+    weights = [1 / (1 + backlog_per_instance(ep)) for ep in endpoints]
+
+    return rng.choices(endpoints, weights=weights, k=1)[0]
+
+
+def _model_affinity(endpoints: List[Endpoint], model_names: List[str], rng: random.Random) -> Endpoint:
+    least = min(backlog_per_instance(ep) for ep in endpoints)
+    warm = [ep for ep in endpoints
+            if holds_models(ep, model_names)
+            and backlog_per_instance(ep) - least <= AFFINITY_BACKLOG_TOLERANCE]
+
+    if warm:
+        return _backlog_weighted(warm, model_names, rng)
+
+    return _backlog_weighted(endpoints, model_names, rng)
+
+
+STRATEGIES: Dict[str, Callable[[List[Endpoint], List[str], random.Random], Endpoint]] = {
+    STRATEGY_RANDOM: _random,
+    STRATEGY_LEAST_OUTSTANDING: _least_outstanding,
+    STRATEGY_BACKLOG_WEIGHTED: _backlog_weighted,
+    STRATEGY_MODEL_AFFINITY: _model_affinity,
+}
+
+
+class EndpointScheduler:
+
+    def __init__(self, strategy: str = DEFAULT_STRATEGY, rng: random.Random = None):
+        if strategy not in STRATEGIES:
+            raise Exception(f'unknown scheduler strategy {strategy}, should be in {list(STRATEGIES.keys())}')
+
+        self.strategy = strategy
+        self.rng = rng or random.Random()
+
+    def select(self, endpoints: List[Endpoint], model_names: List[str] = None) -> Endpoint:
+        if not endpoints:
+            raise Exception('no endpoints to schedule')
+
+        endpoint = STRATEGIES[self.strategy](endpoints, model_names or [], self.rng)
+        logger.info(f'{self.strategy} scheduled endpoint {endpoint.endpoint_name} '
+                    f'with {outstanding_jobs(endpoint)} outstanding jobs')
+
+        return endpoint
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+LOGS_QUERY_LIMIT = 1000
+# a request waits this long for the query, after that it returns what is there with a continuation token
+LOGS_WAIT_SECONDS = 5
+LOGS_POLL_SECONDS = 0.5
+# an unfinished query older than this is not reused, insights queries time out after 60 minutes
+LOGS_QUERY_MAX_AGE_SECONDS = 15 * 60
+# logs of an execution still running may grow, its completed results are reused only this long
+LOGS_RUNNING_CACHE_SECONDS = 30
+LOGS_CACHE_PREFIX = 'comfy/execute_logs'
+
+QUERY_RUNNING = ('Scheduled', 'Running')
+QUERY_FAILED = ('Failed', 'Cancelled', 'Timeout', 'Unknown')
+
+
+@dataclass
+class LogsQueryResult:
+    status: str
+    results: List[dict] = field(default_factory=list)
+    # the query id, passed back to get the rest of a query still running
+    next_token: Optional[str] = None
+    cached: bool = False
+
+
+def parse_results(query_results: List[List[dict]]) -> List[dict]:
+    results = []
+    for result in query_results:
+        item = {f['field']: f['value'] for f in result}
+        results.append({
+            'timestamp': item.get("@timestamp"),
+            'message': item.get("@message"),
+            'logStream': item.get("@logStream"),
+        })
+    return results
+
+
+class ExecuteLogs:
+    """
+    Gets the endpoint logs of a ComfyUI execution with a Logs Insights query.
+
+    The query of a prompt is recorded in S3 with its state: identical requests reuse the
+    query in flight instead of starting another one, and completed results are served from
+    the record. A request waits only `wait_seconds` for the query and otherwise returns the
+    results so far with the query id as continuation token.
+    """
+
+    def __init__(self, logs_client, s3_client, bucket_name: str, wait_seconds: float = LOGS_WAIT_SECONDS,
+                 poll_seconds: float = LOGS_POLL_SECONDS, clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.logs_client = logs_client
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+    def get(self, prompt_id: str, endpoint_name: str, start_time: str, finished: bool,
+            next_token: Optional[str] = None) -> LogsQueryResult:
+        now = self.clock()
+        record = self._load(prompt_id)
+
+        if record and record['status'] == 'Complete' and \
+                (record.get('finished') or now - record['completed_at'] < LOGS_RUNNING_CACHE_SECONDS):
+            return LogsQueryResult(status='Complete', results=record['results'], cached=True)
+
+        query_id = None
+        if record and record['status'] in QUERY_RUNNING and now - record['started_at'] < LOGS_QUERY_MAX_AGE_SECONDS:
+            # a token is only good for the query of this prompt
+            if next_token and next_token != record['query_id']:
+                logger.info(f"ignore next_token {next_token} of another query")
+            query_id = record['query_id']
+
+        if not query_id:
+            query_id = self._start_query(prompt_id, endpoint_name, start_time)
+            self._save(prompt_id, {'query_id': query_id, 'status': 'Running', 'started_at': now})
+
+        response = self._wait(query_id)
+        status = response['status']
+        results = parse_results(response.get('results', []))
+
+        if status == 'Complete':
+            self._save(prompt_id, {'query_id': query_id, 'status': status, 'started_at': now,
+                                   'completed_at': self.clock(), 'finished': finished, 'results': results})
+            return LogsQueryResult(status=status, results=results)
+
+        if status in QUERY_FAILED:
+            # the next request starts a new query
+            self._save(prompt_id, {'query_id': query_id, 'status': status, 'started_at': now})
+            return LogsQueryResult(status=status, results=results)
+
+        return LogsQueryResult(status=status, results=results, next_token=query_id)
+
+    def _start_query(self, prompt_id: str, endpoint_name: str, start_time: str) -> str:
+        query = f"""
+        fields @timestamp, @message, @logStream
+        | filter @message like /{prompt_id}/
+        | sort @timestamp asc
+        | limit {LOGS_QUERY_LIMIT}
+        """
+
+        dt = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f')
+        response = self.logs_client.start_query(
+            logGroupName=f'/aws/sagemaker/Endpoints/{endpoint_name}',
+            startTime=int(dt.timestamp()),
+            endTime=int((dt + timedelta(hours=1)).timestamp()),
+            queryString=query,
+            limit=LOGS_QUERY_LIMIT
+        )
+        logger.info(f"started logs query {response['queryId']} for {prompt_id}")
+        return response['queryId']
+
+    def _wait(self, query_id: str) -> dict:
+        deadline = self.clock() + self.wait_seconds
+        while True:
+            response = self.logs_client.get_query_results(queryId=query_id)
+            if response['status'] not in QUERY_RUNNING or self.clock() + self.poll_seconds > deadline:
+                return response
+            self.sleep(self.poll_seconds)
+
+    def _key(self, prompt_id: str) -> str:
+        return f'{LOGS_CACHE_PREFIX}/{prompt_id}.json'
+
+    def _load(self, prompt_id: str) -> Optional[dict]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._key(prompt_id))
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def _save(self, prompt_id: str, record: dict):
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=self._key(prompt_id), Body=json.dumps(record))
@@ -0,0 +1,171 @@
+import concurrent.futures
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional
+
+from common.ddb_service.client import DynamoDbUtilsService
+from common.excepts import BadRequestException
+from libs.data_types import Endpoint
+from libs.endpoint_scheduler import EndpointScheduler, outstanding_jobs
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# parameter sets accepted by one batch request
+INFERENCE_BATCH_MAX_JOBS = int(os.environ.get('INFERENCE_BATCH_MAX_JOBS') or 500)
+# jobs started by one dispatch invocation
+INFERENCE_BATCH_DISPATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_DISPATCH_SIZE') or 25)
+# jobs of a dispatch invocation started at the same time
+INFERENCE_BATCH_DISPATCH_CONCURRENCY = 8
+
+INFERENCE_BATCH_INDEX = 'batch_id-createTime-index'
+# what the status of a batch reads from each job, the fields projected into the batch_id index
+INFERENCE_BATCH_JOB_FIELDS = ['InferenceJobId', 'status', 'createTime', 'startTime', 'completeTime', 'image_names',
+                              'result_inference_id', 'sagemakerRaw']
+
+BATCH_TERMINAL_STATUSES = ['succeed', 'failed']
+
+# DynamoDB items are limited to 400KB
+INFERENCE_JOB_ITEM_MAX_BYTES = 400 * 1024
+# larger payloads, img2img ones carry their images inline, are stored at input_body_s3 instead of in the job
+INFERENCE_PAYLOAD_INLINE_MAX_BYTES = int(os.environ.get('INFERENCE_PAYLOAD_INLINE_MAX_BYTES') or 64 * 1024)
+
+
+def parse_batch_payloads(payloads: List[Any]) -> List[str]:
+    """Validates the parameter sets of a batch, objects or json strings, and returns them as payload strings."""
+    if not isinstance(payloads, list) or len(payloads) == 0:
+        raise BadRequestException('payloads must be a non empty list')
+
+    if len(payloads) > INFERENCE_BATCH_MAX_JOBS:
+        raise BadRequestException(f'a batch accepts at most {INFERENCE_BATCH_MAX_JOBS} payloads, '
+                                  f'got {len(payloads)}')
+
+    payload_strings = []
+    for i, payload in enumerate(payloads):
+        if isinstance(payload, str):
+            try:
+                payload = json.loads(payload)
+            except json.JSONDecodeError:
+                raise BadRequestException(f'payloads[{i}] must be valid json string')
+
+        if not isinstance(payload, dict):
+            raise BadRequestException(f'payloads[{i}] must be an object')
+
+        payload_strings.append(json.dumps(payload))
+
+    return payload_strings
+
+
+def is_inline_payload(payload_string: str) -> bool:
+    return len(payload_string.encode()) <= INFERENCE_PAYLOAD_INLINE_MAX_BYTES
+
+
+def check_job_items(items: List[dict]):
+    """Rejects a batch before anything is written if one of its jobs would not fit in an item."""
+    for i, item in enumerate(items):
+        # names and values as json, a little more than DynamoDB counts
+        size = len(json.dumps(item, default=str).encode())
+        if size > INFERENCE_JOB_ITEM_MAX_BYTES:
+            raise BadRequestException(f'the job of payloads[{i}] has {size} bytes, '
+                                      f'more than the {INFERENCE_JOB_ITEM_MAX_BYTES} an inference job can store')
+
+
+def assign_endpoints(scheduler: EndpointScheduler, endpoints: List[Endpoint], count: int,
+                     model_names: List[str] = None) -> List[Endpoint]:
+    """
+    Schedules each job of a batch. The jobs already assigned count as outstanding on their
+    endpoint, so a batch spreads over the endpoints like jobs submitted one by one, without
+    reading the endpoint table again per job.
+    """
+    planned = {ep.EndpointDeploymentJobId: replace(ep, outstanding_jobs=outstanding_jobs(ep)) for ep in endpoints}
+    originals = {ep.EndpointDeploymentJobId: ep for ep in endpoints}
+
+    assigned = []
+    for _ in range(count):
+        selected = scheduler.select(list(planned.values()), model_names)
+        selected.outstanding_jobs += 1
+        assigned.append(originals[selected.EndpointDeploymentJobId])
+
+    return assigned
+
+
+def dispatch_batch_jobs(job_ids: List[str], start: Callable[[str], Any],
+                        max_workers: int = INFERENCE_BATCH_DISPATCH_CONCURRENCY) -> Dict[str, str]:
+    """Starts the jobs concurrently, a job that fails to start does not stop the others."""
+
+    def start_job(job_id: str) -> Optional[str]:
+        try:
+            start(job_id)
+            return None
+        except Exception as e:
+            logger.error(f'failed to start inference {job_id}: {e}', exc_info=True)
+            return str(e)
+
+    failures = {}
+    if not job_ids:
+        return failures
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(job_ids)))) as executor:
+        for job_id, error in zip(job_ids, executor.map(start_job, job_ids)):
+            if error is not None:
+                failures[job_id] = error
+
+    return failures
+
+
+def discard_batch_jobs(ddb_service: DynamoDbUtilsService, table_name: str, job_ids: List[str], reason: str):
+    """
+    Deletes the jobs written for a batch that could not be created whole, they would never be
+    dispatched. A job that cannot be deleted is failed instead, so that none stays created.
+    """
+    result = ddb_service.batch_delete_items({table_name: [{'InferenceJobId': job_id} for job_id in job_ids]})
+    for failure in (result.failures if result else []):
+        job_id = failure.item['InferenceJobId']
+        try:
+            ddb_service.update_item_fields(table_name, {'InferenceJobId': job_id},
+                                           {'status': 'failed', 'sagemakerRaw': reason})
+        except Exception as e:
+            logger.error(f'failed to discard inference {job_id}: {e}')
+
+
+def query_batch_jobs(ddb_service: DynamoDbUtilsService, table_name: str, batch_id: str) -> List[dict]:
+    """Reads the jobs of a batch through the batch_id index, in the order they were created."""
+    query_kwargs = {
+        'TableName': table_name,
+        'IndexName': INFERENCE_BATCH_INDEX,
+        'KeyConditionExpression': 'batch_id = :batch_id',
+        'ExpressionAttributeValues': {':batch_id': {'S': batch_id}},
+        'ProjectionExpression': ', '.join(f'#f{i}' for i in range(len(INFERENCE_BATCH_JOB_FIELDS))),
+        'ExpressionAttributeNames': {f'#f{i}': name for i, name in enumerate(INFERENCE_BATCH_JOB_FIELDS)},
+    }
+
+    jobs = []
+    while True:
+        response = ddb_service.client.query(**query_kwargs)
+        jobs.extend(ddb_service.deserialize(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return jobs
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def summarize_batch(jobs: List[dict]) -> dict:
+    counts = Counter(job.get('status') for job in jobs)
+    finished = sum(counts[status] for status in BATCH_TERMINAL_STATUSES)
+
+    if finished < len(jobs):
+        status = 'inprogress'
+    elif counts['failed'] == 0:
+        status = 'succeed'
+    elif counts['succeed'] == 0:
+        status = 'failed'
+    else:
+        status = 'partially_failed'
+
+    return {
+        'status': status,
+        'total': len(jobs),
+        'counts': dict(counts),
+    }
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# results are reused this long, after that an identical job runs again
+INFERENCE_CACHE_MAX_AGE_SECONDS = int(os.environ.get('INFERENCE_CACHE_MAX_AGE_SECONDS') or 7 * 24 * 3600)
+# an async invocation times out after an hour, an older in-flight entry lost its result notification
+INFERENCE_CACHE_IN_FLIGHT_SECONDS = 3600
+CACHEABLE_TASK_TYPES = ['txt2img', 'img2img']
+
+CACHE_IN_FLIGHT = 'inprogress'
+CACHE_SUCCEED = 'succeed'
+
+ACTION_RUN = 'run'
+ACTION_REUSE = 'reuse'
+ACTION_WAIT = 'wait'
+
+
+def _random_seed(payload: dict) -> bool:
+    try:
+        if int(payload.get('seed', -1)) == -1:
+            return True
+        return float(payload.get('subseed_strength') or 0) > 0 and int(payload.get('subseed', -1)) == -1
+    except (TypeError, ValueError):
+        return True
+
+
+def inference_cache_key(task_type: str, workflow: Optional[str], payload: dict,
+                        used_models: Optional[dict]) -> Optional[str]:
+    """
+    Canonical hash of what decides the images of a job: the task, the parameters the WebUI
+    stores with the result and the exact checkpoints. Jobs with a random seed have no key.
+    """
+    if task_type not in CACHEABLE_TASK_TYPES or not isinstance(payload, dict) or _random_seed(payload):
+        return None
+
+    models = {
+        ckpt_type: sorted((model['id'], model['model_name']) for model in ckpt_models)
+        for ckpt_type, ckpt_models in (used_models or {}).items()
+    }
+    canonical = json.dumps({
+        'task_type': task_type,
+        'workflow': workflow or '',
+        'payload': payload,
+        'models': models,
+    }, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class CacheDecision:
+    action: str
+    # the cache entry of the job that ran, or runs, the identical parameters
+    entry: Optional[dict] = None
+
+
+class InMemoryResultCacheStore:
+    """Keeps cache entries in the process, used by tests and local runs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            return dict(entry) if entry else None
+
+    def claim(self, key: str, inference_id: str, now: float, stale_in_flight: float,
+              stale_result: float) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and not _is_stale(entry, stale_in_flight, stale_result):
+                return dict(entry)
+            self.entries[key] = _new_entry(key, inference_id, now)
+            return None
+
+    def add_waiter(self, key: str, inference_id: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry['status'] != CACHE_IN_FLIGHT:
+                return False
+            entry['waiters'] = entry['waiters'] + [inference_id]
+            return True
+
+    def complete(self, key: str, inference_id: str, image_names: List[str], now: float) -> List[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry['inference_id'] != inference_id:
+                return []
+            entry.update({'status': CACHE_SUCCEED, 'image_names': image_names, 'completed_at': now})
+            return list(entry['waiters'])
+
+    def release(self, key: str, inference_id: str) -> List[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry['inference_id'] != inference_id:
+                return []
+            del self.entries[key]
+            return list(entry['waiters'])
+
+
+class DynamoDbResultCacheStore:
+    """
+    Keeps cache entries in InferenceResultCacheTable, keyed by cache_key. Every transition
+    is a conditional write, so concurrent identical jobs agree on the one that runs.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.table.get_item(Key={'cache_key': key}, ConsistentRead=True).get('Item')
+
+    def claim(self, key: str, inference_id: str, now: float, stale_in_flight: float,
+              stale_result: float) -> Optional[dict]:
+        try:
+            self.table.put_item(
+                Item=_new_entry(key, inference_id, now),
+                ConditionExpression='attribute_not_exists(cache_key) '
+                                    'OR (#s = :in_flight AND created_at < :stale_in_flight) '
+                                    'OR (#s = :succeed AND completed_at < :stale_result)',
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={
+                    ':in_flight': CACHE_IN_FLIGHT,
+                    ':succeed': CACHE_SUCCEED,
+                    ':stale_in_flight': _number(stale_in_flight),
+                    ':stale_result': _number(stale_result),
+                },
+            )
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+        return self.get(key) or {}
+
+    def add_waiter(self, key: str, inference_id: str) -> bool:
+        return self._update(key, 'SET waiters = list_append(waiters, :waiter)', '#s = :in_flight',
+                            {':waiter': [inference_id], ':in_flight': CACHE_IN_FLIGHT}) is not None
+
+    def complete(self, key: str, inference_id: str, image_names: List[str], now: float) -> List[str]:
+        entry = self._update(key, 'SET #s = :succeed, image_names = :image_names, completed_at = :now',
+                             'inference_id = :inference_id',
+                             {':succeed': CACHE_SUCCEED, ':image_names': image_names, ':now': _number(now),
+                              ':inference_id': inference_id})
+        return list(entry.get('waiters', [])) if entry else []
+
+    def release(self, key: str, inference_id: str) -> List[str]:
+        try:
+            resp = self.table.delete_item(
+                Key={'cache_key': key},
+                ConditionExpression='inference_id = :inference_id',
+                ExpressionAttributeValues={':inference_id': inference_id},
+                ReturnValues='ALL_OLD',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            return []
+        return list(resp.get('Attributes', {}).get('waiters', []))
+
+    def _update(self, key: str, update_expression: str, condition: str, values: dict) -> Optional[dict]:
+        kwargs = {}
+        if '#s' in update_expression + condition:
+            kwargs['ExpressionAttributeNames'] = {'#s': 'status'}
+        try:
+            resp = self.table.update_item(
+                Key={'cache_key': key},
+                UpdateExpression=update_expression,
+                ConditionExpression=f'attribute_exists(cache_key) AND {condition}',
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_NEW',
+                **kwargs
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            return None
+        return resp.get('Attributes', {})
+
+
+def _number(value: float):
+    # boto3 rejects floats, whole seconds are precise enough
+    return int(value)
+
+
+def _new_entry(key: str, inference_id: str, now: float) -> dict:
+    return {
+        'cache_key': key,
+        'status': CACHE_IN_FLIGHT,
+        'inference_id': inference_id,
+        'created_at': _number(now),
+        'waiters': [],
+    }
+
+
+def _is_stale(entry: dict, stale_in_flight: float, stale_result: float) -> bool:
+    if entry['status'] == CACHE_IN_FLIGHT:
+        return entry['created_at'] < stale_in_flight
+    return entry.get('completed_at', 0) < stale_result
+
+
+class InferenceResultCache:
+    """
+    Decides whether a job runs on an endpoint, reuses the result of an identical finished job,
+    or waits for an identical job in flight. The first job of a key owns the entry: it completes
+    the entry with its image names, or releases it when it fails, and hands back the jobs that
+    were coalesced into it.
+    """
+
+    def __init__(self, store, clock=time.time, max_age: float = INFERENCE_CACHE_MAX_AGE_SECONDS,
+                 in_flight_seconds: float = INFERENCE_CACHE_IN_FLIGHT_SECONDS):
+        self.store = store
+        self.clock = clock
+        self.max_age = max_age
+        self.in_flight_seconds = in_flight_seconds
+
+    def lookup(self, key: str, inference_id: str) -> CacheDecision:
+        # the entry can change between the reads and writes of other jobs, a few rounds settle it
+        for _ in range(3):
+            now = self.clock()
+            entry = self.store.claim(key, inference_id, now, now - self.in_flight_seconds, now - self.max_age)
+            if entry is None:
+                return CacheDecision(ACTION_RUN)
+
+            if entry.get('status') == CACHE_SUCCEED:
+                logger.info(f"inference {inference_id} reuses the result of {entry['inference_id']}")
+                return CacheDecision(ACTION_REUSE, entry)
+
+            if entry.get('status') == CACHE_IN_FLIGHT and self.store.add_waiter(key, inference_id):
+                logger.info(f"inference {inference_id} waits for identical inference {entry['inference_id']}")
+                return CacheDecision(ACTION_WAIT, entry)
+
+        return CacheDecision(ACTION_RUN)
+
+    def complete(self, key: str, inference_id: str, image_names: List[str]) -> List[str]:
+        return self.store.complete(key, inference_id, image_names, self.clock())
+
+    def release(self, key: str, inference_id: str) -> List[str]:
+        return self.store.release(key, inference_id)
+
+
+def is_waiter(job: dict) -> bool:
+    # jobs that reuse a finished result complete at once, only waiters stay in progress with a result job
+    return job.get('status') == 'inprogress' and bool(job.get('result_inference_id')) \
+        and job['result_inference_id'] != job.get('InferenceJobId')
+
+
+def settle_waiter(job_table, job: dict, now: datetime = None,
+                  in_flight_seconds: float = INFERENCE_CACHE_IN_FLIGHT_SECONDS) -> dict:
+    """
+    A waiter is settled by the result notification of the job it waits for. When that job
+    finished without settling it, was deleted, or did not finish within in_flight_seconds,
+    reading the waiter settles it. Returns the job as it is after settling.
+    """
+    if not is_waiter(job):
+        return job
+
+    now = now or datetime.now()
+    result_id = job['result_inference_id']
+    result_job = job_table.get_item(Key={'InferenceJobId': result_id}).get('Item')
+
+    if result_job and result_job.get('status') == 'succeed':
+        fields = {'status': 'succeed', 'image_names': result_job.get('image_names', [])}
+    elif not result_job:
+        fields = {'status': 'failed', 'sagemakerRaw': f'identical inference {result_id} was deleted'}
+    elif result_job.get('status') == 'failed':
+        fields = {'status': 'failed', 'sagemakerRaw': f'identical inference {result_id} failed'}
+    elif _waited_seconds(job, now) > in_flight_seconds:
+        fields = {'status': 'failed', 'sagemakerRaw': f'identical inference {result_id} did not complete'}
+    else:
+        return job
+
+    fields['completeTime'] = now.isoformat()
+    if not update_waiter(job_table, job['InferenceJobId'], fields):
+        return job_table.get_item(Key={'InferenceJobId': job['InferenceJobId']}).get('Item') or job
+
+    logger.info(f"inference {job['InferenceJobId']} settled from {result_id}: {fields['status']}")
+    return {**job, **fields}
+
+
+def update_waiter(job_table, inference_id: str, fields: dict) -> bool:
+    """Updates a job only while it still waits, so a settled job is never overwritten."""
+    names = {f'#f{i}': name for i, name in enumerate(fields)}
+    values = {f':v{i}': value for i, value in enumerate(fields.values())}
+    try:
+        job_table.update_item(
+            Key={'InferenceJobId': inference_id},
+            UpdateExpression='SET ' + ', '.join(f'#f{i} = :v{i}' for i in range(len(fields))),
+            ConditionExpression='#s = :inprogress',
+            ExpressionAttributeNames={**names, '#s': 'status'},
+            ExpressionAttributeValues={**values, ':inprogress': 'inprogress'},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise e
+        return False
+    return True
+
+
+def _waited_seconds(job: dict, now: datetime) -> float:
+    try:
+        return (now - datetime.fromisoformat(job.get('startTime') or job.get('createTime'))).total_seconds()
+    except (TypeError, ValueError):
+        return 0
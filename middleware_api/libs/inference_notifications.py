@@ -0,0 +1,68 @@
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+from common.excepts import BadRequestException
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+TERMINAL_STATUSES = ['succeed', 'failed']
+
+# a waiting request keeps its Lambda busy, so waits stay short and clients ask again
+MAX_WAIT_SECONDS = 10
+
+WAIT_POLL_MIN_INTERVAL = 1.0
+WAIT_POLL_MAX_INTERVAL = 4.0
+
+
+def parse_wait_seconds(value) -> float:
+    """Reads the wait query parameter, clamped to [0, MAX_WAIT_SECONDS]."""
+    if value is None or value == '':
+        return 0
+
+    try:
+        wait = float(value)
+    except (TypeError, ValueError):
+        raise BadRequestException(f'wait must be a number of seconds, got {value}')
+
+    if not math.isfinite(wait):
+        raise BadRequestException(f'wait must be a finite number of seconds, got {value}')
+
+    return min(max(wait, 0), MAX_WAIT_SECONDS)
+
+
+class JobStatusPoller:
+    """
+    Waits for a job to succeed or fail by reading its status on the server side.
+    There is no push channel between Lambdas: the SNS callback only updates the job
+    item, and this poll reads it with eventually consistent reads and a slow backoff,
+    so a wait costs a handful of reads instead of one client request per second.
+    """
+
+    def __init__(self, table, sleep=time.sleep, clock=time.monotonic):
+        self.table = table
+        self.sleep = sleep
+        self.clock = clock
+
+    def wait(self, inference_id: str, timeout: float) -> Optional[str]:
+        deadline = self.clock() + min(timeout, MAX_WAIT_SECONDS)
+        interval = WAIT_POLL_MIN_INTERVAL
+        while True:
+            resp = self.table.get_item(
+                Key={'InferenceJobId': inference_id},
+                ProjectionExpression='#s',
+                ExpressionAttributeNames={'#s': 'status'},
+            )
+            status = resp.get('Item', {}).get('status')
+            if status in TERMINAL_STATUSES or 'Item' not in resp:
+                return status
+
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return None
+
+            self.sleep(min(interval, remaining))
+            interval = min(interval * 2, WAIT_POLL_MAX_INTERVAL)
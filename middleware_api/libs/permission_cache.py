@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from aws_lambda_powertools import Tracer
+
+from libs.data_types import PARTITION_KEYS, User, Role
+
+tracer = Tracer()
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
+
+# how long a warm Lambda trusts users and roles it has already read
+PERMISSIONS_CACHE_TTL = float(os.environ.get('PERMISSIONS_CACHE_TTL') or 60)
+# how often the shared version marker is read to pick up changes made by other Lambdas
+PERMISSIONS_VERSION_CHECK_INTERVAL = float(os.environ.get('PERMISSIONS_VERSION_CHECK_INTERVAL') or 5)
+
+# every handler that creates or deletes users and roles bumps this item in the multi user table
+VERSION_KEY = {
+    'kind': 'cache',
+    'sort_key': 'permissions_version',
+}
+
+
+class PermissionCache:
+    """
+    Per process cache of users and roles of the multi user table.
+
+    Entries expire after `ttl` seconds. Writers call `invalidate`, which clears the local
+    cache and bumps a version marker so that other warm Lambdas drop their entries the
+    next time they check the marker, at most every `version_check_interval` seconds.
+    """
+
+    def __init__(self, ddb_service, user_table: str,
+                 ttl: float = PERMISSIONS_CACHE_TTL,
+                 version_check_interval: float = PERMISSIONS_VERSION_CHECK_INTERVAL,
+                 clock=time.monotonic):
+        self.ddb_service = ddb_service
+        self.user_table = user_table
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.users: Dict[str, Tuple[float, User]] = {}
+        self.roles: Optional[Tuple[float, Dict[str, Role]]] = None
+        self.version = None
+        self.version_checked_at = None
+
+    def get_user(self, username: str) -> Optional[User]:
+        self._check_version()
+
+        now = self.clock()
+        with self.lock:
+            cached = self.users.get(username)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        user_raw = self.ddb_service.query_items(table=self.user_table, key_values={
+            'kind': PARTITION_KEYS.user,
+            'sort_key': username,
+        })
+        if not user_raw or len(user_raw) == 0:
+            # unknown users are not cached, so that a new user can sign in right away
+            return None
+
+        user = User(**self.ddb_service.deserialize(user_raw[0]))
+        with self.lock:
+            self.users[username] = (now + self.ttl, user)
+
+        return user
+
+    def get_roles(self, role_names: List[str]) -> List[Role]:
+        self._check_version()
+
+        now = self.clock()
+        with self.lock:
+            roles = self.roles[1] if self.roles and self.roles[0] > now else None
+
+        if roles is None:
+            # all roles live in one partition, a single query is cheaper than
+            # scanning the whole table for each request
+            roles = {}
+            for role_raw in self.ddb_service.query_items(table=self.user_table, key_values={
+                'kind': PARTITION_KEYS.role,
+            }):
+                role = Role(**self.ddb_service.deserialize(role_raw))
+                roles[role.sort_key] = role
+            with self.lock:
+                self.roles = (now + self.ttl, roles)
+
+        return [roles[name] for name in role_names or [] if name in roles]
+
+    def clear(self):
+        with self.lock:
+            self.users = {}
+            self.roles = None
+
+    @tracer.capture_method
+    def invalidate(self):
+        self.clear()
+        self.version = str(uuid.uuid4())
+        self.version_checked_at = self.clock()
+        self.ddb_service.put_items(self.user_table, {**VERSION_KEY, 'version': self.version})
+
+    def _check_version(self):
+        now = self.clock()
+        if self.version_checked_at is not None and now - self.version_checked_at < self.version_check_interval:
+            return
+
+        item = self.ddb_service.get_item(self.user_table, VERSION_KEY)
+        version = item.get('version') if item else None
+        if version != self.version:
+            if self.version_checked_at is not None:
+                logger.info(f'permissions version changed from {self.version} to {version}, clear cache')
+            self.clear()
+            self.version = version
+        self.version_checked_at = now
+
+
+_caches: Dict[str, PermissionCache] = {}
+
+
+def get_permission_cache(ddb_service, user_table: str) -> PermissionCache:
+    cache = _caches.get(user_table)
+    if cache is None:
+        cache = _caches[user_table] = PermissionCache(ddb_service, user_table)
+
+    return cache
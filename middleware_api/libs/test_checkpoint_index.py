@@ -0,0 +1,152 @@
+import os
+from unittest import TestCase
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from common.ddb_service.client import DynamoDbUtilsService
+from libs import checkpoint_index
+from libs.checkpoint_index import delete_checkpoint_names, get_checkpoint_by_name, put_checkpoint_names, \
+    rename_checkpoint_name
+from libs.data_types import CheckPoint
+from libs.enums import CheckPointStatus
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+KEYS = {
+    'CheckpointTable': ['id'],
+    'CheckpointNameIndexTable': ['checkpoint_name', 'checkpoint_type'],
+}
+
+
+class FakeCheckpointClient:
+    """Keeps the checkpoint table and the name index in memory and counts the scans."""
+
+    def __init__(self):
+        self.tables = {name: {} for name in KEYS}
+        self.scans = 0
+
+    def key(self, table, item):
+        return tuple(deserializer.deserialize(item[name]) for name in KEYS[table])
+
+    def get_item(self, TableName, Key):
+        item = self.tables[TableName].get(self.key(TableName, Key))
+        return {'Item': item} if item else {}
+
+    def put_item(self, TableName, Item):
+        self.tables[TableName][self.key(TableName, Item)] = Item
+
+    def batch_write_item(self, RequestItems):
+        for table, requests in RequestItems.items():
+            for request in requests:
+                self.put_item(table, request['PutRequest']['Item'])
+        return {}
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeValues=None):
+        item = self.tables[TableName].get(self.key(TableName, Key))
+        if ConditionExpression and (not item or item['checkpoint_id'] != ExpressionAttributeValues[':checkpoint_id']):
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'DeleteItem')
+        self.tables[TableName].pop(self.key(TableName, Key), None)
+
+    def scan(self, TableName, FilterExpression, ExpressionAttributeValues):
+        self.scans += 1
+        name = ExpressionAttributeValues[':checkpointName']['S']
+        ckpt_type = ExpressionAttributeValues[':model_type']['S']
+        items = [item for item in self.tables[TableName].values()
+                 if name in deserializer.deserialize(item['checkpoint_names'])
+                 and item['checkpoint_type']['S'] == ckpt_type]
+        return {'Items': items}
+
+    def index_entry(self, name, ckpt_type='Stable-diffusion'):
+        item = self.tables['CheckpointNameIndexTable'].get((name, ckpt_type))
+        return item['checkpoint_id']['S'] if item else None
+
+
+def checkpoint(ckpt_id, name, status):
+    return CheckPoint(id=ckpt_id, timestamp=1, checkpoint_type='Stable-diffusion', s3_location=f's3://b/{ckpt_id}',
+                      checkpoint_status=status, checkpoint_names=[name])
+
+
+class CheckpointIndexTest(TestCase):
+
+    def setUp(self):
+        self.client = FakeCheckpointClient()
+        self.ddb_service = DynamoDbUtilsService(client=self.client)
+        self.patched = {name: getattr(checkpoint_index, name)
+                        for name in ('ddb_service', 'checkpoint_table', 'checkpoint_name_index_table')}
+        checkpoint_index.ddb_service = self.ddb_service
+        checkpoint_index.checkpoint_table = 'CheckpointTable'
+        checkpoint_index.checkpoint_name_index_table = 'CheckpointNameIndexTable'
+        checkpoint_index._missing_names.clear()
+
+    def tearDown(self):
+        for name, value in self.patched.items():
+            setattr(checkpoint_index, name, value)
+        checkpoint_index._missing_names.clear()
+
+    def save(self, ckpt: CheckPoint):
+        self.ddb_service.put_items('CheckpointTable', ckpt.__dict__)
+
+    def test_pending_upload_does_not_take_the_name_of_an_active_checkpoint(self):
+        active = checkpoint('ckpt-1', 'v1-5.safetensors', CheckPointStatus.Active)
+        self.save(active)
+        put_checkpoint_names(active)
+
+        pending = checkpoint('ckpt-2', 'v1-5.safetensors', CheckPointStatus.Initial)
+        self.save(pending)
+        put_checkpoint_names(pending)
+
+        self.assertEqual(self.client.index_entry('v1-5.safetensors'), 'ckpt-1')
+        self.assertEqual(get_checkpoint_by_name('v1-5.safetensors', 'Stable-diffusion').id, 'ckpt-1')
+        self.assertEqual(self.client.scans, 0)
+
+        # deleting the abandoned upload keeps the entry of the active checkpoint
+        delete_checkpoint_names(['v1-5.safetensors'], 'Stable-diffusion', 'ckpt-2')
+        self.assertEqual(self.client.index_entry('v1-5.safetensors'), 'ckpt-1')
+
+    def test_status_mismatch_falls_back_to_the_active_checkpoint(self):
+        # an entry written by an earlier version for an upload that never completed
+        self.save(checkpoint('ckpt-1', 'v1-5.safetensors', CheckPointStatus.Active))
+        self.save(checkpoint('ckpt-2', 'v1-5.safetensors', CheckPointStatus.Initial))
+        self.client.put_item('CheckpointNameIndexTable', self.ddb_service._serialize(
+            {'checkpoint_name': 'v1-5.safetensors', 'checkpoint_type': 'Stable-diffusion', 'checkpoint_id': 'ckpt-2'}))
+
+        self.assertEqual(get_checkpoint_by_name('v1-5.safetensors', 'Stable-diffusion').id, 'ckpt-1')
+        self.assertEqual(self.client.index_entry('v1-5.safetensors'), 'ckpt-1')
+
+    def test_misses_are_remembered(self):
+        self.assertIsNone(get_checkpoint_by_name('missing.safetensors', 'Stable-diffusion'))
+        self.assertIsNone(get_checkpoint_by_name('missing.safetensors', 'Stable-diffusion'))
+        self.assertEqual(self.client.scans, 1)
+
+        # a checkpoint activated by this process is found right away
+        ckpt = checkpoint('ckpt-3', 'missing.safetensors', CheckPointStatus.Active)
+        self.save(ckpt)
+        put_checkpoint_names(ckpt)
+        self.assertEqual(get_checkpoint_by_name('missing.safetensors', 'Stable-diffusion').id, 'ckpt-3')
+
+    def test_rename_and_delete(self):
+        ckpt = checkpoint('ckpt-1', 'old.safetensors', CheckPointStatus.Active)
+        self.save(ckpt)
+        put_checkpoint_names(ckpt)
+
+        rename_checkpoint_name('ckpt-1', 'Stable-diffusion', 'old.safetensors', 'new.safetensors')
+        self.save(checkpoint('ckpt-1', 'new.safetensors', CheckPointStatus.Active))
+
+        self.assertIsNone(self.client.index_entry('old.safetensors'))
+        self.assertEqual(get_checkpoint_by_name('new.safetensors', 'Stable-diffusion').id, 'ckpt-1')
+
+        delete_checkpoint_names(['new.safetensors'], 'Stable-diffusion', 'ckpt-1')
+        self.client.tables['CheckpointTable'].clear()
+        self.assertIsNone(self.client.index_entry('new.safetensors'))
+        self.assertIsNone(get_checkpoint_by_name('new.safetensors', 'Stable-diffusion'))
+
+    def test_legacy_checkpoint_is_backfilled(self):
+        self.save(checkpoint('ckpt-1', 'legacy.safetensors', CheckPointStatus.Active))
+
+        self.assertEqual(get_checkpoint_by_name('legacy.safetensors', 'Stable-diffusion').id, 'ckpt-1')
+        self.assertEqual(get_checkpoint_by_name('legacy.safetensors', 'Stable-diffusion').id, 'ckpt-1')
+        self.assertEqual(self.client.scans, 1)
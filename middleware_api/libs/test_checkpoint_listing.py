@@ -0,0 +1,150 @@
+import os
+from decimal import Decimal
+from unittest import TestCase
+
+from boto3.dynamodb.conditions import AttributeBase, Size
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('ESD_VERSION', 'v1.0.0-test')
+os.environ.setdefault('ENDPOINT_TABLE_NAME', 'SDEndpointDeploymentJobTable')
+
+from libs.checkpoint_listing import list_checkpoints, CHECKPOINT_TYPE_INDEX
+
+
+def evaluate(condition, item):
+    expression = condition.get_expression()
+    operator = expression['operator']
+    values = expression['values']
+
+    def value(v):
+        if isinstance(v, Size):
+            return len(item.get(v.name) or [])
+        if isinstance(v, AttributeBase):
+            return item.get(v.name)
+        return v
+
+    if operator == 'AND':
+        return all(evaluate(v, item) for v in values)
+    if operator == 'OR':
+        return any(evaluate(v, item) for v in values)
+    if operator == '=':
+        return value(values[0]) == value(values[1])
+    if operator == 'IN':
+        return value(values[0]) in values[1]
+    if operator == 'contains':
+        return value(values[1]) in (value(values[0]) or [])
+    if operator == 'attribute_not_exists':
+        return values[0].name not in item
+    if operator == 'attribute_type':
+        return values[1] == 'NULL' and values[0].name in item and item[values[0].name] is None
+    raise NotImplementedError(operator)
+
+
+class FakeCheckpointTable:
+    """Answers queries on the type index the way DynamoDB does, Limit applies before the filter."""
+
+    def __init__(self, items):
+        self.items = items
+        self.read_items = 0
+
+    def query(self, IndexName, KeyConditionExpression, ScanIndexForward, Limit, FilterExpression=None,
+              ExclusiveStartKey=None):
+        assert IndexName == CHECKPOINT_TYPE_INDEX
+        assert ScanIndexForward is False
+        ckpt_type = KeyConditionExpression.get_expression()['values'][1]
+
+        rows = sorted([item for item in self.items if item['checkpoint_type'] == ckpt_type],
+                      key=lambda item: (item['timestamp'], item['id']), reverse=True)
+        if ExclusiveStartKey:
+            start = (ExclusiveStartKey['timestamp'], ExclusiveStartKey['id'])
+            rows = [item for item in rows if (item['timestamp'], item['id']) < start]
+
+        evaluated = rows[:Limit]
+        self.read_items += len(evaluated)
+        resp = {'Items': [item for item in evaluated if not FilterExpression or evaluate(FilterExpression, item)]}
+        if len(rows) > Limit:
+            last = evaluated[-1]
+            resp['LastEvaluatedKey'] = {'id': last['id'], 'checkpoint_type': ckpt_type, 'timestamp': last['timestamp']}
+
+        return resp
+
+
+def checkpoint(i, ckpt_type='Lora', status='Active', owners=None):
+    return {
+        'id': f'{i:04d}',
+        'checkpoint_type': ckpt_type,
+        'checkpoint_status': status,
+        'timestamp': Decimal(i),
+        'allowed_roles_or_users': owners if owners is not None else ['*'],
+    }
+
+
+class CheckpointListingTest(TestCase):
+
+    def list_all(self, table, per_page, **kwargs):
+        ids = []
+        last_key = None
+        while True:
+            page = list_checkpoints(table, limit=per_page, last_evaluated_key=last_key, **kwargs)
+            self.assertLessEqual(len(page.items), per_page)
+            ids.extend(item['id'] for item in page.items)
+            last_key = page.last_evaluated_key
+            if not last_key:
+                return ids
+
+    def test_pages_cover_all_types_newest_first(self):
+        items = [checkpoint(i, ckpt_type) for i, ckpt_type in
+                 enumerate(['Lora', 'VAE', 'Stable-diffusion'] * 9)]
+        table = FakeCheckpointTable(items)
+
+        ids = self.list_all(table, 4)
+
+        self.assertEqual(ids, [item['id'] for item in sorted(items, key=lambda i: i['timestamp'], reverse=True)])
+
+    def test_filters_by_type_and_status(self):
+        items = [checkpoint(i, 'Lora', 'Active' if i % 3 else 'Disabled') for i in range(30)]
+        items += [checkpoint(100 + i, 'VAE') for i in range(5)]
+        table = FakeCheckpointTable(items)
+
+        ids = self.list_all(table, 7, types=['Lora'], status=['Active'])
+
+        self.assertEqual(ids, [f'{i:04d}' for i in reversed(range(30)) if i % 3])
+
+    def test_visibility(self):
+        items = [
+            checkpoint(1, owners=['alice']),
+            checkpoint(2, owners=['bob']),
+            checkpoint(3, owners=[]),
+            checkpoint(4, owners=['IT Operator']),
+            checkpoint(5, owners=['*']),
+        ]
+        table = FakeCheckpointTable(items)
+
+        ids = self.list_all(table, 10, types=['Lora'], visible_to=['alice', 'IT Operator'])
+        self.assertEqual(ids, ['0005', '0004', '0003', '0001'])
+
+        ids = self.list_all(table, 10, types=['Lora'], roles=['bob', 'alice'])
+        self.assertEqual(ids, ['0002', '0001'])
+
+    def test_page_reads_do_not_grow_with_table(self):
+        table = FakeCheckpointTable([checkpoint(i, 'Lora') for i in range(10000)])
+
+        page = list_checkpoints(table, limit=10, types=['Lora'])
+
+        self.assertEqual(len(page.items), 10)
+        self.assertEqual(table.read_items, 10)
+        self.assertIsNotNone(page.last_evaluated_key)
+
+    def test_restrictive_filter_returns_short_pages_in_order(self):
+        items = [checkpoint(i, 'Lora', 'Active' if i % 50 == 0 else 'Disabled') for i in range(1000)]
+        items += [checkpoint(2000 + i * 10, 'VAE') for i in range(5)] + [checkpoint(5, 'VAE')]
+        table = FakeCheckpointTable(items)
+
+        page = list_checkpoints(table, limit=10, types=['Lora', 'VAE'], status=['Active'])
+        self.assertLessEqual(table.read_items, 2 * 4 * 10)
+        self.assertIsNotNone(page.last_evaluated_key)
+
+        ids = self.list_all(table, 10, types=['Lora', 'VAE'], status=['Active'])
+        expected = sorted([item for item in items if item['checkpoint_status'] == 'Active'],
+                          key=lambda item: item['timestamp'], reverse=True)
+        self.assertEqual(ids, [item['id'] for item in expected])
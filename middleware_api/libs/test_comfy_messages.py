@@ -0,0 +1,91 @@
+import json
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from common.ddb_service.client import DynamoDbUtilsService
+from libs import comfy_messages
+from libs.comfy_messages import parse_records, save_messages
+
+
+class FakeMessageTable:
+    """Stands in for the DynamoDB client of the message table, keys listed in `fail_keys` are never written."""
+
+    def __init__(self, fail_keys=None):
+        self.items = {}
+        self.calls = 0
+        self.fail_keys = fail_keys or set()
+
+    def batch_write_item(self, RequestItems):
+        assert sum(len(requests) for requests in RequestItems.values()) <= 25
+        self.calls += 1
+        unprocessed = {}
+        for table, requests in RequestItems.items():
+            for request in requests:
+                item = request['PutRequest']['Item']
+                key = (item['prompt_id']['S'], int(item['request_time']['N']))
+                if key in self.fail_keys:
+                    unprocessed.setdefault(table, []).append(request)
+                    continue
+                assert key not in self.items
+                self.items[key] = item
+        return {'UnprocessedItems': unprocessed}
+
+    def query(self, prompt_id):
+        """The messages of a prompt, in the shape get_sync_msg returns them."""
+        keys = sorted(key for key in self.items if key[0] == prompt_id)
+        return [json.loads(self.items[key]['message_body']['S']) for key in keys]
+
+
+def records(*messages):
+    return [{'messageId': f'm{i}', 'body': json.dumps(message)} for i, message in enumerate(messages)]
+
+
+def event(prompt_id, name, **data):
+    return {'prompt_id': prompt_id, 'event': name, 'sid': None, 'data': dict(data, prompt_id=prompt_id)}
+
+
+class ComfyMessagesTest(TestCase):
+
+    def test_messages_are_saved_in_order_with_batch_writes(self):
+        table = FakeMessageTable()
+        messages = [event(f'p{i % 30}', 'progress', value=i) for i in range(90)]
+        messages += [event('p0', 'finish'), {'event': 'status', 'data': {}}]
+
+        parsed = parse_records(records(*messages))
+        failed = save_messages(DynamoDbUtilsService(client=table), 'msg', parsed, now_ms=1000)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(parsed), 91)
+        # one item per prompt, 30 items fit in two batch writes
+        self.assertEqual(len(table.items), 30)
+        self.assertEqual(table.calls, 2)
+        saved = [message for item in table.query('p0') for message in item]
+        self.assertEqual([m['data'].get('value') for m in saved], [0, 30, 60, None])
+        self.assertEqual(saved[-1]['event'], 'finish')
+
+    def test_large_messages_are_split_over_items(self):
+        table = FakeMessageTable()
+        image = 'x' * (comfy_messages.MSG_ITEM_MAX_BYTES // 3)
+        messages = [event('p1', 'executed', output=image, index=i) for i in range(3)]
+
+        save_messages(DynamoDbUtilsService(client=table), 'msg', parse_records(records(*messages)), now_ms=1000)
+
+        items = table.query('p1')
+        self.assertEqual(len(items), 2)
+        self.assertEqual([m['data']['index'] for item in items for m in item], [0, 1, 2])
+
+    def test_failed_item_reports_later_records_of_the_prompt(self):
+        messages = [event('p1', 'executing'), event('p2', 'executing'),
+                    event('p1', 'executed', output='x' * comfy_messages.MSG_ITEM_MAX_BYTES), event('p1', 'finish')]
+        # the large message gets an item of its own, p1 is saved in items 1000 to 1002 and p2 in 1003
+        table = FakeMessageTable(fail_keys={('p1', 1000)})
+
+        with patch('common.ddb_service.client.BATCH_WRITE_MAX_RETRIES', 0):
+            failed = save_messages(DynamoDbUtilsService(client=table), 'msg', parse_records(records(*messages)),
+                                   now_ms=1000)
+
+        self.assertEqual(sorted(failed), ['m0', 'm2', 'm3'])
+        self.assertEqual(len(table.query('p2')), 1)
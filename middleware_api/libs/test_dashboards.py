@@ -0,0 +1,117 @@
+import json
+import os
+from unittest import TestCase
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from libs.dashboards import DashboardRecords, dashboard_signature, endpoint_metrics, list_esd_metrics, \
+    workflow_names
+
+
+def metric(name, **dimensions):
+    return {'Namespace': 'ESD', 'MetricName': name,
+            'Dimensions': [{'Name': key, 'Value': value} for key, value in dimensions.items()]}
+
+
+# list_metrics pages as CloudWatch returned them for two endpoints and a workflow
+RECORDED_PAGES = [
+    {'Metrics': [
+        metric('GPUUtilization', Endpoint='sd-async-a', Instance='1', InstanceGPU='gpu0'),
+        metric('InferenceTotal', Workflow='flux'),
+        metric('QueueLatency', Endpoint='sd-async-a'),
+        metric('GPUMemoryUtilization', Endpoint='comfy-async-b', Instance='7', InstanceGPU='gpu0'),
+    ], 'NextToken': '1'},
+    {'Metrics': [
+        metric('InferenceTotal', Endpoint='sd-async-a'),
+        metric('GPUMemoryUtilization', Endpoint='sd-async-a', Instance='1', InstanceGPU='gpu0'),
+        metric('InferenceTotal', Workflow='default'),
+    ]},
+]
+
+
+class FakeCloudWatch:
+
+    class exceptions:
+        class ResourceNotFound(Exception):
+            pass
+
+    def __init__(self, pages=None):
+        self.pages = pages or []
+        self.dashboards = {}
+        self.calls = []
+
+    def get_paginator(self, name):
+        cloudwatch = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                cloudwatch.calls.append((name, kwargs))
+                return iter(cloudwatch.pages)
+
+        return Paginator()
+
+    def get_dashboard(self, DashboardName):
+        self.calls.append(('get_dashboard', DashboardName))
+        if DashboardName not in self.dashboards:
+            raise self.exceptions.ResourceNotFound(DashboardName)
+        return {'DashboardBody': self.dashboards[DashboardName]}
+
+    def put_dashboard(self, DashboardName, DashboardBody):
+        self.calls.append(('put_dashboard', DashboardName))
+        self.dashboards[DashboardName] = DashboardBody
+
+
+def body(build_time, metrics):
+    return {'widgets': [
+        {'type': 'text', 'properties': {'markdown': f'## ESD \n Last Build Time: {build_time}'}},
+        {'type': 'metric', 'properties': {'metrics': metrics}},
+    ]}
+
+
+class DashboardsTest(TestCase):
+
+    def test_recorded_metrics_are_grouped_by_endpoint(self):
+        cloudwatch = FakeCloudWatch(RECORDED_PAGES)
+
+        metrics = list_esd_metrics(cloudwatch)
+        by_endpoint = endpoint_metrics(metrics)
+
+        self.assertEqual(cloudwatch.calls, [('list_metrics', {'Namespace': 'ESD'})])
+        self.assertEqual(sorted(by_endpoint), ['comfy-async-b', 'sd-async-a'])
+        self.assertEqual([m['MetricName'] for m in by_endpoint['sd-async-a']],
+                         ['GPUMemoryUtilization', 'GPUUtilization', 'InferenceTotal'])
+        self.assertEqual(workflow_names(metrics), ['default', 'flux'])
+
+        # the order list_metrics returns them in does not change the grouping
+        reversed_pages = [{'Metrics': list(reversed(page['Metrics']))} for page in reversed(RECORDED_PAGES)]
+        self.assertEqual(endpoint_metrics(list_esd_metrics(FakeCloudWatch(reversed_pages))), by_endpoint)
+
+    def test_build_time_is_not_part_of_the_signature(self):
+        self.assertEqual(dashboard_signature(body('10:00', [['ESD', 'GPUUtilization']])),
+                         dashboard_signature(body('10:01', [['ESD', 'GPUUtilization']])))
+        self.assertNotEqual(dashboard_signature(body('10:00', [['ESD', 'GPUUtilization']])),
+                            dashboard_signature(body('10:00', [['ESD', 'GPUMemoryUtilization']])))
+
+    def test_only_changed_dashboards_are_put(self):
+        cloudwatch = FakeCloudWatch()
+        cloudwatch.dashboards['sd-async-a'] = json.dumps(body('yesterday', [['ESD', 'GPUUtilization']]))
+        records = DashboardRecords(cloudwatch)
+
+        for minute in range(5):
+            for name, metrics in [('sd-async-a', [['ESD', 'GPUUtilization']]), ('comfy-async-b', [])]:
+                desired = body(f'10:0{minute}', metrics)
+                if not records.is_current(name, desired):
+                    records.put(name, desired)
+
+        # each dashboard is read once, only the missing one is written
+        self.assertEqual(cloudwatch.calls, [('get_dashboard', 'sd-async-a'), ('get_dashboard', 'comfy-async-b'),
+                                            ('put_dashboard', 'comfy-async-b')])
+
+        changed = body('10:05', [['ESD', 'GPUUtilization'], ['ESD', 'InferenceTotal']])
+        self.assertFalse(records.is_current('sd-async-a', changed))
+        records.put('sd-async-a', changed)
+        self.assertTrue(records.is_current('sd-async-a', body('10:06', changed['widgets'][1]['properties']['metrics'])))
+
+        records.forget('comfy-async-b')
+        del cloudwatch.dashboards['comfy-async-b']
+        self.assertFalse(records.is_current('comfy-async-b', body('10:07', [])))
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from common.ddb_service.client import BatchWriteFailure, BatchWriteResult
+from libs.dataset_crop import CropTask, crop_dataset_items, crop_image, save_dataset_items
+from libs.enums import DataStatus
+
+
+class FakeS3:
+    """Stands in for the S3 client, objects are files under a local folder."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def download_file(self, bucket, key, filename):
+        shutil.copyfile(self._path(key), filename)
+
+    def upload_file(self, filename, bucket, key):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        shutil.copyfile(filename, self._path(key))
+
+
+class FakeDdbService:
+
+    def __init__(self, fail_names=()):
+        self.written = []
+        self.fail_names = fail_names
+
+    def batch_put_items(self, table_items):
+        result = BatchWriteResult()
+        for table, items in table_items.items():
+            for item in items:
+                if item['name'] in self.fail_names:
+                    result.failures.append(BatchWriteFailure(table, 'put', item, 'throttled'))
+                else:
+                    self.written.append(item)
+                    result.written += 1
+        return result
+
+
+class DatasetCropTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.s3 = FakeS3(os.path.join(self.tmp.name, 's3'))
+        self.work_dir = os.path.join(self.tmp.name, 'work')
+        os.makedirs(self.work_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def put_image(self, key, size):
+        path = self.s3._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', size, (255, 0, 0)).save(path)
+
+    def test_crop_covers_then_center_crops(self):
+        src = os.path.join(self.tmp.name, 'wide.png')
+        pixels = np.zeros((200, 400, 3), dtype=np.uint8)
+        # a green stripe in the middle is kept by the center crop
+        pixels[:, 180:220] = (0, 255, 0)
+        Image.fromarray(pixels).save(src)
+        dst = os.path.join(self.tmp.name, 'wide_crop.png')
+
+        crop_image(src, dst, 100, 100)
+
+        cropped = np.array(Image.open(dst))
+        self.assertEqual(cropped.shape, (100, 100, 3))
+        self.assertEqual(tuple(cropped[50, 50]), (0, 255, 0))
+        self.assertEqual(tuple(cropped[50, 0]), (0, 0, 0))
+
+    def test_small_and_grayscale_images_are_padded(self):
+        src = os.path.join(self.tmp.name, 'small.png')
+        Image.new('L', (40, 20), 200).save(src)
+        dst = os.path.join(self.tmp.name, 'small_crop.png')
+
+        crop_image(src, dst, 64, 64)
+
+        cropped = np.array(Image.open(dst))
+        self.assertEqual(cropped.shape, (64, 64))
+        self.assertEqual(cropped[32, 32], 200)
+        self.assertEqual(cropped[0, 0], 0)
+
+    def test_batch_is_cropped_in_processes_and_saved_together(self):
+        tasks = []
+        for i in range(6):
+            self.put_image(f'dataset/cats/img/{i}.png', (300 + i * 10, 200))
+            tasks.append(CropTask(name=f'{i}.png', type='image', old_s3_location=f'dataset/cats/img/{i}.png',
+                                  user_roles=['IT']))
+        with open(self.s3._path('dataset/cats/img/0.txt'), 'w') as f:
+            f.write('a cat')
+        tasks.append(CropTask(name='0.txt', type='text', old_s3_location='dataset/cats/img/0.txt'))
+        with open(self.s3._path('dataset/cats/img/broken.png'), 'wb') as f:
+            f.write(b'not an image')
+        tasks.append(CropTask(name='broken.png', type='image', old_s3_location='dataset/cats/img/broken.png'))
+        tasks.append(CropTask(name='gone.png', type='image', old_s3_location='dataset/cats/img/gone.png'))
+
+        result = crop_dataset_items(self.s3, 'bucket', 'cats_128x96', 'img', '128x96', tasks,
+                                    work_dir=self.work_dir, processes=2, io_workers=3)
+
+        for i in range(6):
+            with Image.open(self.s3._path(f'dataset/cats_128x96/img/{i}.png')) as image:
+                self.assertEqual(image.size, (128, 96))
+        with open(self.s3._path('dataset/cats_128x96/img/0.txt')) as f:
+            self.assertEqual(f.read(), 'a cat')
+        self.assertEqual(sorted(result.failed), ['broken.png', 'gone.png'])
+        self.assertTrue(result.failed['gone.png'].startswith('download failed'))
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+        statuses = {item.name: item.data_status for item in result.items}
+        self.assertEqual(len(statuses), 9)
+        self.assertEqual(statuses['broken.png'], DataStatus.Disabled)
+        self.assertEqual(statuses['0.txt'], DataStatus.Enabled)
+
+        ddb = FakeDdbService(fail_names=['3.png'])
+        self.assertEqual(save_dataset_items(ddb, 'items', result.items), ['3.png'])
+        self.assertEqual(len(ddb.written), 8)
+        self.assertEqual(ddb.written[0]['allowed_roles_or_users'], ['IT'])
@@ -0,0 +1,139 @@
+import os
+from unittest import TestCase
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from common.ddb_service.client import DynamoDbUtilsService
+from libs.endpoint_directory import ENDPOINT_NAME_INDEX, ENDPOINT_STATUS_INDEX, EndpointDirectory
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+class FakeEndpointClient:
+    """Answers index queries of the endpoint table the way DynamoDB does, and counts what they read."""
+
+    def __init__(self, items):
+        self.items = {item['EndpointDeploymentJobId']: item for item in items}
+        self.read_items = 0
+        self.scans = 0
+        self.writes = 0
+
+    def scan(self, **kwargs):
+        self.scans += 1
+        raise AssertionError('the endpoint table must not be scanned')
+
+    def query(self, TableName, IndexName, KeyConditionExpression, ExpressionAttributeValues, ScanIndexForward,
+              Limit=None, ExclusiveStartKey=None):
+        key_name = {ENDPOINT_NAME_INDEX: 'endpoint_name', ENDPOINT_STATUS_INDEX: 'endpoint_status'}[IndexName]
+        assert KeyConditionExpression == f'{key_name} = :value'
+        key_value = ExpressionAttributeValues[':value']['S']
+
+        rows = sorted([item for item in self.items.values() if item.get(key_name) == key_value],
+                      key=lambda item: (item['startTime'], item['EndpointDeploymentJobId']),
+                      reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = (ExclusiveStartKey['startTime']['S'], ExclusiveStartKey['EndpointDeploymentJobId']['S'])
+            rows = [item for item in rows if (item['startTime'], item['EndpointDeploymentJobId']) < start]
+
+        evaluated = rows[:Limit] if Limit else rows
+        self.read_items += len(evaluated)
+        resp = {'Items': [{k: serializer.serialize(v) for k, v in item.items()} for item in evaluated]}
+        if Limit and len(rows) > Limit:
+            last = evaluated[-1]
+            resp['LastEvaluatedKey'] = {name: serializer.serialize(last[name])
+                                        for name in ('EndpointDeploymentJobId', key_name, 'startTime')}
+        return resp
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression, ExpressionAttributeNames,
+                    ExpressionAttributeValues):
+        self.writes += 1
+        item = self.items[Key['EndpointDeploymentJobId']['S']]
+        for assignment in UpdateExpression[len('SET '):].split(', '):
+            name, value = assignment.split(' = ')
+            item[ExpressionAttributeNames[name]] = deserializer.deserialize(ExpressionAttributeValues[value])
+
+
+def endpoint(i, name, endpoint_status, roles=None, **fields):
+    return {
+        'EndpointDeploymentJobId': f'ep-{i:04d}',
+        'endpoint_name': name,
+        'endpoint_status': endpoint_status,
+        'startTime': f'2024-05-01T10:{i // 60:02d}:{i % 60:02d}',
+        'owner_group_or_role': roles or ['IT Operator'],
+        **fields,
+    }
+
+
+class EndpointDirectoryTest(TestCase):
+
+    def setUp(self):
+        # a long endpoint history: a name recreated many times, most of it deleted
+        items = [endpoint(i, 'sd-async-test', 'Deleted') for i in range(200)]
+        items += [
+            endpoint(200, 'sd-async-test', 'InService', roles=['designer']),
+            endpoint(201, 'comfy-async-flux', 'Updating', roles=['flux']),
+            endpoint(202, 'sd-real-time-test', 'Failed'),
+            # legacy row, deleted before endpoint_status existed
+            endpoint(203, 'sd-async-legacy', 'InService', roles=['legacy'], status='deleted'),
+            # stored as the SageMaker event sent it
+            endpoint(204, 'sd-async-patching', 'SYSTEM_UPDATING', roles=['patched']),
+        ]
+        self.client = FakeEndpointClient(items)
+        self.directory = EndpointDirectory('SDEndpointDeploymentJobTable', DynamoDbUtilsService(client=self.client))
+
+    def test_name_resolves_to_the_newest_endpoint_not_deleted(self):
+        ep = self.directory.get_by_name('sd-async-test')
+
+        self.assertEqual((ep.EndpointDeploymentJobId, ep.endpoint_status), ('ep-0200', 'InService'))
+        self.assertIsNone(self.directory.get_by_name('sd-async-missing'))
+
+        self.client.items['ep-0200']['endpoint_status'] = 'Deleted'
+        self.assertEqual(self.directory.get_by_name('sd-async-test').EndpointDeploymentJobId, 'ep-0200')
+
+    def test_role_lookups_read_only_the_active_endpoints(self):
+        role, ep = self.directory.find_role_owner(['nobody', 'designer'])
+
+        self.assertEqual((role, ep.endpoint_name), ('designer', 'sd-async-test'))
+        self.assertIsNone(self.directory.find_role_owner(['legacy']))
+        self.assertEqual([e.endpoint_name for e in self.directory.list_by_role('flux')], ['comfy-async-flux'])
+        # none of the 200 deleted endpoints was read
+        self.assertLess(self.client.read_items, 20)
+        self.assertEqual(self.client.scans, 0)
+
+    def test_legacy_deleted_endpoint_is_left_out_without_writes(self):
+        serving = self.directory.list_active(['InService', 'Updating'])
+
+        self.assertEqual([e.endpoint_name for e in serving], ['sd-async-test', 'comfy-async-flux'])
+        self.assertEqual(self.client.items['ep-0203']['endpoint_status'], 'InService')
+        self.assertEqual(self.client.writes, 0)
+
+    def test_endpoints_in_unmapped_sagemaker_statuses_stay_active(self):
+        self.assertIn('sd-async-patching', [e.endpoint_name for e in self.directory.list_active()])
+        role, ep = self.directory.find_role_owner(['patched'])
+        self.assertEqual(ep.EndpointDeploymentJobId, 'ep-0204')
+
+    def test_archive(self):
+        self.directory.archive(self.directory.get_by_name('sd-async-test'))
+
+        self.assertEqual(self.client.items['ep-0200']['endpoint_status'], 'Deleted')
+        self.assertEqual(self.client.items['ep-0200']['current_instance_count'], 0)
+        self.assertIsNone(self.directory.find_role_owner(['designer']))
+
+    def test_pages_continue_across_statuses(self):
+        statuses = ['InService', 'Updating', 'Failed', 'Deleted']
+        seen = []
+        start_key = None
+        while True:
+            page, start_key = self.directory.list_by_status(statuses, limit=3, start_key=start_key)
+            self.assertLessEqual(len(page), 3)
+            seen.extend(e.EndpointDeploymentJobId for e in page)
+            if not start_key:
+                break
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(seen[:3], ['ep-0200', 'ep-0201', 'ep-0202'])
+        # the legacy row is left out of the InService partition it is still stored under
+        self.assertEqual(len(seen), 203)
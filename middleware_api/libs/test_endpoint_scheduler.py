@@ -0,0 +1,75 @@
+import random
+from unittest import TestCase
+
+from libs.data_types import Endpoint
+from libs.endpoint_scheduler import EndpointScheduler, merge_recent_models, outstanding_jobs, RECENT_MODELS_LIMIT, \
+    OUTSTANDING_JOBS_TTL_SECONDS
+
+
+def endpoint(name, outstanding=0, instances='1', models=None):
+    return Endpoint(
+        EndpointDeploymentJobId=name,
+        endpoint_name=name,
+        endpoint_status='InService',
+        current_instance_count=instances,
+        outstanding_jobs=outstanding,
+        recent_models=models,
+    )
+
+
+class EndpointSchedulerTest(TestCase):
+
+    def test_least_outstanding(self):
+        scheduler = EndpointScheduler('least_outstanding', random.Random(0))
+        endpoints = [endpoint('busy', 10), endpoint('idle', 0), endpoint('medium', 3)]
+
+        for _ in range(20):
+            self.assertEqual(scheduler.select(endpoints).endpoint_name, 'idle')
+
+    def test_least_outstanding_per_instance(self):
+        scheduler = EndpointScheduler('least_outstanding', random.Random(0))
+        endpoints = [endpoint('single', 2, '1'), endpoint('scaled', 4, '4')]
+
+        self.assertEqual(scheduler.select(endpoints).endpoint_name, 'scaled')
+
+    def test_backlog_weighted_prefers_idle(self):
+        scheduler = EndpointScheduler('backlog_weighted', random.Random(0))
+        endpoints = [endpoint('busy', 20), endpoint('idle', 0)]
+
+        picked = [scheduler.select(endpoints).endpoint_name for _ in range(1000)]
+
+        self.assertGreater(picked.count('idle'), picked.count('busy') * 5)
+
+    def test_model_affinity(self):
+        scheduler = EndpointScheduler('model_affinity', random.Random(0))
+        endpoints = [endpoint('cold', 0), endpoint('warm', 1, models=['sdxl.safetensors'])]
+
+        for _ in range(20):
+            self.assertEqual(scheduler.select(endpoints, ['sdxl.safetensors']).endpoint_name, 'warm')
+
+    def test_model_affinity_ignores_overloaded_warm_endpoint(self):
+        scheduler = EndpointScheduler('model_affinity', random.Random(0))
+        endpoints = [endpoint('cold', 0), endpoint('warm', 30, models=['sdxl.safetensors'])]
+
+        picked = [scheduler.select(endpoints, ['sdxl.safetensors']).endpoint_name for _ in range(100)]
+
+        self.assertGreater(picked.count('cold'), picked.count('warm'))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(Exception):
+            EndpointScheduler('round_robin')
+
+    def test_merge_recent_models(self):
+        self.assertEqual(merge_recent_models(['a', 'b'], ['a']), ['b', 'a'])
+        self.assertEqual(merge_recent_models(None, ['a']), ['a'])
+
+        names = [str(i) for i in range(RECENT_MODELS_LIMIT)]
+        self.assertEqual(merge_recent_models(names, ['new'])[-1], 'new')
+        self.assertEqual(len(merge_recent_models(names, ['new'])), RECENT_MODELS_LIMIT)
+
+    def test_stale_outstanding_jobs_are_ignored(self):
+        ep = endpoint('sd-async-a', outstanding=3)
+        ep.outstanding_jobs_updated = 1000
+
+        self.assertEqual(outstanding_jobs(ep, now=1000 + OUTSTANDING_JOBS_TTL_SECONDS), 3)
+        self.assertEqual(outstanding_jobs(ep, now=1001 + OUTSTANDING_JOBS_TTL_SECONDS), 0)
@@ -0,0 +1,139 @@
+import io
+import os
+from unittest import TestCase
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from libs.execute_logs import ExecuteLogs, LOGS_RUNNING_CACHE_SECONDS
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FakeS3:
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body.encode()
+
+
+def row(message):
+    return [{'field': '@timestamp', 'value': '2024-05-01 10:00:00.000'},
+            {'field': '@message', 'value': message},
+            {'field': '@logStream', 'value': 'AllTraffic/i-1'}]
+
+
+class FakeLogs:
+    """Returns scripted query states, one per get_query_results call of each query."""
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.queries = {}
+        self.started = []
+        self.polls = 0
+
+    def start_query(self, **kwargs):
+        query_id = f'query-{len(self.started)}'
+        self.started.append(kwargs)
+        self.queries[query_id] = list(self.scripts.pop(0))
+        return {'queryId': query_id}
+
+    def get_query_results(self, queryId):
+        self.polls += 1
+        states = self.queries[queryId]
+        status, messages = states.pop(0) if len(states) > 1 else states[0]
+        return {'status': status, 'results': [row(m) for m in messages]}
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ExecuteLogsTest(TestCase):
+
+    def setUp(self):
+        self.s3 = FakeS3()
+        self.clock = Clock()
+
+    def execute_logs(self, logs, wait_seconds=1):
+        return ExecuteLogs(logs, self.s3, 'bucket', wait_seconds=wait_seconds, poll_seconds=0.5,
+                           clock=self.clock, sleep=self.clock.sleep)
+
+    def get(self, execute_logs, finished=True, next_token=None):
+        return execute_logs.get('prompt-1', 'comfy-async-ep', '2024-05-01T10:00:00.000000', finished,
+                                next_token=next_token)
+
+    def test_running_query_returns_partial_results_and_is_reused(self):
+        logs = FakeLogs([('Running', ['a']), ('Running', ['a']), ('Running', ['a']),
+                         ('Running', ['a', 'b']), ('Complete', ['a', 'b', 'c'])])
+        execute_logs = self.execute_logs(logs)
+
+        first = self.get(execute_logs)
+        self.assertEqual(first.status, 'Running')
+        self.assertEqual([r['message'] for r in first.results], ['a'])
+        self.assertEqual(first.next_token, 'query-0')
+        # waited at most wait_seconds
+        self.assertLessEqual(self.clock.now - 1000.0, 1)
+
+        # a second click, with or without the token, follows the same query
+        second = self.get(execute_logs)
+        third = self.get(execute_logs, next_token=second.next_token)
+
+        self.assertEqual(len(logs.started), 1)
+        self.assertEqual(third.status, 'Complete')
+        self.assertIsNone(third.next_token)
+        self.assertEqual([r['message'] for r in third.results], ['a', 'b', 'c'])
+        self.assertIn('comfy-async-ep', logs.started[0]['logGroupName'])
+
+    def test_completed_results_are_cached(self):
+        logs = FakeLogs([('Complete', ['done'])])
+        execute_logs = self.execute_logs(logs)
+
+        self.get(execute_logs)
+        polls = logs.polls
+        self.clock.now += 3600
+        cached = self.get(execute_logs)
+
+        self.assertTrue(cached.cached)
+        self.assertEqual(cached.results[0]['message'], 'done')
+        self.assertEqual((len(logs.started), logs.polls), (1, polls))
+
+    def test_results_of_a_running_execution_expire(self):
+        logs = FakeLogs([('Complete', ['first'])], [('Complete', ['first', 'second'])])
+        execute_logs = self.execute_logs(logs)
+
+        self.get(execute_logs, finished=False)
+        self.assertTrue(self.get(execute_logs, finished=False).cached)
+        self.clock.now += LOGS_RUNNING_CACHE_SECONDS + 1
+        later = self.get(execute_logs, finished=True)
+
+        self.assertFalse(later.cached)
+        self.assertEqual([r['message'] for r in later.results], ['first', 'second'])
+        self.assertEqual(len(logs.started), 2)
+
+    def test_failed_query_is_started_again(self):
+        logs = FakeLogs([('Failed', [])], [('Complete', ['ok'])])
+        execute_logs = self.execute_logs(logs)
+
+        self.assertEqual(self.get(execute_logs).status, 'Failed')
+        self.assertEqual(self.get(execute_logs).status, 'Complete')
+        self.assertEqual(len(logs.started), 2)
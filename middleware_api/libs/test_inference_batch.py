@@ -0,0 +1,170 @@
+import json
+import os
+import random
+import threading
+from collections import Counter
+from unittest import TestCase
+from unittest.mock import patch
+
+from boto3.dynamodb.types import TypeSerializer
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from common.ddb_service.client import DynamoDbUtilsService
+from common.excepts import BadRequestException
+from libs.data_types import Endpoint
+from libs.endpoint_scheduler import EndpointScheduler, STRATEGY_LEAST_OUTSTANDING
+from libs.inference_batch import INFERENCE_BATCH_INDEX, INFERENCE_BATCH_MAX_JOBS, INFERENCE_JOB_ITEM_MAX_BYTES, \
+    assign_endpoints, check_job_items, discard_batch_jobs, dispatch_batch_jobs, is_inline_payload, \
+    parse_batch_payloads, query_batch_jobs, summarize_batch
+
+serializer = TypeSerializer()
+
+
+class FakeBatchClient:
+    """Answers queries of the batch_id index a page at a time."""
+
+    def __init__(self, items, page_size):
+        self.items = items
+        self.page_size = page_size
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        assert kwargs['IndexName'] == INFERENCE_BATCH_INDEX
+        batch_id = kwargs['ExpressionAttributeValues'][':batch_id']['S']
+        fields = [kwargs['ExpressionAttributeNames'][name] for name in kwargs['ProjectionExpression'].split(', ')]
+
+        rows = [item for item in self.items if item['batch_id'] == batch_id]
+        start = kwargs.get('ExclusiveStartKey', {}).get('position', 0)
+        page = rows[start:start + self.page_size]
+        resp = {'Items': [{k: serializer.serialize(v) for k, v in item.items() if k in fields} for item in page]}
+        if start + self.page_size < len(rows):
+            resp['LastEvaluatedKey'] = {'position': start + self.page_size}
+        return resp
+
+
+class FakeDiscardClient:
+    """Leaves the deletes of some jobs unprocessed and records the updates."""
+
+    def __init__(self, undeletable):
+        self.undeletable = undeletable
+        self.deleted = []
+        self.updated = {}
+
+    def batch_write_item(self, RequestItems):
+        unprocessed = {}
+        for table, requests in RequestItems.items():
+            for request in requests:
+                job_id = request['DeleteRequest']['Key']['InferenceJobId']['S']
+                if job_id in self.undeletable:
+                    unprocessed.setdefault(table, []).append(request)
+                else:
+                    self.deleted.append(job_id)
+        return {'UnprocessedItems': unprocessed}
+
+    def update_item(self, Key, ExpressionAttributeNames, ExpressionAttributeValues, **kwargs):
+        fields = {name: ExpressionAttributeValues[f':v{placeholder[2:]}']
+                  for placeholder, name in ExpressionAttributeNames.items() if placeholder.startswith('#f')}
+        self.updated[Key['InferenceJobId']['S']] = fields
+
+
+class ParseBatchPayloadsTest(TestCase):
+
+    def test_objects_and_json_strings_become_payload_strings(self):
+        payloads = parse_batch_payloads([{'prompt': 'a cat', 'seed': 1}, '{"prompt": "a dog"}'])
+
+        self.assertEqual([json.loads(p)['prompt'] for p in payloads], ['a cat', 'a dog'])
+
+    def test_invalid_batches_are_rejected(self):
+        for payloads in [[], None, ['{"prompt": '], [['a cat']],
+                         [{'prompt': 'a cat'}] * (INFERENCE_BATCH_MAX_JOBS + 1)]:
+            with self.assertRaises(BadRequestException):
+                parse_batch_payloads(payloads)
+
+
+class JobItemsTest(TestCase):
+
+    def test_large_payloads_are_not_inline_and_oversized_jobs_are_rejected(self):
+        self.assertTrue(is_inline_payload(json.dumps({'prompt': 'a cat'})))
+        self.assertFalse(is_inline_payload(json.dumps({'init_images': ['a' * 1024 * 1024]})))
+
+        check_job_items([{'InferenceJobId': 'job-0', 'payload_string': '{"prompt": "a cat"}'}])
+        with self.assertRaises(BadRequestException) as e:
+            check_job_items([{'InferenceJobId': 'job-0'},
+                             {'InferenceJobId': 'job-1', 'params': {'used_models': 'a' * INFERENCE_JOB_ITEM_MAX_BYTES}}])
+        self.assertIn('payloads[1]', str(e.exception))
+
+    def test_written_jobs_of_a_failed_batch_do_not_stay_created(self):
+        client = FakeDiscardClient(undeletable={'job-2'})
+
+        with patch('common.ddb_service.client.BATCH_WRITE_MAX_RETRIES', 0):
+            discard_batch_jobs(DynamoDbUtilsService(client=client), 'SDInferenceJobTable',
+                               ['job-0', 'job-1', 'job-2'], 'failed to create 1 of 4 jobs')
+
+        self.assertEqual(sorted(client.deleted), ['job-0', 'job-1'])
+        self.assertEqual(client.updated, {'job-2': {'status': {'S': 'failed'},
+                                                    'sagemakerRaw': {'S': 'failed to create 1 of 4 jobs'}}})
+
+
+class AssignEndpointsTest(TestCase):
+
+    def test_batch_spreads_by_backlog_without_touching_the_endpoints(self):
+        busy = Endpoint(EndpointDeploymentJobId='ep-busy', endpoint_name='sd-async-busy', outstanding_jobs=4)
+        idle = Endpoint(EndpointDeploymentJobId='ep-idle', endpoint_name='sd-async-idle', outstanding_jobs=0)
+        scheduler = EndpointScheduler(STRATEGY_LEAST_OUTSTANDING, rng=random.Random(7))
+
+        assigned = assign_endpoints(scheduler, [busy, idle], 6)
+
+        self.assertEqual(Counter(ep.endpoint_name for ep in assigned), {'sd-async-idle': 5, 'sd-async-busy': 1})
+        # the first jobs go to the idle endpoint until it is as busy as the other one
+        self.assertEqual([ep.endpoint_name for ep in assigned[:4]], ['sd-async-idle'] * 4)
+        self.assertIs(assigned[0], idle)
+        self.assertEqual((busy.outstanding_jobs, idle.outstanding_jobs), (4, 0))
+
+
+class DispatchBatchJobsTest(TestCase):
+
+    def test_failed_jobs_are_reported_and_do_not_stop_the_others(self):
+        started = []
+        lock = threading.Lock()
+
+        def start(job_id):
+            if job_id == 'job-3':
+                raise Exception('endpoint is not ready')
+            with lock:
+                started.append(job_id)
+
+        failures = dispatch_batch_jobs([f'job-{i}' for i in range(10)], start, max_workers=4)
+
+        self.assertEqual(failures, {'job-3': 'endpoint is not ready'})
+        self.assertEqual(len(started), 9)
+        self.assertEqual(dispatch_batch_jobs([], start), {})
+
+
+class BatchStatusTest(TestCase):
+
+    def test_jobs_are_read_through_the_index_without_payloads(self):
+        items = [{'InferenceJobId': f'job-{i}', 'batch_id': 'batch-1', 'createTime': '2024-05-01T10:00:00',
+                  'status': 'succeed' if i < 3 else 'inprogress', 'payload_string': '{"prompt": "a cat"}'}
+                 for i in range(5)]
+        items.append({'InferenceJobId': 'other', 'batch_id': 'batch-2', 'createTime': '2024-05-01T10:00:00',
+                      'status': 'failed'})
+        client = FakeBatchClient(items, page_size=2)
+
+        jobs = query_batch_jobs(DynamoDbUtilsService(client=client), 'SDInferenceJobTable', 'batch-1')
+
+        self.assertEqual([job['InferenceJobId'] for job in jobs], [f'job-{i}' for i in range(5)])
+        self.assertNotIn('payload_string', jobs[0])
+        self.assertEqual(len(client.queries), 3)
+        self.assertEqual(summarize_batch(jobs), {'status': 'inprogress', 'total': 5,
+                                                 'counts': {'succeed': 3, 'inprogress': 2}})
+
+    def test_finished_batch_status(self):
+        def status(*statuses):
+            return summarize_batch([{'status': s} for s in statuses])['status']
+
+        self.assertEqual(status('succeed', 'succeed'), 'succeed')
+        self.assertEqual(status('failed', 'failed'), 'failed')
+        self.assertEqual(status('succeed', 'failed'), 'partially_failed')
+        self.assertEqual(status('succeed', 'created'), 'inprogress')
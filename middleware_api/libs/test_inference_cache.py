@@ -0,0 +1,153 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from libs.inference_cache import ACTION_REUSE, ACTION_RUN, ACTION_WAIT, InMemoryResultCacheStore, \
+    InferenceResultCache, inference_cache_key, settle_waiter
+
+USED_MODELS = {'Stable-diffusion': [{'id': 'ckpt-1', 'model_name': 'v1-5-pruned-emaonly.safetensors',
+                                     's3': 's3://bucket/ckpt-1', 'type': 'Stable-diffusion'}]}
+
+
+def txt2img(**changes):
+    payload = {'prompt': 'a cat', 'negative_prompt': '', 'seed': 42, 'steps': 20, 'cfg_scale': 7,
+               'width': 512, 'height': 512, 'sampler_name': 'Euler a', 'batch_size': 1}
+    payload.update(changes)
+    return payload
+
+
+class FakeJobTable:
+    """Jobs by id, updates apply only while the job is in progress."""
+
+    def __init__(self, jobs):
+        self.jobs = {job['InferenceJobId']: dict(job) for job in jobs}
+
+    def get_item(self, Key):
+        job = self.jobs.get(Key['InferenceJobId'])
+        return {'Item': dict(job)} if job else {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeNames,
+                    ExpressionAttributeValues):
+        job = self.jobs.get(Key['InferenceJobId'])
+        if not job or job['status'] != ExpressionAttributeValues[':inprogress']:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+        for assignment in UpdateExpression[len('SET '):].split(', '):
+            name, value = assignment.split(' = ')
+            job[ExpressionAttributeNames[name]] = ExpressionAttributeValues[value]
+
+
+def waiter(job_id, started):
+    return {'InferenceJobId': job_id, 'status': 'inprogress', 'result_inference_id': 'job-1',
+            'startTime': started.isoformat()}
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class InferenceCacheKeyTest(TestCase):
+
+    def test_key_is_canonical(self):
+        key = inference_cache_key('txt2img', None, txt2img(), USED_MODELS)
+        reordered = dict(reversed(list(txt2img().items())))
+
+        self.assertEqual(inference_cache_key('txt2img', '', reordered, USED_MODELS), key)
+        self.assertNotEqual(inference_cache_key('txt2img', None, txt2img(seed=43), USED_MODELS), key)
+        self.assertNotEqual(inference_cache_key('img2img', None, txt2img(), USED_MODELS), key)
+        other_ckpt = {'Stable-diffusion': [dict(USED_MODELS['Stable-diffusion'][0], id='ckpt-2')]}
+        self.assertNotEqual(inference_cache_key('txt2img', None, txt2img(), other_ckpt), key)
+
+    def test_random_jobs_are_not_cached(self):
+        self.assertIsNone(inference_cache_key('txt2img', None, txt2img(seed=-1), USED_MODELS))
+        self.assertIsNone(inference_cache_key('txt2img', None, txt2img(subseed=-1, subseed_strength=0.5),
+                                              USED_MODELS))
+        self.assertIsNone(inference_cache_key('rembg', None, txt2img(), USED_MODELS))
+        self.assertIsNone(inference_cache_key('txt2img', None, None, USED_MODELS))
+
+
+class InferenceResultCacheTest(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = InferenceResultCache(InMemoryResultCacheStore(), clock=self.clock, max_age=3600,
+                                          in_flight_seconds=600)
+        self.key = inference_cache_key('txt2img', None, txt2img(), USED_MODELS)
+
+    def test_retries_reuse_the_finished_result(self):
+        self.assertEqual(self.cache.lookup(self.key, 'job-1').action, ACTION_RUN)
+        self.assertEqual(self.cache.complete(self.key, 'job-1', ['image_0.png']), [])
+
+        decision = self.cache.lookup(self.key, 'job-2')
+        self.assertEqual(decision.action, ACTION_REUSE)
+        self.assertEqual((decision.entry['inference_id'], decision.entry['image_names']), ('job-1', ['image_0.png']))
+
+        # results older than the max age are produced again
+        self.clock.now += 3601
+        self.assertEqual(self.cache.lookup(self.key, 'job-3').action, ACTION_RUN)
+
+    def test_duplicates_in_flight_are_coalesced(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            decisions = list(executor.map(lambda i: (f'job-{i}', self.cache.lookup(self.key, f'job-{i}')), range(8)))
+
+        runs = [job for job, decision in decisions if decision.action == ACTION_RUN]
+        waiting = sorted(job for job, decision in decisions if decision.action == ACTION_WAIT)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(len(waiting), 7)
+
+        self.assertEqual(sorted(self.cache.complete(self.key, runs[0], ['image_0.png'])), waiting)
+        self.assertEqual(self.cache.lookup(self.key, 'job-8').action, ACTION_REUSE)
+
+    def test_failed_run_hands_back_its_waiters(self):
+        self.cache.lookup(self.key, 'job-1')
+        self.cache.lookup(self.key, 'job-2')
+        # only the job that owns the entry settles it
+        self.assertEqual(self.cache.complete(self.key, 'job-2', ['image_0.png']), [])
+
+        self.assertEqual(self.cache.release(self.key, 'job-1'), ['job-2'])
+        self.assertEqual(self.cache.lookup(self.key, 'job-3').action, ACTION_RUN)
+
+    def test_lost_run_is_taken_over(self):
+        self.cache.lookup(self.key, 'job-1')
+        self.clock.now += 601
+
+        self.assertEqual(self.cache.lookup(self.key, 'job-2').action, ACTION_RUN)
+        # the late result of the lost run does not overwrite the entry of its successor
+        self.assertEqual(self.cache.complete(self.key, 'job-1', ['late.png']), [])
+        self.cache.complete(self.key, 'job-2', ['image_0.png'])
+        self.assertEqual(self.cache.lookup(self.key, 'job-3').entry['inference_id'], 'job-2')
+
+
+class SettleWaiterTest(TestCase):
+
+    def test_waiters_of_lost_or_deleted_jobs_are_settled_when_read(self):
+        now = datetime(2024, 5, 1, 12)
+        recent = now - timedelta(minutes=5)
+        old = now - timedelta(hours=2)
+
+        running = FakeJobTable([{'InferenceJobId': 'job-1', 'status': 'inprogress'}, waiter('job-2', recent),
+                                waiter('job-3', old)])
+        self.assertEqual(settle_waiter(running, running.jobs['job-2'], now)['status'], 'inprogress')
+        self.assertEqual(settle_waiter(running, running.jobs['job-3'], now)['status'], 'failed')
+
+        succeeded = FakeJobTable([{'InferenceJobId': 'job-1', 'status': 'succeed', 'image_names': ['image_0.png']},
+                                  waiter('job-2', recent)])
+        job = settle_waiter(succeeded, succeeded.jobs['job-2'], now)
+        self.assertEqual((job['status'], job['image_names']), ('succeed', ['image_0.png']))
+        self.assertEqual(succeeded.jobs['job-2']['status'], 'succeed')
+
+        deleted = FakeJobTable([waiter('job-2', recent)])
+        self.assertIn('deleted', settle_waiter(deleted, deleted.jobs['job-2'], now)['sagemakerRaw'])
+
+        # a job that ran itself, or was already settled, is returned as is
+        self.assertEqual(settle_waiter(deleted, {'InferenceJobId': 'job-4', 'status': 'inprogress'}, now)['status'],
+                         'inprogress')
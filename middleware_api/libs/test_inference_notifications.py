@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+from common.excepts import BadRequestException
+from libs.inference_notifications import JobStatusPoller, MAX_WAIT_SECONDS, parse_wait_seconds
+
+
+class FakeJobTable:
+
+    def __init__(self, statuses):
+        # status returned by each successive read, the last one repeats
+        self.statuses = statuses
+        self.reads = 0
+
+    def get_item(self, Key, ProjectionExpression, ExpressionAttributeNames, ConsistentRead=False):
+        # eventually consistent reads are enough to notice a finished job on the next poll
+        assert not ConsistentRead
+        status = self.statuses[min(self.reads, len(self.statuses) - 1)]
+        self.reads += 1
+        if status is None:
+            return {}
+        return {'Item': {'status': status}}
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ParseWaitSecondsTest(TestCase):
+
+    def test_wait_is_clamped(self):
+        self.assertEqual(parse_wait_seconds(None), 0)
+        self.assertEqual(parse_wait_seconds('5'), 5)
+        self.assertEqual(parse_wait_seconds('-3'), 0)
+        self.assertEqual(parse_wait_seconds('600'), MAX_WAIT_SECONDS)
+
+    def test_invalid_wait_is_rejected(self):
+        for value in ['abc', 'nan', 'inf', '-inf']:
+            with self.assertRaises(BadRequestException):
+                parse_wait_seconds(value)
+
+
+class JobStatusPollerTest(TestCase):
+
+    def test_wait_until_terminal(self):
+        clock = FakeClock()
+        table = FakeJobTable(['inprogress'] * 2 + ['succeed'])
+        poller = JobStatusPoller(table, sleep=clock.sleep, clock=clock)
+
+        self.assertEqual(poller.wait('job', timeout=MAX_WAIT_SECONDS), 'succeed')
+        self.assertEqual(table.reads, 3)
+
+    def test_wait_times_out_with_few_reads(self):
+        clock = FakeClock()
+        table = FakeJobTable(['inprogress'])
+        poller = JobStatusPoller(table, sleep=clock.sleep, clock=clock)
+
+        self.assertIsNone(poller.wait('job', timeout=60))
+        self.assertEqual(clock.now, MAX_WAIT_SECONDS)
+        self.assertLessEqual(table.reads, 6)
+
+    def test_missing_job(self):
+        clock = FakeClock()
+        poller = JobStatusPoller(FakeJobTable([None]), sleep=clock.sleep, clock=clock)
+
+        self.assertIsNone(poller.wait('job', timeout=MAX_WAIT_SECONDS))
+        self.assertEqual(clock.now, 0)
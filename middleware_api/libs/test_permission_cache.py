@@ -0,0 +1,100 @@
+from unittest import TestCase
+
+from libs.data_types import PARTITION_KEYS
+from libs.permission_cache import PermissionCache, VERSION_KEY
+
+
+class FakeUserTable:
+    """Stores deserialized items by (kind, sort_key) and counts reads."""
+
+    def __init__(self):
+        self.items = {}
+        self.reads = 0
+
+    def add_user(self, name, roles):
+        self.items[(PARTITION_KEYS.user, name)] = {'kind': PARTITION_KEYS.user, 'sort_key': name,
+                                                   'roles': roles, 'creator': 'admin'}
+
+    def add_role(self, name, permissions):
+        self.items[(PARTITION_KEYS.role, name)] = {'kind': PARTITION_KEYS.role, 'sort_key': name,
+                                                   'permissions': permissions, 'creator': 'admin'}
+
+    def query_items(self, table, key_values):
+        self.reads += 1
+        return [item for (kind, sort_key), item in self.items.items()
+                if kind == key_values['kind'] and key_values.get('sort_key', sort_key) == sort_key]
+
+    def get_item(self, table, key_values):
+        self.reads += 1
+        return self.items.get((key_values['kind'], key_values['sort_key']), {})
+
+    def put_items(self, table, entries):
+        self.items[(entries['kind'], entries['sort_key'])] = entries
+
+    def deserialize(self, item):
+        return item
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class PermissionCacheTest(TestCase):
+
+    def setUp(self):
+        self.table = FakeUserTable()
+        self.table.add_user('alice', ['viewer'])
+        self.table.add_role('viewer', ['inference:list'])
+        self.table.add_role('admin', ['inference:all'])
+        self.clock = Clock()
+        self.cache = PermissionCache(self.table, 'users', ttl=60, version_check_interval=5, clock=self.clock)
+
+    def resolve(self, cache, username):
+        user = cache.get_user(username)
+        return [p for role in cache.get_roles(user.roles) for p in role.permissions]
+
+    def test_warm_lookups_do_not_read_the_table(self):
+        self.assertEqual(self.resolve(self.cache, 'alice'), ['inference:list'])
+        reads = self.table.reads
+
+        for _ in range(10):
+            self.assertEqual(self.resolve(self.cache, 'alice'), ['inference:list'])
+
+        self.assertEqual(self.table.reads, reads)
+
+    def test_entries_expire(self):
+        self.resolve(self.cache, 'alice')
+        self.table.add_user('alice', ['admin'])
+
+        self.clock.now = 30
+        self.assertEqual(self.resolve(self.cache, 'alice'), ['inference:list'])
+
+        self.clock.now = 61
+        self.assertEqual(self.resolve(self.cache, 'alice'), ['inference:all'])
+
+    def test_unknown_users_are_not_cached(self):
+        self.assertIsNone(self.cache.get_user('bob'))
+
+        self.table.add_user('bob', ['viewer'])
+        self.assertEqual(self.resolve(self.cache, 'bob'), ['inference:list'])
+
+    def test_invalidation_reaches_other_processes(self):
+        other = PermissionCache(self.table, 'users', ttl=60, version_check_interval=5, clock=self.clock)
+        self.resolve(self.cache, 'alice')
+        self.resolve(other, 'alice')
+
+        self.table.add_user('alice', ['admin'])
+        self.cache.invalidate()
+        self.assertIn((VERSION_KEY['kind'], VERSION_KEY['sort_key']), self.table.items)
+
+        # the writer sees the change at once, others after their next version check
+        self.assertEqual(self.resolve(self.cache, 'alice'), ['inference:all'])
+        self.assertEqual(self.resolve(other, 'alice'), ['inference:list'])
+
+        self.clock.now = 5
+        self.assertEqual(self.resolve(other, 'alice'), ['inference:all'])
@@ -0,0 +1,157 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from libs.common_tools import multipart_upload_from_url
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        content = self.server.content
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.server.ranges:
+            start = int(range_header[len('bytes='):].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        self.server.requests.append(start)
+        self.wfile.write(content[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class FileServer:
+    """Serves `content` on a local port, with or without Range support."""
+
+    def __init__(self, content: bytes, ranges=True):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+        self.server.content = content
+        self.server.ranges = ranges
+        self.server.requests = []
+        self.url = f'http://127.0.0.1:{self.server.server_port}/models/model.safetensors'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeS3:
+    """Stands in for the multipart upload calls of the S3 client."""
+
+    def __init__(self):
+        self.uploads = {}
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.part_started = threading.Event()
+        self.hold = None
+
+    def create_multipart_upload(self, Bucket, Key, Expires):
+        upload_id = f'upload-{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.part_started.set()
+        if self.hold:
+            self.hold.wait(5)
+        with self.lock:
+            self.in_flight -= 1
+            self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        numbers = sorted(n for n in self.uploads[UploadId] if n > PartNumberMarker)
+        page = numbers[:2]
+        return {
+            'Parts': [{'PartNumber': n, 'ETag': f'"{n}"', 'Size': len(self.uploads[UploadId][n])} for n in page],
+            'IsTruncated': len(numbers) > 2,
+            'NextPartNumberMarker': page[-1] if page else 0,
+        }
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads[UploadId]
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        assert numbers == list(range(1, len(parts) + 1))
+        self.objects[Key] = b''.join(parts[n] for n in numbers)
+
+
+class UrlImportTest(TestCase):
+
+    def setUp(self):
+        self.content = os.urandom(1000)
+        self.s3 = FakeS3()
+
+    def test_parts_are_uploaded_concurrently_with_bounded_memory(self):
+        server = FileServer(self.content)
+        progress = []
+        self.s3.hold = threading.Event()
+
+        def release_when_all_started():
+            while self.s3.in_flight < 3:
+                self.s3.part_started.wait(0.01)
+            self.s3.hold.set()
+
+        threading.Thread(target=release_when_all_started, daemon=True).start()
+        try:
+            result = multipart_upload_from_url(server.url, 'bucket', 'key', part_size=100, max_workers=3,
+                                               on_progress=lambda done, total: progress.append((done, total)),
+                                               s3=self.s3)
+        finally:
+            server.stop()
+
+        self.assertTrue(result.completed)
+        self.assertEqual(self.s3.objects['key'], self.content)
+        # never more parts in flight than workers, each held part is one slot
+        self.assertEqual(self.s3.max_in_flight, 3)
+        self.assertEqual(max(progress), (1000, 1000))
+        self.assertEqual(len(progress), 10)
+
+    def test_stopped_import_resumes_from_uploaded_parts(self):
+        server = FileServer(self.content)
+        parts_before_stop = 4
+        try:
+            first = multipart_upload_from_url(server.url, 'bucket', 'key', part_size=128, max_workers=2,
+                                              should_stop=lambda: len(self.s3.uploads['upload-0']) >= parts_before_stop,
+                                              s3=self.s3)
+            self.assertFalse(first.completed)
+            self.assertNotIn('key', self.s3.objects)
+
+            second = multipart_upload_from_url(server.url, 'bucket', 'key', upload_id=first.upload_id,
+                                               part_size=128, s3=self.s3)
+        finally:
+            server.stop()
+
+        self.assertTrue(second.completed)
+        self.assertEqual(self.s3.objects['key'], self.content)
+        self.assertEqual(server.server.requests, [0, first.uploaded_bytes])
+        self.assertEqual(first.uploaded_bytes % 128, 0)
+
+    def test_resume_without_range_support_skips_uploaded_bytes(self):
+        server = FileServer(self.content, ranges=False)
+        upload_id = self.s3.create_multipart_upload(Bucket='bucket', Key='key', Expires=None)['UploadId']
+        self.s3.uploads[upload_id] = {1: self.content[:256], 2: self.content[256:512], 3: b'partial'}
+        try:
+            result = multipart_upload_from_url(server.url, 'bucket', 'key', upload_id=upload_id, part_size=256,
+                                               s3=self.s3)
+        finally:
+            server.stop()
+
+        self.assertTrue(result.completed)
+        self.assertEqual(self.s3.objects['key'], self.content)
+        self.assertEqual(result.total_bytes, 1000)
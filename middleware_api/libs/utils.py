@@ -5,13 +5,14 @@ import os
 
 import boto3
 from aws_lambda_powertools import Tracer
-from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
 from common.ddb_service.client import DynamoDbUtilsService
 from common.excepts import ForbiddenException, UnauthorizedException, NotFoundException, BadRequestException
 from common.response import unauthorized, forbidden, not_found, bad_request
-from libs.data_types import PARTITION_KEYS, User, Role, Endpoint, Workflow
+from libs.data_types import PARTITION_KEYS, User, Workflow
+from libs.endpoint_directory import EndpointDirectory
+from libs.permission_cache import get_permission_cache
 
 tracer = Tracer()
 logger = logging.getLogger(__name__)
@@ -23,8 +24,7 @@ ddb_service = DynamoDbUtilsService(logger=logger)
 
 encode_type = "utf-8"
 s3 = boto3.client('s3')
-ddb = boto3.resource('dynamodb')
-endpoint_table = ddb.Table(os.environ.get('ENDPOINT_TABLE_NAME'))
+endpoint_directory = EndpointDirectory(os.environ.get('ENDPOINT_TABLE_NAME'), ddb_service)
 dynamodb = boto3.client('dynamodb')
 
 
@@ -101,23 +101,14 @@ def get_workflow_by_name(workflow_name: str):
 def get_endpoint_by_name(endpoint_name: str):
     tracer.put_annotation(key="endpoint_name", value=endpoint_name)
 
-    scan_kwargs = {
-        'IndexName': "endpoint_name-startTime-index",
-        'KeyConditionExpression': Key('endpoint_name').eq(endpoint_name),
-    }
+    endpoint = endpoint_directory.get_by_name(endpoint_name)
 
-    logger.info(scan_kwargs)
+    tracer.put_metadata(key="endpoint_name", value=endpoint.__dict__ if endpoint else None)
 
-    response = endpoint_table.query(**scan_kwargs)
-
-    tracer.put_metadata(key="endpoint_name", value=response)
-
-    items = response.get('Items', [])
-
-    if len(items) == 0:
+    if endpoint is None:
         raise NotFoundException(f'endpoint with name {endpoint_name} not found')
 
-    return Endpoint(**items[0])
+    return endpoint
 
 
 def log_json(title, payload: any = None):
@@ -195,17 +186,18 @@ def get_user_by_username(ddb_service, user_table, username):
 @tracer.capture_method
 def get_user_roles(ddb_service, user_table_name, username):
     tracer.put_annotation(key="username", value=username)
-    user = ddb_service.query_items(table=user_table_name, key_values={
-        'kind': PARTITION_KEYS.user,
-        'sort_key': username,
-    })
-    if not user or len(user) == 0:
+    user = get_permission_cache(ddb_service, user_table_name).get_user(username)
+    if not user:
         raise Exception(f'user: "{username}" not exist')
 
-    user = User(**ddb_service.deserialize(user[0]))
     return user.roles
 
 
+def invalidate_permissions(ddb_service, user_table_name):
+    """Must be called after users or roles are created, updated or deleted."""
+    get_permission_cache(ddb_service, user_table_name).invalidate()
+
+
 def response_error(e):
     try:
         logger.error(e, exc_info=True)
@@ -250,24 +242,15 @@ def permissions_check(event: any, permissions: [str]):
     if not user_table:
         raise Exception("MULTI_USER_TABLE not set")
 
-    user = ddb_service.query_items(table=user_table, key_values={
-        'kind': PARTITION_KEYS.user,
-        'sort_key': username,
-    })
+    cache = get_permission_cache(ddb_service, user_table)
+    user = cache.get_user(username)
 
-    if not user or len(user) == 0:
+    if not user:
         raise UnauthorizedException("Unauthorized")
 
-    user = User(**ddb_service.deserialize(user[0]))
     logger.info(f'user: {user}')
 
-    roles = ddb_service.scan(table=user_table, filters={
-        'kind': PARTITION_KEYS.role,
-        'sort_key': user.roles,
-    })
-
-    for role_raw in roles:
-        role = Role(**(ddb_service.deserialize(role_raw)))
+    for role in cache.get_roles(user.roles):
         logger.info(f'role: {role}')
         for permission in permissions:
             if permission in role.permissions:
@@ -290,13 +273,8 @@ def check_user_permissions(checkpoint_owners: [str], user_roles: [str], user_nam
 @tracer.capture_method
 def get_permissions_by_username(ddb_service, user_table, username):
     creator_roles = get_user_roles(ddb_service, user_table, username)
-    roles = ddb_service.scan(table=user_table, filters={
-        'kind': PARTITION_KEYS.role,
-        'sort_key': creator_roles,
-    })
     permissions = {}
-    for role_raw in roles:
-        role = Role(**(ddb_service.deserialize(role_raw)))
+    for role in get_permission_cache(ddb_service, user_table).get_roles(creator_roles):
         for permission in role.permissions:
             permission_parts = permission.split(':')
             resource = permission_parts[0]
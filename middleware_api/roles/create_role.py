@@ -10,7 +10,8 @@ from common.const import PERMISSION_ROLE_ALL, PERMISSION_ROLE_CREATE
 from common.ddb_service.client import DynamoDbUtilsService
 from common.response import bad_request, created
 from libs.data_types import Role, PARTITION_KEYS
-from libs.utils import get_permissions_by_username, permissions_check, response_error, get_user_name
+from libs.utils import get_permissions_by_username, permissions_check, response_error, get_user_name, \
+    invalidate_permissions
 
 tracer = Tracer()
 user_table = os.environ.get('MULTI_USER_TABLE')
@@ -67,6 +68,7 @@ def handler(raw_event, ctx):
             permissions=event.permissions,
             creator=username,
         ).__dict__)
+        invalidate_permissions(ddb_service, user_table)
 
         return created(message='role created')
     except Exception as e:
@@ -6,9 +6,10 @@ from dataclasses import dataclass
 import boto3
 from aws_lambda_powertools import Tracer
 
+from common.ddb_service.client import DynamoDbUtilsService
 from common.response import no_content, bad_request
 from libs.data_types import PARTITION_KEYS, Default_Role
-from libs.utils import response_error
+from libs.utils import response_error, invalidate_permissions
 
 tracer = Tracer()
 logger = logging.getLogger(__name__)
@@ -16,6 +17,7 @@ logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 dynamodb = boto3.resource('dynamodb')
 user_table = dynamodb.Table(os.environ.get('MULTI_USER_TABLE'))
+ddb_service = DynamoDbUtilsService(logger=logger)
 
 
 @dataclass
@@ -47,6 +49,8 @@ def handler(event, ctx):
                 }
             )
 
+        invalidate_permissions(ddb_service, user_table.name)
+
         return no_content(message='roles deleted')
     except Exception as e:
         return response_error(e)
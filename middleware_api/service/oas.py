@@ -203,6 +203,8 @@ operations = {
             header_user_name,
             query_page,
             query_per_page,
+            query_limit,
+            query_exclusive_start_key,
             Parameter(name="username", description="Filter by username", location="query"),
         ]
     ),
@@ -9,6 +9,7 @@ from aws_lambda_powertools import Tracer
 
 from common import const
 from common.ddb_service.client import DynamoDbUtilsService
+from common.metrics import flush_metrics
 from common.response import ok, not_found
 from common.util import publish_msg, generate_presigned_url_for_key, record_seconds_metrics
 from inferences.inference_libs import update_table_by_pk
@@ -30,6 +31,7 @@ ddb_service = DynamoDbUtilsService(logger=logger)
 
 
 @tracer.capture_lambda_handler
+@flush_metrics
 def handler(event, ctx):
     logger.info(json.dumps(event))
     train_job_name = event['detail']['TrainingJobName']
@@ -11,7 +11,7 @@ from common.ddb_service.client import DynamoDbUtilsService
 from common.response import bad_request, created, forbidden
 from libs.data_types import User, PARTITION_KEYS, Role, Default_Role
 from libs.utils import KeyEncryptService, check_user_existence, get_permissions_by_username, get_user_by_username, \
-    permissions_check, response_error
+    permissions_check, response_error, invalidate_permissions
 
 tracer = Tracer()
 user_table = os.environ.get('MULTI_USER_TABLE')
@@ -56,6 +56,7 @@ def handler(raw_event, ctx):
                 roles=[role_names[0]],
                 creator=username,
             ).__dict__)
+            invalidate_permissions(ddb_service, user_table)
 
             data = {
                 'user': {
@@ -108,6 +109,7 @@ def handler(raw_event, ctx):
             roles=event.roles,
             creator=username,
         ).__dict__)
+        invalidate_permissions(ddb_service, user_table)
 
         return created()
     except Exception as e:
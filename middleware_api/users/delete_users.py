@@ -9,7 +9,7 @@ from common.ddb_service.client import DynamoDbUtilsService
 from common.response import no_content
 from create_user import _check_action_permission
 from libs.data_types import PARTITION_KEYS
-from libs.utils import permissions_check, response_error
+from libs.utils import permissions_check, response_error, invalidate_permissions
 
 tracer = Tracer()
 user_table = os.environ.get('MULTI_USER_TABLE')
@@ -40,6 +40,8 @@ def handler(event, ctx):
                 'sort_key': username
             })
 
+        invalidate_permissions(ddb_service, user_table)
+
         return no_content(message='Users Deleted')
     except Exception as e:
         return response_error(e)
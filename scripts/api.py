@@ -6,21 +6,19 @@ import traceback
 import copy
 import datetime
 import boto3
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 
 from modules import sd_models
 import modules.extras
 import sys
+from aws_extension.cloudwatch_metrics import MetricsPublisher
+from aws_extension.invocation_queue import InvocationQueue, QueueRejected
 from aws_extension.models import InvocationsRequest
 from aws_extension.mme_utils import checkspace_and_update_models, download_model, models_path
 import requests
 from utils import get_bucket_name_from_s3_path, get_path_from_s3_path, download_folder_from_s3_by_tar, \
     upload_folder_to_s3_by_tar, read_from_s3
 
-THREAD_CHECK_COUNT = 1
-CONDITION_POOL_MAX_COUNT = 10
-CONDITION_WAIT_TIME_OUT = 100000
-
 
 def dummy_function(*args, **kwargs):
     return None
@@ -30,6 +28,7 @@ logger = logging.getLogger("sd_proxy")
 logger.setLevel(os.environ.get('LOG_LEVEL') or logging.ERROR)
 
 cloudwatch = boto3.client('cloudwatch')
+metrics_publisher = MetricsPublisher(client=cloudwatch)
 
 endpoint_name = os.getenv('ENDPOINT_NAME')
 endpoint_instance_id = os.getenv('ENDPOINT_INSTANCE_ID', 'default')
@@ -57,82 +56,27 @@ def update_execute_job_table(prompt_id, key, value):
 
 
 def record_metric(req: InvocationsRequest):
-    data = [
-        {
-            'MetricName': 'InferenceTotal',
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': endpoint_name
-                },
-
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': 'InferenceTotal',
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': endpoint_name
-                },
-                {
-                    'Name': 'Instance',
-                    'Value': endpoint_instance_id
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': 'InferenceEndpointReceived',
-            'Dimensions': [
-                {
-                    'Name': 'Service',
-                    'Value': 'Stable-Diffusion'
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-        {
-            'MetricName': 'InferenceEndpointReceived',
-            'Dimensions': [
-                {
-                    'Name': 'Endpoint',
-                    'Value': endpoint_name
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        },
-    ]
+    metrics_publisher.put('InferenceTotal', [{'Name': 'Endpoint', 'Value': endpoint_name}])
+    metrics_publisher.put('InferenceTotal', [
+        {'Name': 'Endpoint', 'Value': endpoint_name},
+        {'Name': 'Instance', 'Value': endpoint_instance_id},
+    ])
+    metrics_publisher.put('InferenceEndpointReceived', [{'Name': 'Service', 'Value': 'Stable-Diffusion'}])
+    metrics_publisher.put('InferenceEndpointReceived', [{'Name': 'Endpoint', 'Value': endpoint_name}])
 
     if req.workflow:
-        data.append({
-            'MetricName': 'InferenceEndpointReceived',
-            'Dimensions': [
-                {
-                    'Name': 'Workflow',
-                    'Value': req.workflow
-                },
-            ],
-            'Timestamp': datetime.datetime.utcnow(),
-            'Value': 1,
-            'Unit': 'Count'
-        })
-
-    response = cloudwatch.put_metric_data(
-        Namespace='ESD',
-        MetricData=data
-    )
-
-    logger.info(f"record_metric response: {response}")
+        metrics_publisher.put('InferenceEndpointReceived', [{'Name': 'Workflow', 'Value': req.workflow}])
+
+
+def record_queue_metric(req: InvocationsRequest, waited: float = None):
+    dimensions = [
+        {'Name': 'Endpoint', 'Value': endpoint_name},
+        {'Name': 'TaskType', 'Value': req.task},
+    ]
+    if waited is None:
+        metrics_publisher.put('InferenceQueueRejected', dimensions)
+    else:
+        metrics_publisher.put('InferenceQueueWait', dimensions, value=waited, unit='Seconds')
 
 
 def merge_model_on_cloud(req):
@@ -274,11 +218,7 @@ def sagemaker_api(_, app: FastAPI):
     logger.info(app)
     logger.debug("Loading Sagemaker API Endpoints.")
     import threading
-    from collections import deque
-    global condition
-    condition = threading.Condition()
-    global thread_deque
-    thread_deque = deque()
+    invocation_queue = InvocationQueue()
 
     def wrap_response(start_time, data):
         data['start_time'] = start_time
@@ -298,16 +238,10 @@ def sagemaker_api(_, app: FastAPI):
 
         record_metric(req)
 
-        with condition:
-            try:
-                thread_deque.append(req)
-                logger.info(f"{threading.current_thread().ident}_{threading.current_thread().name} {len(thread_deque)}")
-                if len(thread_deque) > THREAD_CHECK_COUNT and len(thread_deque) <= CONDITION_POOL_MAX_COUNT:
-                    logger.info(f"wait {threading.current_thread().ident}_{threading.current_thread().name} {len(thread_deque)}")
-                    condition.wait(timeout=CONDITION_WAIT_TIME_OUT)
-                elif len(thread_deque) > CONDITION_POOL_MAX_COUNT:
-                    logger.info(f"waiting thread too much in condition pool {len(thread_deque)}, max: {CONDITION_POOL_MAX_COUNT}")
-                    raise MemoryError
+        try:
+            with invocation_queue.slot(req.task) as waited:
+                logger.info(f"{threading.current_thread().ident}_{threading.current_thread().name} waited {waited}s, {invocation_queue.stats()}")
+                record_queue_metric(req, waited)
 
                 logger.info(f"task is {req.task}")
                 logger.info(f"models is {req.models}")
@@ -468,11 +402,13 @@ def sagemaker_api(_, app: FastAPI):
                         traceback.print_exc()
                 else:
                     raise NotImplementedError
-            except Exception as e:
-                traceback.print_exc()
-            finally:
-                thread_deque.popleft()
-                condition.notify()
+        except QueueRejected as e:
+            logger.info(f"reject {req.task} invocation: {e}")
+            record_queue_metric(req)
+            raise HTTPException(status_code=e.status_code, detail=str(e),
+                                headers={'Retry-After': str(e.retry_after)})
+        except Exception as e:
+            traceback.print_exc()
 
     @app.get("/ping")
     def ping():
@@ -24,66 +24,8 @@ logger.setLevel(LOGGING_LEVEL)
 
 s3_client = boto3.client('s3')
 
-
-class ModelsRef:
-    def __init__(self):
-        self.models_ref = {}
-
-    def get_models_ref_dict(self):
-        return self.models_ref
-
-    def add_models_ref(self, model_name):
-        if model_name in self.models_ref:
-            self.models_ref[model_name] += 1
-        else:
-            self.models_ref[model_name] = 0
-
-    def remove_model_ref(self,model_name):
-        if self.models_ref.get(model_name):
-            del self.models_ref[model_name]
-
-    def get_models_ref(self, model_name):
-        return self.models_ref.get(model_name)
-
-    def get_least_ref_model(self):
-        sorted_models = sorted(self.models_ref.items(), key=lambda item: item[1])
-        if sorted_models:
-            least_ref_model, least_counter = sorted_models[0]
-            return least_ref_model,least_counter
-        else:
-            return None,None
-
-    def pop_least_ref_model(self):
-        sorted_models = sorted(self.models_ref.items(), key=lambda item: item[1])
-        if sorted_models:
-            least_ref_model, least_counter = sorted_models[0]
-            del self.models_ref[least_ref_model]
-            return least_ref_model,least_counter
-        else:
-            return None,None
-
-    def get_sorted_models(self, key_list=None):
-        print('!!!!!!!!!!!', key_list)
-        if key_list is None:
-            return sorted(self.models_ref.items(), key=lambda item: item[1])
-        else:
-            models_ref_tmp = {}
-            for key_value in key_list:
-                if key_value not in self.models_ref.keys():
-                    models_ref_tmp[key_value] = -1
-                else:
-                    models_ref_tmp[key_value] = self.models_ref[key_value]
-            models_sorted_info = sorted(models_ref_tmp.items(), key=lambda item: item[1])
-            models_sorted = []
-            for model_info in models_sorted_info:
-                models_sorted.append(model_info[0])
-            return models_sorted
-
-# sd_models_Ref = ModelsRef()
-# cn_models_Ref = ModelsRef()
-# lora_models_Ref = ModelsRef()
-# hyper_models_Ref = ModelsRef()
-# embedding_Ref = ModelsRef()
+# an interrupted multipart upload is started again this many times in all, with the parts already sent kept
+UPLOAD_ATTEMPTS = 2
 
 
 def upload_folder_to_s3(local_folder_path, bucket_name, s3_folder_path):
@@ -133,31 +75,23 @@ def upload_file_to_s3_by_presign_url(local_path, s3_presign_url):
     response.raise_for_status()
 
 
-def upload_multipart_files_to_s3_by_signed_url(local_path, signed_urls, part_size):
-    integral_uploaded = False
-    with open(local_path, "rb") as f:
-        parts = []
+def upload_multipart_files_to_s3_by_signed_url(local_path, signed_urls, part_size, on_progress=None):
+    from aws_extension.multipart_upload import MultipartUploader, upload_state_path
+
+    # finished parts are recorded here, a second attempt with the same urls only sends the missing ones
+    state_path = upload_state_path(local_path)
+    uploader = MultipartUploader(on_progress=on_progress)
+    for attempt in range(UPLOAD_ATTEMPTS):
         try:
-            for i, signed_url in enumerate(signed_urls):
-                file_data = f.read(part_size)
-                response = requests.put(signed_url, data=file_data)
-                response.raise_for_status()
-                etag = response.headers['ETag']
-                parts.append({
-                    'ETag': etag,
-                    'PartNumber': i + 1
-                })
-                print(f'model upload part {i+1}: {response}')
-
-            integral_uploaded = True
-            return parts
+            result = uploader.upload(local_path, signed_urls, part_size, state_path=state_path)
+            print(f'model upload {local_path}: {result.summary()}')
+            return result.parts
         except Exception as e:
             print(e)
-            gr.Error(f'Upload file{local_path} failed, please try again. If still not work, contact your admin')
-        finally:
-            if not integral_uploaded:
-                gr.Error(f'Upload file {local_path} not complete, please try again or create new one.')
-                raise Exception('failed at multipart')
+            if attempt + 1 < UPLOAD_ATTEMPTS:
+                continue
+            gr.Error(f'Upload file {local_path} not complete, please try again or create new one.')
+            raise Exception('failed at multipart')
 
 
 def download_folder_from_s3(bucket_name, s3_folder_path, local_folder_path):